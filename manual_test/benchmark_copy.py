@@ -0,0 +1,49 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Callable
+
+from nislmigrate.facades.parallel_copy import DEFAULT_WORKER_COUNT, ParallelDirectoryCopier
+
+MEGABYTE = 1024 * 1024
+
+
+def make_file_store(root: str, file_count: int, file_size: int) -> None:
+    """Creates a directory tree shaped like a file ingestion store, with 100 files per directory."""
+    for index in range(file_count):
+        directory = os.path.join(root, f'{index // 10000:03}', f'{index // 100 % 100:02}')
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f'{index}.bin'), 'wb') as file:
+            file.write(os.urandom(file_size))
+
+
+def measure(name: str, file_count: int, size: int, operation: Callable[[], Any]) -> None:
+    start = time.perf_counter()
+    operation()
+    elapsed = time.perf_counter() - start
+    print(f'{name:<24} {elapsed:8.2f} s {file_count / elapsed:10.0f} files/s {size / MEGABYTE / elapsed:10.1f} MB/s')
+
+
+def run_benchmark(file_count: int, file_size: int, worker_count: int) -> None:
+    copier = ParallelDirectoryCopier(worker_count)
+    size = file_count * file_size
+    with tempfile.TemporaryDirectory() as directory:
+        source_path = os.path.join(directory, 'source')
+        make_file_store(source_path, file_count, file_size)
+
+        print(f'{file_count} files of {file_size // 1024} KB, {worker_count} workers')
+        measure('shutil.copytree', file_count, size,
+                lambda: shutil.copytree(source_path, os.path.join(directory, 'copytree')))
+        measure('parallel copy', file_count, size,
+                lambda: copier.copy_directory(source_path, os.path.join(directory, 'parallel')))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare shutil.copytree and parallel directory copy throughput.')
+    parser.add_argument('--files', type=int, default=20000, help='number of files to generate')
+    parser.add_argument('--file-size', type=int, default=64 * 1024, help='size of each file in bytes')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKER_COUNT, help='number of copy threads')
+    arguments = parser.parse_args()
+    run_benchmark(arguments.files, arguments.file_size, arguments.workers)
@@ -0,0 +1,68 @@
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable
+
+from cryptography.fernet import Fernet
+
+from nislmigrate.facades.encrypted_archive import (
+    ChunkedEncrypter,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_WORKER_COUNT,
+    new_key_derivation,
+)
+
+MEGABYTE = 1024 * 1024
+
+
+def encrypt_single_token(encrypter: Fernet, source_path: str, encrypted_path: str) -> None:
+    """Encrypts the whole file with one Fernet call, the way captures were encrypted before chunking."""
+    with open(source_path, 'rb') as file:
+        text = file.read()
+    with open(encrypted_path, 'wb') as file:
+        file.write(encrypter.encrypt(text))
+
+
+def decrypt_single_token(encrypter: Fernet, encrypted_path: str, destination_path: str) -> None:
+    with open(encrypted_path, 'rb') as file:
+        encrypted_text = file.read()
+    with open(destination_path, 'wb') as file:
+        file.write(encrypter.decrypt(encrypted_text))
+
+
+def measure(name: str, size: int, operation: Callable[[], None]) -> None:
+    start = time.perf_counter()
+    operation()
+    elapsed = time.perf_counter() - start
+    print(f'{name:<32} {elapsed:8.2f} s {size / MEGABYTE / elapsed:10.1f} MB/s')
+
+
+def run_benchmark(size_in_megabytes: int, worker_count: int, chunk_size: int) -> None:
+    encrypter = Fernet(Fernet.generate_key())
+    chunked_encrypter = ChunkedEncrypter(encrypter, worker_count, chunk_size)
+    key_derivation = new_key_derivation()
+    size = size_in_megabytes * MEGABYTE
+    with tempfile.TemporaryDirectory() as directory:
+        source_path = os.path.join(directory, 'source.tar')
+        encrypted_path = os.path.join(directory, 'encrypted')
+        decrypted_path = os.path.join(directory, 'decrypted.tar')
+        with open(source_path, 'wb') as file:
+            for _ in range(size_in_megabytes):
+                file.write(os.urandom(MEGABYTE))
+
+        print(f'{size_in_megabytes} MB, {worker_count} workers, {chunk_size // 1024} KB chunks')
+        measure('single token encrypt', size, lambda: encrypt_single_token(encrypter, source_path, encrypted_path))
+        measure('single token decrypt', size, lambda: decrypt_single_token(encrypter, encrypted_path, decrypted_path))
+        measure('chunked encrypt', size, lambda: chunked_encrypter.encrypt_file(
+            source_path, encrypted_path, key_derivation))
+        measure('chunked decrypt', size, lambda: chunked_encrypter.decrypt_file(encrypted_path, decrypted_path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare single token and chunked encryption throughput.')
+    parser.add_argument('--size', type=int, default=512, help='size of the generated archive in megabytes')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKER_COUNT, help='number of encryption threads')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='chunk size in bytes')
+    arguments = parser.parse_args()
+    run_benchmark(arguments.size, arguments.workers, arguments.chunk_size)
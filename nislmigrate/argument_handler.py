@@ -1,9 +1,10 @@
 import logging
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
-from argparse import ArgumentParser, Action, SUPPRESS
+from argparse import ArgumentParser, Action, Namespace, SUPPRESS
 from nislmigrate.facades.facade_factory import FacadeFactory
+from nislmigrate.facades.parallel_copy import DEFAULT_BUFFER_SIZE, LinkMode, MEGABYTE
 from nislmigrate.migration_action import MigrationAction
 from nislmigrate import migrators
 from nislmigrate.logs.migration_error import MigrationError
@@ -27,7 +28,17 @@ MIGRATION_DIRECTORY_ARGUMENT = 'dir'
 SECRET_ARGUMENT = 'secret'
 FORCE_ARGUMENT = 'force'
 FORCE_ARGUMENT_FLAG = 'f'
+DELTA_ARGUMENT = 'delta'
+DELTA_CHECKSUM_ARGUMENT = 'delta-checksum'
+LINK_MODE_ARGUMENT = 'link-mode'
+BUFFER_SIZE_ARGUMENT = 'buffer-size'
+VERIFY_ARGUMENT = 'verify'
+VERIFY_SAMPLE_ARGUMENT = 'verify-sample'
 LIST_INSTALLED_SERVICES_ARGUMENT = 'list'
+PRUNE_ARGUMENT = 'prune'
+CHECK_ARGUMENT = 'check'
+CAPTURE_STORE_ARGUMENT = 'store'
+KEEP_ARGUMENT = 'keep'
 
 SECRET_ARGUMENT_HELP = ('Some migrators require this --secret to encrypt sensitive data during migration '
                         'otherwise it is ignored. You will need to provide the same '
@@ -54,10 +65,31 @@ MODIFY_COMMAND_HELP = ('use modify to update existing data or settings of a Syst
 DIRECTORY_ARGUMENT_HELP = 'specify the directory used for migrated data (defaults to documents)'
 ALL_SERVICES_ARGUMENT_HELP = 'use all provided migrator plugins during a capture or restore operation'
 FORCE_ARGUMENT_HELP = 'allows capture to delete existing data on the SystemLink server prior to restore'
+DELTA_ARGUMENT_HELP = ('when restoring files, only copy files whose size or modification time differ and delete '
+                       'files that are not in the captured data, instead of replacing all existing files')
+DELTA_CHECKSUM_ARGUMENT_HELP = 'like --delta, but compare the contents of files instead of their modification times'
+LINK_MODE_ARGUMENT_HELP = ('link files instead of copying them when the service data and the migration directory '
+                           'are on the same volume: "hardlink" shares the data with the original files, "reflink" '
+                           'clones it copy-on-write where the filesystem supports it and "auto" clones where possible '
+                           'and hard links otherwise. Files that can not be linked are copied (defaults to copy)')
+BUFFER_SIZE_ARGUMENT_HELP = ('the number of megabytes to read or write at once when copying files. Larger buffers '
+                             'can speed up copies to and from network shares (defaults to 8)')
+VERIFY_ARGUMENT_HELP = ('after copying a directory of files, compare the contents of every copied file with its '
+                        'source and fail if any differ')
+VERIFY_SAMPLE_ARGUMENT_HELP = ('like --verify, but only compare the contents of this fraction of the files, chosen at '
+                               'random, for example 0.05. Every file is still checked for existence and size')
+CAPTURE_STORE_ARGUMENT_HELP = ('store captured files once by content in this capture store directory, shared by '
+                               'many captures, and write only a manifest of the files to the migration directory')
+PRUNE_CAPTURE_STORE_ARGUMENT_HELP = 'the capture store directory to prune'
+KEEP_ARGUMENT_HELP = 'the number of most recent captures to keep'
 DEBUG_VERBOSITY_ARGUMENT_HELP = 'print all logged information and stack trace information in case an error occurs'
 SILENT_VERBOSITY_ARGUMENT_HELP = 'print all logged information except debugging information'
 LIST_INSTALLED_SERVICES_ARGUMENT_HELP = ('list the SystemLink services this tool recognises as installed on the '
                                          'current machine')
+CHECK_COMMAND_HELP = ('use check to look for inconsistencies between the data of services and their metadata '
+                      'without stopping the services (only works with --files)')
+PRUNE_COMMAND_HELP = ('use prune to remove old captures from a capture store and delete the stored files '
+                      'no remaining capture uses')
 
 
 def _get_migrator_arguments_key(migrator: MigratorPlugin):
@@ -68,6 +100,10 @@ def _is_migrator_arguments_key(key: str) -> bool:
     return key.endswith('_args')
 
 
+def _to_destination(argument: str) -> str:
+    return argument.replace('-', '_')
+
+
 class ArgumentHandler:
     """
     Processes arguments either from the command line or just a list of arguments and breaks them
@@ -87,6 +123,7 @@ class ArgumentHandler:
         self.plugin_loader = plugin_loader
         self.facade_factory = facade_factory
         argument_parser = self.__create_migration_tool_argument_parser()
+        self.parsed_arguments: Namespace
         if arguments is None:
             self.parsed_arguments = argument_parser.parse_args()
         else:
@@ -156,6 +193,61 @@ class ArgumentHandler:
     def is_force_migration_flag_present(self) -> bool:
         return getattr(self.parsed_arguments, FORCE_ARGUMENT, False)
 
+    def get_link_mode(self) -> LinkMode:
+        """Gets how directory contents are placed in their destination.
+
+        :return: The link mode from the arguments, or LinkMode.COPY if none was specified.
+        """
+        return LinkMode(getattr(self.parsed_arguments, _to_destination(LINK_MODE_ARGUMENT), LinkMode.COPY.value))
+
+    def get_buffer_size(self) -> int:
+        """Gets the number of bytes to read or write at once when copying files.
+
+        :return: The buffer size from the arguments in bytes, or the default buffer size if none was specified.
+        """
+        megabytes = getattr(self.parsed_arguments, _to_destination(BUFFER_SIZE_ARGUMENT), None)
+        if megabytes is None:
+            return DEFAULT_BUFFER_SIZE
+        if megabytes < 1:
+            raise MigrationError(f'The buffer size must be at least 1 MB, not {megabytes}.')
+        return megabytes * MEGABYTE
+
+    def get_verification_sample_fraction(self) -> Optional[float]:
+        """Gets the fraction of copied files to compare with their source.
+
+        :return: 1.0 if --verify was specified, the fraction given to --verify-sample,
+                 or None if copies are not verified.
+        """
+        fraction = getattr(self.parsed_arguments, _to_destination(VERIFY_SAMPLE_ARGUMENT), None)
+        if fraction is not None:
+            if not 0 < fraction <= 1:
+                raise MigrationError(
+                    f'--{VERIFY_SAMPLE_ARGUMENT} must be greater than 0 and at most 1, not {fraction}.')
+            return fraction
+        if getattr(self.parsed_arguments, VERIFY_ARGUMENT, False):
+            return 1.0
+        return None
+
+    def get_capture_store_directory(self) -> Optional[str]:
+        """Gets the directory of the capture store to capture into or prune.
+
+        :return: The capture store directory, or None if captures are not stored in a capture store.
+        """
+        return getattr(self.parsed_arguments, CAPTURE_STORE_ARGUMENT, None)
+
+    def get_number_of_captures_to_keep(self) -> int:
+        """Gets how many captures pruning a capture store keeps.
+
+        :return: The number of most recent captures to keep.
+        """
+        return getattr(self.parsed_arguments, KEEP_ARGUMENT)
+
+    def is_delta_copy_flag_present(self) -> bool:
+        return self.is_delta_checksum_flag_present() or getattr(self.parsed_arguments, DELTA_ARGUMENT, False)
+
+    def is_delta_checksum_flag_present(self) -> bool:
+        return getattr(self.parsed_arguments, _to_destination(DELTA_CHECKSUM_ARGUMENT), False)
+
     @staticmethod
     def __remove_non_plugin_arguments(arguments: Dict[str, Any]) -> List[str]:
         return [
@@ -166,6 +258,13 @@ class ArgumentHandler:
             and not argument == ALL_SERVICES_ARGUMENT
             and not argument == VERBOSITY_ARGUMENT
             and not argument == FORCE_ARGUMENT
+            and not argument == DELTA_ARGUMENT
+            and not argument == _to_destination(DELTA_CHECKSUM_ARGUMENT)
+            and not argument == _to_destination(LINK_MODE_ARGUMENT)
+            and not argument == _to_destination(BUFFER_SIZE_ARGUMENT)
+            and not argument == VERIFY_ARGUMENT
+            and not argument == _to_destination(VERIFY_SAMPLE_ARGUMENT)
+            and not argument == CAPTURE_STORE_ARGUMENT
             and not argument == SECRET_ARGUMENT
             and not _is_migrator_arguments_key(argument)
         ]
@@ -183,6 +282,10 @@ class ArgumentHandler:
             return MigrationAction.MODIFY
         elif self.parsed_arguments.action == LIST_INSTALLED_SERVICES_ARGUMENT:
             return MigrationAction.LIST
+        elif self.parsed_arguments.action == PRUNE_ARGUMENT:
+            return MigrationAction.PRUNE
+        elif self.parsed_arguments.action == CHECK_ARGUMENT:
+            return MigrationAction.CHECK
         else:
             raise MigrationError(MIGRATION_OPERATION_NOT_PROVIDED_ERROR_TEXT)
 
@@ -231,8 +334,20 @@ class ArgumentHandler:
             f'--{FORCE_ARGUMENT}',
             help=FORCE_ARGUMENT_HELP,
             action='store_true')
+        restore_parser.add_argument(f'--{DELTA_ARGUMENT}', help=DELTA_ARGUMENT_HELP, action='store_true')
+        restore_parser.add_argument(
+            f'--{DELTA_CHECKSUM_ARGUMENT}',
+            help=DELTA_CHECKSUM_ARGUMENT_HELP,
+            action='store_true')
         sub_parser.add_parser(MODIFY_ARGUMENT, help=MODIFY_COMMAND_HELP, parents=[parent_parser])
+        sub_parser.add_parser(CHECK_ARGUMENT, help=CHECK_COMMAND_HELP, parents=[parent_parser])
         sub_parser.add_parser(LIST_INSTALLED_SERVICES_ARGUMENT, help=LIST_INSTALLED_SERVICES_ARGUMENT_HELP)
+        prune_parser = sub_parser.add_parser(PRUNE_ARGUMENT, help=PRUNE_COMMAND_HELP)
+        prune_parser.add_argument(
+            f'--{CAPTURE_STORE_ARGUMENT}',
+            help=PRUNE_CAPTURE_STORE_ARGUMENT_HELP,
+            required=True)
+        prune_parser.add_argument(f'--{KEEP_ARGUMENT}', help=KEEP_ARGUMENT_HELP, type=int, required=True)
 
     @staticmethod
     def __add_additional_flag_options(parser: ArgumentParser) -> None:
@@ -245,6 +360,19 @@ class ArgumentHandler:
             '--' + ALL_SERVICES_ARGUMENT,
             help=ALL_SERVICES_ARGUMENT_HELP,
             action='store_true')
+        parser.add_argument(
+            f'--{LINK_MODE_ARGUMENT}',
+            help=LINK_MODE_ARGUMENT_HELP,
+            choices=[link_mode.value for link_mode in LinkMode],
+            default=LinkMode.COPY.value)
+        parser.add_argument(f'--{BUFFER_SIZE_ARGUMENT}', help=BUFFER_SIZE_ARGUMENT_HELP, type=int)
+        parser.add_argument(f'--{VERIFY_ARGUMENT}', help=VERIFY_ARGUMENT_HELP, action='store_true')
+        parser.add_argument(
+            f'--{VERIFY_SAMPLE_ARGUMENT}',
+            help=VERIFY_SAMPLE_ARGUMENT_HELP,
+            type=float,
+            metavar='fraction')
+        parser.add_argument(f'--{CAPTURE_STORE_ARGUMENT}', help=CAPTURE_STORE_ARGUMENT_HELP)
 
     @staticmethod
     def __add_logging_flag_options(parser: ArgumentParser) -> None:
@@ -1,4 +1,4 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any
 
 import os
 import abc
@@ -55,7 +55,6 @@ class MigratorPlugin(abc.ABC):
     """
 
     service_configuration_directory: str = DEFAULT_SERVICE_CONFIGURATION_DIRECTORY
-    __cached_config: Optional[Dict[str, Any]] = None
 
     @property
     @abc.abstractmethod
@@ -99,11 +98,9 @@ class MigratorPlugin(abc.ABC):
         :param facade_factory: Factory that produces objects abstracing away operations.
         :returns: Gets the configuration dictionary this plugin provides.
         """
-        if self.__cached_config is None:
-            config_file = self.__build_config_file_path()
-            filesystem_facade = facade_factory.get_file_system_facade()
-            self.__cached_config = filesystem_facade.read_json_file(config_file)[self.configuration_category]
-        return self.__cached_config
+        filesystem_facade = facade_factory.get_file_system_facade()
+        config = filesystem_facade.read_service_configuration(self.__build_config_file_path())
+        return config[self.configuration_category]
 
     @abc.abstractmethod
     def capture(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]) -> None:
@@ -136,6 +133,17 @@ class MigratorPlugin(abc.ABC):
         """
         pass
 
+    def check(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]) -> None:
+        """
+        Checks the consistency of the service's data without changing it, while the service
+        keeps running. Services without consistency checks do nothing.
+        :param migration_directory: the root path to write reports of the check to.
+        :param facade_factory: Factory that produces objects capable of doing actual operations.
+        :param arguments: Dictionary containing any command line argument values defined in add_additional_arguments.
+        :raises MigrationError: If the data is inconsistent.
+        """
+        pass
+
     @abc.abstractmethod
     def pre_restore_check(
             self,
@@ -189,7 +197,7 @@ class MigratorPlugin(abc.ABC):
         :param facade_factory: Factory for migration facades.
         :return: True if the service is installed.
         """
-        return facade_factory.file_system_facade.does_file_exist(self.__build_config_file_path())
+        return facade_factory.get_file_system_facade().does_service_configuration_exist(self.__build_config_file_path())
 
     def add_additional_arguments(self, argument_manager: ArgumentManager) -> None:
         """
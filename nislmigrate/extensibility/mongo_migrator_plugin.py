@@ -0,0 +1,52 @@
+from typing import Any, Dict
+
+from nislmigrate.extensibility.migrator_plugin import MigratorPlugin
+from nislmigrate.facades.facade_factory import FacadeFactory
+from nislmigrate.facades.mongo_configuration import MongoConfiguration
+from nislmigrate.facades.mongo_facade import MongoDump, MongoFacade
+
+
+class MongoMigratorPlugin(MigratorPlugin):
+    """
+    Base class for migrators of services that keep all of their data in their Mongo database.
+    Subclasses only declare the argument, name and help of the migrator. When several such
+    migrators are selected, their databases are captured and restored as one batch.
+    """
+
+    def mongo_dump(self, migration_directory: str, facade_factory: FacadeFactory) -> MongoDump:
+        """
+        Gets the database of the service and the archive it is migrated with.
+        :param migration_directory: The directory of the service in the migration directory.
+        :param facade_factory: Factory that produces objects abstracing away operations.
+        :return: The database and archive.
+        """
+        return MongoDump(MongoConfiguration(self.config(facade_factory)), migration_directory, self.name)
+
+    def capture(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
+        mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
+        mongo_facade.capture_databases_to_directories([self.mongo_dump(migration_directory, facade_factory)])
+
+    def restore(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
+        mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
+        mongo_facade.restore_databases_from_directories([self.mongo_dump(migration_directory, facade_factory)])
+
+    def pre_restore_check(
+            self,
+            migration_directory: str,
+            facade_factory: FacadeFactory,
+            arguments: Dict[str, Any]) -> None:
+        mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
+        mongo_facade.validate_can_restore_database_from_directory(
+            migration_directory,
+            self.name)
+
+
+def can_migrate_in_batch(migrator: MongoMigratorPlugin) -> bool:
+    """
+    Determines whether a Mongo migrator migrates nothing but the database of its service,
+    so that it can be migrated in a batch with other such migrators.
+    :param migrator: The migrator.
+    :return: True if the migrator does not override how its service is captured or restored.
+    """
+    return type(migrator).capture is MongoMigratorPlugin.capture \
+        and type(migrator).restore is MongoMigratorPlugin.restore
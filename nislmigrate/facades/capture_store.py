@@ -0,0 +1,327 @@
+"""Store captured files once by content and describe each capture with a manifest."""
+
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, NamedTuple, Set, Tuple
+
+from nislmigrate.facades.parallel_copy import (
+    copy_file_contents,
+    DEFAULT_BUFFER_SIZE,
+    DEFAULT_WORKER_COUNT,
+    FileToCopy,
+    hash_file,
+    index_directory,
+    LinkMode,
+    MEGABYTE,
+    place_file,
+    ProgressReporter,
+    run_bounded,
+    scan_directory,
+)
+from nislmigrate.logs.migration_error import MigrationError
+
+MANIFEST_FILE_NAME = 'nislmigrate-manifest.json'
+MANIFEST_FORMAT_VERSION = 1
+# 32 byte digests keep blob paths short enough for Windows paths limited to 260 characters.
+DIGEST_SIZE = 32
+
+_BLOBS_DIRECTORY = 'blobs'
+_CAPTURES_DIRECTORY = 'captures'
+_LOCKS_DIRECTORY = 'locks'
+_PRUNE_LOCK_NAME = 'prune'
+_TEMPORARY_EXTENSION = '.tmp'
+
+
+class PruneStatistics(NamedTuple):
+    """
+    What pruning a capture store removed.
+    """
+    removed_capture_count: int
+    removed_blob_count: int
+    removed_byte_count: int
+
+
+def new_capture_id() -> str:
+    """
+    Creates an identifier for a capture that sorts by the time the capture was taken.
+
+    :return: The capture identifier.
+    """
+    return f'{time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())}-{uuid.uuid4().hex[:8]}'
+
+
+def is_store_capture(directory: str) -> bool:
+    """
+    Determines whether a captured directory is a manifest referring to a capture store
+    rather than a copy of the files themselves.
+
+    :param directory: The captured directory.
+    :return: True if the directory holds a capture store manifest.
+    """
+    return os.path.isfile(os.path.join(directory, MANIFEST_FILE_NAME))
+
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    """
+    Reads the manifest of a captured directory.
+
+    :param directory: The captured directory.
+    :return: The manifest.
+    """
+    with open(os.path.join(directory, MANIFEST_FILE_NAME), encoding='utf-8') as file:
+        manifest = json.load(file)
+    if manifest.get('version', 0) > MANIFEST_FORMAT_VERSION:
+        raise MigrationError(f'Capture manifest was written by a newer version of nislmigrate: {directory}')
+    return manifest
+
+
+class CaptureStore:
+    """
+    A directory holding the contents of captured files once per distinct content,
+    shared by every capture that refers to it. Each captured directory is recorded
+    as a manifest of file paths and content hashes, both in the capture itself and
+    in the store, where the manifests determine which contents are still in use.
+    """
+    def __init__(
+            self,
+            root: str,
+            worker_count: int = DEFAULT_WORKER_COUNT,
+            buffer_size: int = DEFAULT_BUFFER_SIZE):
+        """
+        Creates a new instance of CaptureStore.
+
+        :param root: The directory of the store, created when the first file is captured.
+        :param worker_count: The number of files to hash or copy at once.
+        :param buffer_size: The number of bytes to read or write at once.
+        """
+        self.root = os.path.abspath(root)
+        self.worker_count = max(1, worker_count)
+        self.buffer_size = buffer_size
+
+    def capture_directory(self, from_directory: str, to_directory: str, capture_id: str) -> None:
+        """
+        Adds the contents of a directory to the store and writes a manifest describing it.
+
+        :param from_directory: The directory to capture.
+        :param to_directory: The directory to write the manifest to, created if needed.
+        :param capture_id: The capture the directory belongs to, see new_capture_id.
+        """
+        start = time.perf_counter()
+        # Blobs are placed or reused before the manifest refers to them, so a prune must not run meanwhile.
+        with self.__lock(f'capture-{uuid.uuid4().hex}'):
+            index = index_directory(from_directory)
+            directories, files = index.directories, index.files
+            previous_files = self.__find_previous_files(from_directory)
+            progress = ProgressReporter('Captured', index.file_count, index.byte_count)
+
+            def store(file: FileToCopy) -> Tuple[str, bool]:
+                result = self.__store_file(file, from_directory, previous_files)
+                progress.add(1, file.size)
+                return result
+
+            results = run_bounded(self.worker_count, store, files)
+            manifest = {
+                'version': MANIFEST_FORMAT_VERSION,
+                'store': self.root,
+                'capture': capture_id,
+                'source': os.path.abspath(from_directory),
+                'directories': [_to_manifest_path(os.path.relpath(source, from_directory))
+                                for source, _ in directories[1:]],
+                'files': [[_to_manifest_path(os.path.relpath(file.source, from_directory)), content_hash,
+                           file.size, file.modified_time]
+                          for file, (content_hash, _) in zip(files, results)],
+            }
+            capture_directory = os.path.join(self.root, _CAPTURES_DIRECTORY, capture_id)
+            os.makedirs(capture_directory, exist_ok=True)
+            os.makedirs(to_directory, exist_ok=True)
+            _write_json(os.path.join(capture_directory, f'{uuid.uuid4().hex}.json'), manifest)
+            _write_json(os.path.join(to_directory, MANIFEST_FILE_NAME), manifest)
+
+        new_files = [file for file, (_, is_new) in zip(files, results) if is_new]
+        log = logging.getLogger(CaptureStore.__name__)
+        log.log(
+            logging.INFO,
+            f'Captured {len(files)} files ({sum(file.size for file in files) / MEGABYTE:.1f} MB) '
+            f'to {self.root} in {time.perf_counter() - start:.1f} s, storing {len(new_files)} '
+            f'new files ({sum(file.size for file in new_files) / MEGABYTE:.1f} MB)')
+
+    def __store_file(
+            self,
+            file: FileToCopy,
+            from_directory: str,
+            previous_files: Dict[str, List[Any]]) -> Tuple[str, bool]:
+        """
+        Adds the contents of a file to the store unless they are already there.
+
+        :return: The content hash of the file and whether its contents were added.
+        """
+        relative_path = _to_manifest_path(os.path.relpath(file.source, from_directory))
+        previous = previous_files.get(relative_path)
+        # Unchanged files keep the hash recorded by the previous capture instead of being read again.
+        if previous and previous[1] == file.size and previous[2] == file.modified_time:
+            if os.path.isfile(self.__blob_path(previous[0])):
+                return previous[0], False
+        content_hash = hash_file(file.source, self.buffer_size, DIGEST_SIZE).hex()
+        blob_path = self.__blob_path(content_hash)
+        if os.path.isfile(blob_path):
+            return content_hash, False
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        temporary_path = f'{blob_path}.{uuid.uuid4().hex}{_TEMPORARY_EXTENSION}'
+        copy_file_contents(file.source, temporary_path, file.size, self.buffer_size)
+        os.replace(temporary_path, blob_path)
+        return content_hash, True
+
+    def restore_directory(self, manifest: Dict[str, Any], to_directory: str, link_mode: LinkMode) -> None:
+        """
+        Recreates a captured directory from the store.
+
+        :param manifest: The manifest of the captured directory, see read_manifest.
+        :param to_directory: The directory to restore into, created if needed.
+        :param link_mode: Whether to clone files from the store instead of copying them.
+                          Files are never hard linked, since changes made to them on the
+                          server would otherwise change the stored content.
+        """
+        files = [FileToCopy(self.__blob_path(content_hash), _from_manifest_path(to_directory, path),
+                            size, modified_time)
+                 for path, content_hash, size, modified_time in manifest['files']]
+        missing = [file.source for file in files if not os.path.isfile(file.source)]
+        if missing:
+            raise MigrationError(
+                f'{len(missing)} captured files are missing from the capture store {self.root}, '
+                f'including: {missing[0]}')
+
+        os.makedirs(to_directory, exist_ok=True)
+        for path in manifest['directories']:
+            os.makedirs(_from_manifest_path(to_directory, path), exist_ok=True)
+        placement_mode = LinkMode.REFLINK if link_mode in (LinkMode.REFLINK, LinkMode.AUTO) else LinkMode.COPY
+        progress = ProgressReporter('Restored', len(files), sum(file.size for file in files))
+
+        def restore(file: FileToCopy) -> None:
+            place_file(file, placement_mode, self.buffer_size)
+            os.utime(file.destination, (file.modified_time, file.modified_time))
+            progress.add(1, file.size)
+
+        run_bounded(self.worker_count, restore, files)
+
+    def prune(self, keep: int) -> PruneStatistics:
+        """
+        Removes all but the most recent captures from the store, then deletes the stored
+        contents no remaining capture refers to.
+
+        :param keep: The number of most recent captures to keep.
+        :return: What was removed.
+        """
+        if keep < 1:
+            raise MigrationError(f'The number of captures to keep must be positive, not {keep}.')
+        captures_directory = os.path.join(self.root, _CAPTURES_DIRECTORY)
+        if not os.path.isdir(captures_directory):
+            raise MigrationError(f'No capture store found at: {self.root}')
+
+        with self.__lock(_PRUNE_LOCK_NAME):
+            statistics = self.__prune(captures_directory, keep)
+        log = logging.getLogger(CaptureStore.__name__)
+        log.log(
+            logging.INFO,
+            f'Removed {statistics.removed_capture_count} captures and {statistics.removed_blob_count} '
+            f'stored files ({statistics.removed_byte_count / MEGABYTE:.1f} MB) from {self.root}')
+        return statistics
+
+    def __prune(self, captures_directory: str, keep: int) -> PruneStatistics:
+        capture_ids = sorted(os.listdir(captures_directory))
+        removed_captures = capture_ids[:-keep]
+        for capture_id in removed_captures:
+            shutil.rmtree(os.path.join(captures_directory, capture_id))
+
+        referenced: Set[str] = set()
+        for capture_id in capture_ids[-keep:]:
+            for manifest in self.__read_capture_manifests(capture_id):
+                referenced.update(content_hash for _, content_hash, _, _ in manifest['files'])
+
+        removed_blob_count = 0
+        removed_byte_count = 0
+        _, blobs = scan_directory(os.path.join(self.root, _BLOBS_DIRECTORY), self.root) \
+            if os.path.isdir(os.path.join(self.root, _BLOBS_DIRECTORY)) else ([], [])
+        for blob in blobs:
+            # No capture runs while the store is locked, so temporary files are left over
+            # from interrupted captures and are removed too.
+            if os.path.basename(blob.source) in referenced:
+                continue
+            os.remove(blob.source)
+            removed_blob_count += 1
+            removed_byte_count += blob.size
+        return PruneStatistics(len(removed_captures), removed_blob_count, removed_byte_count)
+
+    @contextmanager
+    def __lock(self, lock_name: str) -> Iterator[None]:
+        """
+        Holds a lock file in the store. Any number of captures can hold a lock at once,
+        while a prune can only hold one when nothing else does. Each side creates its lock
+        before looking for the other's, so two that start together can not both proceed.
+        """
+        locks_directory = os.path.join(self.root, _LOCKS_DIRECTORY)
+        os.makedirs(locks_directory, exist_ok=True)
+        lock_path = os.path.join(locks_directory, lock_name)
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            raise MigrationError(_store_in_use_error(locks_directory))
+        try:
+            other_locks = [name for name in os.listdir(locks_directory) if name != lock_name]
+            if other_locks and (lock_name == _PRUNE_LOCK_NAME or _PRUNE_LOCK_NAME in other_locks):
+                raise MigrationError(_store_in_use_error(locks_directory))
+            yield
+        finally:
+            os.remove(lock_path)
+
+    def __find_previous_files(self, from_directory: str) -> Dict[str, List[Any]]:
+        """
+        Finds the files recorded by the most recent capture of the same directory.
+        """
+        captures_directory = os.path.join(self.root, _CAPTURES_DIRECTORY)
+        if not os.path.isdir(captures_directory):
+            return {}
+        source = os.path.abspath(from_directory)
+        for capture_id in sorted(os.listdir(captures_directory), reverse=True):
+            for manifest in self.__read_capture_manifests(capture_id):
+                if manifest['source'] == source:
+                    return {path: [content_hash, size, modified_time]
+                            for path, content_hash, size, modified_time in manifest['files']}
+        return {}
+
+    def __read_capture_manifests(self, capture_id: str) -> List[Dict[str, Any]]:
+        capture_directory = os.path.join(self.root, _CAPTURES_DIRECTORY, capture_id)
+        manifests = []
+        for name in sorted(os.listdir(capture_directory)):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(capture_directory, name), encoding='utf-8') as file:
+                manifests.append(json.load(file))
+        return manifests
+
+    def __blob_path(self, content_hash: str) -> str:
+        return os.path.join(self.root, _BLOBS_DIRECTORY, content_hash[:2], content_hash)
+
+
+def _store_in_use_error(locks_directory: str) -> str:
+    return (f'The capture store is being captured into or pruned by another run of nislmigrate. If no other run '
+            f'is in progress, an earlier run was interrupted and the files in {locks_directory} can be deleted.')
+
+
+def _write_json(path: str, content: Dict[str, Any]) -> None:
+    temporary_path = path + _TEMPORARY_EXTENSION
+    with open(temporary_path, 'w', encoding='utf-8') as file:
+        json.dump(content, file)
+    os.replace(temporary_path, path)
+
+
+def _to_manifest_path(relative_path: str) -> str:
+    return relative_path.replace(os.sep, '/')
+
+
+def _from_manifest_path(root: str, path: str) -> str:
+    return os.path.join(root, *path.split('/'))
@@ -0,0 +1,111 @@
+"""Confirm that a copied directory matches its source by hashing both on a pool of processes."""
+
+import hashlib
+import logging
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Optional
+
+from nislmigrate.facades.parallel_copy import DEFAULT_BUFFER_SIZE, FileTreeIndex, index_directory, MEGABYTE
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None  # type: ignore
+
+DEFAULT_PROCESS_COUNT = os.cpu_count() or 1
+# The number of files sent to a process at once, so that many small files are not
+# each paid for with a round trip to another process.
+_FILES_PER_TASK = 16
+
+
+class VerificationResult(NamedTuple):
+    """
+    What verifying a copied directory found.
+    """
+    checked_file_count: int
+    checked_byte_count: int
+    seconds: float
+    mismatched_files: List[str]
+    missing_files: List[str]
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.mismatched_files and not self.missing_files
+
+
+def verify_directory_copy(
+        from_directory: str,
+        to_directory: str,
+        sample_fraction: float = 1.0,
+        process_count: int = DEFAULT_PROCESS_COUNT,
+        seed: Optional[int] = None,
+        index: Optional[FileTreeIndex] = None) -> VerificationResult:
+    """
+    Compares the contents of each file of a directory with its copy. The source and the
+    copy are hashed at the same time on a pool of processes, with xxhash if it is
+    installed and BLAKE2 otherwise.
+
+    :param from_directory: The directory that was copied.
+    :param to_directory: The copy.
+    :param sample_fraction: The fraction of files to compare, chosen at random. Every file
+                            is checked for existence and size regardless.
+    :param process_count: The number of files to hash at once.
+    :param seed: Seeds the random sample, to make it repeatable.
+    :param index: The index of the files that were copied from from_directory into
+                  to_directory, if only some of them were copied.
+    :return: The files whose copies are missing or differ.
+    """
+    start = time.perf_counter()
+    if index is None:
+        index = index_directory(from_directory, to_directory)
+    missing_files = []
+    mismatched_files = []
+    candidates = []
+    for file in index.files:
+        if not os.path.isfile(file.destination):
+            missing_files.append(file.destination)
+        elif os.path.getsize(file.destination) != file.size:
+            mismatched_files.append(file.destination)
+        else:
+            candidates.append(file)
+    sample_count = len(candidates) if sample_fraction >= 1 else round(len(candidates) * sample_fraction)
+    sample = random.Random(seed).sample(candidates, sample_count)
+
+    paths = [path for file in sample for path in (file.source, file.destination)]
+    with ProcessPoolExecutor(max_workers=max(1, process_count)) as executor:
+        digests = list(executor.map(hash_file_contents, paths, chunksize=_FILES_PER_TASK))
+    mismatched_files.extend(file.destination for file, source_digest, destination_digest
+                            in zip(sample, digests[0::2], digests[1::2])
+                            if source_digest != destination_digest)
+
+    result = VerificationResult(
+        len(sample),
+        sum(file.size for file in sample),
+        time.perf_counter() - start,
+        mismatched_files,
+        missing_files)
+    log = logging.getLogger(__name__)
+    log.log(
+        logging.INFO,
+        f'Verified {result.checked_file_count} of {index.file_count} files '
+        f'({result.checked_byte_count / MEGABYTE:.1f} MB) in {result.seconds:.1f} s: '
+        f'{len(result.mismatched_files)} differ and {len(result.missing_files)} are missing')
+    return result
+
+
+def hash_file_contents(path: str, buffer_size: int = DEFAULT_BUFFER_SIZE) -> bytes:
+    """
+    Computes a digest of the contents of a file, with xxhash if it is installed and BLAKE2 otherwise.
+
+    :param path: The file to hash.
+    :param buffer_size: The number of bytes to read at once.
+    :return: The digest.
+    """
+    digest = xxhash.xxh3_128() if xxhash is not None else hashlib.blake2b()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(buffer_size), b''):
+            digest.update(block)
+    return digest.digest()
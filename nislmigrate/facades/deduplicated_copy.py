@@ -0,0 +1,172 @@
+"""Capture each distinct file of a directory once and link the duplicates back on restore."""
+
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Tuple
+
+from nislmigrate.facades.parallel_copy import (
+    copy_file_contents,
+    DEFAULT_BUFFER_SIZE,
+    DEFAULT_WORKER_COUNT,
+    FileToCopy,
+    FileTreeIndex,
+    hardlink_file,
+    hash_file,
+    MEGABYTE,
+    run_bounded,
+)
+from nislmigrate.logs.migration_error import MigrationError
+
+DUPLICATES_FILE_NAME = 'nislmigrate-duplicates.json'
+DUPLICATES_FORMAT_VERSION = 1
+
+
+class DuplicateFile(NamedTuple):
+    """
+    A file whose contents are the same as those of another file that is captured.
+    """
+    file: FileToCopy
+    original: FileToCopy
+
+
+def is_deduplicated_capture(directory: str) -> bool:
+    """
+    Determines whether a captured directory leaves out duplicate files that are linked back on restore.
+
+    :param directory: The captured directory.
+    :return: True if the directory holds a list of duplicate files.
+    """
+    return os.path.isfile(os.path.join(directory, DUPLICATES_FILE_NAME))
+
+
+def find_duplicate_files(
+        files: List[FileToCopy],
+        worker_count: int = DEFAULT_WORKER_COUNT,
+        buffer_size: int = DEFAULT_BUFFER_SIZE) -> List[DuplicateFile]:
+    """
+    Finds the files with the same contents as an earlier file in a list. Only files that
+    share their size with another file are hashed, since a file of a unique size can
+    not be a duplicate.
+
+    :param files: The files to search.
+    :param worker_count: The number of files to hash at once.
+    :param buffer_size: The number of bytes to read at once.
+    :return: Each file that duplicates an earlier one, with the earlier file.
+    """
+    files_by_size: Dict[int, List[FileToCopy]] = defaultdict(list)
+    for file in files:
+        files_by_size[file.size].append(file)
+    candidates = [file for same_size in files_by_size.values() if len(same_size) > 1 for file in same_size]
+    hashes = run_bounded(worker_count, lambda file: hash_file(file.source, buffer_size), candidates)
+    originals: Dict[Tuple[int, bytes], FileToCopy] = {}
+    duplicates = []
+    for file, content_hash in zip(candidates, hashes):
+        original = originals.setdefault((file.size, content_hash), file)
+        if original is not file:
+            duplicates.append(DuplicateFile(file, original))
+    return duplicates
+
+
+def remove_duplicate_files(index: FileTreeIndex, duplicates: List[DuplicateFile]) -> FileTreeIndex:
+    """
+    Removes duplicate files from an index, keeping every directory so that duplicates
+    can be linked back into them.
+
+    :param index: The index to remove the files from.
+    :param duplicates: The duplicate files to remove.
+    :return: The index without the duplicate files.
+    """
+    duplicate_sources = {duplicate.file.source for duplicate in duplicates}
+    files = [file for file in index.files if file.source not in duplicate_sources]
+    return FileTreeIndex(
+        index.directories,
+        files,
+        sum(file.size for file in files),
+        index.depth,
+        [file for file in index.largest_files if file.source not in duplicate_sources])
+
+
+def write_duplicate_list(to_directory: str, duplicates: List[DuplicateFile]) -> None:
+    """
+    Records which captured files duplicates are restored from.
+
+    :param to_directory: The directory the files were captured to.
+    :param duplicates: The duplicate files left out of the capture.
+    """
+    duplicate_list = {
+        'version': DUPLICATES_FORMAT_VERSION,
+        'duplicates': [[_to_list_path(to_directory, duplicate.file.destination),
+                        _to_list_path(to_directory, duplicate.original.destination)]
+                       for duplicate in duplicates],
+    }
+    os.makedirs(to_directory, exist_ok=True)
+    with open(os.path.join(to_directory, DUPLICATES_FILE_NAME), 'w', encoding='utf-8') as file:
+        json.dump(duplicate_list, file)
+    log = logging.getLogger(__name__)
+    byte_count = sum(duplicate.file.size for duplicate in duplicates)
+    log.log(logging.INFO, f'Left out {len(duplicates)} duplicate files ({byte_count / MEGABYTE:.1f} MB)')
+
+
+def without_duplicate_list(index: FileTreeIndex) -> FileTreeIndex:
+    """
+    Removes the list of duplicates from the index of a captured directory.
+
+    :param index: The index of the captured directory.
+    :return: The index of the captured files alone.
+    """
+    duplicate_list_path = os.path.join(index.directories[0][0], DUPLICATES_FILE_NAME)
+    files = [file for file in index.files if file.source != duplicate_list_path]
+    return FileTreeIndex(
+        index.directories,
+        files,
+        sum(file.size for file in files),
+        index.depth,
+        [file for file in index.largest_files if file.source != duplicate_list_path])
+
+
+def restore_duplicate_files(
+        from_directory: str,
+        to_directory: str,
+        worker_count: int = DEFAULT_WORKER_COUNT,
+        buffer_size: int = DEFAULT_BUFFER_SIZE) -> None:
+    """
+    Recreates the duplicates left out of a captured directory, once the captured files
+    have been restored, as hard links to the files they duplicate, or as copies where
+    files can not be linked.
+
+    :param from_directory: The captured directory.
+    :param to_directory: The directory the captured files were restored to.
+    :param worker_count: The number of files to link or copy at once.
+    :param buffer_size: The number of bytes to copy at once.
+    """
+    start = time.perf_counter()
+    with open(os.path.join(from_directory, DUPLICATES_FILE_NAME), encoding='utf-8') as file:
+        duplicate_list = json.load(file)
+    if duplicate_list.get('version', 0) > DUPLICATES_FORMAT_VERSION:
+        raise MigrationError(f'Duplicate list was written by a newer version of nislmigrate: {from_directory}')
+
+    def restore(paths: List[str]) -> bool:
+        duplicate_path, original_path = (_from_list_path(to_directory, path) for path in paths)
+        os.makedirs(os.path.dirname(duplicate_path), exist_ok=True)
+        if hardlink_file(original_path, duplicate_path):
+            return True
+        copy_file_contents(original_path, duplicate_path, os.path.getsize(original_path), buffer_size)
+        return False
+
+    linked = run_bounded(worker_count, restore, duplicate_list['duplicates'])
+    log = logging.getLogger(__name__)
+    log.log(
+        logging.INFO,
+        f'Restored {len(linked)} duplicate files, {sum(linked)} of them as links, '
+        f'in {time.perf_counter() - start:.1f} s')
+
+
+def _to_list_path(root: str, path: str) -> str:
+    return os.path.relpath(path, root).replace(os.sep, '/')
+
+
+def _from_list_path(root: str, path: str) -> str:
+    return os.path.join(root, *path.split('/'))
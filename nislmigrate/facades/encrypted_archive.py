@@ -0,0 +1,532 @@
+"""Encrypt and decrypt archive files in independently encrypted chunks."""
+
+import io
+import json
+import os
+import struct
+import tarfile
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Callable, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, TypeVar
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from nislmigrate.facades.tar_extraction import extract_member
+from nislmigrate.logs.migration_error import MigrationError
+
+ARCHIVE_MAGIC = b'NISLMENC'
+ARCHIVE_FORMAT_VERSION = 3
+# Format versions 1 and 2 were never part of a release and are not read.
+_OLDEST_SUPPORTED_FORMAT_VERSION = 3
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+DEFAULT_WORKER_COUNT = os.cpu_count() or 1
+DEFAULT_KEY_DERIVATION_ITERATIONS = 320000
+SALT_SIZE = 16
+PBKDF2_HMAC_SHA256 = 1
+INDEX_MAGIC = b'NIDX'
+
+# magic, format version, plaintext chunk size
+_HEADER = struct.Struct('>8sBI')
+# key derivation function, iterations, salt (format version 2 and later)
+_KEY_DERIVATION_HEADER = struct.Struct(f'>BI{SALT_SIZE}s')
+# length of the encrypted chunk that follows
+_CHUNK_LENGTH = struct.Struct('>I')
+# sequence number prefixed to the plaintext of each chunk (format version 3 and later)
+_CHUNK_SEQUENCE = struct.Struct('>Q')
+# offset and length of the encrypted index, index magic (format version 3 and later)
+_FOOTER = struct.Struct('>QI4s')
+# The sequence number the index is encrypted with, which no chunk can have.
+_INDEX_SEQUENCE = 2 ** 64 - 1
+
+_WRONG_SECRET_ERROR = 'Unable to decrypt captured data. Verify the --secret matches the one used during capture.'
+
+_T = TypeVar('_T')
+_R = TypeVar('_R')
+
+
+class KeyDerivation(NamedTuple):
+    """
+    The parameters used to derive the encryption key of an archive from the secret.
+    """
+    salt: bytes
+    iterations: int
+
+
+class ArchiveMember(NamedTuple):
+    """
+    Where a tar member is stored within the plaintext of an encrypted archive.
+    """
+    name: str
+    offset: int
+    end: int
+
+
+class _Header(NamedTuple):
+    version: int
+    chunk_size: int
+    key_derivation: KeyDerivation
+
+
+# Archives written before the key derivation parameters were stored in the
+# header all used a fixed salt and iteration count.
+LEGACY_KEY_DERIVATION = KeyDerivation(b'0' * SALT_SIZE, DEFAULT_KEY_DERIVATION_ITERATIONS)
+
+
+def new_key_derivation(iterations: int = DEFAULT_KEY_DERIVATION_ITERATIONS) -> KeyDerivation:
+    """
+    Creates key derivation parameters with a new random salt.
+
+    :param iterations: The number of PBKDF2 iterations to derive the key with.
+    :return: The key derivation parameters.
+    """
+    if iterations < 1:
+        raise MigrationError(f'The key derivation iteration count must be positive, not {iterations}.')
+    return KeyDerivation(os.urandom(SALT_SIZE), iterations)
+
+
+def read_key_derivation(path: str) -> KeyDerivation:
+    """
+    Reads the key derivation parameters an encrypted archive was written with.
+
+    :param path: The path of the encrypted archive.
+    :return: The parameters stored in the archive header, or the legacy
+             parameters for archives written without them.
+    """
+    with open(path, 'rb') as file:
+        return _read_header(file, path).key_derivation
+
+
+def is_chunked_archive(path: str) -> bool:
+    """
+    Determines whether a file was written by ChunkedEncrypter rather than by
+    encrypting the whole file with a single Fernet token.
+
+    :param path: The path of the encrypted file.
+    :return: True if the file starts with the chunked archive header.
+    """
+    with open(path, 'rb') as file:
+        return file.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC
+
+
+def index_tar_members(tar_path: str) -> List[ArchiveMember]:
+    """
+    Lists where each member of an uncompressed tar file is stored, so that the
+    member can later be read back without reading the rest of the archive.
+
+    :param tar_path: The tar file to index.
+    :return: The members of the tar file in archive order.
+    """
+    with tarfile.open(tar_path, 'r:') as tar:
+        return [
+            ArchiveMember(
+                _normalize_member_name(member.name),
+                member.offset,
+                member.offset_data + _round_up_to_block(member.size if member.isreg() else 0))
+            for member in tar.getmembers()
+        ]
+
+
+class ChunkedEncrypter:
+    """
+    Encrypts files as a sequence of independently encrypted chunks so that
+    the chunks can be encrypted and decrypted on several threads at once.
+    Each chunk is authenticated together with its position in the file, and an
+    encrypted index at the end of the archive records where every chunk and
+    tar member is stored.
+    """
+    def __init__(
+            self,
+            encrypter: Fernet,
+            worker_count: int = DEFAULT_WORKER_COUNT,
+            chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Creates a new instance of ChunkedEncrypter.
+
+        :param encrypter: The Fernet instance used to encrypt each chunk.
+        :param worker_count: The number of threads to encrypt or decrypt chunks on.
+        :param chunk_size: The number of plaintext bytes in each chunk.
+        """
+        self.encrypter = encrypter
+        self.worker_count = max(1, worker_count)
+        self.chunk_size = chunk_size
+
+    def encrypt_file(
+            self,
+            source_path: str,
+            encrypted_path: str,
+            key_derivation: KeyDerivation,
+            members: Iterable[ArchiveMember] = ()) -> None:
+        """
+        Encrypts a file into a chunked archive.
+
+        :param source_path: The file to encrypt.
+        :param encrypted_path: The path to write the encrypted archive to.
+        :param key_derivation: The parameters the encryption key was derived with,
+                               recorded in the header so the key can be derived again.
+        :param members: The tar members stored in the file, see index_tar_members.
+        """
+        with open(source_path, 'rb') as source, self.open_archive(encrypted_path, key_derivation) as writer:
+            for chunk in _read_chunks(source, self.chunk_size):
+                writer.write(chunk)
+            writer.finish(members)
+
+    @contextmanager
+    def open_archive(self, encrypted_path: str, key_derivation: KeyDerivation) -> Iterator['ChunkedArchiveWriter']:
+        """
+        Opens a chunked archive to write plaintext into, encrypting each chunk as soon as
+        it is full. The archive is complete once ChunkedArchiveWriter.finish is called,
+        and is removed if an error is raised before then.
+
+        :param encrypted_path: The path to write the encrypted archive to.
+        :param key_derivation: The parameters the encryption key was derived with,
+                               recorded in the header so the key can be derived again.
+        :return: The writer to write the plaintext to.
+        """
+        try:
+            with open(encrypted_path, 'wb') as destination, \
+                    ThreadPoolExecutor(max_workers=self.worker_count) as executor:
+                destination.write(_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_FORMAT_VERSION, self.chunk_size))
+                destination.write(_KEY_DERIVATION_HEADER.pack(
+                    PBKDF2_HMAC_SHA256,
+                    key_derivation.iterations,
+                    key_derivation.salt))
+                writer = ChunkedArchiveWriter(
+                    destination,
+                    executor,
+                    self.__encrypt_chunk,
+                    self.chunk_size,
+                    self.worker_count * 2)
+                yield writer
+                if not writer.is_finished:
+                    raise MigrationError(f'Encrypted archive was not finished: {encrypted_path}')
+        except BaseException:
+            if os.path.exists(encrypted_path):
+                os.remove(encrypted_path)
+            raise
+
+    def read_properties(self, encrypted_path: str) -> Dict[str, Any]:
+        """
+        Reads the properties recorded in the index of a chunked archive, without
+        decrypting any of its chunks.
+
+        :param encrypted_path: The encrypted archive to read.
+        :return: The properties passed to ChunkedArchiveWriter.finish, or an empty
+                 dictionary for archives written without properties or without chunks.
+        """
+        if not is_chunked_archive(encrypted_path):
+            return {}
+        with open(encrypted_path, 'rb') as source:
+            _read_header(source, encrypted_path)
+            return self.__read_index(source, encrypted_path).get('properties', {})
+
+    def decrypt_file(self, encrypted_path: str, destination_path: str) -> None:
+        """
+        Decrypts a chunked archive written by encrypt_file.
+
+        :param encrypted_path: The encrypted archive to decrypt.
+        :param destination_path: The path to write the decrypted contents to.
+        :raises MigrationError: if the secret is wrong or the archive is corrupt. Every
+                                corrupt chunk is reported along with the paths stored in it.
+        """
+        corrupt_chunks: List[int] = []
+        with open(encrypted_path, 'rb') as source, open(destination_path, 'wb') as destination:
+            header = _read_header(source, encrypted_path)
+            index = self.__read_index(source, encrypted_path)
+            chunks = enumerate(_read_indexed_tokens(source, index['chunks'], encrypted_path))
+            with ThreadPoolExecutor(max_workers=self.worker_count) as executor:
+                for sequence, text in enumerate(self.__map_in_order(executor, self.__try_decrypt_chunk, chunks)):
+                    if text is None:
+                        corrupt_chunks.append(sequence)
+                    elif not corrupt_chunks:
+                        destination.write(text)
+        if corrupt_chunks:
+            raise MigrationError(_describe_corruption(encrypted_path, header, index, corrupt_chunks))
+
+    def extract_path(self, encrypted_path: str, member_path: str, to_directory: str) -> List[str]:
+        """
+        Extracts one file or directory from an encrypted tar archive, decrypting
+        only the chunks that hold it.
+
+        :param encrypted_path: The encrypted archive to read.
+        :param member_path: The path of the file or directory within the archive.
+        :param to_directory: The directory to extract into.
+        :return: The paths within the archive that were extracted.
+        """
+        with open(encrypted_path, 'rb') as source:
+            header = _read_header(source, encrypted_path)
+            index = self.__read_index(source, encrypted_path)
+            wanted = _normalize_member_name(member_path)
+            selected = {member[0] for member in index['members'] if _is_same_or_child_path(member[0], wanted)}
+            if not selected:
+                raise MigrationError(f"No data found at '{member_path}' in: {encrypted_path}")
+
+            def decrypt(sequence: int, token: bytes) -> bytes:
+                text = self.__try_decrypt_chunk((sequence, token))
+                if text is None:
+                    raise MigrationError(_describe_corruption(encrypted_path, header, index, [sequence]))
+                return text
+
+            locations = [ArchiveMember(*member) for member in index['members'] if member[0] in selected]
+            reader = _ChunkRangeReader(
+                source,
+                index['chunks'],
+                header.chunk_size,
+                min(member.offset for member in locations),
+                max(member.end for member in locations),
+                decrypt)
+            extracted = []
+            with tarfile.open(fileobj=io.BufferedReader(reader), mode='r|') as tar:
+                for tar_member in tar:
+                    name = _normalize_member_name(tar_member.name)
+                    if name in selected:
+                        extract_member(tar, tar_member, to_directory)
+                        extracted.append(name)
+            return extracted
+
+    def __encrypt_chunk(self, chunk: Tuple[int, bytes]) -> bytes:
+        sequence, text = chunk
+        return self.encrypter.encrypt(_CHUNK_SEQUENCE.pack(sequence) + text)
+
+    def __try_decrypt_chunk(self, chunk: Tuple[int, bytes]) -> Optional[bytes]:
+        sequence, token = chunk
+        try:
+            text = self.encrypter.decrypt(token)
+        except InvalidToken:
+            return None
+        if text[:_CHUNK_SEQUENCE.size] != _CHUNK_SEQUENCE.pack(sequence):
+            return None
+        return text[_CHUNK_SEQUENCE.size:]
+
+    def __read_index(self, source: BinaryIO, path: str) -> Dict[str, Any]:
+        """
+        Reads and authenticates the index at the end of the archive. Failing to
+        decrypt the index means the secret is wrong, since a corrupt chunk
+        cannot affect it.
+        """
+        first_chunk_offset = source.tell()
+        source.seek(0, os.SEEK_END)
+        if source.tell() - first_chunk_offset < _FOOTER.size:
+            raise MigrationError(f'Encrypted archive is truncated: {path}')
+        source.seek(-_FOOTER.size, os.SEEK_END)
+        index_offset, index_length, magic = _FOOTER.unpack(source.read(_FOOTER.size))
+        if magic != INDEX_MAGIC:
+            raise MigrationError(f'Encrypted archive is truncated or its index is corrupt: {path}')
+        source.seek(index_offset)
+        index_text = self.__try_decrypt_chunk((_INDEX_SEQUENCE, _read_exactly(source, index_length, path)))
+        if index_text is None:
+            raise MigrationError(_WRONG_SECRET_ERROR)
+        return json.loads(index_text)
+
+    def __map_in_order(
+            self,
+            executor: Executor,
+            function: Callable[[_T], _R],
+            items: Iterable[_T]) -> Iterator[_R]:
+        return map_in_order(executor, function, items, self.worker_count * 2)
+
+
+class ChunkedArchiveWriter(io.RawIOBase):
+    """
+    A stream that encrypts what is written to it into the chunks of an archive, see
+    ChunkedEncrypter.open_archive. Tar files can be written to it directly so that
+    their plaintext is never stored on disk.
+    """
+    def __init__(
+            self,
+            destination: BinaryIO,
+            executor: Executor,
+            encrypt_chunk: Callable[[Tuple[int, bytes]], bytes],
+            chunk_size: int,
+            window: int):
+        self.__destination = destination
+        self.__executor = executor
+        self.__encrypt_chunk = encrypt_chunk
+        self.__chunk_size = chunk_size
+        self.__window = window
+        self.__buffer = bytearray()
+        self.__pending: Deque[Future] = deque()
+        self.__chunk_locations: List[Tuple[int, int]] = []
+        self.is_finished = False
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.__buffer.extend(data)
+        while len(self.__buffer) >= self.__chunk_size:
+            self.__submit(bytes(self.__buffer[:self.__chunk_size]))
+            del self.__buffer[:self.__chunk_size]
+        return len(data)
+
+    def finish(self, members: Iterable[ArchiveMember] = (), properties: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Encrypts the rest of the plaintext and writes the index of the archive.
+
+        :param members: The tar members stored in the plaintext.
+        :param properties: Values to record in the encrypted index, see ChunkedEncrypter.read_properties.
+        """
+        if self.__buffer:
+            self.__submit(bytes(self.__buffer))
+            self.__buffer.clear()
+        while self.__pending:
+            self.__write_token(self.__pending.popleft().result())
+        index: Dict[str, Any] = {
+            'chunks': self.__chunk_locations,
+            'members': [list(member) for member in members],
+        }
+        if properties:
+            index['properties'] = properties
+        index_token = self.__encrypt_chunk((_INDEX_SEQUENCE, json.dumps(index).encode('utf-8')))
+        index_offset = self.__destination.tell()
+        self.__destination.write(index_token)
+        self.__destination.write(_FOOTER.pack(index_offset, len(index_token), INDEX_MAGIC))
+        self.is_finished = True
+
+    def __submit(self, text: bytes) -> None:
+        sequence = len(self.__chunk_locations) + len(self.__pending)
+        self.__pending.append(self.__executor.submit(self.__encrypt_chunk, (sequence, text)))
+        if len(self.__pending) >= self.__window:
+            self.__write_token(self.__pending.popleft().result())
+
+    def __write_token(self, token: bytes) -> None:
+        self.__destination.write(_CHUNK_LENGTH.pack(len(token)))
+        self.__chunk_locations.append((self.__destination.tell(), len(token)))
+        self.__destination.write(token)
+
+
+def map_in_order(
+        executor: Executor,
+        function: Callable[[_T], _R],
+        items: Iterable[_T],
+        window: int) -> Iterator[_R]:
+    """
+    Applies a function to each item on an executor and yields the results in the
+    order of the items, keeping at most window calls in progress.
+
+    :param executor: The executor to call the function on.
+    :param function: The function to call for each item.
+    :param items: The items to pass to the function.
+    :param window: The number of calls to keep in progress.
+    :return: The result of each call, in the order of the items.
+    """
+    pending: Deque[Future] = deque()
+    for item in items:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class _ChunkRangeReader(io.RawIOBase):
+    """
+    Presents a range of the plaintext of a chunked archive as a readable stream,
+    decrypting each chunk only once the range reaches it.
+    """
+    def __init__(
+            self,
+            source: BinaryIO,
+            chunk_locations: List[Tuple[int, int]],
+            chunk_size: int,
+            start: int,
+            end: int,
+            decrypt: Callable[[int, bytes], bytes]):
+        self.__source = source
+        self.__chunk_locations = chunk_locations
+        self.__chunk_size = chunk_size
+        self.__position = start
+        self.__end = end
+        self.__decrypt = decrypt
+        self.__sequence = -1
+        self.__text = b''
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.__position >= self.__end:
+            return 0
+        sequence, offset_in_chunk = divmod(self.__position, self.__chunk_size)
+        if sequence != self.__sequence:
+            offset, length = self.__chunk_locations[sequence]
+            self.__source.seek(offset)
+            self.__text = self.__decrypt(sequence, self.__source.read(length))
+            self.__sequence = sequence
+        size = min(len(self.__text) - offset_in_chunk, self.__end - self.__position, len(buffer))
+        if size <= 0:
+            return 0
+        buffer[:size] = self.__text[offset_in_chunk:offset_in_chunk + size]
+        self.__position += size
+        return size
+
+
+def _read_header(source: BinaryIO, path: str) -> _Header:
+    """
+    Reads the archive header, leaving the source positioned at the first chunk.
+    Files without a header are archives encrypted as a single Fernet token.
+    """
+    magic = source.read(len(ARCHIVE_MAGIC))
+    if magic != ARCHIVE_MAGIC:
+        source.seek(0)
+        return _Header(0, 0, LEGACY_KEY_DERIVATION)
+    _, version, chunk_size = _HEADER.unpack(magic + _read_exactly(source, _HEADER.size - len(magic), path))
+    if version > ARCHIVE_FORMAT_VERSION:
+        raise MigrationError(f'Encrypted archive was written by a newer version of nislmigrate: {path}')
+    if version < _OLDEST_SUPPORTED_FORMAT_VERSION:
+        raise MigrationError(f'Unsupported encrypted archive format version {version}: {path}')
+    function, iterations, salt = _KEY_DERIVATION_HEADER.unpack(
+        _read_exactly(source, _KEY_DERIVATION_HEADER.size, path))
+    if function != PBKDF2_HMAC_SHA256:
+        raise MigrationError(f'Unsupported key derivation function {function}: {path}')
+    return _Header(version, chunk_size, KeyDerivation(salt, iterations))
+
+
+def _describe_corruption(path: str, header: _Header, index: Dict[str, Any], corrupt_chunks: List[int]) -> str:
+    lines = [f'Encrypted archive is corrupt: {path}']
+    for sequence in corrupt_chunks:
+        offset, length = index['chunks'][sequence]
+        start = sequence * header.chunk_size
+        end = start + header.chunk_size
+        affected = [name for name, member_offset, member_end in index['members']
+                    if member_offset < end and member_end > start]
+        lines.append(f'  chunk {sequence} at bytes {offset}-{offset + length} failed authentication, '
+                     f'affected paths: {", ".join(affected) or "none"}')
+    return '\n'.join(lines)
+
+
+def _read_exactly(source: BinaryIO, size: int, path: str) -> bytes:
+    data = source.read(size)
+    if len(data) != size:
+        raise MigrationError(f'Encrypted archive is truncated: {path}')
+    return data
+
+
+def _read_chunks(source: BinaryIO, chunk_size: int) -> Iterator[bytes]:
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _read_indexed_tokens(source: BinaryIO, chunk_locations: List[Tuple[int, int]], path: str) -> Iterator[bytes]:
+    for offset, length in chunk_locations:
+        source.seek(offset)
+        yield _read_exactly(source, length, path)
+
+
+def _normalize_member_name(name: str) -> str:
+    name = name.replace('\\', '/')
+    while name.startswith('./'):
+        name = name[2:]
+    name = name.strip('/')
+    return '' if name == '.' else name
+
+
+def _is_same_or_child_path(name: str, path: str) -> bool:
+    return not path or name == path or name.startswith(path + '/')
+
+
+def _round_up_to_block(size: int) -> int:
+    return -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
@@ -0,0 +1,197 @@
+"""Capture directory trees into encrypted archives, in full or as the files changed since an earlier capture."""
+
+import io
+import os
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from nislmigrate.facades.encrypted_archive import (
+    ArchiveMember,
+    ChunkedEncrypter,
+    KeyDerivation,
+    map_in_order,
+)
+from nislmigrate.logs.migration_error import MigrationError
+
+# The index property holding the state of the tree an archive was captured from.
+TREE_STATE_PROPERTY = 'tree'
+DEFAULT_READ_WORKER_COUNT = 16
+# Files up to this size are read ahead on several threads; larger files are streamed.
+SMALL_FILE_SIZE = 1024 * 1024
+
+_NO_TREE_STATE_ERROR = """
+
+The earlier capture at {path} does not record which files it holds, so it
+can not be updated with only the files that changed. Capture into an empty
+migration directory instead.
+
+"""
+
+
+class TreeState(NamedTuple):
+    """
+    The directories and files of a tree, with the modification time in nanoseconds
+    and size of each file. Paths are relative to the tree and separated by '/'.
+    """
+    directories: List[str]
+    files: Dict[str, Tuple[int, int]]
+
+
+def scan_tree(directory: str) -> TreeState:
+    """
+    Lists the directories and files of a tree.
+
+    :param directory: The root of the tree.
+    :return: The state of the tree.
+    """
+    directories: List[str] = []
+    files: Dict[str, Tuple[int, int]] = {}
+    for root, directory_names, file_names in os.walk(directory):
+        relative_root = os.path.relpath(root, directory)
+        for name in directory_names:
+            directories.append(_to_tree_path(relative_root, name))
+        for name in file_names:
+            status = os.stat(os.path.join(root, name))
+            files[_to_tree_path(relative_root, name)] = (status.st_mtime_ns, status.st_size)
+    return TreeState(sorted(directories), files)
+
+
+def find_changed_files(previous: Optional[TreeState], current: TreeState) -> List[str]:
+    """
+    Finds the files that were added or changed since an earlier state of a tree. A
+    file changed if its modification time or size differs, so that files moved into
+    place with an old modification time, such as accepted minion keys, are found too.
+
+    :param previous: The earlier state, or None to treat every file as added.
+    :param current: The current state.
+    :return: The paths of the added and changed files, sorted.
+    """
+    if previous is None:
+        return sorted(current.files)
+    return sorted(path for path, status in current.files.items()
+                  if previous.files.get(path) != status)
+
+
+def find_removed_paths(states: List[TreeState]) -> Tuple[List[str], List[str]]:
+    """
+    Finds the files and directories that earlier captures of a tree hold but the
+    last capture does not, so they can be removed after restoring every capture.
+
+    :param states: The states of the tree, oldest first.
+    :return: The removed files and the removed directories, deepest first.
+    """
+    last = states[-1]
+    files = {path for state in states[:-1] for path in state.files} - set(last.files)
+    directories = {path for state in states[:-1] for path in state.directories} - set(last.directories)
+    return sorted(files), sorted(directories, reverse=True)
+
+
+def increment_path(encrypted_file_path: str, number: int) -> str:
+    """
+    Gets the path of an incremental capture written next to a full capture.
+
+    :param encrypted_file_path: The path of the full capture.
+    :param number: The number of the increment, starting at 1.
+    :return: The path of the increment.
+    """
+    return f'{encrypted_file_path}.{number}'
+
+
+def find_tree_archives(encrypted_file_path: str) -> List[str]:
+    """
+    Lists a full capture and the increments written next to it.
+
+    :param encrypted_file_path: The path of the full capture.
+    :return: The paths of the captures, oldest first.
+    """
+    archives = [encrypted_file_path]
+    while os.path.isfile(increment_path(encrypted_file_path, len(archives))):
+        archives.append(increment_path(encrypted_file_path, len(archives)))
+    return archives
+
+
+def read_tree_state(encrypter: ChunkedEncrypter, encrypted_path: str) -> Optional[TreeState]:
+    """
+    Reads the state of the tree an archive was captured from.
+
+    :param encrypter: The encrypter for the secret the archive was written with.
+    :param encrypted_path: The archive to read.
+    :return: The state, or None if the archive was written without one.
+    """
+    state: Optional[Dict[str, Any]] = encrypter.read_properties(encrypted_path).get(TREE_STATE_PROPERTY)
+    if state is None:
+        return None
+    files = {path: (status[0], status[1]) for path, status in state['files'].items()}
+    return TreeState(state['directories'], files)
+
+
+def verify_tree_state(state: Optional[TreeState], encrypted_path: str) -> TreeState:
+    """
+    Raises an error if an earlier capture can not be updated incrementally.
+
+    :param state: The state read from the capture, see read_tree_state.
+    :param encrypted_path: The path of the capture.
+    :return: The state.
+    """
+    if state is None:
+        raise MigrationError(_NO_TREE_STATE_ERROR.format(path=encrypted_path))
+    return state
+
+
+def write_tree_archive(
+        encrypter: ChunkedEncrypter,
+        from_directory: str,
+        encrypted_path: str,
+        key_derivation: KeyDerivation,
+        state: TreeState,
+        file_paths: List[str],
+        read_worker_count: int = DEFAULT_READ_WORKER_COUNT) -> None:
+    """
+    Writes the directories of a tree and some of its files to an encrypted archive as
+    a tar stream, without writing the tar file to disk. Small files are read on
+    several threads ahead of the stream, since opening many tiny files one after the
+    other takes far longer than encrypting them.
+
+    :param encrypter: The encrypter to write the archive with.
+    :param from_directory: The root of the tree.
+    :param encrypted_path: The path to write the archive to.
+    :param key_derivation: The parameters the encryption key was derived with.
+    :param state: The state of the tree, recorded in the archive.
+    :param file_paths: The paths of the files to write, relative to the tree.
+    :param read_worker_count: The number of small files to read at once.
+    """
+    def read_small_file(path: str) -> Optional[bytes]:
+        full_path = os.path.join(from_directory, *path.split('/'))
+        if state.files[path][1] > SMALL_FILE_SIZE:
+            return None
+        with open(full_path, 'rb') as file:
+            return file.read()
+
+    members: List[ArchiveMember] = []
+    with encrypter.open_archive(encrypted_path, key_derivation) as writer, \
+            ThreadPoolExecutor(max_workers=read_worker_count) as executor:
+        with tarfile.open(fileobj=writer, mode='w|') as tar:
+            for path in state.directories:
+                start = tar.offset
+                tar.addfile(tar.gettarinfo(os.path.join(from_directory, *path.split('/')), arcname=path))
+                members.append(ArchiveMember(path, start, tar.offset))
+            contents = map_in_order(executor, read_small_file, file_paths, read_worker_count * 2)
+            for path, content in zip(file_paths, contents):
+                full_path = os.path.join(from_directory, *path.split('/'))
+                start = tar.offset
+                info = tar.gettarinfo(full_path, arcname=path)
+                if content is not None:
+                    info.size = len(content)
+                    tar.addfile(info, io.BytesIO(content))
+                else:
+                    with open(full_path, 'rb') as file:
+                        tar.addfile(info, file)
+                members.append(ArchiveMember(path, start, tar.offset))
+        writer.finish(members, {TREE_STATE_PROPERTY: state._asdict()})
+
+
+def _to_tree_path(relative_root: str, name: str) -> str:
+    if relative_root == os.curdir:
+        return name
+    return '/'.join(relative_root.split(os.sep) + [name])
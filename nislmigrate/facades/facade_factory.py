@@ -1,7 +1,10 @@
 from nislmigrate.facades.ni_web_server_manager_facade import NiWebServerManagerFacade
 from nislmigrate.facades.file_system_facade import FileSystemFacade
+from nislmigrate.facades.git_facade import GitFacade
 from nislmigrate.facades.mongo_facade import MongoFacade
+from nislmigrate.facades.object_store_facade import ObjectStoreFacade
 from nislmigrate.facades.process_facade import ProcessFacade
+from nislmigrate.facades.redis_facade import RedisFacade
 from nislmigrate.facades.system_link_service_manager_facade import SystemLinkServiceManagerFacade
 
 
@@ -20,6 +23,9 @@ class FacadeFactory:
         self.file_system_facade: FileSystemFacade = FileSystemFacade()
         self.ni_web_server_manager_facade: NiWebServerManagerFacade = NiWebServerManagerFacade()
         self.system_link_service_manager_facade: SystemLinkServiceManagerFacade = SystemLinkServiceManagerFacade()
+        self.object_store_facade: ObjectStoreFacade = ObjectStoreFacade()
+        self.redis_facade: RedisFacade = RedisFacade(self.process_facade)
+        self.git_facade: GitFacade = GitFacade(self.process_facade)
 
     def get_mongo_facade(self) -> MongoFacade:
         """
@@ -47,3 +53,21 @@ class FacadeFactory:
 
     def get_process_facade(self) -> ProcessFacade:
         return self.process_facade
+
+    def get_object_store_facade(self) -> ObjectStoreFacade:
+        """
+        Gets an ObjectStoreFacade instance.
+        """
+        return self.object_store_facade
+
+    def get_redis_facade(self) -> RedisFacade:
+        """
+        Gets a RedisFacade instance.
+        """
+        return self.redis_facade
+
+    def get_git_facade(self) -> GitFacade:
+        """
+        Gets a GitFacade instance.
+        """
+        return self.git_facade
@@ -0,0 +1,173 @@
+"""Compare the files that metadata refers to with the files in a file store."""
+
+import itertools
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, TypeVar
+
+from nislmigrate.facades.parallel_copy import DEFAULT_WORKER_COUNT, ProgressReporter, run_bounded
+
+# The number of rows written to the database at once, and so the number of files stat'ed by each task.
+CHECK_BATCH_SIZE = 1000
+
+_SCHEMA = """
+PRAGMA journal_mode = OFF;
+PRAGMA synchronous = OFF;
+CREATE TABLE files (key TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL);
+CREATE TABLE refs (key TEXT NOT NULL, path TEXT NOT NULL, size INTEGER);
+"""
+_SIZE_MISMATCHES_QUERY = """
+SELECT refs.path, refs.size, files.size FROM refs JOIN files ON files.key = refs.key
+WHERE refs.size IS NOT NULL AND refs.size != files.size
+"""
+_UNRESOLVED_REFERENCES_QUERY = """
+SELECT refs.path, refs.size FROM refs WHERE NOT EXISTS (SELECT 1 FROM files WHERE files.key = refs.key)
+"""
+_UNREFERENCED_FILES_QUERY = """
+SELECT files.path FROM files WHERE NOT EXISTS (SELECT 1 FROM refs WHERE refs.key = files.key)
+"""
+
+_T = TypeVar('_T')
+
+
+class FileReference(NamedTuple):
+    """
+    A file that metadata refers to.
+    """
+    path: str
+    size: Optional[int]
+
+
+class SizeMismatch(NamedTuple):
+    """
+    A referenced file whose size differs from the size its metadata records.
+    """
+    path: str
+    expected_size: int
+    actual_size: int
+
+
+class FileStoreCheckResult(NamedTuple):
+    """
+    What comparing metadata with a file store found.
+    """
+    referenced_file_count: int
+    missing_files: List[str]
+    size_mismatches: List[SizeMismatch]
+    unreferenced_files: List[str]
+    seconds: float
+
+    @property
+    def is_consistent(self) -> bool:
+        return not self.missing_files and not self.size_mismatches and not self.unreferenced_files
+
+
+def check_file_store(
+        data_directory: str,
+        references: Iterable[FileReference],
+        worker_count: int = DEFAULT_WORKER_COUNT) -> FileStoreCheckResult:
+    """
+    Checks that every referenced file exists with the recorded size, and finds the files
+    in a file store that nothing refers to. The file store is scanned once, and the scan
+    and the references are both written to a temporary SQLite database, so a store of tens
+    of millions of files is checked in a bounded amount of memory. References to scanned
+    files are resolved by joining the two without touching the disk again. Only references
+    the scan did not find, such as files outside the file store or added after the scan,
+    are looked up one by one on a pool of threads.
+
+    :param data_directory: The directory of the file store.
+    :param references: The files the metadata refers to. They are read once, in batches,
+                       so they can be streamed from the database.
+    :param worker_count: The number of files to look up at once.
+    :return: The missing files, the files with the wrong size and the unreferenced files.
+    """
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as temporary_directory, \
+            closing(sqlite3.connect(os.path.join(temporary_directory, 'check.db'))) as database:
+        database.executescript(_SCHEMA)
+        file_count = 0
+        if os.path.isdir(data_directory):
+            for batch in _batches(_scan_files(data_directory)):
+                database.executemany(
+                    'INSERT OR IGNORE INTO files (key, path, size) VALUES (?, ?, ?)',
+                    [(_to_key(path), path, size) for path, size in batch])
+                file_count += len(batch)
+        # Each file is normally referenced once, so the number of files estimates the number of references.
+        progress = ProgressReporter('Checked', file_count)
+        reference_count = 0
+        for references_batch in _batches(iter(references)):
+            database.executemany(
+                'INSERT INTO refs (key, path, size) VALUES (?, ?, ?)',
+                [(_to_key(reference.path), reference.path, reference.size) for reference in references_batch])
+            reference_count += len(references_batch)
+            progress.add(len(references_batch))
+        database.execute('CREATE INDEX refs_by_key ON refs (key)')
+
+        size_mismatches = [SizeMismatch(*row) for row in database.execute(_SIZE_MISMATCHES_QUERY)]
+        missing_files: List[str] = []
+        unresolved = (
+            [FileReference(*row) for row in batch]
+            for batch in _batches(database.execute(_UNRESOLVED_REFERENCES_QUERY)))
+        for missing, mismatched in run_bounded(worker_count, _look_up_files, unresolved):
+            missing_files.extend(missing)
+            size_mismatches.extend(mismatched)
+        unreferenced_files = [path for path, in database.execute(_UNREFERENCED_FILES_QUERY)]
+
+    result = FileStoreCheckResult(
+        reference_count,
+        missing_files,
+        size_mismatches,
+        unreferenced_files,
+        time.perf_counter() - start)
+    log = logging.getLogger(__name__)
+    log.log(
+        logging.INFO,
+        f'Checked {result.referenced_file_count} referenced files in {result.seconds:.1f} s: '
+        f'{len(result.missing_files)} are missing, {len(result.size_mismatches)} have the wrong size '
+        f'and {len(result.unreferenced_files)} files in {data_directory} are not referenced')
+    return result
+
+
+def _scan_files(directory: str) -> Iterator[Tuple[str, int]]:
+    """
+    Lists the path and size of every file beneath a directory, one directory at a time.
+    """
+    pending = [directory]
+    visited: Set[Tuple[int, int]] = set()
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                info = entry.stat()
+                if entry.is_dir():
+                    # Following links to directories could otherwise visit a directory forever.
+                    if (info.st_dev, info.st_ino) not in visited:
+                        visited.add((info.st_dev, info.st_ino))
+                        pending.append(entry.path)
+                else:
+                    yield entry.path, info.st_size
+
+
+def _batches(items: Iterator[_T]) -> Iterator[List[_T]]:
+    return iter(lambda: list(itertools.islice(items, CHECK_BATCH_SIZE)), [])
+
+
+def _look_up_files(references: List[FileReference]) -> Tuple[List[str], List[SizeMismatch]]:
+    missing_files = []
+    size_mismatches = []
+    for reference in references:
+        try:
+            size = os.stat(reference.path).st_size
+        except (FileNotFoundError, NotADirectoryError):
+            missing_files.append(reference.path)
+            continue
+        if reference.size is not None and reference.size != size:
+            size_mismatches.append(SizeMismatch(reference.path, reference.size, size))
+    return missing_files, size_mismatches
+
+
+def _to_key(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
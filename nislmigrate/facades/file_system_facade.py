@@ -2,10 +2,62 @@
 
 import json
 import os
-import shutil
 import stat
+import tarfile
 import base64
-
+import itertools
+import logging
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from nislmigrate.facades.capture_store import CaptureStore, is_store_capture, new_capture_id, read_manifest
+from nislmigrate.facades.copy_verification import verify_directory_copy
+from nislmigrate.facades.deduplicated_copy import (
+    find_duplicate_files,
+    is_deduplicated_capture,
+    remove_duplicate_files,
+    restore_duplicate_files,
+    without_duplicate_list,
+    write_duplicate_list,
+)
+from nislmigrate.facades.encrypted_tree import (
+    find_changed_files,
+    find_removed_paths,
+    find_tree_archives,
+    increment_path,
+    read_tree_state,
+    scan_tree,
+    TreeState,
+    verify_tree_state,
+    write_tree_archive,
+)
+from nislmigrate.facades.file_store_check import check_file_store, FileReference, FileStoreCheckResult
+from nislmigrate.facades.encrypted_archive import (
+    ChunkedEncrypter,
+    DEFAULT_KEY_DERIVATION_ITERATIONS,
+    is_chunked_archive,
+    KeyDerivation,
+    LEGACY_KEY_DERIVATION,
+    new_key_derivation,
+    read_key_derivation,
+)
+from nislmigrate.facades.parallel_copy import (
+    copy_single_file,
+    DEFAULT_BUFFER_SIZE,
+    FileTreeIndex,
+    index_directory,
+    LinkMode,
+    MEGABYTE,
+    ParallelDirectoryCopier,
+    ReferencedFileSelection,
+    run_bounded,
+    select_referenced_files,
+    verify_free_space,
+)
+from nislmigrate.facades.parallel_delete import ParallelTreeRemover
+from nislmigrate.facades.service_configuration_index import ServiceConfigurationIndex
+from nislmigrate.facades.tar_extraction import extract_member
+from nislmigrate.facades.volume_archive import is_volume_archive, read_volume_archive, write_volume_archive
 from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.migration_action import MigrationAction
 from cryptography.fernet import Fernet
@@ -13,12 +65,30 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
 COMPRESSION_FORMAT = 'tar'
+STAGING_DIRECTORY_SUFFIX = '.nislmigrate-staging'
+REPLACED_DIRECTORY_SUFFIX = '.nislmigrate-replaced'
 
 
 class FileSystemFacade:
     """
     Handles operations that act on the real file system.
     """
+    def __init__(self):
+        """
+        Creates a new instance of FileSystemFacade.
+        """
+        self.__key_derivations: Dict[int, KeyDerivation] = {}
+        self.__encrypters: Dict[Tuple[str, KeyDerivation], Fernet] = {}
+        self.__delta_copy = False
+        self.__delta_copy_compares_checksums = False
+        self.__link_mode = LinkMode.COPY
+        self.__buffer_size = DEFAULT_BUFFER_SIZE
+        self.__verification_sample_fraction: Optional[float] = None
+        self.__capture_store: Optional[str] = None
+        self.__capture_id: Optional[str] = None
+        self.__replaced_directories: List[str] = []
+        self.__service_configurations = ServiceConfigurationIndex(self.read_json_file)
+
     def determine_migration_directory_for_service(self,
                                                   migration_directory_root: str,
                                                   service_name: str) -> str:
@@ -69,7 +139,7 @@ class FileSystemFacade:
         :return: None.
         """
         if os.path.isdir(directory):
-            shutil.rmtree(directory, onerror=self.__on_error_remove_readonly_and_retry)
+            ParallelTreeRemover().remove_tree(directory)
 
     def migrate_singlefile(self,
                            migration_directory_root: str,
@@ -93,10 +163,10 @@ class FileSystemFacade:
                 single_file_source_directory,
                 single_file_name,
             )
-            shutil.copy(singlefile_full_path, migration_dir)
+            copy_single_file(singlefile_full_path, migration_dir, self.__buffer_size)
         elif action == MigrationAction.RESTORE:
             singlefile_full_path = os.path.join(migration_dir, single_file_name)
-            shutil.copy(singlefile_full_path, single_file_source_directory)
+            copy_single_file(singlefile_full_path, single_file_source_directory, self.__buffer_size)
 
     def capture_single_file(self,
                             migration_directory_root: str,
@@ -111,7 +181,7 @@ class FileSystemFacade:
             restore_directory,
             file,
         )
-        shutil.copy(singlefile_full_path, migration_dir)
+        copy_single_file(singlefile_full_path, migration_dir, self.__buffer_size)
 
     def restore_single_file(self,
                             migration_directory_root: str,
@@ -121,7 +191,7 @@ class FileSystemFacade:
         root = migration_directory_root
         migration_dir = self.determine_migration_directory_for_service(root, service_name)
         singlefile_full_path = os.path.join(migration_dir, file)
-        shutil.copy(singlefile_full_path, restore_directory)
+        copy_single_file(singlefile_full_path, restore_directory, self.__buffer_size)
 
     def read_json_file(self, path: str) -> dict:
         """
@@ -133,8 +203,26 @@ class FileSystemFacade:
         with open(path, encoding='utf-8-sig') as json_file:
             return json.load(json_file)
 
-    @staticmethod
-    def copy_file(from_directory: str, to_directory: str, file_name: str):
+    def does_service_configuration_exist(self, configuration_file_path: str) -> bool:
+        """
+        Checks whether a service configuration file exists. The configuration directory
+        is listed once per run rather than checking each file separately.
+
+        :param configuration_file_path: The path of the service configuration file.
+        :return: True if the file exists.
+        """
+        return self.__service_configurations.does_configuration_exist(configuration_file_path)
+
+    def read_service_configuration(self, configuration_file_path: str) -> dict:
+        """
+        Reads a service configuration file, parsing it only the first time it is read during a run.
+
+        :param configuration_file_path: The path of the service configuration file.
+        :return: The parsed configuration.
+        """
+        return self.__service_configurations.read_configuration(configuration_file_path)
+
+    def copy_file(self, from_directory: str, to_directory: str, file_name: str):
         """
         Copy an entire directory from one location to another.
 
@@ -145,7 +233,66 @@ class FileSystemFacade:
         if not os.path.exists(to_directory):
             os.mkdir(to_directory)
         file_path = os.path.join(from_directory, file_name)
-        shutil.copy(file_path, to_directory)
+        copy_single_file(file_path, to_directory, self.__buffer_size)
+
+    def enable_delta_copy(self, compare_checksums: bool = False) -> None:
+        """
+        Makes forced directory copies update the existing content of the destination
+        instead of deleting it, copying only the files that changed.
+
+        :param compare_checksums: Whether to compare file contents instead of sizes and
+                                  modification times to decide whether a file changed.
+        """
+        self.__delta_copy = True
+        self.__delta_copy_compares_checksums = compare_checksums
+
+    def set_link_mode(self, link_mode: LinkMode) -> None:
+        """
+        Sets whether copy_directory links files instead of copying them when the source
+        and destination are on the same volume. Files that can not be linked are copied.
+
+        :param link_mode: How to place files in the destination directory.
+        """
+        self.__link_mode = link_mode
+
+    def enable_copy_verification(self, sample_fraction: float = 1.0) -> None:
+        """
+        Makes copy_directory compare the contents of copied files with their source after
+        copying them, raising an error if any differ. Restores from archive volumes or a
+        capture store are not compared, since their source is not a directory of files.
+
+        :param sample_fraction: The fraction of files to compare, chosen at random.
+        """
+        self.__verification_sample_fraction = sample_fraction
+
+    def set_buffer_size(self, buffer_size: int) -> None:
+        """
+        Sets how many bytes are read or written at once when copying files. Larger
+        buffers need fewer round trips to network shares.
+
+        :param buffer_size: The buffer size in bytes.
+        """
+        self.__buffer_size = buffer_size
+
+    def set_capture_store(self, store_directory: str) -> None:
+        """
+        Makes copy_directory capture files into a deduplicated capture store and write
+        only a manifest of the captured files to the destination. Restoring a captured
+        manifest reads the files from this store instead of the one recorded in the manifest.
+
+        :param store_directory: The directory of the capture store.
+        """
+        self.__capture_store = store_directory
+
+    def prune_capture_store(self, store_directory: str, keep: int) -> None:
+        """
+        Removes all but the most recent captures from a capture store along with the
+        stored files no remaining capture uses.
+
+        :param store_directory: The directory of the capture store.
+        :param keep: The number of most recent captures to keep.
+        """
+        CaptureStore(store_directory).prune(keep)
 
     def copy_directory(self, from_directory: str, to_directory: str, force: bool):
         """
@@ -154,6 +301,7 @@ class FileSystemFacade:
         :param from_directory: The directory whose contents to copy.
         :param to_directory: The directory to put the copied contents.
         :param force: Whether to delete existing content in to_directory before copying.
+                      If delta copy is enabled, only the content that differs is replaced.
         """
         if os.path.exists(to_directory) and os.listdir(to_directory) and not force:
             error = "The tool can not copy to the non empty directory: '%s'" % to_directory
@@ -161,34 +309,333 @@ class FileSystemFacade:
         if not os.path.exists(from_directory):
             raise MigrationError("No data found at: '%s'" % from_directory)
 
-        self.remove_directory(to_directory)
-        shutil.copytree(from_directory, to_directory)
+        if self.__capture_store and not force and not is_store_capture(from_directory):
+            if self.__capture_id is None:
+                self.__capture_id = new_capture_id()
+            self.__new_capture_store(self.__capture_store).capture_directory(
+                from_directory,
+                to_directory,
+                self.__capture_id)
+            return
+        if force and self.__delta_copy and not is_store_capture(from_directory) \
+                and not is_volume_archive(from_directory) and not is_deduplicated_capture(from_directory):
+            self.__new_copier().synchronize_directory(
+                from_directory,
+                to_directory,
+                self.__delta_copy_compares_checksums)
+            self.__verify_copy(from_directory, to_directory)
+            return
+
+        def copy_into(directory: str):
+            if is_store_capture(from_directory):
+                self.__restore_from_capture_store(from_directory, directory)
+            elif is_volume_archive(from_directory):
+                read_volume_archive(from_directory, directory)
+            elif is_deduplicated_capture(from_directory):
+                index = without_duplicate_list(index_directory(from_directory, directory))
+                self.__new_copier().copy_directory(from_directory, directory, index)
+                self.__verify_copy(from_directory, directory, index)
+                restore_duplicate_files(from_directory, directory, buffer_size=self.__buffer_size)
+            else:
+                index = index_directory(from_directory, directory)
+                # Linked files take up no extra space, so only full copies are checked for room.
+                if self.__link_mode == LinkMode.COPY:
+                    verify_free_space(index, directory)
+                self.__new_copier().copy_directory(from_directory, directory, index)
+                self.__verify_copy(from_directory, directory, index)
+
+        if force:
+            self.__replace_directory(to_directory, copy_into)
+        else:
+            self.remove_directory(to_directory)
+            copy_into(to_directory)
+
+    def merge_directory(self, from_directory: str, to_directory: str):
+        """
+        Copy the contents of a directory into another, replacing the files found in both
+        and leaving every other file in to_directory in place.
+
+        :param from_directory: The directory whose contents to copy.
+        :param to_directory: The directory to put the copied contents, created if needed.
+        """
+        if not os.path.exists(from_directory):
+            raise MigrationError("No data found at: '%s'" % from_directory)
+        index = index_directory(from_directory, to_directory)
+        # Existing files are removed rather than overwritten so that a file linked into
+        # to_directory by an earlier restore is not written through.
+        for file in index.files:
+            if os.path.lexists(file.destination):
+                os.remove(file.destination)
+        if self.__link_mode == LinkMode.COPY:
+            verify_free_space(index, to_directory)
+        self.__new_copier().copy_directory(from_directory, to_directory, index)
+        self.__verify_copy(from_directory, to_directory, index)
+
+    def replace_directory(self, to_directory: str, create_into: Callable[[str], None]) -> None:
+        """
+        Replaces a directory with one that create_into fills, leaving the existing data in
+        place if create_into fails. The replaced directory is kept until
+        remove_replaced_directories is called.
+
+        :param to_directory: The directory to replace.
+        :param create_into: Fills the directory it is passed, which does not exist yet.
+        """
+        self.__replace_directory(to_directory, create_into)
+
+    def remove_replaced_directories(self) -> None:
+        """
+        Deletes the directories that copy_directory replaced during this run. Deleting
+        large directories takes a long time, so this is deferred until services are
+        running again. The delete still finishes before the run does.
+        """
+        log = logging.getLogger(FileSystemFacade.__name__)
+        while self.__replaced_directories:
+            directory = self.__replaced_directories.pop()
+            log.log(logging.INFO, f'Deleting replaced data: {directory}')
+            self.remove_directory(directory)
+
+    def get_replaced_directories(self) -> List[str]:
+        """
+        Gets the directories copy_directory replaced during this run that have not been deleted yet.
+
+        :return: The paths of the replaced directories.
+        """
+        return list(self.__replaced_directories)
+
+    def copy_directory_to_volume_archive(self, from_directory: str, to_directory: str, volume_size: int):
+        """
+        Capture an entire directory as compressed archive volumes. Restoring the
+        volumes with copy_directory extracts them.
 
-    def copy_directory_to_encrypted_file(self, from_directory: str, encrypted_file_path: str, secret: str):
+        :param from_directory: The directory whose contents to capture.
+        :param to_directory: The directory to put the archive volumes.
+        :param volume_size: The largest number of uncompressed bytes in a volume of several files.
+        """
+        if os.path.exists(to_directory) and os.listdir(to_directory):
+            error = "The tool can not copy to the non empty directory: '%s'" % to_directory
+            raise MigrationError(error)
+        if not os.path.exists(from_directory):
+            raise MigrationError("No data found at: '%s'" % from_directory)
+        write_volume_archive(from_directory, to_directory, volume_size)
+
+    def copy_referenced_files(
+            self,
+            from_directory: str,
+            to_directory: str,
+            referenced_paths: Iterable[str],
+            deduplicate: bool = False,
+            selected_extensions: Optional[Tuple[str, ...]] = None) -> ReferencedFileSelection:
+        """
+        Copy only the files of a directory that a list of paths refers to, leaving behind
+        the files nothing refers to.
+
+        :param from_directory: The directory whose referenced files to copy.
+        :param to_directory: The directory to put the copied files.
+        :param referenced_paths: The full paths of the files to copy.
+        :param deduplicate: Whether to copy files with the same contents only once. The
+                            duplicates are linked back when the directory is restored.
+        :param selected_extensions: The extensions of the files to leave behind if nothing
+                                    refers to them, copying every other file, or None to
+                                    leave behind any file nothing refers to.
+        :return: What was copied, the files that were left behind and the referenced
+                 paths that were not found.
+        """
+        if os.path.exists(to_directory) and os.listdir(to_directory):
+            error = "The tool can not copy to the non empty directory: '%s'" % to_directory
+            raise MigrationError(error)
+        if not os.path.exists(from_directory):
+            raise MigrationError("No data found at: '%s'" % from_directory)
+        index = index_directory(from_directory, to_directory)
+        if selected_extensions is not None:
+            unselected_paths = [file.source for file in index.files
+                                if not file.source.lower().endswith(selected_extensions)]
+            referenced_paths = itertools.chain(referenced_paths, unselected_paths)
+        selection = select_referenced_files(index, referenced_paths)
+        index = selection.referenced_index
+        duplicates = find_duplicate_files(index.files, buffer_size=self.__buffer_size) if deduplicate else []
+        if deduplicate:
+            index = remove_duplicate_files(index, duplicates)
+        if self.__link_mode == LinkMode.COPY:
+            verify_free_space(index, to_directory)
+        self.__new_copier().copy_directory(from_directory, to_directory, index)
+        self.__verify_copy(from_directory, to_directory, index)
+        if deduplicate:
+            write_duplicate_list(to_directory, duplicates)
+
+        log = logging.getLogger(FileSystemFacade.__name__)
+        orphaned_byte_count = sum(file.size for file in selection.orphaned_files)
+        log.log(
+            logging.INFO,
+            f'Left behind {len(selection.orphaned_files)} files ({orphaned_byte_count / MEGABYTE:.1f} MB) '
+            f'in {from_directory} that are not referenced')
+        if selection.missing_paths:
+            log.warning(
+                f'{len(selection.missing_paths)} referenced files were not found in {from_directory}, '
+                f'including: {", ".join(selection.missing_paths[:10])}')
+        return selection
+
+    def check_file_store(self, data_directory: str, references: Iterable[FileReference]) -> FileStoreCheckResult:
+        """
+        Compares the files that metadata refers to with the files in a file store.
+
+        :param data_directory: The directory of the file store.
+        :param references: The paths and sizes of the files the metadata refers to.
+        :return: The missing files, the files with the wrong size and the unreferenced files.
+        """
+        return check_file_store(data_directory, references)
+
+    def __replace_directory(self, to_directory: str, copy_into: Callable[[str], None]):
+        """
+        Copies into a staging directory next to to_directory and then swaps the staging
+        directory in with two renames, so that a failed copy leaves the existing data in
+        place. The replaced directory is kept until remove_replaced_directories is called.
+        Directories that can not be swapped with a sibling are emptied and copied into
+        in place instead.
+        """
+        to_directory = os.path.abspath(to_directory)
+        reason = self.__find_reason_to_replace_in_place(to_directory)
+        if reason:
+            log = logging.getLogger(FileSystemFacade.__name__)
+            log.log(logging.INFO, f'Replacing the data in {to_directory} in place because {reason}.')
+            if os.path.isdir(to_directory):
+                ParallelTreeRemover().remove_contents(to_directory)
+            copy_into(to_directory)
+            return
+
+        staging_directory = to_directory + STAGING_DIRECTORY_SUFFIX
+        self.remove_directory(staging_directory)
+        try:
+            copy_into(staging_directory)
+        except BaseException:
+            self.remove_directory(staging_directory)
+            raise
+        if os.path.exists(to_directory):
+            replaced_directory = f'{to_directory}{REPLACED_DIRECTORY_SUFFIX}-{uuid.uuid4().hex[:8]}'
+            os.rename(to_directory, replaced_directory)
+            self.__replaced_directories.append(replaced_directory)
+        os.rename(staging_directory, to_directory)
+
+    @staticmethod
+    def __find_reason_to_replace_in_place(directory: str) -> Optional[str]:
+        """
+        Finds why a directory can not be swapped with a staging directory next to it: a
+        drive or share root has no parent to put the staging directory in, and renaming
+        a mount point, link or junction would move the link rather than the data,
+        leaving the restored data on the volume of the parent directory.
+        """
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return 'it is the root of a drive or share'
+        if not os.path.isdir(parent):
+            return 'its parent directory does not exist'
+        if os.path.islink(directory):
+            return 'it is a link'
+        if os.path.lexists(directory) \
+                and getattr(os.lstat(directory), 'st_file_attributes', 0) & stat.FILE_ATTRIBUTE_REPARSE_POINT:
+            return 'it is a junction or reparse point'
+        if os.path.ismount(directory):
+            return 'it is a mount point'
+        return None
+
+    def __verify_copy(self, from_directory: str, to_directory: str, index: Optional[FileTreeIndex] = None):
+        if self.__verification_sample_fraction is None:
+            return
+        result = verify_directory_copy(
+            from_directory,
+            to_directory,
+            self.__verification_sample_fraction,
+            index=index)
+        if not result.is_valid:
+            differing_files = result.mismatched_files + result.missing_files
+            raise MigrationError(
+                f'{len(result.mismatched_files)} copied files differ from and {len(result.missing_files)} are '
+                f'missing from the files in {from_directory}, including: {", ".join(differing_files[:10])}')
+
+    def __restore_from_capture_store(self, from_directory: str, to_directory: str):
+        manifest = read_manifest(from_directory)
+        self.__new_capture_store(self.__capture_store or manifest['store']).restore_directory(
+            manifest,
+            to_directory,
+            self.__link_mode)
+
+    def __new_copier(self) -> ParallelDirectoryCopier:
+        return ParallelDirectoryCopier(buffer_size=self.__buffer_size, link_mode=self.__link_mode)
+
+    def __new_capture_store(self, store_directory: str) -> CaptureStore:
+        return CaptureStore(store_directory, buffer_size=self.__buffer_size)
+
+    def copy_directory_to_encrypted_file(
+            self,
+            from_directory: str,
+            encrypted_file_path: str,
+            secret: str,
+            key_derivation_iterations: int = DEFAULT_KEY_DERIVATION_ITERATIONS,
+            incremental: bool = False):
         """
         Copy an entire directory from one location to another and encrypts it.
 
         :param from_directory: The directory whose contents to copy.
         :param encrypted_file_path: The directory to put the copied contents.
         :param secret: A password to use when encrypting the directory.
+        :param key_derivation_iterations: The number of PBKDF2 iterations used to derive
+                                          the encryption key from the secret.
+        :param incremental: Whether to copy only the files added or changed since an
+                            earlier capture to encrypted_file_path, into a new file next
+                            to it. Restoring the earlier capture then restores both.
         """
 
-        if self.does_file_exist(encrypted_file_path):
-            raise FileExistsError("Captured data already exists: '%s'" % encrypted_file_path)
         if not self.does_directory_exist(from_directory):
             raise FileExistsError("No data found at: '%s'" % from_directory)
-        extension = f'.{COMPRESSION_FORMAT}'
-        if self.does_file_exist(from_directory + extension):
-            raise FileExistsError(f'Data not cleaned up from previous migration: {from_directory + extension}')
-
-        # shutil.make_archive automatically appends the compression formats file extension to the output path.
-        shutil.make_archive(from_directory, COMPRESSION_FORMAT, from_directory)
-        self.__encrypt_tar(secret, from_directory + extension, encrypted_file_path)
-        os.remove(from_directory + extension)
+        previous_state = None
+        if self.does_file_exist(encrypted_file_path):
+            if not incremental:
+                raise FileExistsError("Captured data already exists: '%s'" % encrypted_file_path)
+            archives = find_tree_archives(encrypted_file_path)
+            previous_encrypter = self.__get_encrypter(secret, read_key_derivation(archives[-1]))
+            previous_state = verify_tree_state(
+                read_tree_state(ChunkedEncrypter(previous_encrypter), archives[-1]),
+                archives[-1])
+            encrypted_file_path = increment_path(encrypted_file_path, len(archives))
+
+        state = scan_tree(from_directory)
+        file_paths = find_changed_files(previous_state, state)
+        key_derivation = self.__get_key_derivation_for_run(key_derivation_iterations)
+        encrypter = ChunkedEncrypter(self.__get_encrypter(secret, key_derivation))
+        write_tree_archive(encrypter, from_directory, encrypted_file_path, key_derivation, state, file_paths)
+        log = logging.getLogger(FileSystemFacade.__name__)
+        log.log(
+            logging.INFO,
+            f'Encrypted {len(file_paths)} of {len(state.files)} files in {from_directory} into {encrypted_file_path}')
+
+    def copy_directories_to_encrypted_files(
+            self,
+            copies: List[Tuple[str, str]],
+            secret: str,
+            key_derivation_iterations: int = DEFAULT_KEY_DERIVATION_ITERATIONS,
+            incremental: bool = False):
+        """
+        Copies several directories into encrypted files at once.
+        See copy_directory_to_encrypted_file for parameter descriptions.
+
+        :param copies: The directory to copy and the encrypted file to copy it to, for each directory.
+        """
+        # Derive the key before starting so that every archive of the run shares it.
+        self.__get_encrypter(secret, self.__get_key_derivation_for_run(key_derivation_iterations))
+        run_bounded(
+            max(1, len(copies)),
+            lambda copy: self.copy_directory_to_encrypted_file(
+                copy[0],
+                copy[1],
+                secret,
+                key_derivation_iterations,
+                incremental),
+            copies)
 
     def copy_directory_from_encrypted_file(self, encrypted_file_path: str, to_directory: str, secret: str):
         """
-        Copy an entire directory from one location to another and encrypts it.
+        Copy an entire directory from one location to another and encrypts it. Files
+        captured incrementally next to the encrypted file are copied too, and files
+        removed between those captures are removed from to_directory.
 
         :param encrypted_file_path: The directory whose contents to copy.
         :param to_directory: The directory to put the copied contents.
@@ -201,9 +648,18 @@ class FileSystemFacade:
         if self.does_file_exist(encrypted_file_path + extension):
             raise MigrationError(f'Data not cleaned up from previous migration: {encrypted_file_path + extension}')
 
-        self.__decrypt_tar(secret, encrypted_file_path, encrypted_file_path + extension)
-        shutil.unpack_archive(encrypted_file_path + extension, to_directory, COMPRESSION_FORMAT)
-        os.remove(encrypted_file_path + extension)
+        archives = find_tree_archives(encrypted_file_path)
+        for archive in archives:
+            self.__decrypt_tar(secret, archive, encrypted_file_path + extension)
+            try:
+                with tarfile.open(encrypted_file_path + extension, 'r:') as tar:
+                    for member in tar:
+                        extract_member(tar, member, to_directory)
+            finally:
+                os.remove(encrypted_file_path + extension)
+        if len(archives) > 1:
+            states = [verify_tree_state(self.__read_tree_state(secret, archive), archive) for archive in archives]
+            self.__remove_tree_paths(to_directory, *find_removed_paths(states))
 
     def write_file(self, path: str, content: str) -> None:
         """
@@ -212,6 +668,7 @@ class FileSystemFacade:
         :param path: The path to the file to write.
         :param content: The contents to write in the file.
         """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
         with open(path, 'w') as file:
             file.write(content)
 
@@ -226,30 +683,61 @@ class FileSystemFacade:
         with open(path, 'r') as file:
             return file.read()
 
-    def __encrypt_tar(self, secret: str, tar_path: str, encrypted_path: str):
-        with open(tar_path, 'rb') as file:
-            text = file.read()
-        encrypter = self.__get_encrypter(secret)
-        encrypted_text = encrypter.encrypt(text)
-        with open(encrypted_path, 'wb') as file:
-            file.write(encrypted_text)
+    def __read_tree_state(self, secret: str, encrypted_path: str) -> Optional[TreeState]:
+        encrypter = self.__get_encrypter(secret, read_key_derivation(encrypted_path))
+        return read_tree_state(ChunkedEncrypter(encrypter), encrypted_path)
+
+    @staticmethod
+    def __remove_tree_paths(to_directory: str, files: List[str], directories: List[str]):
+        for path in files:
+            full_path = os.path.join(to_directory, *path.split('/'))
+            if os.path.isfile(full_path):
+                os.remove(full_path)
+        for path in directories:
+            full_path = os.path.join(to_directory, *path.split('/'))
+            if os.path.isdir(full_path) and not os.listdir(full_path):
+                os.rmdir(full_path)
+        log = logging.getLogger(FileSystemFacade.__name__)
+        log.log(logging.INFO, f'Removed {len(files)} files from {to_directory} that were removed between captures')
 
     def __decrypt_tar(self, secret: str, encrypted_path: str, tar_path: str):
+        if is_chunked_archive(encrypted_path):
+            encrypter = self.__get_encrypter(secret, read_key_derivation(encrypted_path))
+            ChunkedEncrypter(encrypter).decrypt_file(encrypted_path, tar_path)
+            return
+        # Archives captured before chunking was introduced are a single Fernet token.
         with open(encrypted_path, 'rb') as file:
             encrypted_text = file.read()
-        encrypter = self.__get_encrypter(secret)
-        text = encrypter.decrypt(encrypted_text)
+        text = self.__get_encrypter(secret, LEGACY_KEY_DERIVATION).decrypt(encrypted_text)
         with open(tar_path, 'wb') as file:
             file.write(text)
 
-    @staticmethod
-    def __get_encrypter(secret: str):
+    def __get_key_derivation_for_run(self, iterations: int) -> KeyDerivation:
+        """
+        Gets the key derivation parameters for archives encrypted during this run. A random
+        salt is chosen once per run so that every archive of the run shares a single key.
+        """
+        if iterations not in self.__key_derivations:
+            self.__key_derivations[iterations] = new_key_derivation(iterations)
+        return self.__key_derivations[iterations]
+
+    def __get_encrypter(self, secret: str, key_derivation: KeyDerivation) -> Fernet:
+        """
+        Derives the encryption key for a secret, reusing keys already derived during this run.
+        """
         password = bytes(secret, 'utf-8')
         if not password:
             raise MigrationError('Secret not provided via the --secret flag for encryption.')
-        key_derivation_function = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, iterations=320000, salt=b'0'*16)
-        key = base64.urlsafe_b64encode(key_derivation_function.derive(password))
-        return Fernet(key)
+        cache_key = (secret, key_derivation)
+        if cache_key not in self.__encrypters:
+            key_derivation_function = PBKDF2HMAC(
+                algorithm=hashes.SHA256(),
+                length=32,
+                iterations=key_derivation.iterations,
+                salt=key_derivation.salt)
+            key = base64.urlsafe_b64encode(key_derivation_function.derive(password))
+            self.__encrypters[cache_key] = Fernet(key)
+        return self.__encrypters[cache_key]
 
     def copy_directory_if_exists(self, from_directory: str, to_directory: str, force: bool) -> bool:
         """
@@ -262,24 +750,3 @@ class FileSystemFacade:
             return True
         else:
             return False
-
-    def __on_error_remove_readonly_and_retry(self, func, path, execinfo):
-        """
-        Error handler that removes the readonly attribute from a file path
-        and then retries the previous operation.
-
-        :param func: A continuation to run with the path.
-        :param path: The path to remove the readonly attribute from.
-        :param execinfo: Will be the exception information returned by sys.exc_info()
-        :return: None.
-        """
-        self.__remove_readonly(path)
-        func(path)
-
-    def __remove_readonly(self, path):
-        """
-        Removes the read-only attribute from a file or directory.
-
-        :param path: The path to remove the readonly attribute from.
-        """
-        os.chmod(path, stat.S_IWRITE)
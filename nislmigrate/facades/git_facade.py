@@ -0,0 +1,232 @@
+"""Capture git repositories into bundles and rebuild repositories from them."""
+
+import json
+import logging
+import os
+import shutil
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from nislmigrate.facades.process_facade import ProcessError, ProcessFacade
+from nislmigrate.logs.migration_error import MigrationError
+
+GIT_EXECUTABLE = 'git'
+# Describes the bundles of a capture and the refs the repository had when it was captured.
+BUNDLE_MANIFEST_FILE_NAME = 'bundles.json'
+
+_BUNDLE_FILE_NAME_FORMAT = 'repository-{number:04d}.bundle'
+# Refs are fetched from bundles into this namespace and then set from the manifest.
+_FETCHED_REFS_NAMESPACE = 'refs/nislmigrate-bundle/'
+# The repository may be owned by the account of the service rather than the one running the tool.
+_SAFE_DIRECTORY_ARGUMENTS = ['-c', 'safe.directory=*']
+# The number of uncommitted paths listed when a capture is refused because of them.
+_LISTED_UNCOMMITTED_PATH_COUNT = 10
+
+_GIT_NOT_INSTALLED_ERROR = """
+
+Migrating git repositories as bundles requires git. Install git and make sure
+that "git" is on the PATH.
+
+"""
+
+_UNCOMMITTED_CHANGES_ERROR = """
+
+The working tree of {repository} has {count} uncommitted changes, including:
+{paths}
+Bundles only hold committed history, and restoring them checks out the last commit, so
+these changes would be lost. Commit or discard them, or capture anyway and leave them behind.
+
+"""
+
+
+class BundleManifest(NamedTuple):
+    """
+    The bundles of a capture, oldest first, the refs and HEAD of the repository and
+    whether it is a bare repository without a working tree.
+    """
+    bundles: List[str]
+    refs: Dict[str, str]
+    head: Optional[str]
+    # Manifests written before bareness was recorded describe repositories with a working tree.
+    bare: bool = False
+
+
+def verify_git_support() -> None:
+    """
+    Raises an error if git is not installed.
+    """
+    if shutil.which(GIT_EXECUTABLE) is None:
+        raise MigrationError(_GIT_NOT_INSTALLED_ERROR)
+
+
+def read_bundle_manifest(directory: str) -> Optional[BundleManifest]:
+    """
+    Reads the manifest of the bundles captured into a directory.
+
+    :param directory: The directory the bundles were captured into.
+    :return: The manifest, or None if no bundles were captured into the directory.
+    """
+    path = os.path.join(directory, BUNDLE_MANIFEST_FILE_NAME)
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding='utf-8') as file:
+        return BundleManifest(**json.load(file))
+
+
+class GitFacade:
+    """
+    Captures a repository into a chain of bundles, each holding the commits added since
+    the one before, and rebuilds a repository from them.
+    """
+    def __init__(self, process_facade: ProcessFacade):
+        self.process_facade: ProcessFacade = process_facade
+
+    def capture_repository_to_bundles(
+            self,
+            repository: str,
+            directory: str,
+            incremental: bool,
+            repack: bool,
+            allow_uncommitted_changes: bool = False) -> BundleManifest:
+        """
+        Writes the commits of a repository to a bundle, along with a manifest of its refs.
+        Changes to the working tree that were not committed are not captured.
+
+        :param repository: The repository to capture.
+        :param directory: The directory to write the bundle and manifest to.
+        :param incremental: Whether to bundle only the commits added since the bundles
+                            already captured into directory, keeping those bundles.
+        :param repack: Whether to repack the repository into a single pack first.
+        :param allow_uncommitted_changes: Whether to capture a repository whose working tree
+                                          has uncommitted changes or untracked files.
+        :return: The manifest of the capture.
+        """
+        bare = self.__is_bare(repository)
+        if not bare and not allow_uncommitted_changes:
+            self.__verify_working_tree_is_clean(repository)
+        previous = read_bundle_manifest(directory) if incremental else None
+        if previous is not None and not all(os.path.isfile(os.path.join(directory, bundle))
+                                            for bundle in previous.bundles):
+            raise MigrationError(f'The bundles of the previous capture in {directory} are incomplete.')
+        if repack:
+            self.__run_git(repository, ['repack', '-a', '-d', '-q'])
+        refs = self.__read_refs(repository)
+        bundles = list(previous.bundles) if previous is not None else []
+        prerequisites = self.__find_existing_commits(repository, previous.refs.values()) if previous else []
+        bundle_name = _BUNDLE_FILE_NAME_FORMAT.format(number=len(bundles) + 1)
+        if refs and self.__create_bundle(repository, os.path.join(directory, bundle_name), prerequisites):
+            bundles.append(bundle_name)
+        if previous is None:
+            self.__remove_stale_bundles(directory, bundles)
+        manifest = BundleManifest(bundles, refs, self.__read_head(repository), bare)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, BUNDLE_MANIFEST_FILE_NAME), 'w', encoding='utf-8') as file:
+            json.dump(manifest._asdict(), file, indent=2)
+        log = logging.getLogger(GitFacade.__name__)
+        log.log(logging.INFO, f'Captured {len(refs)} refs of {repository} into {len(bundles)} bundles')
+        return manifest
+
+    def restore_repository_from_bundles(self, directory: str, repository: str) -> None:
+        """
+        Creates a repository from the bundles captured into a directory, with the refs
+        and HEAD the captured repository had, and checks out its working tree unless the
+        captured repository was bare.
+
+        :param directory: The directory the bundles were captured into.
+        :param repository: The directory to create the repository in, which must not exist.
+        """
+        manifest = read_bundle_manifest(directory)
+        if manifest is None:
+            raise MigrationError(f'No captured bundles were found in {directory}.')
+        self.__run_git(None, ['init', '-q'] + (['--bare'] if manifest.bare else []) + [repository])
+        for bundle in manifest.bundles:
+            self.__run_git(repository, [
+                'fetch', '-q', '--update-head-ok',
+                os.path.abspath(os.path.join(directory, bundle)),
+                f'+refs/*:{_FETCHED_REFS_NAMESPACE}*'])
+        for ref in self.__read_refs(repository):
+            self.__run_git(repository, ['update-ref', '-d', ref])
+        for ref, commit in manifest.refs.items():
+            self.__run_git(repository, ['update-ref', ref, commit])
+        if manifest.head is None:
+            return
+        if manifest.head.startswith('refs/'):
+            self.__run_git(repository, ['symbolic-ref', 'HEAD', manifest.head])
+        else:
+            self.__run_git(repository, ['update-ref', '--no-deref', 'HEAD', manifest.head])
+        if not manifest.bare and (manifest.head in manifest.refs or not manifest.head.startswith('refs/')):
+            self.__run_git(repository, ['reset', '-q', '--hard'])
+
+    def __create_bundle(self, repository: str, path: str, prerequisites: List[str]) -> bool:
+        arguments = ['bundle', 'create', '-q', os.path.abspath(path), '--all']
+        if prerequisites:
+            arguments.extend(['--not'] + prerequisites)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        try:
+            self.__try_git(repository, arguments)
+        except ProcessError as error:
+            # Nothing was committed since the previous capture.
+            if 'empty bundle' in (error.error or ''):
+                return False
+            raise MigrationError(f'git could not bundle {repository}: {error.error}')
+        return True
+
+    def __read_refs(self, repository: str) -> Dict[str, str]:
+        output = self.__run_git(repository, ['for-each-ref', '--format=%(objectname) %(refname)'])
+        refs: Dict[str, str] = {}
+        for line in output.splitlines():
+            commit, _, ref = line.partition(' ')
+            if ref:
+                refs[ref] = commit
+        return refs
+
+    def __read_head(self, repository: str) -> Optional[str]:
+        try:
+            return self.__try_git(repository, ['symbolic-ref', '-q', 'HEAD']).strip() or None
+        except ProcessError:
+            # A detached HEAD is recorded as the commit it points to.
+            try:
+                return self.__try_git(repository, ['rev-parse', '-q', '--verify', 'HEAD']).strip()
+            except ProcessError:
+                return None
+
+    def __is_bare(self, repository: str) -> bool:
+        return self.__run_git(repository, ['rev-parse', '--is-bare-repository']).strip() == 'true'
+
+    def __verify_working_tree_is_clean(self, repository: str) -> None:
+        changes = self.__run_git(repository, ['status', '--porcelain', '--untracked-files=all']).splitlines()
+        if changes:
+            raise MigrationError(_UNCOMMITTED_CHANGES_ERROR.format(
+                repository=repository,
+                count=len(changes),
+                paths='\n'.join(changes[:_LISTED_UNCOMMITTED_PATH_COUNT])))
+
+    def __find_existing_commits(self, repository: str, commits: Iterable[str]) -> List[str]:
+        existing: List[str] = []
+        for commit in sorted(set(commits)):
+            try:
+                self.__try_git(repository, ['cat-file', '-e', commit])
+                existing.append(commit)
+            except ProcessError:
+                # History rewritten since the previous capture no longer holds this commit.
+                pass
+        return existing
+
+    @staticmethod
+    def __remove_stale_bundles(directory: str, bundles: List[str]) -> None:
+        if not os.path.isdir(directory):
+            return
+        for entry in os.listdir(directory):
+            if entry.endswith('.bundle') and entry not in bundles:
+                os.remove(os.path.join(directory, entry))
+
+    def __run_git(self, repository: Optional[str], arguments: List[str]) -> str:
+        try:
+            return self.__try_git(repository, arguments)
+        except ProcessError as error:
+            raise MigrationError(f'git {arguments[0]} failed for {repository}: {error.error}')
+
+    def __try_git(self, repository: Optional[str], arguments: List[str]) -> str:
+        command = [GIT_EXECUTABLE] + _SAFE_DIRECTORY_ARGUMENTS
+        if repository is not None:
+            command.extend(['-C', repository])
+        return self.process_facade.run_process(command + arguments)
@@ -0,0 +1,80 @@
+"""Build Mongo aggregations that downsample time series history into coarser buckets."""
+
+import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Set
+
+
+class HistoryLayout(NamedTuple):
+    """
+    Where a history collection keeps the series, time and value of each sample.
+    """
+    collection_name: str
+    series_fields: List[str]
+    timestamp_field: str
+    value_field: str
+
+
+def build_downsampling_pipeline(
+        layout: HistoryLayout,
+        older_than: datetime.datetime,
+        interval: datetime.timedelta) -> List[Dict[str, Any]]:
+    """
+    Builds an aggregation that replaces the samples of each series taken before a time
+    with one sample per interval. Each bucket sample is timed at the start of its interval
+    and holds the mean of the numeric values in it, or the largest value if none are
+    numeric, along with the minimum, maximum and number of samples it replaces.
+
+    :param layout: The layout of the history collection.
+    :param older_than: The time before which samples are downsampled.
+    :param interval: The length of each bucket.
+    :return: The aggregation pipeline, producing documents shaped like the samples.
+    """
+    interval_milliseconds = int(interval.total_seconds() * 1000)
+    timestamp = f'${layout.timestamp_field}'
+    value = f'${layout.value_field}'
+    bucket_start = {'$subtract': [timestamp, {'$mod': [{'$toLong': timestamp}, interval_milliseconds]}]}
+    group_id: Dict[str, Any] = {field: f'${field}' for field in layout.series_fields}
+    group_id['bucket'] = bucket_start
+    projection: Dict[str, Any] = {'_id': 0}
+    projection.update({field: f'$_id.{field}' for field in layout.series_fields})
+    projection[layout.timestamp_field] = '$_id.bucket'
+    projection[layout.value_field] = {'$ifNull': ['$mean', '$max']}
+    projection.update({'min': 1, 'max': 1, 'count': 1})
+    return [
+        {'$match': {layout.timestamp_field: {'$lt': older_than}}},
+        {'$group': {
+            '_id': group_id,
+            'min': {'$min': value},
+            'max': {'$max': value},
+            'mean': {'$avg': value},
+            'count': {'$sum': 1},
+        }},
+        {'$project': projection},
+    ]
+
+
+def build_recent_history_query(layout: HistoryLayout, older_than: datetime.datetime) -> Dict[str, Any]:
+    """
+    Builds the query for the samples a downsampling pipeline keeps at full resolution.
+
+    :param layout: The layout of the history collection.
+    :param older_than: The time before which samples are downsampled.
+    :return: The query.
+    """
+    return {layout.timestamp_field: {'$gte': older_than}}
+
+
+def find_missing_layout_fields(layout: HistoryLayout, samples: Iterable[Dict[str, Any]]) -> List[str]:
+    """
+    Finds the series and timestamp fields of a layout that some samples lack. Samples
+    without them would all be grouped into the same series or bucket.
+
+    :param layout: The layout of the history collection.
+    :param samples: Some of the samples of the history collection.
+    :return: The fields missing from at least one sample, in the order of the layout.
+    """
+    fields = layout.series_fields + [layout.timestamp_field]
+    missing_fields: Set[str] = set()
+    for sample in samples:
+        missing_fields.update(field for field in fields if field not in sample)
+    return [field for field in fields if field in missing_fields]
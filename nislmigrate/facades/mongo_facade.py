@@ -1,11 +1,15 @@
 """Handle Mongo operations."""
 
+import gzip
+import itertools
 import os
 import logging
-from typing import List, Optional, Callable, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, cast
 
 import bson
-from pymongo import MongoClient
+from bson import json_util
+from pymongo import MongoClient, ReplaceOne
 
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
 from nislmigrate.facades.process_facade import ProcessFacade, BackgroundProcess, ProcessError
@@ -25,6 +29,21 @@ MONGO_BINARIES_DIRECTORY: str = os.path.join(
 MONGO_DUMP_EXECUTABLE_PATH: str = os.path.join(MONGO_BINARIES_DIRECTORY, 'mongodump.exe')
 MONGO_RESTORE_EXECUTABLE_PATH: str = os.path.join(MONGO_BINARIES_DIRECTORY, 'mongorestore.exe')
 MONGO_EXECUTABLE_PATH: str = os.path.join(MONGO_BINARIES_DIRECTORY, 'mongod.exe')
+# The number of documents fetched from the server at once when streaming a collection.
+FIND_BATCH_SIZE = 10000
+# The number of documents sent to the server with each insert.
+INSERT_BATCH_SIZE = 1000
+# The number of mongodump or mongorestore processes run at once for a batch of databases.
+DATABASE_BATCH_WORKER_COUNT = 4
+
+
+class MongoDump(NamedTuple):
+    """
+    The database of a service and the archive it is captured to.
+    """
+    configuration: MongoConfiguration
+    directory: str
+    dump_name: str
 
 
 class MongoFacade:
@@ -38,12 +57,18 @@ class MongoFacade:
             configuration: MongoConfiguration,
             directory: str,
             dump_name: str,
+            collection_name: Optional[str] = None,
+            query: Optional[Dict[str, Any]] = None,
+            excluded_collection_names: Optional[List[str]] = None,
             ) -> None:
         """
         Capture the data in mongoDB from the given service.
         :param configuration: The mongo configuration for a service.
         :param directory: The directory to migrate the service in to.
         :param dump_name: The name of the file to dump to.
+        :param collection_name: The only collection to capture, or None to capture the whole database.
+        :param query: Restricts the documents captured from collection_name, or None to capture every document.
+        :param excluded_collection_names: The collections to leave out when capturing the whole database.
         """
         if not os.path.exists(directory):
             os.makedirs(directory)
@@ -51,6 +76,12 @@ class MongoFacade:
         mongo_dump_command = [MONGO_DUMP_EXECUTABLE_PATH]
         connection_arguments = self.__get_mongo_connection_arguments(configuration)
         mongo_dump_command.extend(connection_arguments)
+        if collection_name:
+            mongo_dump_command.extend(['--collection', collection_name])
+        if query is not None:
+            mongo_dump_command.extend(['--query', json_util.dumps(query)])
+        for excluded_collection_name in excluded_collection_names or []:
+            mongo_dump_command.extend(['--excludeCollection', excluded_collection_name])
         mongo_dump_command.append('--archive=' + dump_path)
         mongo_dump_command.append('--gzip')
         output = self.__ensure_mongo_process_is_running_and_execute_command(mongo_dump_command)
@@ -84,6 +115,51 @@ class MongoFacade:
         output = self.__ensure_mongo_process_is_running_and_execute_command(mongo_restore_command)
         self.__check_mongo_output_for_errors(output)
 
+    def capture_databases_to_directories(
+            self,
+            dumps: List[MongoDump],
+            worker_count: int = DATABASE_BATCH_WORKER_COUNT) -> None:
+        """
+        Captures the databases of several services, starting Mongo once and running several
+        mongodump processes at once so that their startup and authentication overlap. Each
+        service connects with its own credentials, so each database is dumped to its own archive.
+
+        :param dumps: The database of each service and the archive to capture it to.
+        :param worker_count: The number of databases to capture at once.
+        """
+        self.__start_mongo()
+        self.__run_batch(
+            lambda dump: self.capture_database_to_directory(dump.configuration, dump.directory, dump.dump_name),
+            dumps,
+            worker_count)
+
+    def restore_databases_from_directories(
+            self,
+            dumps: List[MongoDump],
+            worker_count: int = DATABASE_BATCH_WORKER_COUNT) -> None:
+        """
+        Restores the databases of several services, see capture_databases_to_directories.
+        Every archive is checked before any database is restored.
+
+        :param dumps: The database of each service and the archive to restore it from.
+        :param worker_count: The number of databases to restore at once.
+        """
+        for dump in dumps:
+            self.validate_can_restore_database_from_directory(dump.directory, dump.dump_name)
+        self.__start_mongo()
+        self.__run_batch(
+            lambda dump: self.restore_database_from_directory(dump.configuration, dump.directory, dump.dump_name),
+            dumps,
+            worker_count)
+
+    @staticmethod
+    def __run_batch(function: Callable[[MongoDump], None], dumps: List[MongoDump], worker_count: int) -> None:
+        with ThreadPoolExecutor(max_workers=max(1, worker_count)) as executor:
+            # Consuming the results re-raises the first error of any dump.
+            list(executor.map(function, dumps))
+        log = logging.getLogger(MongoFacade.__name__)
+        log.log(logging.INFO, f'Migrated {len(dumps)} databases in one batch')
+
     @staticmethod
     def validate_can_restore_database_from_directory(
             directory: str,
@@ -176,6 +252,133 @@ class MongoFacade:
                 document = update_function(document)
                 collection.replace_one({'_id': document['_id']}, document)
 
+    def find_documents_in_collection(
+            self,
+            configuration: MongoConfiguration,
+            collection_name: str,
+            field_names: List[str],
+            query: Optional[Dict[str, Any]] = None,
+            start_mongo: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Streams some fields of the documents in a collection, fetching only those fields.
+
+        :param configuration: The mongo configuration for a service.
+        :param collection_name: The collection to read.
+        :param field_names: The fields to read from each document.
+        :param query: Restricts the documents read, or None to read every document.
+        :param start_mongo: Whether to start the database first. Pass False to read from
+                            the database of the running services instead.
+        :return: Each document, holding only the fields it has of field_names.
+        """
+        if start_mongo:
+            self.__start_mongo()
+        client: MongoClient = MongoClient(configuration.connection_string)
+        codec: bson.codec_options.CodecOptions = bson.codec_options.CodecOptions(
+            uuid_representation=bson.binary.UUID_SUBTYPE)
+        database = client.get_database(name=configuration.database_name, codec_options=codec)
+        projection: Dict[str, Any] = {field_name: True for field_name in field_names}
+        projection['_id'] = '_id' in field_names
+        documents = database[collection_name].find(query or {}, projection=projection)
+        yield from documents.batch_size(FIND_BATCH_SIZE)
+
+    def find_field_values_in_collection(
+            self,
+            configuration: MongoConfiguration,
+            collection_name: str,
+            field_name: str,
+            query: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+        """
+        Streams one field of the documents in a collection, fetching only that field.
+
+        :param configuration: The mongo configuration for a service.
+        :param collection_name: The collection to read.
+        :param field_name: The field to read from each document.
+        :param query: Restricts the documents read, or None to read every document.
+        :return: The value of the field in each document that has it.
+        """
+        for document in self.find_documents_in_collection(configuration, collection_name, [field_name], query):
+            if field_name in document:
+                yield document[field_name]
+
+    def capture_aggregation_to_file(
+            self,
+            configuration: MongoConfiguration,
+            collection_name: str,
+            pipeline: List[Dict[str, Any]],
+            path: str) -> int:
+        """
+        Runs an aggregation on a collection and writes the documents it produces to a
+        document file as the server produces them.
+
+        :param configuration: The mongo configuration for a service.
+        :param collection_name: The collection to aggregate.
+        :param pipeline: The aggregation pipeline.
+        :param path: The document file to write.
+        :return: The number of documents written.
+        """
+        self.__start_mongo()
+        client: MongoClient = MongoClient(configuration.connection_string)
+        codec: bson.codec_options.CodecOptions = bson.codec_options.CodecOptions(
+            uuid_representation=bson.binary.UUID_SUBTYPE)
+        database = client.get_database(name=configuration.database_name, codec_options=codec)
+        documents = database[collection_name].aggregate(pipeline, allowDiskUse=True, batchSize=FIND_BATCH_SIZE)
+        return write_document_file(path, documents)
+
+    def restore_documents_from_file(
+            self,
+            configuration: MongoConfiguration,
+            collection_name: str,
+            path: str) -> int:
+        """
+        Inserts the documents of a document file into a collection, a batch at a time.
+
+        :param configuration: The mongo configuration for a service.
+        :param collection_name: The collection to insert into.
+        :param path: The document file to read.
+        :return: The number of documents inserted.
+        """
+        self.__start_mongo()
+        client: MongoClient = MongoClient(configuration.connection_string)
+        codec: bson.codec_options.CodecOptions = bson.codec_options.CodecOptions(
+            uuid_representation=bson.binary.UUID_SUBTYPE)
+        database = client.get_database(name=configuration.database_name, codec_options=codec)
+        collection = database[collection_name]
+        document_count = 0
+        documents = read_document_file(path)
+        for batch in iter(lambda: list(itertools.islice(documents, INSERT_BATCH_SIZE)), []):
+            collection.insert_many(batch, ordered=False)
+            document_count += len(batch)
+        return document_count
+
+    def upsert_documents_from_file(
+            self,
+            configuration: MongoConfiguration,
+            collection_name: str,
+            path: str) -> int:
+        """
+        Writes the documents of a document file into a collection a batch at a time,
+        replacing the documents with the same _id and leaving every other document in place.
+
+        :param configuration: The mongo configuration for a service.
+        :param collection_name: The collection to write into.
+        :param path: The document file to read.
+        :return: The number of documents written.
+        """
+        self.__start_mongo()
+        client: MongoClient = MongoClient(configuration.connection_string)
+        codec: bson.codec_options.CodecOptions = bson.codec_options.CodecOptions(
+            uuid_representation=bson.binary.UUID_SUBTYPE)
+        database = client.get_database(name=configuration.database_name, codec_options=codec)
+        collection = database[collection_name]
+        document_count = 0
+        documents = read_document_file(path)
+        for batch in iter(lambda: list(itertools.islice(documents, INSERT_BATCH_SIZE)), []):
+            collection.bulk_write(
+                [ReplaceOne({'_id': document['_id']}, document, upsert=True) for document in batch],
+                ordered=False)
+            document_count += len(batch)
+        return document_count
+
     def update_documents_in_collection(
             self,
             configuration: MongoConfiguration,
@@ -188,3 +391,34 @@ class MongoFacade:
         for document in collection.find():
             document = update_function(document)
             collection.replace_one({'_id': document['_id']}, document)
+
+
+def write_document_file(path: str, documents: Iterable[Dict[str, Any]]) -> int:
+    """
+    Writes documents to a gzipped file of concatenated BSON documents.
+
+    :param path: The document file to write.
+    :param documents: The documents to write.
+    :return: The number of documents written.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    document_count = 0
+    with gzip.open(path, 'wb') as file:
+        for document in documents:
+            file.write(bson.encode(document))
+            document_count += 1
+    return document_count
+
+
+def read_document_file(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Reads the documents of a file written by write_document_file one at a time.
+
+    :param path: The document file to read.
+    :return: The documents.
+    """
+    with gzip.open(path, 'rb') as file:
+        try:
+            yield from bson.decode_file_iter(cast(BinaryIO, file))
+        except (bson.errors.InvalidBSON, EOFError, OSError) as error:
+            raise MigrationError(f'The document file {path} is corrupt: {error}')
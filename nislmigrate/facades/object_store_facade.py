@@ -0,0 +1,475 @@
+"""Transfer directories of files to and from S3 compatible object stores."""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+from nislmigrate.facades.parallel_copy import (
+    DEFAULT_WORKER_COUNT,
+    MEGABYTE,
+    ProgressReporter,
+    run_bounded,
+    scan_directory,
+)
+from nislmigrate.logs.migration_error import MigrationError
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None  # type: ignore
+
+# Objects larger than this are transferred in parts of this size, several parts at once.
+DEFAULT_PART_SIZE = 64 * MEGABYTE
+TRANSFER_STATE_FILE_NAME = 'object-store-transfer.json'
+# Finished parts and objects are appended here, one JSON line each, and folded into the
+# state file whenever it is written, so that recording progress costs the same for the
+# last of millions of objects as for the first.
+TRANSFER_JOURNAL_FILE_NAME = 'object-store-transfer.journal'
+
+_S3_URI_SCHEME = 's3://'
+_PARTIAL_EXTENSION = '.nislmigrate-partial'
+
+_BOTO3_NOT_INSTALLED_ERROR = """
+
+Migrating files stored in S3 requires the boto3 package. Install it with:
+
+    pip install nislmigrate[s3]
+
+"""
+
+
+class _StoredObject(NamedTuple):
+    key: str
+    path: str
+    size: int
+    etag: str
+
+
+def verify_object_store_support() -> None:
+    """
+    Raises an error if the optional dependencies needed to transfer files to and from S3 are missing.
+    """
+    if boto3 is None:
+        raise MigrationError(_BOTO3_NOT_INSTALLED_ERROR)
+
+
+def parse_s3_uri(uri: str) -> Tuple[str, str]:
+    """
+    Splits an s3://bucket/prefix URI into its bucket and key prefix.
+
+    :param uri: The URI to split.
+    :return: The bucket and the key prefix, which ends with a slash unless it is empty.
+    """
+    if not uri.lower().startswith(_S3_URI_SCHEME) or not uri[len(_S3_URI_SCHEME):].split('/')[0]:
+        raise MigrationError(f'Expected an S3 location of the form s3://bucket/prefix, not: {uri}')
+    bucket, _, prefix = uri[len(_S3_URI_SCHEME):].partition('/')
+    prefix = prefix.strip('/')
+    return bucket, prefix + '/' if prefix else ''
+
+
+class ObjectStoreFacade:
+    """
+    Downloads objects from and uploads files to S3 compatible object stores.
+    """
+    def download_directory(
+            self,
+            uri: str,
+            to_directory: str,
+            state_directory: str,
+            endpoint_url: Optional[str] = None) -> None:
+        """
+        Downloads every object under an S3 location into a directory.
+
+        :param uri: The s3://bucket/prefix location to download.
+        :param to_directory: The directory to download into, created if needed.
+        :param state_directory: The directory to record transfer progress in, so that
+                                an interrupted download resumes where it stopped.
+        :param endpoint_url: The URL of an S3 compatible service, or None for Amazon S3.
+        """
+        bucket, prefix = parse_s3_uri(uri)
+        ObjectStoreTransfer(self.__create_client(endpoint_url), state_directory).download_directory(
+            bucket,
+            prefix,
+            to_directory)
+
+    def upload_directory(
+            self,
+            from_directory: str,
+            uri: str,
+            state_directory: str,
+            endpoint_url: Optional[str] = None) -> None:
+        """
+        Uploads every file in a directory to an S3 location.
+
+        :param from_directory: The directory to upload.
+        :param uri: The s3://bucket/prefix location to upload to.
+        :param state_directory: The directory to record transfer progress in, so that
+                                an interrupted upload resumes where it stopped.
+        :param endpoint_url: The URL of an S3 compatible service, or None for Amazon S3.
+        """
+        bucket, prefix = parse_s3_uri(uri)
+        ObjectStoreTransfer(self.__create_client(endpoint_url), state_directory).upload_directory(
+            from_directory,
+            bucket,
+            prefix)
+
+    @staticmethod
+    def __create_client(endpoint_url: Optional[str]) -> Any:
+        verify_object_store_support()
+        return boto3.client('s3', endpoint_url=endpoint_url)
+
+
+class ObjectStoreTransfer:
+    """
+    Transfers objects with an S3 client, moving large objects as ranges or multipart
+    uploads of several parts at once. Every transferred object is checked against its
+    ETag, and finished parts are recorded in a journal next to a state file so that an
+    interrupted transfer can be resumed.
+    """
+    def __init__(
+            self,
+            client: Any,
+            state_directory: str,
+            worker_count: int = DEFAULT_WORKER_COUNT,
+            part_size: int = DEFAULT_PART_SIZE):
+        """
+        Creates a new instance of ObjectStoreTransfer.
+
+        :param client: A boto3 S3 client, or an object with the same methods.
+        :param state_directory: The directory to record transfer progress in.
+        :param worker_count: The number of parts to transfer at once.
+        :param part_size: The size of each transferred part in bytes.
+        """
+        self.client = client
+        self.worker_count = max(1, worker_count)
+        self.part_size = part_size
+        self.__state_path = os.path.join(state_directory, TRANSFER_STATE_FILE_NAME)
+        self.__journal_path = os.path.join(state_directory, TRANSFER_JOURNAL_FILE_NAME)
+        self.__state_lock = threading.Lock()
+        self.__state: Dict[str, Dict[str, Any]] = self.__read_state()
+        self.__journal: Optional[TextIO] = None
+
+    def download_directory(self, bucket: str, prefix: str, to_directory: str) -> None:
+        """
+        Downloads every object under a key prefix into a directory.
+
+        :param bucket: The bucket to download from.
+        :param prefix: The key prefix of the objects to download.
+        :param to_directory: The directory to download into, created if needed.
+        """
+        start = time.perf_counter()
+        objects = self.__list_objects(bucket, prefix, to_directory)
+        downloads = self.__state.setdefault('downloads', {})
+        pending = []
+        for stored_object in objects:
+            recorded = downloads.get(stored_object.key, {})
+            if recorded.get('etag') != stored_object.etag:
+                recorded = downloads[stored_object.key] = {'etag': stored_object.etag, 'parts': []}
+            if recorded.get('complete') and _file_size(stored_object.path) == stored_object.size:
+                continue
+            recorded['complete'] = False
+            os.makedirs(os.path.dirname(stored_object.path), exist_ok=True)
+            partial_path = stored_object.path + _PARTIAL_EXTENSION
+            if not recorded['parts'] or _file_size(partial_path) != stored_object.size:
+                recorded['parts'] = []
+                with open(partial_path, 'wb') as file:
+                    file.truncate(stored_object.size)
+            pending.append(stored_object)
+        self.__write_state()
+
+        parts = [(stored_object, number)
+                 for stored_object in pending
+                 for number in range(_part_count(stored_object.size, self.part_size))
+                 if number not in downloads[stored_object.key]['parts']]
+        progress = ProgressReporter('Downloaded', len(pending), sum(stored_object.size for stored_object in pending))
+
+        def download_part(part: Tuple[_StoredObject, int]) -> None:
+            stored_object, number = part
+            self.__download_part(bucket, stored_object, number)
+            self.__record({'downloads': stored_object.key, 'part': number})
+            progress.add(0, _part_length(stored_object.size, self.part_size, number))
+
+        with self.__open_journal():
+            run_bounded(self.worker_count, download_part, parts)
+        for stored_object in pending:
+            partial_path = stored_object.path + _PARTIAL_EXTENSION
+            self.__verify_download(stored_object, partial_path)
+            os.replace(partial_path, stored_object.path)
+            downloads[stored_object.key]['complete'] = True
+        self.__write_state()
+
+        log = logging.getLogger(ObjectStoreTransfer.__name__)
+        log.log(
+            logging.INFO,
+            f'Downloaded {len(pending)} of {len(objects)} objects from s3://{bucket}/{prefix} '
+            f'in {time.perf_counter() - start:.1f} s, the rest were already downloaded')
+
+    def upload_directory(self, from_directory: str, bucket: str, prefix: str) -> None:
+        """
+        Uploads every file in a directory under a key prefix.
+
+        :param from_directory: The directory to upload.
+        :param bucket: The bucket to upload to.
+        :param prefix: The key prefix to upload the files under.
+        """
+        start = time.perf_counter()
+        _, files = scan_directory(from_directory, from_directory)
+        uploads = self.__state.setdefault('uploads', {})
+        # One listing of the prefix confirms every upload recorded as finished, rather
+        # than one request per file.
+        stored_etags = self.__list_etags(bucket, prefix) \
+            if any(recorded.get('etag') for recorded in uploads.values()) else {}
+        pending = []
+        for file in files:
+            key = prefix + os.path.relpath(file.source, from_directory).replace(os.sep, '/')
+            recorded = uploads.get(key, {})
+            unchanged = recorded.get('size') == file.size and recorded.get('modified_time') == file.modified_time
+            if not unchanged:
+                if recorded.get('upload_id'):
+                    self.client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=recorded['upload_id'])
+                recorded = uploads[key] = {'size': file.size, 'modified_time': file.modified_time, 'parts': {}}
+            if recorded.get('etag') and stored_etags.get(key) == recorded['etag']:
+                continue
+            if file.size > self.part_size and not recorded.get('upload_id'):
+                recorded['upload_id'] = self.client.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+                recorded['parts'] = {}
+            pending.append(_StoredObject(key, file.source, file.size, ''))
+        self.__write_state()
+
+        parts = [(stored_object, number)
+                 for stored_object in pending if stored_object.size > self.part_size
+                 for number in range(_part_count(stored_object.size, self.part_size))
+                 if str(number) not in uploads[stored_object.key]['parts']]
+        whole_objects = [stored_object for stored_object in pending if stored_object.size <= self.part_size]
+        progress = ProgressReporter('Uploaded', len(pending), sum(stored_object.size for stored_object in pending))
+
+        def upload_part(part: Tuple[_StoredObject, int]) -> None:
+            stored_object, number = part
+            recorded = uploads[stored_object.key]
+            etag = self.__upload_part(bucket, stored_object, recorded['upload_id'], number)
+            self.__record({'uploads': stored_object.key, 'part': number, 'etag': etag})
+            progress.add(0, _part_length(stored_object.size, self.part_size, number))
+
+        def upload_whole_object(stored_object: _StoredObject) -> None:
+            with open(stored_object.path, 'rb') as file:
+                data = file.read()
+            digest = hashlib.md5(data).hexdigest()
+            response = self.client.put_object(Bucket=bucket, Key=stored_object.key, Body=data)
+            _check_etag(stored_object.key, response['ETag'], digest)
+            self.__record({'uploads': stored_object.key, 'etag': digest})
+            progress.add(1, stored_object.size)
+
+        with self.__open_journal():
+            run_bounded(self.worker_count, upload_part, parts)
+            run_bounded(self.worker_count, upload_whole_object, whole_objects)
+        for stored_object in pending:
+            if stored_object.size > self.part_size:
+                self.__complete_upload(bucket, stored_object, uploads[stored_object.key])
+        self.__write_state()
+
+        log = logging.getLogger(ObjectStoreTransfer.__name__)
+        log.log(
+            logging.INFO,
+            f'Uploaded {len(pending)} of {len(files)} files to s3://{bucket}/{prefix} '
+            f'in {time.perf_counter() - start:.1f} s, the rest were already uploaded')
+
+    def __list_objects(self, bucket: str, prefix: str, to_directory: str) -> List[_StoredObject]:
+        objects = []
+        for content in self.__list_contents(bucket, prefix):
+            key = content['Key']
+            if key.endswith('/'):
+                continue
+            relative_path = key[len(prefix):]
+            if any(part in ('', '.', '..') for part in relative_path.split('/')):
+                raise MigrationError(f'Can not download the object with an unsafe key: {key}')
+            path = os.path.join(to_directory, *relative_path.split('/'))
+            objects.append(_StoredObject(key, path, content['Size'], _strip_etag(content['ETag'])))
+        return objects
+
+    def __list_etags(self, bucket: str, prefix: str) -> Dict[str, str]:
+        return {content['Key']: _strip_etag(content['ETag']) for content in self.__list_contents(bucket, prefix)}
+
+    def __list_contents(self, bucket: str, prefix: str) -> Iterator[Dict[str, Any]]:
+        arguments = {'Bucket': bucket, 'Prefix': prefix}
+        while True:
+            response = self.client.list_objects_v2(**arguments)
+            yield from response.get('Contents', [])
+            if not response.get('IsTruncated'):
+                return
+            arguments['ContinuationToken'] = response['NextContinuationToken']
+
+    def __download_part(self, bucket: str, stored_object: _StoredObject, number: int) -> None:
+        offset = number * self.part_size
+        length = _part_length(stored_object.size, self.part_size, number)
+        if not length:
+            return
+        response = self.client.get_object(
+            Bucket=bucket,
+            Key=stored_object.key,
+            Range=f'bytes={offset}-{offset + length - 1}',
+            IfMatch=f'"{stored_object.etag}"')
+        with open(stored_object.path + _PARTIAL_EXTENSION, 'r+b') as file:
+            file.seek(offset)
+            for block in iter(lambda: response['Body'].read(MEGABYTE), b''):
+                file.write(block)
+            if file.tell() != offset + length:
+                raise MigrationError(f'Downloading {stored_object.key} returned the wrong number of bytes.')
+
+    def __verify_download(self, stored_object: _StoredObject, path: str) -> None:
+        # An ETag of the form <hash>-<part count> was computed from parts of an unknown size,
+        # so only the part sizes multipart uploads commonly use can be checked against it.
+        if '-' not in stored_object.etag:
+            _check_etag(stored_object.key, stored_object.etag, _hash_file_parts(path, stored_object.size)[0].hex())
+            return
+        part_count = int(stored_object.etag.split('-')[1])
+        for part_size in sorted({self.part_size, 8 * MEGABYTE, 16 * MEGABYTE, _round_up_to_megabytes(
+                -(-stored_object.size // part_count))}):
+            if _part_count(stored_object.size, part_size) == part_count:
+                if _multipart_etag(_hash_file_parts(path, part_size)) == stored_object.etag:
+                    return
+        log = logging.getLogger(ObjectStoreTransfer.__name__)
+        log.warning(f'Could not check the contents of {stored_object.key} against its ETag {stored_object.etag}')
+
+    def __upload_part(self, bucket: str, stored_object: _StoredObject, upload_id: str, number: int) -> str:
+        with open(stored_object.path, 'rb') as file:
+            file.seek(number * self.part_size)
+            data = file.read(self.part_size)
+        digest = hashlib.md5(data).hexdigest()
+        response = self.client.upload_part(
+            Bucket=bucket,
+            Key=stored_object.key,
+            UploadId=upload_id,
+            PartNumber=number + 1,
+            Body=data)
+        _check_etag(stored_object.key, response['ETag'], digest)
+        return digest
+
+    def __complete_upload(self, bucket: str, stored_object: _StoredObject, recorded: Dict[str, Any]) -> None:
+        part_etags = [recorded['parts'][str(number)]
+                      for number in range(_part_count(stored_object.size, self.part_size))]
+        response = self.client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=stored_object.key,
+            UploadId=recorded['upload_id'],
+            MultipartUpload={'Parts': [{'ETag': f'"{etag}"', 'PartNumber': number + 1}
+                                       for number, etag in enumerate(part_etags)]})
+        expected_etag = _multipart_etag([bytes.fromhex(etag) for etag in part_etags])
+        _check_etag(stored_object.key, response['ETag'], expected_etag)
+        recorded['etag'] = expected_etag
+        recorded.pop('upload_id')
+        recorded['parts'] = {}
+
+    def __read_state(self) -> Dict[str, Dict[str, Any]]:
+        state: Dict[str, Dict[str, Any]] = {}
+        if os.path.isfile(self.__state_path):
+            with open(self.__state_path, encoding='utf-8') as file:
+                state = json.load(file)
+        if os.path.isfile(self.__journal_path):
+            with open(self.__journal_path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line is cut short if the transfer stopped while writing it.
+                        break
+                    _apply_journal_entry(state, entry)
+        return state
+
+    @contextmanager
+    def __open_journal(self) -> Iterator[None]:
+        os.makedirs(os.path.dirname(self.__journal_path) or '.', exist_ok=True)
+        with open(self.__journal_path, 'a', encoding='utf-8') as journal:
+            self.__journal = journal
+            try:
+                yield
+            finally:
+                self.__journal = None
+
+    def __record(self, entry: Dict[str, Any]) -> None:
+        """
+        Records a finished part or object in the state and, while the journal is open,
+        appends it to the journal so that it survives an interrupted transfer.
+        """
+        with self.__state_lock:
+            _apply_journal_entry(self.__state, entry)
+            if self.__journal is not None:
+                self.__journal.write(json.dumps(entry) + '\n')
+                self.__journal.flush()
+
+    def __write_state(self) -> None:
+        with self.__state_lock:
+            os.makedirs(os.path.dirname(self.__state_path) or '.', exist_ok=True)
+            temporary_path = self.__state_path + '.tmp'
+            with open(temporary_path, 'w', encoding='utf-8') as file:
+                json.dump(self.__state, file)
+            os.replace(temporary_path, self.__state_path)
+            if os.path.exists(self.__journal_path):
+                os.remove(self.__journal_path)
+
+
+def _apply_journal_entry(state: Dict[str, Dict[str, Any]], entry: Dict[str, Any]) -> None:
+    if 'downloads' in entry:
+        recorded = state.get('downloads', {}).get(entry['downloads'])
+        if recorded is not None and entry['part'] not in recorded['parts']:
+            recorded['parts'].append(entry['part'])
+        return
+    recorded = state.get('uploads', {}).get(entry['uploads'])
+    if recorded is None:
+        return
+    if 'part' in entry:
+        recorded['parts'][str(entry['part'])] = entry['etag']
+    else:
+        recorded['etag'] = entry['etag']
+
+
+def _check_etag(key: str, etag: str, expected_etag: str) -> None:
+    if _strip_etag(etag) != expected_etag:
+        raise MigrationError(f'The contents of {key} do not match its ETag {etag}.')
+
+
+def _strip_etag(etag: str) -> str:
+    return etag.strip('"')
+
+
+def _multipart_etag(part_digests: List[bytes]) -> str:
+    return f'{hashlib.md5(b"".join(part_digests)).hexdigest()}-{len(part_digests)}'
+
+
+def _hash_file_parts(path: str, part_size: int) -> List[bytes]:
+    digests: List[bytes] = []
+    with open(path, 'rb') as file:
+        while True:
+            digest = hashlib.md5()
+            remaining = part_size
+            while remaining:
+                block = file.read(min(remaining, MEGABYTE))
+                if not block:
+                    break
+                digest.update(block)
+                remaining -= len(block)
+            if remaining == part_size and digests:
+                return digests
+            digests.append(digest.digest())
+            if remaining:
+                return digests
+
+
+def _part_count(size: int, part_size: int) -> int:
+    return max(1, -(-size // part_size))
+
+
+def _part_length(size: int, part_size: int, number: int) -> int:
+    return min(part_size, size - number * part_size)
+
+
+def _round_up_to_megabytes(size: int) -> int:
+    return -(-size // MEGABYTE) * MEGABYTE
+
+
+def _file_size(path: str) -> int:
+    return os.path.getsize(path) if os.path.isfile(path) else -1
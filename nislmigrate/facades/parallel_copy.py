@@ -0,0 +1,678 @@
+"""Copy directory trees with many files on several threads at once."""
+
+import hashlib
+import heapq
+import logging
+import os
+import queue
+import shutil
+import stat
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from enum import Enum
+from typing import BinaryIO, Callable, Iterable, List, NamedTuple, Optional, Set, Tuple, TypeVar
+
+from nislmigrate.logs.migration_error import MigrationError
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
+
+DEFAULT_WORKER_COUNT = min(32, (os.cpu_count() or 1) * 4)
+DEFAULT_BUFFER_SIZE = 8 * 1024 * 1024
+MEGABYTE = 1024 * 1024
+# Modification times are compared with this tolerance because FAT formatted
+# drives, which captures are often carried on, store them in 2 second steps.
+MODIFICATION_TIME_TOLERANCE_SECONDS = 2
+PROGRESS_INTERVAL_SECONDS = 5
+# Files at least this large are read and written on separate threads when the
+# kernel can not copy them, so that reads and writes overlap.
+PIPELINE_THRESHOLD = 64 * MEGABYTE
+# The number of buffers read ahead of the writer, bounding the memory a pipelined copy uses.
+PIPELINE_QUEUE_DEPTH = 4
+LARGEST_FILE_COUNT = 5
+
+# The Linux ioctl that makes a file share the data blocks of another file.
+_FICLONE = 0x40049409
+
+_T = TypeVar('_T')
+_R = TypeVar('_R')
+
+
+class LinkMode(Enum):
+    """
+    How files are placed in the destination of a copy.
+    """
+    # Copy the contents of every file.
+    COPY = 'copy'
+    # Create a hard link to every file. The copy shares the source's data, so later
+    # changes made to a file in place show up in both.
+    HARDLINK = 'hardlink'
+    # Clone every file on filesystems that support copy-on-write block sharing.
+    REFLINK = 'reflink'
+    # Clone files where possible and hard link them otherwise.
+    AUTO = 'auto'
+
+
+class FileToCopy(NamedTuple):
+    """
+    A file found while scanning the source directory.
+    """
+    source: str
+    destination: str
+    size: int
+    modified_time: float
+
+
+class FileTreeIndex(NamedTuple):
+    """
+    Everything beneath a directory, gathered in a single scan before it is copied.
+    """
+    directories: List[Tuple[str, str]]
+    files: List[FileToCopy]
+    byte_count: int
+    depth: int
+    largest_files: List[FileToCopy]
+
+    @property
+    def file_count(self) -> int:
+        return len(self.files)
+
+
+class ReferencedFileSelection(NamedTuple):
+    """
+    The files of an index that a list of paths refers to, and what the two disagree on.
+    """
+    referenced_index: FileTreeIndex
+    orphaned_files: List[FileToCopy]
+    missing_paths: List[str]
+
+
+class CopyStatistics(NamedTuple):
+    """
+    The amount of data copied and how long copying took.
+    """
+    file_count: int
+    byte_count: int
+    seconds: float
+    unchanged_file_count: int = 0
+    deleted_count: int = 0
+    linked_file_count: int = 0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.file_count / self.seconds if self.seconds else 0.0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.byte_count / MEGABYTE / self.seconds if self.seconds else 0.0
+
+
+class ParallelDirectoryCopier:
+    """
+    Copies a directory tree by scanning it once, creating every directory up
+    front and then copying the files on a bounded pool of threads.
+    """
+    def __init__(
+            self,
+            worker_count: int = DEFAULT_WORKER_COUNT,
+            buffer_size: int = DEFAULT_BUFFER_SIZE,
+            link_mode: LinkMode = LinkMode.COPY):
+        """
+        Creates a new instance of ParallelDirectoryCopier.
+
+        :param worker_count: The number of files to copy at once.
+        :param buffer_size: The number of bytes to copy with each read and write.
+        :param link_mode: Whether to link files instead of copying them. Files that
+                          can not be linked are copied.
+        """
+        self.worker_count = max(1, worker_count)
+        self.buffer_size = buffer_size
+        self.link_mode = link_mode
+
+    def copy_directory(
+            self,
+            from_directory: str,
+            to_directory: str,
+            index: Optional[FileTreeIndex] = None) -> CopyStatistics:
+        """
+        Copies the contents of one directory into another, preserving file metadata.
+
+        :param from_directory: The directory whose contents to copy.
+        :param to_directory: The directory to put the copied contents, created if needed.
+        :param index: The index of from_directory mapped into to_directory, if it was
+                      already built with index_directory.
+        :return: How many files and bytes were copied and how long it took.
+        """
+        start = time.perf_counter()
+        if index is None:
+            index = index_directory(from_directory, to_directory)
+        directories, files = index.directories, index.files
+        for _, destination in directories:
+            os.makedirs(destination, exist_ok=True)
+        progress = ProgressReporter('Copied', index.file_count, index.byte_count)
+
+        def copy_file(file: FileToCopy) -> bool:
+            was_linked = self.__copy_file(file)
+            progress.add(1, file.size)
+            return was_linked
+
+        linked = run_bounded(self.worker_count, copy_file, files)
+        # Copying files into a directory changes its modification time, so directory
+        # metadata is copied once all of the files are in place.
+        for source, destination in reversed(directories):
+            shutil.copystat(source, destination)
+
+        statistics = CopyStatistics(
+            len(files),
+            sum(file.size for file, was_linked in zip(files, linked) if not was_linked),
+            time.perf_counter() - start,
+            linked_file_count=sum(linked))
+        _log_statistics(statistics)
+        return statistics
+
+    def synchronize_directory(
+            self,
+            from_directory: str,
+            to_directory: str,
+            compare_checksums: bool = False) -> CopyStatistics:
+        """
+        Makes one directory a copy of another, copying only the files that differ
+        and deleting the files and directories that no longer exist in the source.
+        Files are considered unchanged when their sizes match and their modification
+        times match, or their checksums match if compare_checksums is set.
+
+        :param from_directory: The directory whose contents to copy.
+        :param to_directory: The directory to update, created if needed.
+        :param compare_checksums: Whether to compare file contents instead of modification times.
+        :return: How many files and bytes were copied, how many files were already
+                 up to date, how many paths were deleted and how long it took.
+        """
+        start = time.perf_counter()
+        index = index_directory(from_directory, to_directory)
+        directories, files = index.directories, index.files
+        existing_directories, existing_files = scan_directory(to_directory, from_directory) \
+            if os.path.isdir(to_directory) else ([], [])
+        source_directories = {destination for _, destination in directories}
+        source_files = {file.destination for file in files}
+
+        deleted_count = 0
+        for existing_directory, _ in existing_directories:
+            if existing_directory not in source_directories and os.path.isdir(existing_directory):
+                shutil.rmtree(existing_directory, onerror=_remove_readonly_and_retry)
+                deleted_count += 1
+        for existing_file in existing_files:
+            if existing_file.source not in source_files and os.path.lexists(existing_file.source):
+                _remove_file(existing_file.source)
+                deleted_count += 1
+
+        existing = {file.source: file for file in existing_files if file.source in source_files}
+        for _, destination in directories:
+            os.makedirs(destination, exist_ok=True)
+
+        progress = ProgressReporter('Synchronized', index.file_count, index.byte_count)
+
+        def copy_if_changed(file: FileToCopy) -> Optional[bool]:
+            existing_file = existing.get(file.destination)
+            if existing_file and self.__is_unchanged(file, existing_file, compare_checksums):
+                progress.add(1, file.size)
+                return None
+            if existing_file:
+                # Replace rather than overwrite the file, which may be a link to other data.
+                _remove_file(file.destination)
+            was_linked = self.__copy_file(file)
+            progress.add(1, file.size)
+            return was_linked
+
+        results = run_bounded(self.worker_count, copy_if_changed, files)
+        for source, destination in reversed(directories):
+            shutil.copystat(source, destination)
+
+        copied = [file for file, was_linked in zip(files, results) if was_linked is not None]
+        linked_file_count = sum(1 for was_linked in results if was_linked)
+        statistics = CopyStatistics(
+            len(copied),
+            sum(file.size for file, was_linked in zip(files, results) if was_linked is False),
+            time.perf_counter() - start,
+            len(files) - len(copied),
+            deleted_count,
+            linked_file_count)
+        _log_statistics(statistics)
+        return statistics
+
+    def __copy_file(self, file: FileToCopy) -> bool:
+        return place_file(file, self.link_mode, self.buffer_size)
+
+    def __is_unchanged(self, file: FileToCopy, existing_file: FileToCopy, compare_checksums: bool) -> bool:
+        if file.size != existing_file.size:
+            return False
+        if compare_checksums:
+            return hash_file(file.source, self.buffer_size) == hash_file(existing_file.source, self.buffer_size)
+        return abs(file.modified_time - existing_file.modified_time) <= MODIFICATION_TIME_TOLERANCE_SECONDS
+
+
+def scan_directory(from_directory: str, to_directory: str) -> Tuple[List[Tuple[str, str]], List[FileToCopy]]:
+    """
+    Lists every directory and file beneath a directory using os.scandir.
+
+    :param from_directory: The directory to scan.
+    :param to_directory: The directory the scanned paths are mapped into.
+    :return: The (source, destination) pairs of each directory, parents before their
+             children and starting with the root, and the files to copy.
+    """
+    directories = [(from_directory, to_directory)]
+    files: List[FileToCopy] = []
+    visited: Set[Tuple[int, int]] = set()
+    index = 0
+    while index < len(directories):
+        source_directory, destination_directory = directories[index]
+        index += 1
+        with os.scandir(source_directory) as entries:
+            for entry in entries:
+                destination = os.path.join(destination_directory, entry.name)
+                if entry.is_dir():
+                    # Following links to directories could otherwise visit a directory forever.
+                    info = entry.stat()
+                    if (info.st_dev, info.st_ino) not in visited:
+                        visited.add((info.st_dev, info.st_ino))
+                        directories.append((entry.path, destination))
+                else:
+                    info = entry.stat()
+                    files.append(FileToCopy(entry.path, destination, info.st_size, info.st_mtime))
+    return directories, files
+
+
+def index_directory(
+        from_directory: str,
+        to_directory: Optional[str] = None,
+        largest_file_count: int = LARGEST_FILE_COUNT) -> FileTreeIndex:
+    """
+    Scans a directory and summarizes what it holds, so that copying it can report
+    progress and the destination can be checked for free space before copying.
+
+    :param from_directory: The directory to index.
+    :param to_directory: The directory the indexed paths are mapped into. Defaults to from_directory.
+    :param largest_file_count: The number of largest files to list in the index.
+    :return: The index.
+    """
+    directories, files = scan_directory(from_directory, from_directory if to_directory is None else to_directory)
+    depth = max((os.path.relpath(source, from_directory).count(os.sep) + 1 for source, _ in directories[1:]),
+                default=0)
+    index = FileTreeIndex(
+        directories,
+        files,
+        sum(file.size for file in files),
+        depth,
+        heapq.nlargest(largest_file_count, files, key=lambda file: file.size))
+    log = logging.getLogger(ParallelDirectoryCopier.__name__)
+    log.log(
+        logging.INFO,
+        f'Found {index.file_count} files ({index.byte_count / MEGABYTE:.1f} MB) in {len(directories)} '
+        f'directories up to {index.depth} levels deep in {from_directory}')
+    return index
+
+
+def select_referenced_files(index: FileTreeIndex, referenced_paths: Iterable[str]) -> ReferencedFileSelection:
+    """
+    Narrows an index down to the files a list of paths refers to, along with the
+    directories that contain them.
+
+    :param index: The index of every file in a directory.
+    :param referenced_paths: The full paths of the files to keep. Paths are compared
+                             the way the platform compares them, ignoring case on Windows.
+    :return: The narrowed index, the indexed files no path refers to and the
+             paths that do not refer to an indexed file.
+    """
+    referenced = {os.path.normcase(os.path.abspath(path)): path for path in referenced_paths}
+    files = []
+    orphaned_files = []
+    for file in index.files:
+        if referenced.pop(os.path.normcase(os.path.abspath(file.source)), None) is None:
+            orphaned_files.append(file)
+        else:
+            files.append(file)
+
+    root_source, root_destination = index.directories[0]
+    needed_directories = {root_destination}
+    for file in files:
+        directory = os.path.dirname(file.destination)
+        while directory not in needed_directories:
+            needed_directories.add(directory)
+            directory = os.path.dirname(directory)
+    directories = [directory for directory in index.directories if directory[1] in needed_directories]
+    selected_index = FileTreeIndex(
+        directories,
+        files,
+        sum(file.size for file in files),
+        max((os.path.relpath(source, root_source).count(os.sep) + 1 for source, _ in directories[1:]), default=0),
+        heapq.nlargest(len(index.largest_files), files, key=lambda file: file.size))
+    return ReferencedFileSelection(selected_index, orphaned_files, sorted(referenced.values()))
+
+
+def verify_free_space(index: FileTreeIndex, to_directory: str) -> None:
+    """
+    Raises an error if the volume of a directory does not have room for the indexed files.
+
+    :param index: The index of the files to copy.
+    :param to_directory: The directory the files will be copied to, which need not exist yet.
+    """
+    existing_directory = os.path.abspath(to_directory)
+    while not os.path.exists(existing_directory) and os.path.dirname(existing_directory) != existing_directory:
+        existing_directory = os.path.dirname(existing_directory)
+    free_byte_count = shutil.disk_usage(existing_directory).free
+    if free_byte_count < index.byte_count:
+        largest = ', '.join(f'{file.source} ({file.size / MEGABYTE:.1f} MB)' for file in index.largest_files)
+        raise MigrationError(
+            f'Copying {index.byte_count / MEGABYTE:.1f} MB to {to_directory} needs more than the '
+            f'{free_byte_count / MEGABYTE:.1f} MB that is free. The largest files are: {largest}')
+
+
+class ProgressReporter:
+    """
+    Logs how much of a long running operation is done and how long the rest should
+    take, at most once per progress interval. Safe to update from several threads.
+    """
+    def __init__(self, action: str, file_count: int, byte_count: int = 0):
+        """
+        Creates a new instance of ProgressReporter.
+
+        :param action: The past tense verb that starts each progress message.
+        :param file_count: The number of files the operation handles.
+        :param byte_count: The number of bytes the operation handles, or 0 to
+                           measure progress by the number of files.
+        """
+        self.action = action
+        self.file_count = file_count
+        self.byte_count = byte_count
+        self.done_file_count = 0
+        self.done_byte_count = 0
+        self.__start = time.perf_counter()
+        self.__last_report = self.__start
+        self.__lock = threading.Lock()
+
+    def add(self, file_count: int, byte_count: int = 0) -> None:
+        """
+        Records that more files are done and logs the progress if it is time to.
+
+        :param file_count: The number of files done since the last call.
+        :param byte_count: The number of bytes done since the last call.
+        """
+        with self.__lock:
+            self.done_file_count += file_count
+            self.done_byte_count += byte_count
+            now = time.perf_counter()
+            if now - self.__last_report < PROGRESS_INTERVAL_SECONDS:
+                return
+            self.__last_report = now
+            message = self.__describe(now - self.__start)
+        logging.getLogger(ProgressReporter.__name__).log(logging.INFO, message)
+
+    def __describe(self, elapsed_seconds: float) -> str:
+        if self.byte_count:
+            fraction = self.done_byte_count / self.byte_count
+            amount = f'{self.done_byte_count / MEGABYTE:.1f} of {self.byte_count / MEGABYTE:.1f} MB'
+        else:
+            fraction = self.done_file_count / self.file_count if self.file_count else 1.0
+            amount = f'{self.done_file_count} of {self.file_count} files'
+        message = f'{self.action} {amount} ({100 * fraction:.0f}%)'
+        if 0 < fraction < 1:
+            message += f', about {_format_duration(elapsed_seconds * (1 - fraction) / fraction)} remaining'
+        return message
+
+
+def run_bounded(worker_count: int, function: Callable[[_T], _R], items: Iterable[_T]) -> List[_R]:
+    """
+    Calls a function for each item on a pool of threads, keeping at most two
+    calls per worker queued. The first error raised by any call is re-raised.
+
+    :param worker_count: The number of threads to use.
+    :param function: The function to call for each item.
+    :param items: The items to pass to the function.
+    :return: The result of each call, in the order of the items.
+    """
+    window = worker_count * 2
+    futures: List[Future] = []
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        pending: Set[Future] = set()
+        for item in items:
+            future = executor.submit(function, item)
+            futures.append(future)
+            pending.add(future)
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _raise_first_error(done)
+        done, _ = wait(pending)
+        _raise_first_error(done)
+    return [future.result() for future in futures]
+
+
+def place_file(file: FileToCopy, link_mode: LinkMode, buffer_size: int = DEFAULT_BUFFER_SIZE) -> bool:
+    """
+    Links or copies a file into its destination, preserving its metadata.
+
+    :param file: The file to place.
+    :param link_mode: Whether to try linking the file before copying it.
+    :param buffer_size: The number of bytes to copy with each call.
+    :return: True if the file was linked, False if it was copied.
+    """
+    if link_mode in (LinkMode.REFLINK, LinkMode.AUTO) and reflink_file(file.source, file.destination):
+        shutil.copystat(file.source, file.destination)
+        return True
+    if link_mode in (LinkMode.HARDLINK, LinkMode.AUTO) and hardlink_file(file.source, file.destination):
+        return True
+    copy_file_contents(file.source, file.destination, file.size, buffer_size)
+    shutil.copystat(file.source, file.destination)
+    return False
+
+
+def hash_file(path: str, buffer_size: int = DEFAULT_BUFFER_SIZE, digest_size: int = 64) -> bytes:
+    """
+    Computes a BLAKE2 digest of the contents of a file.
+
+    :param path: The file to hash.
+    :param buffer_size: The number of bytes to read at once.
+    :param digest_size: The size of the digest in bytes.
+    :return: The digest.
+    """
+    digest = hashlib.blake2b(digest_size=digest_size)
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(buffer_size), b''):
+            digest.update(block)
+    return digest.digest()
+
+
+def hardlink_file(source_path: str, destination_path: str) -> bool:
+    """
+    Creates a hard link to a file.
+
+    :param source_path: The file to link to.
+    :param destination_path: The path of the new link.
+    :return: False if the file could not be linked, for example because the paths
+             are on different volumes.
+    """
+    try:
+        os.link(source_path, destination_path)
+        return True
+    except OSError:
+        return False
+
+
+def reflink_file(source_path: str, destination_path: str) -> bool:
+    """
+    Creates a copy-on-write clone of a file that shares the data blocks of the original.
+
+    :param source_path: The file to clone.
+    :param destination_path: The path of the clone.
+    :return: False if the platform or filesystem does not support cloning the file.
+    """
+    if fcntl is None:
+        return False
+    try:
+        with open(source_path, 'rb') as source, open(destination_path, 'wb') as destination:
+            fcntl.ioctl(destination.fileno(), _FICLONE, source.fileno())
+        return True
+    except OSError:
+        if os.path.exists(destination_path):
+            os.remove(destination_path)
+        return False
+
+
+def copy_file_contents(source_path: str, destination_path: str, size: int, buffer_size: int) -> None:
+    """
+    Copies the contents of a file, letting the kernel move the data with
+    copy_file_range or sendfile where the platform supports it.
+
+    :param source_path: The file to copy.
+    :param destination_path: The file to create or overwrite.
+    :param size: The size of the file in bytes.
+    :param buffer_size: The number of bytes to copy with each call.
+    """
+    with open(source_path, 'rb') as source, open(destination_path, 'wb') as destination:
+        if size and _copy_in_kernel(source, destination, size, buffer_size):
+            return
+        if size >= PIPELINE_THRESHOLD:
+            copy_pipelined(source, destination, buffer_size)
+            return
+        shutil.copyfileobj(source, destination, buffer_size)
+
+
+def copy_single_file(source_path: str, destination_path: str, buffer_size: int = DEFAULT_BUFFER_SIZE) -> str:
+    """
+    Copies a file and its permission bits like shutil.copy, overlapping reads and
+    writes for large files.
+
+    :param source_path: The file to copy.
+    :param destination_path: The file to create or overwrite, or the directory to copy the file into.
+    :param buffer_size: The number of bytes to read or write at once.
+    :return: The path of the copy.
+    """
+    if os.path.isdir(destination_path):
+        destination_path = os.path.join(destination_path, os.path.basename(source_path))
+    copy_file_contents(source_path, destination_path, os.path.getsize(source_path), buffer_size)
+    shutil.copymode(source_path, destination_path)
+    return destination_path
+
+
+def copy_pipelined(
+        source: BinaryIO,
+        destination: BinaryIO,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        queue_depth: int = PIPELINE_QUEUE_DEPTH) -> int:
+    """
+    Copies one open file to another with a reader thread that fills a bounded queue of
+    buffers while the calling thread writes them, so that a slow read from one device
+    and a slow write to another happen at the same time.
+
+    :param source: The file to read from.
+    :param destination: The file to write to.
+    :param buffer_size: The number of bytes to read or write at once.
+    :param queue_depth: The number of buffers that may be read ahead of the writer.
+    :return: The number of bytes copied.
+    """
+    blocks: queue.Queue = queue.Queue(maxsize=max(1, queue_depth))
+    stopped = threading.Event()
+
+    def read() -> None:
+        try:
+            while not stopped.is_set():
+                block = source.read(buffer_size)
+                blocks.put(block)
+                if not block:
+                    return
+        except BaseException as error:
+            blocks.put(error)
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    byte_count = 0
+    try:
+        while True:
+            block = blocks.get()
+            if isinstance(block, BaseException):
+                raise block
+            if not block:
+                return byte_count
+            destination.write(block)
+            byte_count += len(block)
+    finally:
+        stopped.set()
+        # Emptying the queue releases a reader waiting to add a buffer after a failed write.
+        while reader.is_alive():
+            try:
+                blocks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def _copy_file_range(source: int, destination: int, offset: int, count: int) -> int:
+    return os.copy_file_range(source, destination, count, offset, offset)
+
+
+def _sendfile(source: int, destination: int, offset: int, count: int) -> int:
+    return os.sendfile(destination, source, offset, count)
+
+
+def _copy_in_kernel(source, destination, size: int, buffer_size: int) -> bool:
+    kernel_copies = [function for name, function in (('copy_file_range', _copy_file_range), ('sendfile', _sendfile))
+                     if hasattr(os, name)]
+    for kernel_copy in kernel_copies:
+        offset = 0
+        try:
+            while True:
+                copied = kernel_copy(source.fileno(), destination.fileno(), offset, buffer_size)
+                if copied == 0:
+                    break
+                offset += copied
+        except OSError:
+            if offset:
+                raise
+            continue
+        if offset >= size:
+            return True
+        # Some file systems report success but copy nothing, so start over with the next way of copying.
+        destination.seek(0)
+        destination.truncate()
+    return False
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f'{hours} h {minutes:02} min'
+    if minutes:
+        return f'{minutes} min {seconds:02} s'
+    return f'{seconds} s'
+
+
+def _log_statistics(statistics: CopyStatistics) -> None:
+    message = (f'Copied {statistics.file_count} files ({statistics.byte_count / MEGABYTE:.1f} MB) '
+               f'in {statistics.seconds:.1f} s: {statistics.files_per_second:.0f} files/s, '
+               f'{statistics.megabytes_per_second:.1f} MB/s')
+    if statistics.linked_file_count:
+        message += f', {statistics.linked_file_count} of them linked instead of copied'
+    if statistics.unchanged_file_count or statistics.deleted_count:
+        message += (f'. Skipped {statistics.unchanged_file_count} unchanged files '
+                    f'and deleted {statistics.deleted_count} paths no longer in the source')
+    log = logging.getLogger(ParallelDirectoryCopier.__name__)
+    log.log(logging.INFO, message)
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except PermissionError:
+        os.chmod(path, stat.S_IWRITE)
+        os.remove(path)
+
+
+def _remove_readonly_and_retry(function, path, _) -> None:
+    os.chmod(path, stat.S_IWRITE)
+    function(path)
+
+
+def _raise_first_error(futures: Iterable[Future]) -> None:
+    for future in futures:
+        future.result()
@@ -0,0 +1,151 @@
+"""Delete directory trees with many files on several threads at once."""
+
+import logging
+import os
+import stat
+import time
+from typing import Dict, List, NamedTuple, Tuple
+
+from nislmigrate.facades.parallel_copy import DEFAULT_WORKER_COUNT, ProgressReporter, run_bounded
+
+# The number of paths deleted by each task, so that tasks outweigh the cost of scheduling them.
+BATCH_SIZE = 256
+
+
+class RemoveStatistics(NamedTuple):
+    """
+    The number of paths deleted and how long deleting them took.
+    """
+    file_count: int
+    directory_count: int
+    read_only_count: int
+    seconds: float
+
+
+class ParallelTreeRemover:
+    """
+    Deletes a directory tree by scanning it once, clearing the read-only attribute of
+    every read-only path up front and then deleting files and directories in batches
+    on a bounded pool of threads.
+    """
+    def __init__(self, worker_count: int = DEFAULT_WORKER_COUNT):
+        """
+        Creates a new instance of ParallelTreeRemover.
+
+        :param worker_count: The number of batches to delete at once.
+        """
+        self.worker_count = max(1, worker_count)
+
+    def remove_tree(self, directory: str) -> RemoveStatistics:
+        """
+        Deletes a directory and everything beneath it. Links, directory junctions and
+        mount points are deleted without deleting what they point to.
+
+        :param directory: The directory to delete.
+        :return: How many paths were deleted and how long it took.
+        """
+        start = time.perf_counter()
+        if os.path.islink(directory):
+            os.unlink(directory)
+            return RemoveStatistics(1, 0, 0, time.perf_counter() - start)
+        if _is_reparse_point(os.lstat(directory)):
+            os.rmdir(directory)
+            return RemoveStatistics(0, 1, 0, time.perf_counter() - start)
+        return self.__remove(directory, start, keep_directory=False)
+
+    def remove_contents(self, directory: str) -> RemoveStatistics:
+        """
+        Deletes everything beneath a directory, keeping the directory itself. The
+        directory may be a link, directory junction or mount point, whose target is
+        emptied.
+
+        :param directory: The directory to empty.
+        :return: How many paths were deleted and how long it took.
+        """
+        return self.__remove(directory, time.perf_counter(), keep_directory=True)
+
+    def __remove(self, directory: str, start: float, keep_directory: bool) -> RemoveStatistics:
+        directories_by_depth, files, linked_directories, read_only = _scan_for_removal(directory)
+        if keep_directory:
+            directories_by_depth[0] = []
+            read_only = [(path, mode) for path, mode in read_only if path != directory]
+        run_bounded(self.worker_count, _make_writable, _batches(read_only))
+
+        progress = ProgressReporter('Deleted', len(files))
+
+        def remove_files(batch: List[str]) -> None:
+            for path in batch:
+                os.unlink(path)
+            progress.add(len(batch))
+
+        run_bounded(self.worker_count, remove_files, _batches(files))
+        run_bounded(self.worker_count, _remove_directories, _batches(linked_directories))
+        # Directories can only be removed once they are empty, so each level of the tree
+        # is removed in parallel after the level beneath it.
+        for depth in sorted(directories_by_depth, reverse=True):
+            run_bounded(self.worker_count, _remove_directories, _batches(directories_by_depth[depth]))
+
+        directory_count = sum(len(directories) for directories in directories_by_depth.values()) \
+            + len(linked_directories)
+        statistics = RemoveStatistics(len(files), directory_count, len(read_only), time.perf_counter() - start)
+        log = logging.getLogger(ParallelTreeRemover.__name__)
+        log.log(
+            logging.INFO,
+            f'Deleted {statistics.file_count} files and {statistics.directory_count} directories '
+            f'in {statistics.seconds:.1f} s')
+        return statistics
+
+
+def _scan_for_removal(
+        directory: str) -> Tuple[Dict[int, List[str]], List[str], List[str], List[Tuple[str, int]]]:
+    """
+    Lists the directories beneath a directory by depth, the files and links to delete,
+    the directory junctions and mount points to delete without scanning them, and the
+    paths that are read-only along with their permissions.
+    """
+    directories_by_depth: Dict[int, List[str]] = {0: [directory]}
+    files: List[str] = []
+    linked_directories: List[str] = []
+    read_only: List[Tuple[str, int]] = []
+    root_mode = os.lstat(directory).st_mode
+    if not root_mode & stat.S_IWRITE:
+        read_only.append((directory, root_mode))
+    depth = 0
+    while depth in directories_by_depth:
+        for parent in directories_by_depth[depth]:
+            with os.scandir(parent) as entries:
+                for entry in entries:
+                    entry_stat = entry.stat(follow_symlinks=False)
+                    if _is_reparse_point(entry_stat) and entry.is_dir(follow_symlinks=False):
+                        # Like shutil.rmtree, never descend into or change a junction or mount
+                        # point, since what is beneath it belongs to its target.
+                        linked_directories.append(entry.path)
+                        continue
+                    mode = entry_stat.st_mode
+                    if not mode & stat.S_IWRITE:
+                        read_only.append((entry.path, mode))
+                    if entry.is_dir(follow_symlinks=False):
+                        directories_by_depth.setdefault(depth + 1, []).append(entry.path)
+                    else:
+                        files.append(entry.path)
+        depth += 1
+    return directories_by_depth, files, linked_directories, read_only
+
+
+def _is_reparse_point(path_stat: os.stat_result) -> bool:
+    return bool(getattr(path_stat, 'st_file_attributes', 0) & stat.FILE_ATTRIBUTE_REPARSE_POINT)
+
+
+def _make_writable(batch: List[Tuple[str, int]]) -> None:
+    for path, mode in batch:
+        if not stat.S_ISLNK(mode):
+            os.chmod(path, stat.S_IMODE(mode) | stat.S_IWRITE)
+
+
+def _remove_directories(batch: List[str]) -> None:
+    for path in batch:
+        os.rmdir(path)
+
+
+def _batches(items: list) -> List[list]:
+    return [items[index:index + BATCH_SIZE] for index in range(0, len(items), BATCH_SIZE)]
@@ -50,7 +50,8 @@ class ProcessFacade:
             result = subprocess.check_output(arguments, stderr=subprocess.STDOUT)
             return result.decode('utf-8')
         except subprocess.CalledProcessError as e:
-            raise ProcessError(e.stderr) from e
+            # stderr is merged into the output, so the output holds the error message.
+            raise ProcessError(e.output.decode('utf-8', errors='replace')) from e
 
     def run_background_process(self, arguments: List[str]) -> BackgroundProcess:
         return BackgroundProcess(arguments)
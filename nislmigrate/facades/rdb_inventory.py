@@ -0,0 +1,365 @@
+"""Summarize Redis dump.rdb files and key dumps by streaming through them."""
+
+import os
+import struct
+from collections import Counter
+from typing import BinaryIO, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from nislmigrate.logs.migration_error import MigrationError
+
+# The number of separated parts of a key that make up the prefix its memory is counted under.
+DEFAULT_PREFIX_DEPTH = 2
+# The number of prefixes with the most memory that a summary lists.
+SUMMARY_PREFIX_COUNT = 10
+
+_MAGIC = b'REDIS'
+_PREFIX_SEPARATORS = (b':', b'.')
+# A DUMP payload ends with the RDB version of the server that dumped it and a CRC64 checksum.
+_DUMP_FOOTER = struct.Struct('<HQ')
+# Strings shorter than this are read rather than skipped with a seek.
+_SEEK_THRESHOLD = 64 * 1024
+
+_OPCODE_SLOT_INFO = 0xF4
+_OPCODE_FUNCTION2 = 0xF5
+_OPCODE_FUNCTION_PRE_GA = 0xF6
+_OPCODE_MODULE_AUX = 0xF7
+_OPCODE_IDLE = 0xF8
+_OPCODE_FREQ = 0xF9
+_OPCODE_AUX = 0xFA
+_OPCODE_RESIZEDB = 0xFB
+_OPCODE_EXPIRETIME_MS = 0xFC
+_OPCODE_EXPIRETIME = 0xFD
+_OPCODE_SELECTDB = 0xFE
+_OPCODE_EOF = 0xFF
+
+_TYPE_NAMES = {
+    0: 'string',
+    1: 'list', 10: 'list', 14: 'list', 18: 'list',
+    2: 'set', 11: 'set', 20: 'set',
+    3: 'zset', 5: 'zset', 12: 'zset', 17: 'zset',
+    4: 'hash', 9: 'hash', 13: 'hash', 16: 'hash',
+    15: 'stream', 19: 'stream', 21: 'stream',
+    6: 'module', 7: 'module',
+}
+_STREAM_LISTPACKS_2 = 19
+_STREAM_LISTPACKS_3 = 21
+
+_ENCODING_INT8 = 0
+_ENCODING_INT16 = 1
+_ENCODING_INT32 = 2
+_ENCODING_LZF = 3
+_INTEGER_ENCODING_SIZES = {_ENCODING_INT8: 1, _ENCODING_INT16: 2, _ENCODING_INT32: 4}
+
+
+class RdbInventory(NamedTuple):
+    """
+    What a dump.rdb file or a key dump holds.
+    """
+    version: int
+    key_count: int
+    expiring_key_count: int
+    type_counts: Dict[str, int]
+    prefix_key_counts: Dict[str, int]
+    prefix_byte_counts: Dict[str, int]
+
+    def describe(self, prefix_count: int = SUMMARY_PREFIX_COUNT) -> str:
+        """
+        Describes the inventory in a few lines.
+
+        :param prefix_count: The number of prefixes with the most memory to list.
+        :return: The description.
+        """
+        types = ', '.join(f'{count} {name}' for name, count in sorted(self.type_counts.items()))
+        lines = [f'{self.key_count} keys ({types or "none"}), {self.expiring_key_count} of which expire, '
+                 f'saved with RDB version {self.version}']
+        largest = sorted(self.prefix_byte_counts.items(), key=lambda item: item[1], reverse=True)[:prefix_count]
+        lines.extend(f'  {prefix}: {self.prefix_key_counts[prefix]} keys, {byte_count} bytes'
+                     for prefix, byte_count in largest)
+        return '\n'.join(lines)
+
+
+class _InventoryBuilder:
+    def __init__(self, prefix_depth: int):
+        self.prefix_depth = prefix_depth
+        self.key_count = 0
+        self.expiring_key_count = 0
+        self.type_counts: Counter = Counter()
+        self.prefix_key_counts: Counter = Counter()
+        self.prefix_byte_counts: Counter = Counter()
+
+    def add(self, key: bytes, value_type: int, byte_count: int, expires: bool) -> None:
+        prefix = key_prefix(key, self.prefix_depth)
+        self.key_count += 1
+        self.expiring_key_count += expires
+        self.type_counts[_TYPE_NAMES.get(value_type, f'type {value_type}')] += 1
+        self.prefix_key_counts[prefix] += 1
+        self.prefix_byte_counts[prefix] += byte_count
+
+    def build(self, version: int) -> RdbInventory:
+        return RdbInventory(
+            version,
+            self.key_count,
+            self.expiring_key_count,
+            dict(self.type_counts),
+            dict(self.prefix_key_counts),
+            dict(self.prefix_byte_counts))
+
+
+def read_rdb_version(path: str) -> int:
+    """
+    Reads the RDB version from the header of a dump.rdb file.
+
+    :param path: The dump.rdb file.
+    :return: The RDB version.
+    """
+    with open(path, 'rb') as file:
+        return _read_header(file, path)
+
+
+def read_rdb_inventory(path: str, prefix_depth: int = DEFAULT_PREFIX_DEPTH) -> RdbInventory:
+    """
+    Counts the keys of a dump.rdb file by type and by prefix, reading through the file
+    once and skipping over values without loading them.
+
+    :param path: The dump.rdb file.
+    :param prefix_depth: The number of parts of each key, separated by ':' or '.', that
+                         make up the prefix the key is counted under.
+    :return: The inventory.
+    """
+    builder = _InventoryBuilder(prefix_depth)
+    with open(path, 'rb') as file:
+        reader = _RdbReader(file, path, os.path.getsize(path))
+        version = _read_header(file, path)
+        expires = False
+        # The expiry and eviction details of a key precede it and count towards its size.
+        entry_start: Optional[int] = None
+        while True:
+            start = file.tell()
+            opcode = reader.read_byte()
+            if opcode == _OPCODE_EOF:
+                break
+            elif opcode in (_OPCODE_EXPIRETIME_MS, _OPCODE_EXPIRETIME):
+                reader.read(8 if opcode == _OPCODE_EXPIRETIME_MS else 4)
+                expires = True
+                entry_start = start if entry_start is None else entry_start
+            elif opcode in (_OPCODE_IDLE, _OPCODE_FREQ):
+                if opcode == _OPCODE_IDLE:
+                    reader.read_length()
+                else:
+                    reader.read(1)
+                entry_start = start if entry_start is None else entry_start
+            elif opcode == _OPCODE_SELECTDB:
+                reader.read_length()
+            elif opcode == _OPCODE_RESIZEDB:
+                reader.read_length()
+                reader.read_length()
+            elif opcode == _OPCODE_SLOT_INFO:
+                for _ in range(3):
+                    reader.read_length()
+            elif opcode == _OPCODE_AUX:
+                reader.skip_string()
+                reader.skip_string()
+            elif opcode == _OPCODE_FUNCTION2:
+                reader.skip_string()
+            elif opcode in (_OPCODE_FUNCTION_PRE_GA, _OPCODE_MODULE_AUX):
+                raise MigrationError(f'{path} holds module or function data, which can not be inventoried.')
+            else:
+                key = reader.read_string()
+                reader.skip_value(opcode)
+                builder.add(key, opcode, file.tell() - (start if entry_start is None else entry_start), expires)
+                expires = False
+                entry_start = None
+    return builder.build(version)
+
+
+def read_key_dump_inventory(
+        records: Iterable[Tuple[bytes, int, bytes]],
+        path: str,
+        prefix_depth: int = DEFAULT_PREFIX_DEPTH) -> RdbInventory:
+    """
+    Counts the keys of a key dump captured from Redis by type and by prefix.
+
+    :param records: The key, the milliseconds it has left to live or -1, and the DUMP payload of each key.
+    :param path: The key dump file the records are read from, for errors.
+    :param prefix_depth: The number of parts of each key, separated by ':' or '.', that
+                         make up the prefix the key is counted under.
+    :return: The inventory, with the newest RDB version of any DUMP payload.
+    """
+    builder = _InventoryBuilder(prefix_depth)
+    version = 0
+    for key, milliseconds_to_live, payload in records:
+        if len(payload) < 1 + _DUMP_FOOTER.size:
+            raise MigrationError(f'The Redis key dump {path} holds an invalid payload for {key!r}.')
+        payload_version, _ = _DUMP_FOOTER.unpack(payload[-_DUMP_FOOTER.size:])
+        version = max(version, payload_version)
+        builder.add(key, payload[0], len(key) + len(payload), milliseconds_to_live > 0)
+    return builder.build(version)
+
+
+def key_prefix(key: bytes, depth: int = DEFAULT_PREFIX_DEPTH) -> str:
+    """
+    Gets the first parts of a key, separated by ':' or '.'.
+
+    :param key: The key.
+    :param depth: The number of parts to keep.
+    :return: The prefix, decoded for display.
+    """
+    end = 0
+    for _ in range(depth):
+        positions = [position for position in (key.find(separator, end) for separator in _PREFIX_SEPARATORS)
+                     if position >= 0]
+        if not positions:
+            return key.decode('utf-8', errors='replace')
+        end = min(positions) + 1
+    return key[:end - 1].decode('utf-8', errors='replace')
+
+
+def _read_header(file: BinaryIO, path: str) -> int:
+    header = file.read(len(_MAGIC) + 4)
+    if len(header) != len(_MAGIC) + 4 or not header.startswith(_MAGIC) or not header[len(_MAGIC):].isdigit():
+        raise MigrationError(f'{path} is not a Redis dump.rdb file.')
+    return int(header[len(_MAGIC):])
+
+
+class _RdbReader:
+    def __init__(self, file: BinaryIO, path: str, size: int):
+        self.file = file
+        self.path = path
+        self.size = size
+
+    def read(self, count: int) -> bytes:
+        data = self.file.read(count)
+        if len(data) != count:
+            raise MigrationError(f'The Redis dump {self.path} is truncated.')
+        return data
+
+    def read_byte(self) -> int:
+        return self.read(1)[0]
+
+    def read_length(self) -> Tuple[int, bool]:
+        first = self.read_byte()
+        kind = first >> 6
+        if kind == 0:
+            return first & 0x3F, False
+        if kind == 1:
+            return ((first & 0x3F) << 8) | self.read_byte(), False
+        if kind == 3:
+            return first & 0x3F, True
+        if first == 0x80:
+            return struct.unpack('>I', self.read(4))[0], False
+        if first == 0x81:
+            return struct.unpack('>Q', self.read(8))[0], False
+        raise MigrationError(f'The Redis dump {self.path} holds an unknown length encoding.')
+
+    def read_string(self) -> bytes:
+        length, is_encoded = self.read_length()
+        if not is_encoded:
+            return self.read(length)
+        if length == _ENCODING_INT8:
+            return str(struct.unpack('<b', self.read(1))[0]).encode()
+        if length == _ENCODING_INT16:
+            return str(struct.unpack('<h', self.read(2))[0]).encode()
+        if length == _ENCODING_INT32:
+            return str(struct.unpack('<i', self.read(4))[0]).encode()
+        if length == _ENCODING_LZF:
+            compressed_length, _ = self.read_length()
+            uncompressed_length, _ = self.read_length()
+            return _lzf_decompress(self.read(compressed_length), uncompressed_length, self.path)
+        raise MigrationError(f'The Redis dump {self.path} holds an unknown string encoding.')
+
+    def skip_string(self) -> None:
+        length, is_encoded = self.read_length()
+        if is_encoded:
+            if length == _ENCODING_LZF:
+                compressed_length, _ = self.read_length()
+                self.read_length()
+                self.skip(compressed_length)
+            elif length in _INTEGER_ENCODING_SIZES:
+                self.skip(_INTEGER_ENCODING_SIZES[length])
+            else:
+                raise MigrationError(f'The Redis dump {self.path} holds an unknown string encoding.')
+            return
+        self.skip(length)
+
+    def skip(self, count: int) -> None:
+        if count < _SEEK_THRESHOLD:
+            self.read(count)
+            return
+        self.file.seek(count, os.SEEK_CUR)
+        if self.file.tell() > self.size:
+            raise MigrationError(f'The Redis dump {self.path} is truncated.')
+
+    def skip_strings(self, count: int) -> None:
+        for _ in range(count):
+            self.skip_string()
+
+    def skip_value(self, value_type: int) -> None:
+        if value_type in (0, 9, 10, 11, 12, 13, 16, 17, 20):
+            self.skip_string()
+        elif value_type in (1, 2, 14):
+            self.skip_strings(self.read_length()[0])
+        elif value_type == 3:
+            for _ in range(self.read_length()[0]):
+                self.skip_string()
+                double_length = self.read_byte()
+                if double_length < 253:
+                    self.skip(double_length)
+        elif value_type == 4:
+            self.skip_strings(2 * self.read_length()[0])
+        elif value_type == 5:
+            for _ in range(self.read_length()[0]):
+                self.skip_string()
+                self.skip(8)
+        elif value_type == 18:
+            for _ in range(self.read_length()[0]):
+                self.read_length()
+                self.skip_string()
+        elif value_type in (15, 19, 21):
+            self.skip_stream(value_type)
+        else:
+            raise MigrationError(
+                f'The Redis dump {self.path} holds a value of type {value_type}, which can not be inventoried.')
+
+    def skip_stream(self, value_type: int) -> None:
+        self.skip_strings(2 * self.read_length()[0])
+        # The length and the last ID, followed in newer versions by the first ID, the
+        # largest deleted ID and the number of entries ever added.
+        length_count = 3 + (5 if value_type >= _STREAM_LISTPACKS_2 else 0)
+        for _ in range(length_count):
+            self.read_length()
+        for _ in range(self.read_length()[0]):
+            self.skip_string()
+            for _ in range(3 if value_type >= _STREAM_LISTPACKS_2 else 2):
+                self.read_length()
+            for _ in range(self.read_length()[0]):
+                self.skip(16 + 8)
+                self.read_length()
+            for _ in range(self.read_length()[0]):
+                self.skip_string()
+                self.skip(16 if value_type >= _STREAM_LISTPACKS_3 else 8)
+                self.skip(16 * self.read_length()[0])
+
+
+def _lzf_decompress(data: bytes, length: int, path: str) -> bytes:
+    output = bytearray()
+    index = 0
+    while index < len(data):
+        control = data[index]
+        index += 1
+        if control < 32:
+            output += data[index:index + control + 1]
+            index += control + 1
+            continue
+        reference_length = control >> 5
+        if reference_length == 7:
+            reference_length += data[index]
+            index += 1
+        reference = len(output) - ((control & 0x1F) << 8) - data[index] - 1
+        index += 1
+        if reference < 0:
+            raise MigrationError(f'The Redis dump {path} holds corrupt compressed data.')
+        for offset in range(reference_length + 2):
+            output.append(output[reference + offset])
+    if len(output) != length:
+        raise MigrationError(f'The Redis dump {path} holds corrupt compressed data.')
+    return bytes(output)
@@ -0,0 +1,33 @@
+from typing import Dict
+
+REDIS_HOST_CONFIGURATION_KEY = 'Redis.Host'
+REDIS_PORT_CONFIGURATION_KEY = 'Redis.Port'
+REDIS_PASSWORD_CONFIGURATION_KEY = 'Redis.Password'
+
+DEFAULT_REDIS_HOST = 'localhost'
+DEFAULT_REDIS_PORT = 6379
+
+
+class RedisConfiguration(object):
+    def __init__(self, service_config: Dict):
+        self.service_config = service_config
+
+    @property
+    def host_name(self) -> str:
+        return self.service_config.get(REDIS_HOST_CONFIGURATION_KEY) or DEFAULT_REDIS_HOST
+
+    @property
+    def port(self) -> int:
+        return int(self.service_config.get(REDIS_PORT_CONFIGURATION_KEY) or DEFAULT_REDIS_PORT)
+
+    @property
+    def password(self) -> str:
+        return self.service_config.get(REDIS_PASSWORD_CONFIGURATION_KEY, '')
+
+    def __eq__(self, other):
+        if isinstance(other, RedisConfiguration):
+            return \
+                self.host_name == other.host_name \
+                and self.port == other.port \
+                and self.password == other.password
+        return False
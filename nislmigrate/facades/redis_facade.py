@@ -0,0 +1,296 @@
+"""Capture and restore the keys of a Redis database with SCAN, DUMP and RESTORE."""
+
+import itertools
+import json
+import logging
+import os
+import struct
+import time
+from typing import Any, BinaryIO, Iterable, Iterator, List, Optional, Set, Tuple
+
+from nislmigrate.facades.process_facade import BackgroundProcess, ProcessFacade
+from nislmigrate.facades.rdb_inventory import (
+    RdbInventory,
+    read_key_dump_inventory,
+    read_rdb_inventory,
+    read_rdb_version,
+)
+from nislmigrate.facades.redis_configuration import RedisConfiguration
+from nislmigrate.logs.migration_error import MigrationError
+from nislmigrate.utility.paths import get_ni_application_data_directory_path, get_ni_shared_directory_64_path
+
+try:
+    import redis
+except ImportError:
+    redis = None  # type: ignore
+
+REDIS_CONFIGURATION_PATH: str = os.path.join(
+    get_ni_application_data_directory_path(),
+    'Skyline',
+    'KeyValueDatabase',
+    'redis.conf')
+REDIS_SERVER_EXECUTABLE_PATH: str = os.path.join(
+    get_ni_shared_directory_64_path(),
+    'Skyline',
+    'KeyValueDatabase',
+    'redis-server.exe')
+# The number of keys scanned, dumped or restored with each round trip to the server.
+DEFAULT_BATCH_SIZE = 1000
+# How long to wait for a Redis server started by the tool to accept connections.
+STARTUP_TIMEOUT_SECONDS = 30
+
+_KEY_DUMP_HEADER = b'nislmigrate redis key dump 2\n'
+_LEGACY_KEY_DUMP_HEADER = b'nislmigrate redis key dump 1\n'
+# The length of the JSON list of the key patterns a dump was captured with, which
+# follows the header of dumps that are not legacy dumps.
+_PATTERNS_HEADER = struct.Struct('<I')
+_EVERY_KEY_PATTERN = '*'
+# The length of the key, the milliseconds the key has left to live or -1 if it does not
+# expire, and the length of the DUMP payload that follow each record header.
+_RECORD_HEADER = struct.Struct('<IqI')
+
+_REDIS_NOT_INSTALLED_ERROR = """
+
+Migrating tags through Redis requires the redis package. Install it with:
+
+    pip install nislmigrate[redis]
+
+"""
+
+
+def verify_redis_support() -> None:
+    """
+    Raises an error if the optional dependencies needed to migrate keys through Redis are missing.
+    """
+    if redis is None:
+        raise MigrationError(_REDIS_NOT_INSTALLED_ERROR)
+
+
+class RedisFacade:
+    """
+    Captures the keys of a Redis database into a key dump file and restores them, into
+    a running server or into one the facade starts and stops again once it is done.
+    """
+    def __init__(self, process_facade: ProcessFacade):
+        self.process_facade: ProcessFacade = process_facade
+        self.__redis_process_handle: Optional[BackgroundProcess] = None
+
+    def capture_keys(
+            self,
+            configuration: RedisConfiguration,
+            path: str,
+            key_patterns: Optional[List[str]] = None,
+            batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """
+        Walks the keys with SCAN and writes each key, its time to live and its DUMP
+        payload to a key dump file, dumping a batch of keys with each round trip.
+
+        :param configuration: The Redis configuration of a service.
+        :param path: The key dump file to write.
+        :param key_patterns: The glob-style patterns of the keys to capture, or None to capture every key.
+        :param batch_size: The number of keys to scan and dump with each round trip.
+        :return: The number of keys captured.
+        """
+        start = time.perf_counter()
+        key_count = 0
+        key_patterns = key_patterns or [_EVERY_KEY_PATTERN]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        try:
+            client = self.__connect(configuration)
+            with open(path, 'wb') as file:
+                file.write(_KEY_DUMP_HEADER)
+                encoded_patterns = json.dumps(key_patterns).encode('utf-8')
+                file.write(_PATTERNS_HEADER.pack(len(encoded_patterns)))
+                file.write(encoded_patterns)
+                for batch in _batches(_scan_keys(client, key_patterns, batch_size), batch_size):
+                    pipeline = client.pipeline(transaction=False)
+                    for key in batch:
+                        pipeline.pttl(key)
+                        pipeline.dump(key)
+                    results = pipeline.execute()
+                    for key, milliseconds_to_live, payload in zip(batch, results[0::2], results[1::2]):
+                        # Keys deleted or expired since they were scanned have nothing to dump.
+                        if payload is not None:
+                            _write_record(file, key, milliseconds_to_live, payload)
+                            key_count += 1
+        finally:
+            self.__stop_redis()
+        log = logging.getLogger(RedisFacade.__name__)
+        log.log(logging.INFO, f'Captured {key_count} Redis keys in {time.perf_counter() - start:.1f} s')
+        return key_count
+
+    def restore_keys(
+            self,
+            configuration: RedisConfiguration,
+            path: str,
+            batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """
+        Restores the keys of a key dump file with RESTORE, replacing keys that already
+        exist and restoring a batch of keys with each round trip, then saves the database.
+        If the dump holds every key, the database is emptied first so that it ends up
+        with the captured keys only. Otherwise the keys are merged into the database,
+        keeping the keys the dump does not hold.
+
+        :param configuration: The Redis configuration of a service.
+        :param path: The key dump file to read.
+        :param batch_size: The number of keys to restore with each round trip.
+        :return: The number of keys restored.
+        """
+        start = time.perf_counter()
+        key_count = 0
+        try:
+            client = self.__connect(configuration)
+            if read_key_dump_patterns(path) == [_EVERY_KEY_PATTERN]:
+                client.flushdb()
+            for batch in _batches(read_key_dump(path), batch_size):
+                pipeline = client.pipeline(transaction=False)
+                for key, milliseconds_to_live, payload in batch:
+                    pipeline.restore(key, max(milliseconds_to_live, 0), payload, replace=True)
+                pipeline.execute()
+                key_count += len(batch)
+            # A server the tool started is stopped without saving, so save the restored keys now.
+            client.save()
+        finally:
+            self.__stop_redis()
+        log = logging.getLogger(RedisFacade.__name__)
+        log.log(logging.INFO, f'Restored {key_count} Redis keys in {time.perf_counter() - start:.1f} s')
+        return key_count
+
+    def inventory_key_dump(self, path: str) -> RdbInventory:
+        """
+        Counts the keys of a key dump file by type and by prefix.
+
+        :param path: The key dump file to read.
+        :return: The inventory.
+        """
+        return read_key_dump_inventory(read_key_dump(path), path)
+
+    def inventory_dump_file(self, path: str) -> RdbInventory:
+        """
+        Counts the keys of a dump.rdb file by type and by prefix without loading it.
+
+        :param path: The dump.rdb file to read.
+        :return: The inventory.
+        """
+        return read_rdb_inventory(path)
+
+    def read_dump_file_version(self, path: str) -> int:
+        """
+        Reads the RDB version of the server that saved a dump.rdb file.
+
+        :param path: The dump.rdb file to read.
+        :return: The RDB version.
+        """
+        return read_rdb_version(path)
+
+    def __connect(self, configuration: RedisConfiguration) -> Any:
+        verify_redis_support()
+        client = redis.Redis(
+            host=configuration.host_name,
+            port=configuration.port,
+            password=configuration.password or None)
+        if self.__is_reachable(client):
+            return client
+        if not self.__redis_process_handle:
+            arguments = [REDIS_SERVER_EXECUTABLE_PATH, REDIS_CONFIGURATION_PATH]
+            self.__redis_process_handle = self.process_facade.run_background_process(arguments)
+        deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+        while not self.__is_reachable(client):
+            if time.monotonic() > deadline:
+                raise MigrationError(
+                    f'Could not connect to Redis at {configuration.host_name}:{configuration.port}.')
+            time.sleep(0.5)
+        return client
+
+    def __stop_redis(self) -> None:
+        """
+        Stops the Redis server if the facade started it.
+        """
+        if self.__redis_process_handle:
+            process_handle = self.__redis_process_handle
+            self.__redis_process_handle = None
+            process_handle.stop()
+
+    @staticmethod
+    def __is_reachable(client: Any) -> bool:
+        try:
+            return client.ping()
+        except redis.ConnectionError:
+            return False
+
+
+def read_key_dump_patterns(path: str) -> Optional[List[str]]:
+    """
+    Reads the glob-style patterns of the keys a key dump file was captured with.
+
+    :param path: The key dump file to read.
+    :return: The patterns, which are ['*'] if every key was captured, or None if the
+             dump was written before the patterns were recorded.
+    """
+    with open(path, 'rb') as file:
+        return _read_key_dump_header(file, path)
+
+
+def read_key_dump(path: str) -> Iterator[Tuple[bytes, int, bytes]]:
+    """
+    Reads the records of a key dump file one at a time.
+
+    :param path: The key dump file to read.
+    :return: The key, the milliseconds it has left to live or -1, and the DUMP payload of each record.
+    """
+    with open(path, 'rb') as file:
+        _read_key_dump_header(file, path)
+        while True:
+            header = file.read(_RECORD_HEADER.size)
+            if not header:
+                return
+            if len(header) != _RECORD_HEADER.size:
+                raise MigrationError(f'The Redis key dump {path} is truncated.')
+            key_length, milliseconds_to_live, payload_length = _RECORD_HEADER.unpack(header)
+            key = file.read(key_length)
+            payload = file.read(payload_length)
+            if len(key) != key_length or len(payload) != payload_length:
+                raise MigrationError(f'The Redis key dump {path} is truncated.')
+            yield key, milliseconds_to_live, payload
+
+
+def _read_key_dump_header(file: BinaryIO, path: str) -> Optional[List[str]]:
+    header = file.read(len(_KEY_DUMP_HEADER))
+    if header == _LEGACY_KEY_DUMP_HEADER:
+        return None
+    if header != _KEY_DUMP_HEADER:
+        raise MigrationError(f'{path} is not a Redis key dump captured by nislmigrate.')
+    patterns_header = file.read(_PATTERNS_HEADER.size)
+    if len(patterns_header) != _PATTERNS_HEADER.size:
+        raise MigrationError(f'The Redis key dump {path} is truncated.')
+    encoded_patterns = file.read(_PATTERNS_HEADER.unpack(patterns_header)[0])
+    try:
+        return json.loads(encoded_patterns.decode('utf-8'))
+    except ValueError:
+        raise MigrationError(f'The Redis key dump {path} is truncated.')
+
+
+def _write_record(file: BinaryIO, key: bytes, milliseconds_to_live: int, payload: bytes) -> None:
+    file.write(_RECORD_HEADER.pack(len(key), milliseconds_to_live if milliseconds_to_live > 0 else -1, len(payload)))
+    file.write(key)
+    file.write(payload)
+
+
+def _scan_keys(client: Any, key_patterns: List[str], batch_size: int) -> Iterator[bytes]:
+    # SCAN may return a key more than once, which only means the key is restored twice,
+    # so keys are only remembered when several patterns could match the same key. A
+    # capture of every key then does not hold every key name in memory.
+    if len(key_patterns) == 1:
+        yield from client.scan_iter(match=key_patterns[0], count=batch_size)
+        return
+    seen: Set[bytes] = set()
+    for key_pattern in key_patterns:
+        for key in client.scan_iter(match=key_pattern, count=batch_size):
+            if key not in seen:
+                seen.add(key)
+                yield key
+
+
+def _batches(items: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    return iter(lambda: list(itertools.islice(iterator, batch_size)), [])
@@ -0,0 +1,57 @@
+"""Share the service configuration files read during a run between every plugin and check."""
+
+import os
+from typing import Any, Callable, Dict, Set
+
+
+class ServiceConfigurationIndex:
+    """
+    Lists each service configuration directory once and parses each configuration file
+    the first time it is read, so that discovering installed services, checks and
+    migrations all share the same view of the configuration files.
+    """
+    def __init__(self, read_json_file: Callable[[str], Dict[str, Any]]):
+        """
+        Creates a new instance of ServiceConfigurationIndex.
+
+        :param read_json_file: Reads and parses a configuration file.
+        """
+        self.__read_json_file = read_json_file
+        self.__file_names: Dict[str, Set[str]] = {}
+        self.__configurations: Dict[str, Dict[str, Any]] = {}
+
+    def does_configuration_exist(self, path: str) -> bool:
+        """
+        Checks whether a configuration file exists, listing its directory on first use.
+
+        :param path: The path of the configuration file.
+        :return: True if the file exists.
+        """
+        directory, file_name = os.path.split(path)
+        return os.path.normcase(file_name) in self.__list_file_names(directory)
+
+    def read_configuration(self, path: str) -> Dict[str, Any]:
+        """
+        Reads a configuration file, parsing it on first use.
+
+        :param path: The path of the configuration file.
+        :return: The parsed configuration.
+        """
+        key = _to_key(path)
+        if key not in self.__configurations:
+            self.__configurations[key] = self.__read_json_file(path)
+        return self.__configurations[key]
+
+    def __list_file_names(self, directory: str) -> Set[str]:
+        key = _to_key(directory)
+        if key not in self.__file_names:
+            try:
+                with os.scandir(directory) as entries:
+                    self.__file_names[key] = {os.path.normcase(entry.name) for entry in entries if entry.is_file()}
+            except (FileNotFoundError, NotADirectoryError):
+                self.__file_names[key] = set()
+        return self.__file_names[key]
+
+
+def _to_key(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
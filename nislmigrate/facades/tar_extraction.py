@@ -0,0 +1,45 @@
+"""Extract members of tar archives without writing outside the directory they are extracted into."""
+
+import os
+import tarfile
+
+from nislmigrate.logs.migration_error import MigrationError
+
+
+def extract_member(tar: tarfile.TarFile, member: tarfile.TarInfo, to_directory: str) -> None:
+    """
+    Extracts a member of a tar archive, refusing members that would be written outside
+    to_directory, links that point outside it and members that are not files,
+    directories or links. Uses the 'data' extraction filter where Python has it.
+
+    :param tar: The archive being read.
+    :param member: The member to extract.
+    :param to_directory: The directory to extract into.
+    """
+    if hasattr(tarfile, 'data_filter'):
+        try:
+            tar.extract(member, to_directory, filter='data')
+        except tarfile.FilterError as error:
+            raise MigrationError(f'The archive member {member.name} can not be extracted safely: {error}')
+        return
+    _verify_member(member, to_directory)
+    tar.extract(member, to_directory)
+
+
+def _verify_member(member: tarfile.TarInfo, to_directory: str) -> None:
+    root = os.path.realpath(to_directory)
+    destination = os.path.realpath(os.path.join(root, member.name))
+    if member.issym():
+        link_target = os.path.join(os.path.dirname(destination), member.linkname)
+    elif member.islnk():
+        link_target = os.path.join(root, member.linkname)
+    else:
+        link_target = destination
+    is_supported = member.isfile() or member.isdir() or member.issym() or member.islnk()
+    if not is_supported or not all(_is_within(path, root) for path in (destination, link_target)):
+        raise MigrationError(f'The archive member {member.name} can not be extracted safely.')
+
+
+def _is_within(path: str, root: str) -> bool:
+    path = os.path.realpath(path)
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
@@ -0,0 +1,184 @@
+"""Stream directory trees into compressed tar volumes that can be restored in parallel."""
+
+import json
+import logging
+import os
+import tarfile
+import time
+from typing import Any, Dict, List, Tuple
+
+from nislmigrate.facades.parallel_copy import (
+    DEFAULT_WORKER_COUNT,
+    FileToCopy,
+    index_directory,
+    MEGABYTE,
+    ProgressReporter,
+    run_bounded,
+)
+from nislmigrate.facades.tar_extraction import extract_member
+from nislmigrate.logs.migration_error import MigrationError
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore
+
+VOLUME_LIST_FILE_NAME = 'volumes.json'
+VOLUME_LIST_FORMAT_VERSION = 1
+DEFAULT_VOLUME_SIZE = 1024 * MEGABYTE
+DEFAULT_COMPRESSION_LEVEL = 3
+
+_ZSTANDARD_NOT_INSTALLED_ERROR = """
+
+Archiving captured files requires the zstandard package. Install it with:
+
+    pip install nislmigrate[zstd]
+
+"""
+
+
+def verify_volume_archive_support() -> None:
+    """
+    Raises an error if the optional dependencies needed for volume archives are missing.
+    """
+    if zstandard is None:
+        raise MigrationError(_ZSTANDARD_NOT_INSTALLED_ERROR)
+
+
+def is_volume_archive(directory: str) -> bool:
+    """
+    Determines whether a captured directory holds volume archives rather than a copy of the files.
+
+    :param directory: The captured directory.
+    :return: True if the directory holds a volume list.
+    """
+    return os.path.isfile(os.path.join(directory, VOLUME_LIST_FILE_NAME))
+
+
+def write_volume_archive(
+        from_directory: str,
+        to_directory: str,
+        volume_size: int = DEFAULT_VOLUME_SIZE,
+        compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+        worker_count: int = DEFAULT_WORKER_COUNT) -> None:
+    """
+    Streams the files of a directory into zstandard compressed tar volumes. A volume is
+    sealed before a file that would take it past volume_size bytes before compression,
+    so only a file larger than volume_size on its own makes a larger volume. Each volume
+    is written with an index of the paths inside it.
+
+    :param from_directory: The directory to archive.
+    :param to_directory: The directory to write the volumes to, created if needed.
+    :param volume_size: The largest number of uncompressed bytes in a volume of several files.
+    :param compression_level: The zstandard compression level.
+    :param worker_count: The number of volumes to write at once.
+    """
+    verify_volume_archive_support()
+    if volume_size < 1:
+        raise MigrationError(f'The volume size must be positive, not {volume_size}.')
+    start = time.perf_counter()
+    index = index_directory(from_directory)
+    directories, files = index.directories, index.files
+    volumes = _split_into_volumes(files, volume_size)
+    progress = ProgressReporter('Archived', index.file_count, index.byte_count)
+    os.makedirs(to_directory, exist_ok=True)
+    # A single volume is compressed on several threads, several volumes one thread each.
+    compression_threads = -1 if len(volumes) == 1 else 0
+
+    def write_volume(numbered_volume: Tuple[int, List[FileToCopy]]) -> Dict[str, Any]:
+        number, volume_files = numbered_volume
+        name = f'volume-{number:05}'
+        paths: List[Tuple[str, int]] = [(_to_archive_path(os.path.relpath(file.source, from_directory)), file.size)
+                                        for file in volume_files]
+        compressor = zstandard.ZstdCompressor(level=compression_level, threads=compression_threads)
+        with open(os.path.join(to_directory, f'{name}.tar.zst'), 'wb') as file, \
+                compressor.stream_writer(file) as stream, \
+                tarfile.open(fileobj=stream, mode='w|') as tar:
+            for volume_file, (path, _) in zip(volume_files, paths):
+                tar.add(volume_file.source, arcname=path, recursive=False)
+                progress.add(1, volume_file.size)
+        _write_json(os.path.join(to_directory, f'{name}.index.json'), {'paths': paths})
+        return {
+            'archive': f'{name}.tar.zst',
+            'index': f'{name}.index.json',
+            'file_count': len(volume_files),
+            'byte_count': sum(volume_file.size for volume_file in volume_files),
+        }
+
+    entries = run_bounded(max(1, min(worker_count, len(volumes))), write_volume, enumerate(volumes, 1))
+    _write_json(os.path.join(to_directory, VOLUME_LIST_FILE_NAME), {
+        'version': VOLUME_LIST_FORMAT_VERSION,
+        'directories': [_to_archive_path(os.path.relpath(source, from_directory)) for source, _ in directories[1:]],
+        'volumes': entries,
+    })
+
+    byte_count = index.byte_count
+    compressed_byte_count = sum(os.path.getsize(os.path.join(to_directory, entry['archive'])) for entry in entries)
+    log = logging.getLogger(__name__)
+    log.log(
+        logging.INFO,
+        f'Archived {len(files)} files ({byte_count / MEGABYTE:.1f} MB) into {len(entries)} volumes '
+        f'({compressed_byte_count / MEGABYTE:.1f} MB) in {time.perf_counter() - start:.1f} s')
+
+
+def read_volume_archive(from_directory: str, to_directory: str, worker_count: int = DEFAULT_WORKER_COUNT) -> None:
+    """
+    Extracts the volumes written by write_volume_archive, several volumes at once.
+
+    :param from_directory: The directory holding the volumes.
+    :param to_directory: The directory to extract the files into, created if needed.
+    :param worker_count: The number of volumes to extract at once.
+    """
+    verify_volume_archive_support()
+    with open(os.path.join(from_directory, VOLUME_LIST_FILE_NAME), encoding='utf-8') as file:
+        volume_list = json.load(file)
+    if volume_list.get('version', 0) > VOLUME_LIST_FORMAT_VERSION:
+        raise MigrationError(f'Archived files were written by a newer version of nislmigrate: {from_directory}')
+
+    # Creating every directory first keeps volumes extracting at once from racing to create them.
+    os.makedirs(to_directory, exist_ok=True)
+    for path in volume_list['directories']:
+        os.makedirs(_from_archive_path(to_directory, path), exist_ok=True)
+
+    def read_volume(entry: Dict[str, Any]) -> None:
+        with open(os.path.join(from_directory, entry['index']), encoding='utf-8') as index_file:
+            expected = {path for path, _ in json.load(index_file)['paths']}
+        extracted = set()
+        with open(os.path.join(from_directory, entry['archive']), 'rb') as file, \
+                zstandard.ZstdDecompressor().stream_reader(file) as stream, \
+                tarfile.open(fileobj=stream, mode='r|') as tar:
+            for member in tar:
+                extract_member(tar, member, to_directory)
+                extracted.add(member.name)
+        missing = expected - extracted
+        if missing:
+            raise MigrationError(
+                f'Archived volume {entry["archive"]} is missing {len(missing)} files, '
+                f'including: {sorted(missing)[0]}')
+
+    run_bounded(max(1, worker_count), read_volume, volume_list['volumes'])
+
+
+def _split_into_volumes(files: List[FileToCopy], volume_size: int) -> List[List[FileToCopy]]:
+    volumes: List[List[FileToCopy]] = [[]]
+    size = 0
+    for file in files:
+        if volumes[-1] and size + file.size > volume_size:
+            volumes.append([])
+            size = 0
+        volumes[-1].append(file)
+        size += file.size
+    return volumes
+
+
+def _write_json(path: str, content: Dict[str, Any]) -> None:
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(content, file)
+
+
+def _to_archive_path(relative_path: str) -> str:
+    return relative_path.replace(os.sep, '/')
+
+
+def _from_archive_path(root: str, path: str) -> str:
+    return os.path.join(root, *path.split('/'))
@@ -9,3 +9,5 @@ class MigrationAction(Enum):
     RESTORE = 1
     MODIFY = 2
     LIST = 3
+    PRUNE = 4
+    CHECK = 5
@@ -1,5 +1,6 @@
 import logging
 import os
+from typing import List
 
 from nislmigrate.argument_handler import ArgumentHandler, MIGRATION_OPERATION_NOT_PROVIDED_ERROR_TEXT
 from nislmigrate.facades.facade_factory import FacadeFactory
@@ -7,6 +8,7 @@ from nislmigrate.facades.ni_web_server_manager_facade import NiWebServerManagerF
 from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.migration_action import MigrationAction
 from nislmigrate.extensibility.migrator_plugin import MigratorPlugin
+from nislmigrate.extensibility.mongo_migrator_plugin import can_migrate_in_batch, MongoMigratorPlugin
 from nislmigrate.facades.system_link_service_manager_facade import SystemLinkServiceManagerFacade
 from nislmigrate.utility.permission_checker import PermissionChecker
 
@@ -29,6 +31,17 @@ class MigrationFacilitator:
         self._migrators = argument_handler.get_list_of_services_to_capture_or_restore()
         self._migration_directory = argument_handler.get_migration_directory()
         self._argument_handler = argument_handler
+        file_facade = facade_factory.get_file_system_facade()
+        file_facade.set_link_mode(argument_handler.get_link_mode())
+        file_facade.set_buffer_size(argument_handler.get_buffer_size())
+        verification_sample_fraction = argument_handler.get_verification_sample_fraction()
+        if verification_sample_fraction is not None:
+            file_facade.enable_copy_verification(verification_sample_fraction)
+        capture_store_directory = argument_handler.get_capture_store_directory()
+        if capture_store_directory:
+            file_facade.set_capture_store(capture_store_directory)
+        if argument_handler.is_delta_copy_flag_present():
+            file_facade.enable_delta_copy(argument_handler.is_delta_checksum_flag_present())
 
     def migrate(self):
         """Facilitates an entire migration operation from start to finish.
@@ -39,16 +52,53 @@ class MigrationFacilitator:
 
     def __stop_services_and_perform_migration(self) -> None:
         self.service_manager.stop_all_system_link_services()
+        succeeded = False
         try:
+            batched_migrators = self.__find_migrators_to_migrate_in_batch()
+            if batched_migrators:
+                self.__migrate_mongo_services_in_batch(batched_migrators)
             for migrator in self._migrators:
+                if migrator in batched_migrators:
+                    continue
                 migrator_directory = os.path.join(self._migration_directory, migrator.name)
                 self.__report_migration_starting(migrator.name)
                 self.__migrate_service(migrator, migrator_directory)
                 self.__report_migration_finished(migrator.name)
+            succeeded = True
         finally:
             if self._action == MigrationAction.RESTORE or self._action == MigrationAction.MODIFY:
                 self.web_server_manager.restart_web_server()
             self.service_manager.start_all_system_link_services()
+            self.__clean_up_replaced_data(succeeded)
+
+    def __clean_up_replaced_data(self, succeeded: bool) -> None:
+        file_facade = self.facade_factory.get_file_system_facade()
+        if succeeded:
+            file_facade.remove_replaced_directories()
+            return
+        log = logging.getLogger(MigrationFacilitator.__name__)
+        for directory in file_facade.get_replaced_directories():
+            log.log(logging.WARNING, f'The data replaced before the migration failed was kept at: {directory}')
+
+    def __find_migrators_to_migrate_in_batch(self) -> List[MongoMigratorPlugin]:
+        if self._action != MigrationAction.CAPTURE and self._action != MigrationAction.RESTORE:
+            return []
+        migrators = [migrator for migrator in self._migrators
+                     if isinstance(migrator, MongoMigratorPlugin) and can_migrate_in_batch(migrator)]
+        return migrators if len(migrators) > 1 else []
+
+    def __migrate_mongo_services_in_batch(self, migrators: List[MongoMigratorPlugin]) -> None:
+        for migrator in migrators:
+            self.__report_migration_starting(migrator.name)
+        dumps = [migrator.mongo_dump(os.path.join(self._migration_directory, migrator.name), self.facade_factory)
+                 for migrator in migrators]
+        mongo_facade = self.facade_factory.get_mongo_facade()
+        if self._action == MigrationAction.CAPTURE:
+            mongo_facade.capture_databases_to_directories(dumps)
+        else:
+            mongo_facade.restore_databases_from_directories(dumps)
+        for migrator in migrators:
+            self.__report_migration_finished(migrator.name)
 
     def __migrate_service(self, migrator: MigratorPlugin, migrator_directory) -> None:
         migrator_arguments = self._argument_handler.get_migrator_additional_arguments(migrator)
@@ -1,6 +1,10 @@
+import logging
+import os
+
 from nislmigrate.logs import logging_setup, migration_error
 from nislmigrate.argument_handler import ArgumentHandler
 from nislmigrate.facades.facade_factory import FacadeFactory
+from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.migration_action import MigrationAction
 from nislmigrate.migration_facilitator import MigrationFacilitator
 from nislmigrate.utility.information_logger import InformationLogger
@@ -19,6 +23,37 @@ def run_migration_tool(facade_factory: FacadeFactory, argument_handler: Argument
     migration_facilitator.migrate()
 
 
+def check_services(facade_factory: FacadeFactory, argument_handler: ArgumentHandler) -> None:
+    """
+    Checks the consistency of the data of services without stopping them.
+
+    :param facade_factory: Factory that produces objects abstracting away operations.
+    :param argument_handler: Handler for the command line arguments.
+    """
+    log = logging.getLogger(__name__)
+    for migrator in argument_handler.get_list_of_services_to_capture_or_restore():
+        log.log(logging.INFO, f'Checking {migrator.name} ...')
+        migrator.check(
+            os.path.join(argument_handler.get_migration_directory(), migrator.name),
+            facade_factory,
+            argument_handler.get_migrator_additional_arguments(migrator))
+
+
+def prune_capture_store(facade_factory: FacadeFactory, argument_handler: ArgumentHandler) -> None:
+    """
+    Removes old captures from a capture store.
+
+    :param facade_factory: Factory that produces objects abstracting away operations.
+    :param argument_handler: Handler for the command line arguments.
+    """
+    store_directory = argument_handler.get_capture_store_directory()
+    if not store_directory:
+        raise MigrationError('The --store flag must be provided to prune a capture store.')
+    facade_factory.get_file_system_facade().prune_capture_store(
+        store_directory,
+        argument_handler.get_number_of_captures_to_keep())
+
+
 def main():
     """
     The entry point for the NI SystemLink Migration tool.
@@ -33,6 +68,10 @@ def main():
 
         if argument_handler.get_migration_action() == MigrationAction.LIST:
             InformationLogger.list_installed_services(argument_handler)
+        elif argument_handler.get_migration_action() == MigrationAction.PRUNE:
+            prune_capture_store(facade_factory, argument_handler)
+        elif argument_handler.get_migration_action() == MigrationAction.CHECK:
+            check_services(facade_factory, argument_handler)
         else:
             run_migration_tool(facade_factory, argument_handler)
     except Exception as e:
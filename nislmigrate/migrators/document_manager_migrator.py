@@ -1,11 +1,7 @@
-from nislmigrate.facades.facade_factory import FacadeFactory
-from nislmigrate.facades.mongo_configuration import MongoConfiguration
-from nislmigrate.facades.mongo_facade import MongoFacade
-from nislmigrate.extensibility.migrator_plugin import MigratorPlugin
-from typing import Any, Dict
+from nislmigrate.extensibility.mongo_migrator_plugin import MongoMigratorPlugin
 
 
-class DocumentManagerMigrator(MigratorPlugin):
+class DocumentManagerMigrator(MongoMigratorPlugin):
 
     @property
     def argument(self):
@@ -23,31 +19,5 @@ class DocumentManagerMigrator(MigratorPlugin):
     def help(self):
         return 'Migrate dashboards and web applications'
 
-    def capture(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
-        mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
-        mongo_configuration: MongoConfiguration = MongoConfiguration(self.config(facade_factory))
-        mongo_facade.capture_database_to_directory(
-            mongo_configuration,
-            migration_directory,
-            self.name)
-
-        # NOTE: Do not migrate the /Config/EmbeddedDashboards/ folder. Those files belong to other services
-        # and we want to use the copy installed at the destination.
-
-    def restore(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
-        mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
-        mongo_configuration: MongoConfiguration = MongoConfiguration(self.config(facade_factory))
-        mongo_facade.restore_database_from_directory(
-            mongo_configuration,
-            migration_directory,
-            self.name)
-
-    def pre_restore_check(
-            self,
-            migration_directory: str,
-            facade_factory: FacadeFactory,
-            arguments: Dict[str, Any]) -> None:
-        mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
-        mongo_facade.validate_can_restore_database_from_directory(
-            migration_directory,
-            self.name)
+    # NOTE: Do not migrate the /Config/EmbeddedDashboards/ folder. Those files belong to other services
+    # and we want to use the copy installed at the destination.
@@ -1,11 +1,22 @@
+import json
+import logging
 import os
-from typing import Any, Dict, Callable
+from typing import Any, Dict, Callable, Optional, Tuple
+
+from bson import json_util
 
 from nislmigrate.extensibility.migrator_plugin import MigratorPlugin, ArgumentManager
 from nislmigrate.facades.facade_factory import FacadeFactory
+from nislmigrate.facades.file_store_check import FileReference
 from nislmigrate.facades.file_system_facade import FileSystemFacade
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
 from nislmigrate.facades.mongo_facade import MongoFacade
+from nislmigrate.facades.object_store_facade import ObjectStoreFacade, parse_s3_uri, verify_object_store_support
+from nislmigrate.facades.volume_archive import (
+    DEFAULT_VOLUME_SIZE,
+    is_volume_archive,
+    verify_volume_archive_support,
+)
 from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.migration_action import MigrationAction
 from nislmigrate.utility.paths import get_ni_application_data_directory_path
@@ -36,6 +47,37 @@ _FILE_STORE_ROOT_HELP = 'The file store root directory for file storage location
 "--files-change-file-store-root" when run with the "modify" operation. For "restore" operations this \
 value is inferred from the database and this argument is ignored.'
 
+_ARCHIVE_ARGUMENT = 'archive'
+_ARCHIVE_HELP = 'Capture the files as zstandard compressed tar volumes instead of copying them one by one. \
+Requires the zstandard package.'
+
+_ARCHIVE_VOLUME_SIZE_ARGUMENT = 'archive-volume-size'
+_ARCHIVE_VOLUME_SIZE_HELP = f'The largest size in megabytes of an archive volume when capturing with "--files-archive" \
+(defaults to {DEFAULT_VOLUME_SIZE // (1024 * 1024)}). A file larger than this is archived in a volume of its own.'
+
+_REFERENCED_ONLY_ARGUMENT = 'referenced-only'
+_REFERENCED_ONLY_HELP = 'Capture only the files that file metadata refers to, leaving behind files left over from \
+deleted files and failed uploads. The files left behind and the referenced files that were not found are listed in \
+referenced-files.json in the captured data.'
+
+_QUERY_ARGUMENT = 'query'
+_QUERY_HELP = 'Capture only the files whose metadata matches a MongoDB filter, given as extended JSON, for example \
+\'{"workspace": "<workspace-id>"}\'. The captured metadata and the captured files are limited to the same \
+documents, and the files are captured as with "--files-referenced-only". Restoring such a capture adds and \
+replaces the captured metadata and files, leaving every other file in place.'
+
+_S3_URI_ARGUMENT = 's3-uri'
+_S3_URI_HELP = 'The s3://bucket/prefix location of the files when S3 file storage is enabled on the backend. \
+Captures download the files from this location and restores upload them to it, several parts at once. \
+Credentials are read from the usual AWS environment variables and configuration files. Requires the boto3 package.'
+
+_S3_ENDPOINT_URL_ARGUMENT = 's3-endpoint-url'
+_S3_ENDPOINT_URL_HELP = 'The URL of an S3 compatible service to use with "--files-s3-uri" instead of Amazon S3.'
+
+_INVALID_QUERY_ERROR = '--files-query must be a MongoDB filter document in extended JSON: {error}'
+
+_INVALID_ARCHIVE_VOLUME_SIZE_ERROR = '--files-archive-volume-size must be a positive number of megabytes, not {value}.'
+
 _NO_FILES_ERROR = """
 
 Files data was not found. If you intend to restore metadata only, pass
@@ -45,8 +87,23 @@ Files data was not found. If you intend to restore metadata only, pass
 
 _CANNOT_MIGRATE_S3_FILES_ERROR = """
 
-S3 file storage is enabled on the backend. nislmigrate cannot capture/restore the files
-stored in S3. If you intend to migrate metadata only, pass --files-metadata-only.
+S3 file storage is enabled on the backend. To capture/restore the files stored in S3,
+pass their location with --files-s3-uri s3://bucket/prefix. If you intend to migrate
+metadata only, pass --files-metadata-only.
+
+"""
+
+_CANNOT_CHECK_S3_FILES_ERROR = """
+
+S3 file storage is enabled on the backend. nislmigrate can only check files stored on disk.
+
+"""
+
+_INCONSISTENT_FILE_STORE_ERROR = """
+
+The file metadata and the file store are inconsistent: {missing} referenced files are missing,
+{mismatched} have the wrong size and {unreferenced} files are not referenced. Every inconsistency
+is listed in {report}.
 
 """
 
@@ -56,7 +113,27 @@ _FILE_STORE_ROOT_NOT_SET_FOR_MODIFY_CHANGE_FILE_STORE_ERROR = """
 
 """
 
+_CANNOT_ARCHIVE_REFERENCED_FILES_ERROR = """
+
+--files-referenced-only and --files-query can not be combined with --files-archive.
+
+"""
+
+_CANNOT_COMBINE_S3_FILES_ERROR = """
+
+--files-archive, --files-referenced-only and --files-query can not be used with files stored in S3.
+
+"""
+
 _SAVED_OLD_FILE_STORE_ROOT_FILE_NAME = 'file-store-root'
+_QUERY_FILE_NAME = 'files-query.json'
+_QUERIED_DOCUMENTS_FILE_NAME = 'FileIngestion-queried-documents.bson.gz'
+_REFERENCED_FILES_REPORT_FILE_NAME = 'referenced-files.json'
+_FILE_STORE_CHECK_REPORT_FILE_NAME = 'file-store-check.json'
+_PATH_FIELD = 'path'
+_SIZE_FIELD = 'size'
+# The number of inconsistencies of each kind that a check logs, with the rest only in the report.
+_LOGGED_INCONSISTENCY_COUNT = 10
 
 
 class _FileMigratorConfiguration:
@@ -69,11 +146,10 @@ class _FileMigratorConfiguration:
         config: Dict[str, Any]
     ):
         self.mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
+        self.object_store_facade: ObjectStoreFacade = facade_factory.get_object_store_facade()
         self.file_facade: FileSystemFacade = facade_factory.get_file_system_facade()
         self.mongo_configuration: MongoConfiguration = MongoConfiguration(config)
         self.file_migration_directory: str = os.path.join(migration_directory, 'files')
-        self.file_migration_directory_exists: bool = self.file_facade.does_directory_exist(
-                self.file_migration_directory)
 
         self.data_directory: str = config.get(PATH_CONFIGURATION_KEY) or DEFAULT_DATA_DIRECTORY
 
@@ -87,9 +163,46 @@ class _FileMigratorConfiguration:
             self.old_store_path = ''
         self.should_update_store: bool = not self.update_store_path == ''
         self.use_forward_slashes: bool = arguments.get(_CHANGE_FILE_STORE_SLASHES_ARGUMENT, False)
+        self.should_archive_files: bool = arguments.get(_ARCHIVE_ARGUMENT, False)
+        self.archive_volume_size: int = self.__parse_volume_size(arguments.get(_ARCHIVE_VOLUME_SIZE_ARGUMENT))
+        self.query: Optional[Dict[str, Any]] = self.__parse_query(arguments.get(_QUERY_ARGUMENT))
+        self.should_copy_referenced_files_only: bool = (arguments.get(_REFERENCED_ONLY_ARGUMENT, False)
+                                                        or self.query is not None)
+        self.s3_uri: str = arguments.get(_S3_URI_ARGUMENT) or ''
+        self.s3_endpoint_url: Optional[str] = arguments.get(_S3_ENDPOINT_URL_ARGUMENT)
+
+    @property
+    def file_migration_directory_exists(self) -> bool:
+        return self.file_facade.does_directory_exist(self.file_migration_directory)
+
+    @staticmethod
+    def __parse_query(argument: Optional[str]) -> Optional[Dict[str, Any]]:
+        if argument is None:
+            return None
+        try:
+            query = json_util.loads(argument)
+        except ValueError as error:
+            raise MigrationError(_INVALID_QUERY_ERROR.format(error=error))
+        if not isinstance(query, dict):
+            raise MigrationError(_INVALID_QUERY_ERROR.format(error='expected an object'))
+        return query
+
+    @staticmethod
+    def __parse_volume_size(argument: Optional[str]) -> int:
+        if argument is None:
+            return DEFAULT_VOLUME_SIZE
+        try:
+            megabytes = int(argument)
+        except ValueError:
+            megabytes = 0
+        if megabytes < 1:
+            raise MigrationError(_INVALID_ARCHIVE_VOLUME_SIZE_ERROR.format(value=argument))
+        return megabytes * 1024 * 1024
 
 
 class FileMigrator(MigratorPlugin):
+    def __init__(self):
+        self.__configurations: Dict[Tuple[Any, ...], _FileMigratorConfiguration] = {}
 
     @property
     def name(self):
@@ -104,77 +217,150 @@ class FileMigrator(MigratorPlugin):
         return 'Migrate ingested files'
 
     def capture(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
-        configuration = _FileMigratorConfiguration(
+        configuration = self.__get_configuration(
             MigrationAction.CAPTURE,
             migration_directory,
             facade_factory,
-            arguments,
-            self.config(facade_factory)
-        )
-        configuration.mongo_facade.capture_database_to_directory(
-            configuration.mongo_configuration,
-            migration_directory,
-            self.name)
+            arguments)
+        if configuration.query is not None:
+            self.capture_queried_documents(configuration, migration_directory)
+        else:
+            configuration.mongo_facade.capture_database_to_directory(
+                configuration.mongo_configuration,
+                migration_directory,
+                self.name)
 
         captured_file_store_root_path = os.path.join(migration_directory, _SAVED_OLD_FILE_STORE_ROOT_FILE_NAME)
         configuration.file_facade.write_file(captured_file_store_root_path, configuration.data_directory)
 
-        if configuration.should_migrate_files:
+        if configuration.should_migrate_files and configuration.is_s3_backend:
+            configuration.object_store_facade.download_directory(
+                configuration.s3_uri,
+                configuration.file_migration_directory,
+                migration_directory,
+                configuration.s3_endpoint_url)
+        elif configuration.should_migrate_files and configuration.should_archive_files:
+            configuration.file_facade.copy_directory_to_volume_archive(
+                configuration.data_directory,
+                configuration.file_migration_directory,
+                configuration.archive_volume_size)
+        elif configuration.should_migrate_files and configuration.should_copy_referenced_files_only:
+            self.capture_referenced_files(configuration, migration_directory)
+        elif configuration.should_migrate_files:
             configuration.file_facade.copy_directory(
                 configuration.data_directory,
                 configuration.file_migration_directory,
                 False)
 
     def restore(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
-        configuration = _FileMigratorConfiguration(
+        configuration = self.__get_configuration(
             MigrationAction.RESTORE,
             migration_directory,
             facade_factory,
-            arguments,
-            self.config(facade_factory)
-        )
-
-        configuration.mongo_facade.restore_database_from_directory(
-            configuration.mongo_configuration,
-            migration_directory,
-            self.name)
+            arguments)
+
+        is_query_capture = self.is_query_capture(configuration, migration_directory)
+        if is_query_capture:
+            configuration.mongo_facade.upsert_documents_from_file(
+                configuration.mongo_configuration,
+                self.name.lower(),
+                os.path.join(migration_directory, _QUERIED_DOCUMENTS_FILE_NAME))
+        else:
+            configuration.mongo_facade.restore_database_from_directory(
+                configuration.mongo_configuration,
+                migration_directory,
+                self.name)
         if configuration.should_update_store:
             configuration.old_store_path = configuration.file_facade.read_file(_SAVED_OLD_FILE_STORE_ROOT_FILE_NAME)
         self.update_database(configuration)
-        if configuration.should_migrate_files:
+        if configuration.should_migrate_files and configuration.is_s3_backend:
+            configuration.object_store_facade.upload_directory(
+                configuration.file_migration_directory,
+                configuration.s3_uri,
+                migration_directory,
+                configuration.s3_endpoint_url)
+        elif configuration.should_migrate_files and is_query_capture:
+            configuration.file_facade.merge_directory(
+                configuration.file_migration_directory,
+                configuration.data_directory)
+        elif configuration.should_migrate_files:
             configuration.file_facade.copy_directory(
                 configuration.file_migration_directory,
                 configuration.data_directory,
                 True)
 
     def modify(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
-        configuration = _FileMigratorConfiguration(
+        configuration = self.__get_configuration(
             MigrationAction.MODIFY,
             migration_directory,
             facade_factory,
-            arguments,
-            self.config(facade_factory)
-        )
+            arguments)
         if configuration.should_update_store:
             self.update_root_file_path_in_metadata(configuration)
         if configuration.use_forward_slashes:
             self.update_file_path_slashes_in_metadata(configuration)
 
+    def check(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
+        configuration = self.__get_configuration(
+            MigrationAction.CHECK,
+            migration_directory,
+            facade_factory,
+            arguments)
+        if configuration.is_s3_backend:
+            raise MigrationError(_CANNOT_CHECK_S3_FILES_ERROR)
+        # Checks run while the services are running, so the metadata is read from their database.
+        documents = configuration.mongo_facade.find_documents_in_collection(
+            configuration.mongo_configuration,
+            self.name.lower(),
+            [_PATH_FIELD, _SIZE_FIELD],
+            start_mongo=False)
+        references = (FileReference(document[_PATH_FIELD], document.get(_SIZE_FIELD))
+                      for document in documents if _PATH_FIELD in document)
+        result = configuration.file_facade.check_file_store(configuration.data_directory, references)
+        if result.is_consistent:
+            return
+
+        report_path = os.path.join(migration_directory, _FILE_STORE_CHECK_REPORT_FILE_NAME)
+        report = {
+            'missing_files': result.missing_files,
+            'size_mismatches': [mismatch._asdict() for mismatch in result.size_mismatches],
+            'unreferenced_files': result.unreferenced_files,
+        }
+        configuration.file_facade.write_file(report_path, json.dumps(report, indent=2))
+        log = logging.getLogger(FileMigrator.__name__)
+        for path in result.missing_files[:_LOGGED_INCONSISTENCY_COUNT]:
+            log.warning(f'Missing referenced file: {path}')
+        for mismatch in result.size_mismatches[:_LOGGED_INCONSISTENCY_COUNT]:
+            log.warning(
+                f'Referenced file has {mismatch.actual_size} bytes instead of {mismatch.expected_size}: '
+                f'{mismatch.path}')
+        for path in result.unreferenced_files[:_LOGGED_INCONSISTENCY_COUNT]:
+            log.warning(f'Unreferenced file: {path}')
+        raise MigrationError(_INCONSISTENT_FILE_STORE_ERROR.format(
+            missing=len(result.missing_files),
+            mismatched=len(result.size_mismatches),
+            unreferenced=len(result.unreferenced_files),
+            report=report_path))
+
     def pre_capture_check(
             self,
             migration_directory: str,
             facade_factory: FacadeFactory,
             arguments: Dict[str, Any]) -> None:
 
-        configuration = _FileMigratorConfiguration(
+        configuration = self.__get_configuration(
             MigrationAction.CAPTURE,
             migration_directory,
             facade_factory,
-            arguments,
-            self.config(facade_factory)
-        )
-        if not configuration.has_metadata_only_argument and configuration.is_s3_backend:
-            raise MigrationError(_CANNOT_MIGRATE_S3_FILES_ERROR)
+            arguments)
+        if configuration.should_migrate_files and configuration.is_s3_backend:
+            self.__verify_s3_files_can_migrate(configuration)
+            if configuration.should_archive_files or configuration.should_copy_referenced_files_only:
+                raise MigrationError(_CANNOT_COMBINE_S3_FILES_ERROR)
+        elif configuration.should_migrate_files and configuration.should_archive_files:
+            if configuration.should_copy_referenced_files_only:
+                raise MigrationError(_CANNOT_ARCHIVE_REFERENCED_FILES_ERROR)
+            verify_volume_archive_support()
 
     def pre_restore_check(
             self,
@@ -182,22 +368,24 @@ class FileMigrator(MigratorPlugin):
             facade_factory: FacadeFactory,
             arguments: Dict[str, Any]) -> None:
 
-        configuration = _FileMigratorConfiguration(
+        configuration = self.__get_configuration(
             MigrationAction.RESTORE,
             migration_directory,
             facade_factory,
-            arguments,
-            self.config(facade_factory)
-        )
+            arguments)
 
         configuration.mongo_facade.validate_can_restore_database_from_directory(
             migration_directory,
-            self.name)
+            _QUERIED_DOCUMENTS_FILE_NAME if self.is_query_capture(configuration, migration_directory) else self.name)
 
-        if configuration.is_s3_backend and not configuration.has_metadata_only_argument:
-            raise MigrationError(_CANNOT_MIGRATE_S3_FILES_ERROR)
-        elif not configuration.file_migration_directory_exists and configuration.should_migrate_files:
+        if not configuration.file_migration_directory_exists and configuration.should_migrate_files:
             raise MigrationError(_NO_FILES_ERROR)
+        elif configuration.should_migrate_files and configuration.is_s3_backend:
+            self.__verify_s3_files_can_migrate(configuration)
+            if is_volume_archive(configuration.file_migration_directory):
+                raise MigrationError(_CANNOT_COMBINE_S3_FILES_ERROR)
+        elif configuration.should_migrate_files and is_volume_archive(configuration.file_migration_directory):
+            verify_volume_archive_support()
 
     def pre_modify_check(
             self,
@@ -205,16 +393,41 @@ class FileMigrator(MigratorPlugin):
             facade_factory: FacadeFactory,
             arguments: Dict[str, Any]) -> None:
 
-        configuration = _FileMigratorConfiguration(
+        configuration = self.__get_configuration(
             MigrationAction.MODIFY,
             migration_directory,
             facade_factory,
-            arguments,
-            self.config(facade_factory)
-        )
+            arguments)
         if configuration.update_store_path != '' and configuration.old_store_path == '':
             raise MigrationError(_FILE_STORE_ROOT_NOT_SET_FOR_MODIFY_CHANGE_FILE_STORE_ERROR)
 
+    @staticmethod
+    def __verify_s3_files_can_migrate(configuration: _FileMigratorConfiguration) -> None:
+        if not configuration.s3_uri:
+            raise MigrationError(_CANNOT_MIGRATE_S3_FILES_ERROR)
+        parse_s3_uri(configuration.s3_uri)
+        verify_object_store_support()
+
+    def __get_configuration(
+            self,
+            action: MigrationAction,
+            migration_directory: str,
+            facade_factory: FacadeFactory,
+            arguments: Dict[str, Any]) -> _FileMigratorConfiguration:
+        """
+        Gets the configuration for an action, building it only once per run for the
+        pre-check and the action itself.
+        """
+        key = (action, migration_directory, facade_factory, tuple(sorted(arguments.items())))
+        if key not in self.__configurations:
+            self.__configurations[key] = _FileMigratorConfiguration(
+                action,
+                migration_directory,
+                facade_factory,
+                arguments,
+                self.config(facade_factory))
+        return self.__configurations[key]
+
     def add_additional_arguments(self, argument_manager: ArgumentManager):
         argument_manager.add_switch(_METADATA_ONLY_ARGUMENT, help=_METADATA_ONLY_HELP)
         argument_manager.add_argument(_CHANGE_FILE_STORE_ARGUMENT, help=_CHANGE_FILE_STORE_HELP, metavar='new-root-dir')
@@ -223,6 +436,51 @@ class FileMigrator(MigratorPlugin):
             help=_FILE_STORE_ROOT_HELP,
             metavar='existing-root-dir')
         argument_manager.add_switch(_CHANGE_FILE_STORE_SLASHES_ARGUMENT, help=_CHANGE_FILE_STORE_SLASHES_HELP)
+        argument_manager.add_switch(_REFERENCED_ONLY_ARGUMENT, help=_REFERENCED_ONLY_HELP)
+        argument_manager.add_argument(_QUERY_ARGUMENT, help=_QUERY_HELP, metavar='filter')
+        argument_manager.add_switch(_ARCHIVE_ARGUMENT, help=_ARCHIVE_HELP)
+        argument_manager.add_argument(
+            _ARCHIVE_VOLUME_SIZE_ARGUMENT,
+            help=_ARCHIVE_VOLUME_SIZE_HELP,
+            metavar='megabytes')
+        argument_manager.add_argument(_S3_URI_ARGUMENT, help=_S3_URI_HELP, metavar='s3://bucket/prefix')
+        argument_manager.add_argument(_S3_ENDPOINT_URL_ARGUMENT, help=_S3_ENDPOINT_URL_HELP, metavar='url')
+
+    def capture_queried_documents(self, configuration: _FileMigratorConfiguration, migration_directory: str):
+        """
+        Captures the metadata that matches the query along with the query itself, so that
+        a restore adds the documents to the existing metadata instead of replacing it.
+        """
+        configuration.mongo_facade.capture_aggregation_to_file(
+            configuration.mongo_configuration,
+            self.name.lower(),
+            [{'$match': configuration.query}],
+            os.path.join(migration_directory, _QUERIED_DOCUMENTS_FILE_NAME))
+        configuration.file_facade.write_file(
+            os.path.join(migration_directory, _QUERY_FILE_NAME),
+            json_util.dumps(configuration.query))
+
+    @staticmethod
+    def is_query_capture(configuration: _FileMigratorConfiguration, migration_directory: str) -> bool:
+        return configuration.file_facade.does_file_exist(os.path.join(migration_directory, _QUERY_FILE_NAME))
+
+    def capture_referenced_files(self, configuration: _FileMigratorConfiguration, migration_directory: str):
+        referenced_paths = configuration.mongo_facade.find_field_values_in_collection(
+            configuration.mongo_configuration,
+            self.name.lower(),
+            _PATH_FIELD,
+            configuration.query)
+        selection = configuration.file_facade.copy_referenced_files(
+            configuration.data_directory,
+            configuration.file_migration_directory,
+            referenced_paths)
+        report = {
+            'orphaned_files': [file.source for file in selection.orphaned_files],
+            'missing_files': selection.missing_paths,
+        }
+        configuration.file_facade.write_file(
+            os.path.join(migration_directory, _REFERENCED_FILES_REPORT_FILE_NAME),
+            json.dumps(report, indent=2))
 
     def update_database(self, configuration: _FileMigratorConfiguration):
         if configuration.should_update_store:
@@ -1,12 +1,14 @@
+import json
 import os
 
 from nislmigrate.facades.facade_factory import FacadeFactory
-from nislmigrate.extensibility.migrator_plugin import MigratorPlugin
+from nislmigrate.extensibility.migrator_plugin import ArgumentManager, MigratorPlugin
 from nislmigrate.facades.file_system_facade import FileSystemFacade
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
 from nislmigrate.facades.mongo_facade import MongoFacade
+from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.utility.paths import get_ni_shared_directory_64_path
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 BASE_REPOSITORY_PATH_CONFIG_TOKEN = 'BaseFilePath'
 DEFAULT_BASE_REPOSITORY_PATH = os.path.join(
@@ -16,6 +18,34 @@ DEFAULT_BASE_REPOSITORY_PATH = os.path.join(
     'repo_webservice',
     'files')
 
+_DEDUPLICATE_ARGUMENT = 'deduplicate'
+_DEDUPLICATE_HELP = 'Capture only the packages that a feed refers to, and copy each distinct package file once. \
+Other files in the repository are captured as usual. Duplicate packages are linked back when restoring. The \
+packages left behind and the referenced packages that were not found are listed in referenced-packages.json in \
+the captured data.'
+
+_FEEDS_COLLECTION_NAME = 'feeds'
+_PACKAGES_COLLECTION_NAME = 'packages'
+_PACKAGE_FEED_FIELD = 'feedId'
+# The path of the package file, relative to the repository's base file path.
+_PACKAGE_FILE_FIELD = 'fileName'
+_PACKAGE_EXTENSIONS = ('.nipkg',)
+_REFERENCED_PACKAGES_REPORT_FILE_NAME = 'referenced-packages.json'
+
+_PACKAGE_WITHOUT_FILE_ERROR = """
+
+The package {package_id} in the {collection} collection has no {field} field, so the
+package files it refers to can not be found. Capture without --repo-deduplicate.
+
+"""
+
+_NO_REFERENCED_PACKAGES_FOUND_ERROR = """
+
+None of the {referenced} package files that feeds refer to were found in {repository},
+although it holds {unreferenced} package files. Capture without --repo-deduplicate.
+
+"""
+
 
 class RepositoryMigrator(MigratorPlugin):
 
@@ -41,8 +71,32 @@ class RepositoryMigrator(MigratorPlugin):
             mongo_configuration,
             migration_directory,
             self.name)
+        repository_path = self.__find_repository_path(facade_factory)
+        if arguments.get(_DEDUPLICATE_ARGUMENT, False) and file_facade.does_directory_exist(repository_path):
+            referenced_paths = self.__find_referenced_package_paths(repository_path, mongo_facade, mongo_configuration)
+            selection = file_facade.copy_referenced_files(
+                repository_path,
+                file_migration_directory,
+                referenced_paths,
+                deduplicate=True,
+                selected_extensions=_PACKAGE_EXTENSIONS)
+            # Packages that are all left behind mean the package documents do not describe
+            # the files the way this migrator expects, so nothing would be restored.
+            if selection.orphaned_files and len(selection.missing_paths) == len(referenced_paths):
+                raise MigrationError(_NO_REFERENCED_PACKAGES_FOUND_ERROR.format(
+                    referenced=len(referenced_paths),
+                    repository=repository_path,
+                    unreferenced=len(selection.orphaned_files)))
+            report = {
+                'unreferenced_packages': [file.source for file in selection.orphaned_files],
+                'missing_packages': selection.missing_paths,
+            }
+            file_facade.write_file(
+                os.path.join(migration_directory, _REFERENCED_PACKAGES_REPORT_FILE_NAME),
+                json.dumps(report, indent=2))
+            return
         file_facade.copy_directory_if_exists(
-            self.__find_repository_path(facade_factory),
+            repository_path,
             file_migration_directory,
             False)
 
@@ -71,6 +125,33 @@ class RepositoryMigrator(MigratorPlugin):
             migration_directory,
             self.name)
 
+    def add_additional_arguments(self, argument_manager: ArgumentManager):
+        argument_manager.add_switch(_DEDUPLICATE_ARGUMENT, help=_DEDUPLICATE_HELP)
+
+    @staticmethod
+    def __find_referenced_package_paths(
+            repository_path: str,
+            mongo_facade: MongoFacade,
+            mongo_configuration: MongoConfiguration) -> List[str]:
+        feed_ids = {str(feed_id) for feed_id in mongo_facade.find_field_values_in_collection(
+            mongo_configuration,
+            _FEEDS_COLLECTION_NAME,
+            '_id')}
+        packages = mongo_facade.find_documents_in_collection(
+            mongo_configuration,
+            _PACKAGES_COLLECTION_NAME,
+            ['_id', _PACKAGE_FEED_FIELD, _PACKAGE_FILE_FIELD])
+        paths = []
+        for package in packages:
+            if _PACKAGE_FILE_FIELD not in package:
+                raise MigrationError(_PACKAGE_WITHOUT_FILE_ERROR.format(
+                    package_id=package.get('_id'),
+                    collection=_PACKAGES_COLLECTION_NAME,
+                    field=_PACKAGE_FILE_FIELD))
+            if str(package.get(_PACKAGE_FEED_FIELD)) in feed_ids:
+                paths.append(os.path.join(repository_path, package[_PACKAGE_FILE_FIELD]))
+        return paths
+
     def __find_repository_path(self, facade_factory: FacadeFactory) -> str:
         config = self.config(facade_factory)
         return config.get(BASE_REPOSITORY_PATH_CONFIG_TOKEN) or DEFAULT_BASE_REPOSITORY_PATH
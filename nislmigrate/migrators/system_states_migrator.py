@@ -1,8 +1,9 @@
 import os
 
 from nislmigrate.facades.facade_factory import FacadeFactory
-from nislmigrate.extensibility.migrator_plugin import MigratorPlugin
+from nislmigrate.extensibility.migrator_plugin import ArgumentManager, MigratorPlugin
 from nislmigrate.facades.file_system_facade import FileSystemFacade
+from nislmigrate.facades.git_facade import BUNDLE_MANIFEST_FILE_NAME, GitFacade, verify_git_support
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
 from nislmigrate.facades.mongo_facade import MongoFacade
 from typing import Any, Dict
@@ -17,6 +18,25 @@ DEFAULT_GIT_REPOT_PATH = os.path.join(
 
 GIT_REPO_CONFIG_CONFIGURATION_KEY = 'Git.RepoPath'
 
+_BUNDLE_ARGUMENT = 'git-bundle'
+_BUNDLE_HELP = 'Capture the system states repository as git bundles instead of copying its files one by one. \
+Unlike a copy, bundles only hold committed history, and restoring them checks out the last commit, so captures \
+of a working tree with uncommitted changes or untracked files are refused. Requires git.'
+
+_REPACK_ARGUMENT = 'git-repack'
+_REPACK_HELP = 'Repack the system states repository into a single pack before bundling it. Implies \
+"--systemstates-git-bundle".'
+
+_INCREMENTAL_ARGUMENT = 'git-incremental'
+_INCREMENTAL_HELP = 'Bundle only the commits added since the bundles already captured into the migration \
+directory, keeping those bundles. Implies "--systemstates-git-bundle".'
+
+_ALLOW_UNCOMMITTED_ARGUMENT = 'git-allow-uncommitted'
+_ALLOW_UNCOMMITTED_HELP = 'Capture git bundles even if the working tree of the system states repository has \
+uncommitted changes or untracked files, which are left behind. Implies "--systemstates-git-bundle".'
+
+_BUNDLE_DIRECTORY_NAME = 'bundles'
+
 
 class SystemStatesMigrator(MigratorPlugin):
 
@@ -42,8 +62,24 @@ class SystemStatesMigrator(MigratorPlugin):
             mongo_configuration,
             migration_directory,
             self.name)
+        git_repo_directory = self.__find_git_repo_directory(facade_factory)
+        bundle_directory = os.path.join(migration_directory, _BUNDLE_DIRECTORY_NAME)
+        # Restores prefer bundles over copied files, so the kind of capture not taken this
+        # time is removed in case an earlier capture into the same directory left it behind.
+        if self.__should_capture_bundles(arguments):
+            file_facade.remove_directory(file_migration_directory)
+            if file_facade.does_directory_exist(git_repo_directory):
+                git_facade: GitFacade = facade_factory.get_git_facade()
+                git_facade.capture_repository_to_bundles(
+                    git_repo_directory,
+                    bundle_directory,
+                    arguments.get(_INCREMENTAL_ARGUMENT, False),
+                    arguments.get(_REPACK_ARGUMENT, False),
+                    arguments.get(_ALLOW_UNCOMMITTED_ARGUMENT, False))
+            return
+        file_facade.remove_directory(bundle_directory)
         file_facade.copy_directory_if_exists(
-            self.__find_git_repo_directory(facade_factory),
+            git_repo_directory,
             file_migration_directory,
             False)
 
@@ -57,11 +93,26 @@ class SystemStatesMigrator(MigratorPlugin):
             mongo_configuration,
             migration_directory,
             self.name)
+        bundle_directory = os.path.join(migration_directory, _BUNDLE_DIRECTORY_NAME)
+        if file_facade.does_file_exist(os.path.join(bundle_directory, BUNDLE_MANIFEST_FILE_NAME)):
+            git_facade: GitFacade = facade_factory.get_git_facade()
+            file_facade.replace_directory(
+                self.__find_git_repo_directory(facade_factory),
+                lambda repository: git_facade.restore_repository_from_bundles(bundle_directory, repository))
+            return
         file_facade.copy_directory_if_exists(
             file_migration_directory,
             self.__find_git_repo_directory(facade_factory),
             True)
 
+    def pre_capture_check(
+            self,
+            migration_directory: str,
+            facade_factory: FacadeFactory,
+            arguments: Dict[str, Any]) -> None:
+        if self.__should_capture_bundles(arguments):
+            verify_git_support()
+
     def pre_restore_check(
             self,
             migration_directory: str,
@@ -71,6 +122,21 @@ class SystemStatesMigrator(MigratorPlugin):
         mongo_facade.validate_can_restore_database_from_directory(
             migration_directory,
             self.name)
+        file_facade: FileSystemFacade = facade_factory.get_file_system_facade()
+        bundle_directory = os.path.join(migration_directory, _BUNDLE_DIRECTORY_NAME)
+        if file_facade.does_file_exist(os.path.join(bundle_directory, BUNDLE_MANIFEST_FILE_NAME)):
+            verify_git_support()
+
+    def add_additional_arguments(self, argument_manager: ArgumentManager):
+        argument_manager.add_switch(_BUNDLE_ARGUMENT, help=_BUNDLE_HELP)
+        argument_manager.add_switch(_REPACK_ARGUMENT, help=_REPACK_HELP)
+        argument_manager.add_switch(_INCREMENTAL_ARGUMENT, help=_INCREMENTAL_HELP)
+        argument_manager.add_switch(_ALLOW_UNCOMMITTED_ARGUMENT, help=_ALLOW_UNCOMMITTED_HELP)
+
+    @staticmethod
+    def __should_capture_bundles(arguments: Dict[str, Any]) -> bool:
+        bundle_arguments = (_BUNDLE_ARGUMENT, _REPACK_ARGUMENT, _INCREMENTAL_ARGUMENT, _ALLOW_UNCOMMITTED_ARGUMENT)
+        return any(arguments.get(argument, False) for argument in bundle_arguments)
 
     def __find_git_repo_directory(self, facade_factory: FacadeFactory) -> str:
         config = self.config(facade_factory)
@@ -1,13 +1,14 @@
+from nislmigrate.facades.encrypted_archive import DEFAULT_KEY_DERIVATION_ITERATIONS
 from nislmigrate.facades.file_system_facade import FileSystemFacade
 from nislmigrate.facades.facade_factory import FacadeFactory
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
 from nislmigrate.facades.mongo_facade import MongoFacade
-from nislmigrate.extensibility.migrator_plugin import MigratorPlugin
+from nislmigrate.extensibility.migrator_plugin import ArgumentManager, MigratorPlugin
 from nislmigrate.utility.paths import get_ni_application_data_directory_path
 from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.argument_handler import SECRET_ARGUMENT
 import os
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple
 
 PKI_DIRECTORY_NAME = 'pki'
 PILLAR_DIRECTORY_NAME = 'pillar'
@@ -24,6 +25,22 @@ including the following command line argument:
 
 """
 
+_KEY_DERIVATION_ITERATIONS_ARGUMENT = 'key-derivation-iterations'
+_KEY_DERIVATION_ITERATIONS_HELP = f'The number of PBKDF2 iterations used to derive the encryption key from the \
+secret during capture (defaults to {DEFAULT_KEY_DERIVATION_ITERATIONS}). Restore reads the value from the \
+captured data.'
+
+_INCREMENTAL_ARGUMENT = 'incremental'
+_INCREMENTAL_HELP = 'When capturing into a migration directory that already holds a capture of systems, capture \
+only the salt keys and pillar files added or changed since then. Restore applies every capture in order and \
+removes the files that were removed between them.'
+
+_INVALID_KEY_DERIVATION_ITERATIONS_ERROR = """
+
+--systems-key-derivation-iterations must be a positive whole number.
+
+"""
+
 
 class SystemsManagementMigrator(MigratorPlugin):
 
@@ -62,6 +79,14 @@ class SystemsManagementMigrator(MigratorPlugin):
     def pre_capture_check(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
         self.__file_facade = facade_factory.get_file_system_facade()
         self.__verify_secret_provided(arguments)
+        self.__get_key_derivation_iterations(arguments)
+
+    def add_additional_arguments(self, argument_manager: ArgumentManager):
+        argument_manager.add_argument(
+            _KEY_DERIVATION_ITERATIONS_ARGUMENT,
+            help=_KEY_DERIVATION_ITERATIONS_HELP,
+            metavar='iterations')
+        argument_manager.add_switch(_INCREMENTAL_ARGUMENT, help=_INCREMENTAL_HELP)
 
     @staticmethod
     def __verify_secret_provided(arguments):
@@ -69,13 +94,25 @@ class SystemsManagementMigrator(MigratorPlugin):
         if not secret:
             raise MigrationError(NO_SECRET_ERROR)
 
+    @staticmethod
+    def __get_key_derivation_iterations(arguments) -> int:
+        try:
+            iterations = int(arguments.get(_KEY_DERIVATION_ITERATIONS_ARGUMENT, DEFAULT_KEY_DERIVATION_ITERATIONS))
+        except ValueError:
+            raise MigrationError(_INVALID_KEY_DERIVATION_ITERATIONS_ERROR)
+        if iterations < 1:
+            raise MigrationError(_INVALID_KEY_DERIVATION_ITERATIONS_ERROR)
+        return iterations
+
     def __capture_file_data(self, arguments, migration_directory):
-        encrypted_pki_files = os.path.join(migration_directory, PKI_DIRECTORY_NAME)
-        encrypted_pillar_files = os.path.join(migration_directory, PILLAR_DIRECTORY_NAME)
-        secret = arguments.get(SECRET_ARGUMENT)
-        self.__file_facade.copy_directory_to_encrypted_file(PKI_INSTALLED_PATH, encrypted_pki_files, secret)
+        copies: List[Tuple[str, str]] = [(PKI_INSTALLED_PATH, os.path.join(migration_directory, PKI_DIRECTORY_NAME))]
         if self.__file_facade.does_directory_exist(PILLAR_INSTALLED_PATH):
-            self.__file_facade.copy_directory_to_encrypted_file(PILLAR_INSTALLED_PATH, encrypted_pillar_files, secret)
+            copies.append((PILLAR_INSTALLED_PATH, os.path.join(migration_directory, PILLAR_DIRECTORY_NAME)))
+        self.__file_facade.copy_directories_to_encrypted_files(
+            copies,
+            arguments.get(SECRET_ARGUMENT),
+            self.__get_key_derivation_iterations(arguments),
+            arguments.get(_INCREMENTAL_ARGUMENT, False))
 
     def __capture_mongo_data(self, facade_factory, migration_directory):
         mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
@@ -1,13 +1,76 @@
+import datetime
+import itertools
+import json
+import logging
 import os
-from typing import Any, Dict
+from typing import Any, Callable, Dict, List, Optional
 
-from nislmigrate.extensibility.migrator_plugin import MigratorPlugin
+from nislmigrate.extensibility.migrator_plugin import MigratorPlugin, ArgumentManager
 from nislmigrate.facades.facade_factory import FacadeFactory
 from nislmigrate.facades.file_system_facade import FileSystemFacade
+from nislmigrate.facades.history_downsampling import (
+    build_downsampling_pipeline,
+    build_recent_history_query,
+    find_missing_layout_fields,
+    HistoryLayout,
+)
 from nislmigrate.facades.mongo_facade import MongoFacade
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
+from nislmigrate.facades.rdb_inventory import RdbInventory
+from nislmigrate.facades.redis_configuration import RedisConfiguration
+from nislmigrate.facades.redis_facade import RedisFacade, verify_redis_support
+from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.utility.paths import get_ni_application_data_directory_path
 
+_REDIS_ARGUMENT = 'redis'
+_REDIS_HELP = 'Capture the tags by reading their keys from the tag Redis database instead of copying its dump.rdb \
+file, which only holds what Redis last saved. Restores of such captures replace the keys of the Redis database, \
+which may be running. Requires the redis package.'
+
+_REDIS_KEY_PATTERN_ARGUMENT = 'redis-key-pattern'
+_REDIS_KEY_PATTERN_HELP = 'Comma separated glob-style patterns of the Redis keys to capture, for example \
+"tag:*". Restores of such captures replace the captured keys and keep every other key of the Redis database. \
+Implies "--tags-redis".'
+
+_REDIS_KEY_DUMP_FILE_NAME = 'tags.redisdump'
+_INVENTORY_FILE_NAME = 'tags-inventory.json'
+
+_FULL_RESOLUTION_DAYS_ARGUMENT = 'history-full-resolution-days'
+_FULL_RESOLUTION_DAYS_HELP = 'Capture only the tag history of the last <days> days at full resolution, and \
+replace older history with one sample per interval holding the minimum, maximum, mean and number of the samples \
+it replaces.'
+
+_DOWNSAMPLING_INTERVAL_ARGUMENT = 'history-interval-minutes'
+_DOWNSAMPLING_INTERVAL_HELP = 'The length of the intervals older tag history is downsampled into. Defaults to 60. \
+Requires "--tags-history-full-resolution-days".'
+_DEFAULT_DOWNSAMPLING_INTERVAL_MINUTES = 60
+
+# The collection the tag historian keeps the samples of each tag in.
+_HISTORY_LAYOUT = HistoryLayout(
+    collection_name='values',
+    series_fields=['workspace', 'path'],
+    timestamp_field='timestamp',
+    value_field='value')
+_RECENT_HISTORY_DUMP_NAME = 'TagHistorian-recent-history'
+_DOWNSAMPLED_HISTORY_FILE_NAME = 'TagHistorian-downsampled-history.bson.gz'
+# The number of history samples checked against the layout before downsampling.
+_LAYOUT_SAMPLE_COUNT = 100
+
+_INVALID_DOWNSAMPLING_ARGUMENT_ERROR = '"--tags-{argument}" must be a positive whole number.'
+_DOWNSAMPLING_INTERVAL_REQUIRES_DAYS_ERROR = \
+    '"--tags-history-interval-minutes" requires "--tags-history-full-resolution-days".'
+
+_UNEXPECTED_HISTORY_LAYOUT_ERROR = """
+The tag history in the {collection} collection does not have the fields {fields}
+that downsampling groups samples by. Capture without "--tags-history-full-resolution-days".
+"""
+
+_NEWER_RDB_VERSION_ERROR = """
+The captured tags were saved with RDB version {captured_version}, but the Redis server
+of this SystemLink Server saves RDB version {target_version} and can not load them.
+Upgrade SystemLink Server before restoring.
+"""
+
 
 class TagMigrator(MigratorPlugin):
 
@@ -33,14 +96,32 @@ class TagMigrator(MigratorPlugin):
         mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
         file_facade: FileSystemFacade = facade_factory.get_file_system_facade()
         mongo_configuration: MongoConfiguration = MongoConfiguration(self.config(facade_factory))
-        mongo_facade.capture_database_to_directory(
-            mongo_configuration,
-            migration_directory,
-            self.name)
-        file_facade.copy_file(
-            self.__file_to_migrate_directory,
-            migration_directory,
-            self.__file_to_migrate)
+        if _FULL_RESOLUTION_DAYS_ARGUMENT in arguments:
+            self.__capture_downsampled_database(migration_directory, mongo_facade, mongo_configuration, arguments)
+        else:
+            mongo_facade.capture_database_to_directory(
+                mongo_configuration,
+                migration_directory,
+                self.name)
+        redis_facade: RedisFacade = facade_factory.get_redis_facade()
+        if self.__should_capture_from_redis(arguments):
+            redis_facade.capture_keys(
+                RedisConfiguration(self.config(facade_factory)),
+                os.path.join(migration_directory, _REDIS_KEY_DUMP_FILE_NAME),
+                self.__get_key_patterns(arguments))
+        else:
+            file_facade.copy_file(
+                self.__file_to_migrate_directory,
+                migration_directory,
+                self.__file_to_migrate)
+        inventory = self.__inventory_capture(migration_directory, facade_factory)
+        if inventory is None:
+            return
+        file_facade.write_file(
+            os.path.join(migration_directory, _INVENTORY_FILE_NAME),
+            json.dumps(inventory._asdict(), indent=2))
+        log = logging.getLogger(TagMigrator.__name__)
+        log.log(logging.INFO, f'Captured tags: {inventory.describe()}')
 
     def restore(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
         mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
@@ -50,10 +131,38 @@ class TagMigrator(MigratorPlugin):
             mongo_configuration,
             migration_directory,
             self.name)
-        file_facade.copy_file(
-            migration_directory,
-            self.__file_to_migrate_directory,
-            self.__file_to_migrate)
+        downsampled_history_path = os.path.join(migration_directory, _DOWNSAMPLED_HISTORY_FILE_NAME)
+        if file_facade.does_file_exist(downsampled_history_path):
+            mongo_facade.restore_database_from_directory(
+                mongo_configuration,
+                migration_directory,
+                _RECENT_HISTORY_DUMP_NAME)
+            mongo_facade.restore_documents_from_file(
+                mongo_configuration,
+                _HISTORY_LAYOUT.collection_name,
+                downsampled_history_path)
+        key_dump_path = os.path.join(migration_directory, _REDIS_KEY_DUMP_FILE_NAME)
+        if file_facade.does_file_exist(key_dump_path):
+            redis_facade: RedisFacade = facade_factory.get_redis_facade()
+            redis_facade.restore_keys(RedisConfiguration(self.config(facade_factory)), key_dump_path)
+        else:
+            file_facade.copy_file(
+                migration_directory,
+                self.__file_to_migrate_directory,
+                self.__file_to_migrate)
+
+    def pre_capture_check(
+            self,
+            migration_directory: str,
+            facade_factory: FacadeFactory,
+            arguments: Dict[str, Any]) -> None:
+        if self.__should_capture_from_redis(arguments):
+            verify_redis_support()
+        if _DOWNSAMPLING_INTERVAL_ARGUMENT in arguments and _FULL_RESOLUTION_DAYS_ARGUMENT not in arguments:
+            raise MigrationError(_DOWNSAMPLING_INTERVAL_REQUIRES_DAYS_ERROR)
+        if _FULL_RESOLUTION_DAYS_ARGUMENT in arguments:
+            self.__get_downsampling_interval(arguments)
+            self.__get_positive_integer(arguments, _FULL_RESOLUTION_DAYS_ARGUMENT, None)
 
     def pre_restore_check(
             self,
@@ -64,3 +173,141 @@ class TagMigrator(MigratorPlugin):
         mongo_facade.validate_can_restore_database_from_directory(
             migration_directory,
             self.name)
+        file_facade: FileSystemFacade = facade_factory.get_file_system_facade()
+        if file_facade.does_file_exist(os.path.join(migration_directory, _DOWNSAMPLED_HISTORY_FILE_NAME)):
+            mongo_facade.validate_can_restore_database_from_directory(
+                migration_directory,
+                _RECENT_HISTORY_DUMP_NAME)
+        if file_facade.does_file_exist(os.path.join(migration_directory, _REDIS_KEY_DUMP_FILE_NAME)):
+            verify_redis_support()
+        self.__compare_capture_with_target(migration_directory, facade_factory)
+
+    def add_additional_arguments(self, argument_manager: ArgumentManager):
+        argument_manager.add_switch(_REDIS_ARGUMENT, help=_REDIS_HELP)
+        argument_manager.add_argument(_REDIS_KEY_PATTERN_ARGUMENT, help=_REDIS_KEY_PATTERN_HELP, metavar='patterns')
+        argument_manager.add_argument(
+            _FULL_RESOLUTION_DAYS_ARGUMENT,
+            help=_FULL_RESOLUTION_DAYS_HELP,
+            metavar='days')
+        argument_manager.add_argument(
+            _DOWNSAMPLING_INTERVAL_ARGUMENT,
+            help=_DOWNSAMPLING_INTERVAL_HELP,
+            metavar='minutes')
+
+    def __capture_downsampled_database(
+            self,
+            migration_directory: str,
+            mongo_facade: MongoFacade,
+            mongo_configuration: MongoConfiguration,
+            arguments: Dict[str, Any]) -> None:
+        full_resolution_days = self.__get_positive_integer(arguments, _FULL_RESOLUTION_DAYS_ARGUMENT, None)
+        interval = datetime.timedelta(minutes=self.__get_downsampling_interval(arguments))
+        older_than = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=full_resolution_days)
+        self.__verify_history_layout(mongo_facade, mongo_configuration)
+        mongo_facade.capture_database_to_directory(
+            mongo_configuration,
+            migration_directory,
+            self.name,
+            excluded_collection_names=[_HISTORY_LAYOUT.collection_name])
+        mongo_facade.capture_database_to_directory(
+            mongo_configuration,
+            migration_directory,
+            _RECENT_HISTORY_DUMP_NAME,
+            collection_name=_HISTORY_LAYOUT.collection_name,
+            query=build_recent_history_query(_HISTORY_LAYOUT, older_than))
+        bucket_count = mongo_facade.capture_aggregation_to_file(
+            mongo_configuration,
+            _HISTORY_LAYOUT.collection_name,
+            build_downsampling_pipeline(_HISTORY_LAYOUT, older_than, interval),
+            os.path.join(migration_directory, _DOWNSAMPLED_HISTORY_FILE_NAME))
+        log = logging.getLogger(TagMigrator.__name__)
+        log.log(
+            logging.INFO,
+            f'Downsampled tag history older than {older_than:%Y-%m-%d %H:%M} UTC into {bucket_count} samples')
+
+    @staticmethod
+    def __verify_history_layout(mongo_facade: MongoFacade, mongo_configuration: MongoConfiguration) -> None:
+        samples = mongo_facade.find_documents_in_collection(
+            mongo_configuration,
+            _HISTORY_LAYOUT.collection_name,
+            _HISTORY_LAYOUT.series_fields + [_HISTORY_LAYOUT.timestamp_field])
+        missing_fields = find_missing_layout_fields(_HISTORY_LAYOUT, itertools.islice(samples, _LAYOUT_SAMPLE_COUNT))
+        if missing_fields:
+            raise MigrationError(_UNEXPECTED_HISTORY_LAYOUT_ERROR.format(
+                collection=_HISTORY_LAYOUT.collection_name,
+                fields=', '.join(missing_fields)))
+
+    def __get_downsampling_interval(self, arguments: Dict[str, Any]) -> int:
+        return self.__get_positive_integer(
+            arguments,
+            _DOWNSAMPLING_INTERVAL_ARGUMENT,
+            _DEFAULT_DOWNSAMPLING_INTERVAL_MINUTES)
+
+    @staticmethod
+    def __get_positive_integer(arguments: Dict[str, Any], argument: str, default: Optional[int]) -> int:
+        value: Any = arguments.get(argument)
+        if value is None and default is not None:
+            return default
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            number = 0
+        if number <= 0:
+            raise MigrationError(_INVALID_DOWNSAMPLING_ARGUMENT_ERROR.format(argument=argument))
+        return number
+
+    def __compare_capture_with_target(self, migration_directory: str, facade_factory: FacadeFactory) -> None:
+        file_facade: FileSystemFacade = facade_factory.get_file_system_facade()
+        redis_facade: RedisFacade = facade_factory.get_redis_facade()
+        captured_inventory = self.__inventory_capture(migration_directory, facade_factory)
+        log = logging.getLogger(TagMigrator.__name__)
+        if captured_inventory is not None:
+            log.log(logging.INFO, f'Restoring tags: {captured_inventory.describe()}')
+        target_path = os.path.join(self.__file_to_migrate_directory, self.__file_to_migrate)
+        if not file_facade.does_file_exist(target_path):
+            return
+        # Only a newer RDB version stops the restore. The version of a dump.rdb file is read
+        # from its header alone, so values the inventory can not read never block a restore.
+        key_dump_path = os.path.join(migration_directory, _REDIS_KEY_DUMP_FILE_NAME)
+        if file_facade.does_file_exist(key_dump_path):
+            captured_version = None if captured_inventory is None else captured_inventory.version
+        else:
+            captured_version = redis_facade.read_dump_file_version(
+                os.path.join(migration_directory, self.__file_to_migrate))
+        target_version = redis_facade.read_dump_file_version(target_path)
+        if captured_version is not None and captured_version > target_version:
+            raise MigrationError(_NEWER_RDB_VERSION_ERROR.format(
+                captured_version=captured_version,
+                target_version=target_version))
+        target_inventory = self.__try_inventory(lambda: redis_facade.inventory_dump_file(target_path), target_path)
+        if target_inventory is not None:
+            log.log(logging.INFO, f'Tags before the restore: {target_inventory.describe()}')
+
+    def __inventory_capture(self, migration_directory: str, facade_factory: FacadeFactory) -> Optional[RdbInventory]:
+        file_facade: FileSystemFacade = facade_factory.get_file_system_facade()
+        redis_facade: RedisFacade = facade_factory.get_redis_facade()
+        key_dump_path = os.path.join(migration_directory, _REDIS_KEY_DUMP_FILE_NAME)
+        if file_facade.does_file_exist(key_dump_path):
+            return self.__try_inventory(lambda: redis_facade.inventory_key_dump(key_dump_path), key_dump_path)
+        dump_file_path = os.path.join(migration_directory, self.__file_to_migrate)
+        return self.__try_inventory(lambda: redis_facade.inventory_dump_file(dump_file_path), dump_file_path)
+
+    @staticmethod
+    def __try_inventory(read_inventory: Callable[[], RdbInventory], path: str) -> Optional[RdbInventory]:
+        try:
+            return read_inventory()
+        except MigrationError as error:
+            log = logging.getLogger(TagMigrator.__name__)
+            log.warning(f'Could not summarize the tags in {path}, so no inventory is logged or written: {error}')
+            return None
+
+    @staticmethod
+    def __should_capture_from_redis(arguments: Dict[str, Any]) -> bool:
+        return arguments.get(_REDIS_ARGUMENT, False) or _REDIS_KEY_PATTERN_ARGUMENT in arguments
+
+    @staticmethod
+    def __get_key_patterns(arguments: Dict[str, Any]) -> Optional[List[str]]:
+        argument = arguments.get(_REDIS_KEY_PATTERN_ARGUMENT)
+        if not argument:
+            return None
+        return [pattern.strip() for pattern in argument.split(',') if pattern.strip()]
@@ -0,0 +1,119 @@
+import os
+
+import pytest
+from testfixtures import tempdir
+
+from nislmigrate.facades.capture_store import CaptureStore, is_store_capture, read_manifest
+from nislmigrate.facades.parallel_copy import LinkMode
+from nislmigrate.logs.migration_error import MigrationError
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_directory_writes_manifest_and_restore_recreates_files(directory):
+    directory.write('source/a.txt', b'a')
+    directory.write('source/b/c.txt', b'c')
+    os.makedirs(os.path.join(directory.path, 'source', 'empty'))
+    os.utime(os.path.join(directory.path, 'source', 'a.txt'), (1000000000, 1000000000))
+    store = CaptureStore(os.path.join(directory.path, 'store'))
+    capture_path = os.path.join(directory.path, 'capture')
+    restore_path = os.path.join(directory.path, 'restore')
+
+    store.capture_directory(os.path.join(directory.path, 'source'), capture_path, 'capture-1')
+    store.restore_directory(read_manifest(capture_path), restore_path, LinkMode.COPY)
+
+    assert is_store_capture(capture_path)
+    assert directory.read('restore/a.txt') == b'a'
+    assert directory.read('restore/b/c.txt') == b'c'
+    assert os.path.isdir(os.path.join(restore_path, 'empty'))
+    assert os.path.getmtime(os.path.join(restore_path, 'a.txt')) == 1000000000
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_directory_stores_identical_files_once(directory):
+    directory.write('source/a.txt', b'same')
+    directory.write('source/b.txt', b'same')
+    directory.write('other/c.txt', b'same')
+    store = CaptureStore(os.path.join(directory.path, 'store'))
+
+    store.capture_directory(os.path.join(directory.path, 'source'), os.path.join(directory.path, 'c1'), 'capture-1')
+    store.capture_directory(os.path.join(directory.path, 'other'), os.path.join(directory.path, 'c2'), 'capture-2')
+
+    assert count_blobs(store) == 1
+
+
+@pytest.mark.unit
+@tempdir()
+def test_prune_removes_old_captures_and_unreferenced_files(directory):
+    store = CaptureStore(os.path.join(directory.path, 'store'))
+    source_path = os.path.join(directory.path, 'source')
+    directory.write('source/kept.txt', b'kept')
+    directory.write('source/changed.txt', b'first')
+    store.capture_directory(source_path, os.path.join(directory.path, 'c1'), 'capture-1')
+    directory.write('source/changed.txt', b'second')
+    store.capture_directory(source_path, os.path.join(directory.path, 'c2'), 'capture-2')
+
+    statistics = store.prune(keep=1)
+
+    assert statistics.removed_capture_count == 1
+    assert statistics.removed_blob_count == 1
+    assert count_blobs(store) == 2
+    restore_path = os.path.join(directory.path, 'restore')
+    store.restore_directory(read_manifest(os.path.join(directory.path, 'c2')), restore_path, LinkMode.COPY)
+    assert directory.read('restore/changed.txt') == b'second'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_prune_while_capture_is_running_raises_error_and_keeps_files(directory):
+    directory.write('source/a.txt', b'a')
+    store = CaptureStore(os.path.join(directory.path, 'store'))
+    store.capture_directory(os.path.join(directory.path, 'source'), os.path.join(directory.path, 'c1'), 'capture-1')
+    directory.write('store/blobs/00/unreferenced', b'placed by a running capture')
+    directory.write('store/locks/capture-running', b'')
+
+    with pytest.raises(MigrationError):
+        store.prune(keep=1)
+
+    assert count_blobs(store) == 2
+    assert os.listdir(os.path.join(store.root, 'locks')) == ['capture-running']
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_while_prune_is_running_raises_error(directory):
+    directory.write('source/a.txt', b'a')
+    directory.write('store/locks/prune', b'')
+    store = CaptureStore(os.path.join(directory.path, 'store'))
+
+    with pytest.raises(MigrationError):
+        store.capture_directory(os.path.join(directory.path, 'source'), os.path.join(directory.path, 'c1'), 'capture-1')
+
+    assert count_blobs(store) == 0
+
+
+@pytest.mark.unit
+@tempdir()
+def test_restore_directory_with_missing_stored_file_raises_error(directory):
+    directory.write('source/a.txt', b'a')
+    store = CaptureStore(os.path.join(directory.path, 'store'))
+    capture_path = os.path.join(directory.path, 'capture')
+    store.capture_directory(os.path.join(directory.path, 'source'), capture_path, 'capture-1')
+    store.prune(keep=1)
+    manifest = read_manifest(capture_path)
+    manifest['files'][0][1] = '00' * 32
+
+    with pytest.raises(MigrationError):
+        store.restore_directory(manifest, os.path.join(directory.path, 'restore'), LinkMode.COPY)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_prune_without_captures_raises_error(directory):
+    with pytest.raises(MigrationError):
+        CaptureStore(os.path.join(directory.path, 'store')).prune(keep=1)
+
+
+def count_blobs(store: CaptureStore) -> int:
+    return sum(len(files) for _, _, files in os.walk(os.path.join(store.root, 'blobs')))
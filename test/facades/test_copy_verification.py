@@ -0,0 +1,56 @@
+import os
+
+import pytest
+from testfixtures import tempdir
+
+from nislmigrate.facades.copy_verification import verify_directory_copy
+
+
+@pytest.mark.unit
+@tempdir()
+def test_verify_directory_copy_of_identical_directories_is_valid(directory):
+    for root in ('source', 'destination'):
+        directory.write(f'{root}/a.txt', b'a')
+        directory.write(f'{root}/b/c.txt', b'c')
+
+    result = verify_directory_copy(
+        os.path.join(directory.path, 'source'),
+        os.path.join(directory.path, 'destination'),
+        process_count=2)
+
+    assert result.is_valid
+    assert result.checked_file_count == 2
+
+
+@pytest.mark.unit
+@tempdir()
+def test_verify_directory_copy_reports_differing_and_missing_files(directory):
+    directory.write('source/same.txt', b'same')
+    directory.write('source/changed.txt', b'before')
+    directory.write('source/missing.txt', b'missing')
+    directory.write('destination/same.txt', b'same')
+    directory.write('destination/changed.txt', b'after!')
+    destination_path = os.path.join(directory.path, 'destination')
+
+    result = verify_directory_copy(os.path.join(directory.path, 'source'), destination_path, process_count=2)
+
+    assert result.mismatched_files == [os.path.join(destination_path, 'changed.txt')]
+    assert result.missing_files == [os.path.join(destination_path, 'missing.txt')]
+
+
+@pytest.mark.unit
+@tempdir()
+def test_verify_directory_copy_with_sample_hashes_fraction_of_files(directory):
+    for index in range(10):
+        directory.write(f'source/{index}.txt', b'a')
+        directory.write(f'destination/{index}.txt', b'a')
+
+    result = verify_directory_copy(
+        os.path.join(directory.path, 'source'),
+        os.path.join(directory.path, 'destination'),
+        sample_fraction=0.3,
+        process_count=1,
+        seed=1)
+
+    assert result.is_valid
+    assert result.checked_file_count == 3
@@ -0,0 +1,70 @@
+import json
+import os
+
+import pytest
+from testfixtures import tempdir
+
+from nislmigrate.facades.deduplicated_copy import DUPLICATES_FILE_NAME, find_duplicate_files
+from nislmigrate.facades.file_system_facade import FileSystemFacade
+from nislmigrate.facades.parallel_copy import index_directory
+
+
+def write_file(directory: str, relative_path: str, content: bytes) -> str:
+    path = os.path.join(directory, *relative_path.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(content)
+    return path
+
+
+def read_file(path: str) -> bytes:
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+@pytest.mark.unit
+@tempdir()
+def test_find_duplicate_files_only_matches_same_contents(directory):
+    write_file(directory.path, 'a.nipkg', b'package')
+    write_file(directory.path, 'b/a.nipkg', b'package')
+    write_file(directory.path, 'c.nipkg', b'packagf')
+    write_file(directory.path, 'd.nipkg', b'other size')
+    index = index_directory(directory.path, 'unused')
+
+    duplicates = find_duplicate_files(index.files)
+
+    assert len(duplicates) == 1
+    assert read_file(duplicates[0].file.source) == read_file(duplicates[0].original.source)
+    assert duplicates[0].file.source != duplicates[0].original.source
+
+
+@pytest.mark.unit
+@tempdir()
+def test_deduplicated_capture_copies_each_package_once_and_restores_duplicates(directory):
+    source = os.path.join(directory.path, 'source')
+    captured = os.path.join(directory.path, 'captured')
+    restored = os.path.join(directory.path, 'restored')
+    first = write_file(source, 'feed1/package.nipkg', b'package contents')
+    second = write_file(source, 'feed2/package.nipkg', b'package contents')
+    write_file(source, 'feed1/Packages', b'feed index')
+    write_file(source, 'orphan.nipkg', b'unreferenced')
+    facade = FileSystemFacade()
+
+    selection = facade.copy_referenced_files(
+        source,
+        captured,
+        [first, second],
+        deduplicate=True,
+        selected_extensions=('.nipkg',))
+    facade.copy_directory(captured, restored, False)
+
+    assert [file.source for file in selection.orphaned_files] == [os.path.join(source, 'orphan.nipkg')]
+    captured_packages = [name for _, _, names in os.walk(captured) for name in names if name.endswith('.nipkg')]
+    assert len(captured_packages) == 1
+    with open(os.path.join(captured, DUPLICATES_FILE_NAME)) as file:
+        assert len(json.load(file)['duplicates']) == 1
+    assert read_file(os.path.join(restored, 'feed1', 'package.nipkg')) == b'package contents'
+    assert read_file(os.path.join(restored, 'feed2', 'package.nipkg')) == b'package contents'
+    assert read_file(os.path.join(restored, 'feed1', 'Packages')) == b'feed index'
+    assert not os.path.exists(os.path.join(restored, 'orphan.nipkg'))
+    assert not os.path.exists(os.path.join(restored, DUPLICATES_FILE_NAME))
@@ -0,0 +1,257 @@
+import os
+import struct
+import tarfile
+
+import pytest
+from cryptography.fernet import Fernet
+from testfixtures import tempdir
+
+from nislmigrate.facades.encrypted_archive import (
+    ARCHIVE_MAGIC,
+    ChunkedEncrypter,
+    index_tar_members,
+    is_chunked_archive,
+    KeyDerivation,
+    LEGACY_KEY_DERIVATION,
+    new_key_derivation,
+    read_key_derivation,
+)
+from nislmigrate.logs.migration_error import MigrationError
+
+
+@pytest.mark.unit
+@tempdir()
+def test_chunked_encrypter_round_trips_content_spanning_many_chunks(directory):
+    content = os.urandom(10_000)
+    source_path = make_binary_file(directory.path, 'source', content)
+    encrypted_path = os.path.join(directory.path, 'encrypted')
+    decrypted_path = os.path.join(directory.path, 'decrypted')
+    encrypter = ChunkedEncrypter(Fernet(Fernet.generate_key()), worker_count=4, chunk_size=128)
+
+    encrypter.encrypt_file(source_path, encrypted_path, new_key_derivation())
+    encrypter.decrypt_file(encrypted_path, decrypted_path)
+
+    with open(decrypted_path, 'rb') as file:
+        assert file.read() == content
+
+
+@pytest.mark.unit
+@tempdir()
+def test_chunked_encrypter_round_trips_empty_file(directory):
+    source_path = make_binary_file(directory.path, 'source', b'')
+    encrypted_path = os.path.join(directory.path, 'encrypted')
+    decrypted_path = os.path.join(directory.path, 'decrypted')
+    encrypter = ChunkedEncrypter(Fernet(Fernet.generate_key()))
+
+    encrypter.encrypt_file(source_path, encrypted_path, new_key_derivation())
+    encrypter.decrypt_file(encrypted_path, decrypted_path)
+
+    with open(decrypted_path, 'rb') as file:
+        assert file.read() == b''
+
+
+@pytest.mark.unit
+@tempdir()
+def test_chunked_encrypter_writes_chunked_archive_header(directory):
+    source_path = make_binary_file(directory.path, 'source', b'content')
+    encrypted_path = os.path.join(directory.path, 'encrypted')
+
+    ChunkedEncrypter(Fernet(Fernet.generate_key())).encrypt_file(source_path, encrypted_path, new_key_derivation())
+
+    assert is_chunked_archive(encrypted_path)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_chunked_encrypter_decrypt_with_wrong_key_raises_error(directory):
+    source_path = make_binary_file(directory.path, 'source', b'content')
+    encrypted_path = os.path.join(directory.path, 'encrypted')
+    decrypted_path = os.path.join(directory.path, 'decrypted')
+    ChunkedEncrypter(Fernet(Fernet.generate_key())).encrypt_file(source_path, encrypted_path, new_key_derivation())
+
+    with pytest.raises(MigrationError):
+        ChunkedEncrypter(Fernet(Fernet.generate_key())).decrypt_file(encrypted_path, decrypted_path)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_read_key_derivation_reads_parameters_from_header(directory):
+    source_path = make_binary_file(directory.path, 'source', b'content')
+    encrypted_path = os.path.join(directory.path, 'encrypted')
+    key_derivation = KeyDerivation(os.urandom(16), 12345)
+    ChunkedEncrypter(Fernet(Fernet.generate_key())).encrypt_file(source_path, encrypted_path, key_derivation)
+
+    assert read_key_derivation(encrypted_path) == key_derivation
+
+
+@pytest.mark.unit
+@tempdir()
+def test_read_key_derivation_returns_legacy_parameters_for_single_token_archive(directory):
+    encrypted_path = make_binary_file(directory.path, 'encrypted', Fernet(Fernet.generate_key()).encrypt(b'content'))
+
+    assert read_key_derivation(encrypted_path) == LEGACY_KEY_DERIVATION
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('version', [1, 2])
+@tempdir()
+def test_chunked_encrypter_rejects_unreleased_format_versions(directory, version):
+    encrypter = Fernet(Fernet.generate_key())
+    token = encrypter.encrypt(b'content')
+    archive = struct.pack('>8sBI', ARCHIVE_MAGIC, version, 128) + struct.pack('>I', len(token)) + token
+    encrypted_path = make_binary_file(directory.path, 'encrypted', archive)
+
+    with pytest.raises(MigrationError) as error:
+        ChunkedEncrypter(encrypter).decrypt_file(encrypted_path, os.path.join(directory.path, 'decrypted'))
+
+    assert f'Unsupported encrypted archive format version {version}' in str(error.value)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_extract_path_extracts_single_file(directory):
+    encrypter, encrypted_path = make_encrypted_tar(directory, {'a.txt': b'a' * 3000, 'b/c.txt': b'c' * 3000})
+    destination_path = os.path.join(directory.path, 'destination')
+
+    extracted = encrypter.extract_path(encrypted_path, 'b/c.txt', destination_path)
+
+    assert extracted == ['b/c.txt']
+    assert not os.path.exists(os.path.join(destination_path, 'a.txt'))
+    with open(os.path.join(destination_path, 'b', 'c.txt'), 'rb') as file:
+        assert file.read() == b'c' * 3000
+
+
+@pytest.mark.unit
+@tempdir()
+def test_extract_path_extracts_directory_and_its_contents(directory):
+    files = {'a.txt': b'a' * 3000, 'b/c.txt': b'c' * 3000, 'b/d/e.txt': b'e' * 10}
+    encrypter, encrypted_path = make_encrypted_tar(directory, files)
+    destination_path = os.path.join(directory.path, 'destination')
+
+    encrypter.extract_path(encrypted_path, 'b', destination_path)
+
+    assert not os.path.exists(os.path.join(destination_path, 'a.txt'))
+    assert os.path.isfile(os.path.join(destination_path, 'b', 'c.txt'))
+    assert os.path.isfile(os.path.join(destination_path, 'b', 'd', 'e.txt'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_extract_path_missing_path_raises_error(directory):
+    encrypter, encrypted_path = make_encrypted_tar(directory, {'a.txt': b'a'})
+
+    with pytest.raises(MigrationError):
+        encrypter.extract_path(encrypted_path, 'missing.txt', os.path.join(directory.path, 'destination'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_extract_path_refuses_link_outside_destination(directory):
+    tar_path = os.path.join(directory.path, 'source.tar')
+    with tarfile.open(tar_path, 'w') as tar:
+        member = tarfile.TarInfo('link')
+        member.type = tarfile.SYMTYPE
+        member.linkname = '../outside'
+        tar.addfile(member)
+    encrypted_path = os.path.join(directory.path, 'encrypted')
+    encrypter = ChunkedEncrypter(Fernet(Fernet.generate_key()))
+    encrypter.encrypt_file(tar_path, encrypted_path, new_key_derivation(), index_tar_members(tar_path))
+    destination_path = os.path.join(directory.path, 'destination')
+
+    with pytest.raises(MigrationError):
+        encrypter.extract_path(encrypted_path, 'link', destination_path)
+
+    assert not os.path.lexists(os.path.join(destination_path, 'link'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_decrypt_file_reports_corrupt_chunk_and_affected_path(directory):
+    encrypter, encrypted_path = make_encrypted_tar(directory, {'a.txt': b'a' * 3000, 'b.txt': b'b' * 3000})
+    corrupt_last_chunk_holding(encrypted_path, 'b.txt')
+
+    with pytest.raises(MigrationError) as error:
+        encrypter.decrypt_file(encrypted_path, os.path.join(directory.path, 'decrypted'))
+
+    assert 'b.txt' in str(error.value)
+    assert 'a.txt' not in str(error.value)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_extract_path_reads_path_outside_corrupt_chunk(directory):
+    encrypter, encrypted_path = make_encrypted_tar(directory, {'a.txt': b'a' * 3000, 'b.txt': b'b' * 3000})
+    corrupt_last_chunk_holding(encrypted_path, 'b.txt')
+    destination_path = os.path.join(directory.path, 'destination')
+
+    encrypter.extract_path(encrypted_path, 'a.txt', destination_path)
+
+    with open(os.path.join(destination_path, 'a.txt'), 'rb') as file:
+        assert file.read() == b'a' * 3000
+
+
+@pytest.mark.unit
+@tempdir()
+def test_decrypt_file_rejects_reordered_chunks(directory):
+    encrypter = ChunkedEncrypter(Fernet(Fernet.generate_key()), chunk_size=128)
+    source_path = make_binary_file(directory.path, 'source', b'a' * 128 + b'b' * 128)
+    encrypted_path = os.path.join(directory.path, 'encrypted')
+    encrypter.encrypt_file(source_path, encrypted_path, new_key_derivation())
+    with open(encrypted_path, 'rb') as file:
+        content = file.read()
+    header_size = struct.calcsize('>8sBI') + struct.calcsize('>BI16s')
+    (length,) = struct.unpack('>I', content[header_size:header_size + 4])
+    record_size = 4 + length
+    first = content[header_size:header_size + record_size]
+    second = content[header_size + record_size:header_size + 2 * record_size]
+    swapped = content[:header_size] + second + first + content[header_size + 2 * record_size:]
+    make_binary_file(directory.path, 'encrypted', swapped)
+
+    with pytest.raises(MigrationError) as error:
+        encrypter.decrypt_file(encrypted_path, os.path.join(directory.path, 'decrypted'))
+
+    assert 'chunk 0' in str(error.value)
+    assert 'chunk 1' in str(error.value)
+
+
+@pytest.mark.unit
+def test_new_key_derivation_rejects_non_positive_iterations():
+    with pytest.raises(MigrationError):
+        new_key_derivation(0)
+
+
+def make_binary_file(path: str, name: str, content: bytes) -> str:
+    file_path = os.path.join(path, name)
+    with open(file_path, 'wb') as file:
+        file.write(content)
+    return file_path
+
+
+def make_encrypted_tar(directory, files: dict):
+    source_path = os.path.join(directory.path, 'source')
+    for name, content in files.items():
+        os.makedirs(os.path.dirname(os.path.join(source_path, name)), exist_ok=True)
+        make_binary_file(source_path, name, content)
+    tar_path = os.path.join(directory.path, 'source.tar')
+    with tarfile.open(tar_path, 'w') as tar:
+        tar.add(source_path, arcname='.')
+    encrypted_path = os.path.join(directory.path, 'encrypted')
+    encrypter = ChunkedEncrypter(Fernet(Fernet.generate_key()), worker_count=2, chunk_size=1024)
+    encrypter.encrypt_file(tar_path, encrypted_path, new_key_derivation(), index_tar_members(tar_path))
+    return encrypter, encrypted_path
+
+
+def corrupt_last_chunk_holding(encrypted_path: str, name: str):
+    tar_path = encrypted_path.replace('encrypted', 'source.tar')
+    member = next(member for member in index_tar_members(tar_path) if member.name == name)
+    header_size = struct.calcsize('>8sBI') + struct.calcsize('>BI16s')
+    with open(encrypted_path, 'r+b') as file:
+        file.seek(header_size)
+        for _ in range((member.end - 1) // 1024):
+            (length,) = struct.unpack('>I', file.read(4))
+            file.seek(length, os.SEEK_CUR)
+        (length,) = struct.unpack('>I', file.read(4))
+        file.seek(length // 2, os.SEEK_CUR)
+        byte = file.read(1)
+        file.seek(-1, os.SEEK_CUR)
+        file.write(bytes([byte[0] ^ 0xff]))
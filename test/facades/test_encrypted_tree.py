@@ -0,0 +1,80 @@
+import os
+
+import pytest
+from cryptography.fernet import Fernet
+from testfixtures import tempdir
+
+from nislmigrate.facades.encrypted_archive import ChunkedEncrypter, new_key_derivation
+from nislmigrate.facades.encrypted_tree import (
+    find_changed_files,
+    find_removed_paths,
+    find_tree_archives,
+    read_tree_state,
+    scan_tree,
+    TreeState,
+    verify_tree_state,
+    write_tree_archive,
+)
+from nislmigrate.logs.migration_error import MigrationError
+
+
+def write_file(directory: str, relative_path: str, content: bytes) -> str:
+    path = os.path.join(directory, *relative_path.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(content)
+    return path
+
+
+@pytest.mark.unit
+def test_find_changed_files_finds_added_and_modified_files():
+    previous = TreeState(['minions'], {'minions/a': (1, 10), 'minions/b': (1, 10), 'master.pub': (1, 5)})
+    current = TreeState(['minions'], {'minions/a': (1, 10), 'minions/b': (2, 10), 'minions/c': (1, 10)})
+
+    assert find_changed_files(previous, current) == ['minions/b', 'minions/c']
+    assert find_changed_files(None, current) == ['minions/a', 'minions/b', 'minions/c']
+
+
+@pytest.mark.unit
+def test_find_removed_paths_finds_paths_missing_from_last_state():
+    first = TreeState(['minions', 'minions_pre'], {'minions_pre/a': (1, 10)})
+    last = TreeState(['minions'], {'minions/a': (1, 10)})
+
+    assert find_removed_paths([first, last]) == (['minions_pre/a'], ['minions_pre'])
+
+
+@pytest.mark.unit
+@tempdir()
+def test_write_tree_archive_records_state_and_only_requested_files(directory):
+    source = os.path.join(directory.path, 'source')
+    write_file(source, 'minions/a', b'a')
+    write_file(source, 'minions/b', b'b' * 10)
+    encrypted_path = os.path.join(directory.path, 'encrypted')
+    restored = os.path.join(directory.path, 'restored')
+    encrypter = ChunkedEncrypter(Fernet(Fernet.generate_key()), chunk_size=7)
+    state = scan_tree(source)
+
+    write_tree_archive(encrypter, source, encrypted_path, new_key_derivation(1000), state, ['minions/b'])
+    extracted = encrypter.extract_path(encrypted_path, 'minions', restored)
+
+    assert read_tree_state(encrypter, encrypted_path) == state
+    assert sorted(extracted) == ['minions', 'minions/b']
+    with open(os.path.join(restored, 'minions', 'b'), 'rb') as file:
+        assert file.read() == b'b' * 10
+
+
+@pytest.mark.unit
+@tempdir()
+def test_find_tree_archives_lists_increments_in_order(directory):
+    encrypted_path = write_file(directory.path, 'pki', b'')
+    write_file(directory.path, 'pki.1', b'')
+    write_file(directory.path, 'pki.2', b'')
+    write_file(directory.path, 'pki.4', b'')
+
+    assert find_tree_archives(encrypted_path) == [encrypted_path, encrypted_path + '.1', encrypted_path + '.2']
+
+
+@pytest.mark.unit
+def test_verify_tree_state_raises_for_capture_without_state():
+    with pytest.raises(MigrationError):
+        verify_tree_state(None, 'pki')
@@ -0,0 +1,92 @@
+import os
+
+import pytest
+from testfixtures import tempdir
+
+from nislmigrate.facades import file_store_check
+from nislmigrate.facades.file_store_check import check_file_store, FileReference, SizeMismatch
+
+
+@pytest.mark.unit
+@tempdir()
+def test_check_file_store_consistent_store(directory):
+    directory.write('store/a/file.txt', b'abc')
+    directory.write('store/b/file.txt', b'abcdef')
+    store = os.path.join(directory.path, 'store')
+    references = [
+        FileReference(os.path.join(store, 'a', 'file.txt'), 3),
+        FileReference(os.path.join(store, 'b', 'file.txt'), None),
+    ]
+
+    result = check_file_store(store, iter(references))
+
+    assert result.is_consistent
+    assert result.referenced_file_count == 2
+
+
+@pytest.mark.unit
+@tempdir()
+def test_check_file_store_reports_inconsistencies(directory):
+    directory.write('store/a/file.txt', b'abc')
+    directory.write('store/orphan.txt', b'abc')
+    directory.write('elsewhere/file.txt', b'abcd')
+    store = os.path.join(directory.path, 'store')
+    missing_path = os.path.join(store, 'missing.txt')
+    elsewhere_path = os.path.join(directory.path, 'elsewhere', 'file.txt')
+    references = [
+        FileReference(os.path.join(store, 'a', 'file.txt'), 5),
+        FileReference(missing_path, 1),
+        FileReference(elsewhere_path, 2),
+    ]
+
+    result = check_file_store(store, iter(references))
+
+    assert not result.is_consistent
+    assert result.missing_files == [missing_path]
+    assert sorted(result.size_mismatches) == sorted([
+        SizeMismatch(os.path.join(store, 'a', 'file.txt'), 5, 3),
+        SizeMismatch(elsewhere_path, 2, 4),
+    ])
+    assert result.unreferenced_files == [os.path.join(store, 'orphan.txt')]
+
+
+@pytest.mark.unit
+@tempdir()
+def test_check_file_store_allows_files_referenced_twice(directory):
+    directory.write('store/file.txt', b'abc')
+    path = os.path.join(directory.path, 'store', 'file.txt')
+
+    result = check_file_store(os.path.join(directory.path, 'store'), [FileReference(path, 3)] * 2)
+
+    assert result.is_consistent
+    assert result.referenced_file_count == 2
+
+
+@pytest.mark.unit
+@tempdir()
+def test_check_file_store_missing_store_reports_every_reference_missing(directory):
+    path = os.path.join(directory.path, 'store', 'file.txt')
+
+    result = check_file_store(os.path.join(directory.path, 'store'), [FileReference(path, 3)])
+
+    assert result.missing_files == [path]
+    assert result.unreferenced_files == []
+
+
+@pytest.mark.unit
+@tempdir()
+def test_check_file_store_checks_stores_larger_than_a_batch(directory, monkeypatch):
+    monkeypatch.setattr(file_store_check, 'CHECK_BATCH_SIZE', 2)
+    for index in range(5):
+        directory.write(f'store/{index}/file.txt', b'abc')
+    store = os.path.join(directory.path, 'store')
+    missing_path = os.path.join(store, 'missing.txt')
+    references = [FileReference(os.path.join(store, str(index), 'file.txt'), 3) for index in range(4)]
+    references += [FileReference(missing_path, 1), FileReference(os.path.join(store, '0', 'file.txt'), 4)]
+
+    result = check_file_store(store, iter(references), worker_count=2)
+
+    assert result.referenced_file_count == 6
+    assert result.missing_files == [missing_path]
+    assert result.size_mismatches == [SizeMismatch(os.path.join(store, '0', 'file.txt'), 4, 3)]
+    assert result.unreferenced_files == [os.path.join(store, '4', 'file.txt')]
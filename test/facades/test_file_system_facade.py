@@ -1,7 +1,15 @@
+import base64
 import os
 import pytest
+import shutil
+import tarfile
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from testfixtures import tempdir, TempDirectory
+from nislmigrate.facades.encrypted_archive import read_key_derivation
 from nislmigrate.facades.file_system_facade import FileSystemFacade
+from nislmigrate.facades.parallel_copy import ParallelDirectoryCopier
 from nislmigrate.logs.migration_error import MigrationError
 
 
@@ -45,6 +53,212 @@ def test_force_copy_directory_destination_directory_contents_deleted(directory):
     assert not os.path.exists(deleted_file_path)
 
 
+@pytest.mark.unit
+@tempdir()
+def test_force_copy_directory_keeps_replaced_directory_until_removed(directory):
+    source_path = make_directory(directory, 'source')
+    make_file(source_path, 'new.txt')
+    destination_path = make_directory(directory, 'destination')
+    make_file(destination_path, 'old.txt')
+    file_system_facade = FileSystemFacade()
+
+    file_system_facade.copy_directory(source_path, destination_path, True)
+    replaced_directories = file_system_facade.get_replaced_directories()
+
+    assert os.listdir(destination_path) == ['new.txt']
+    assert len(replaced_directories) == 1
+    assert os.listdir(replaced_directories[0]) == ['old.txt']
+    file_system_facade.remove_replaced_directories()
+    assert not os.path.exists(replaced_directories[0])
+    assert sorted(os.listdir(directory.path)) == ['destination', 'source']
+
+
+@pytest.mark.unit
+@tempdir()
+def test_force_copy_directory_replaces_contents_of_linked_directory_in_place(directory):
+    source_path = make_directory(directory, 'source')
+    make_file(source_path, 'new.txt')
+    target_path = make_directory(directory, 'target')
+    make_file(target_path, 'old.txt')
+    destination_path = os.path.join(directory.path, 'destination')
+    try:
+        os.symlink(target_path, destination_path, target_is_directory=True)
+    except OSError:
+        pytest.skip('Creating symbolic links is not permitted.')
+    file_system_facade = FileSystemFacade()
+
+    file_system_facade.copy_directory(source_path, destination_path, True)
+
+    assert os.path.islink(destination_path)
+    assert os.listdir(target_path) == ['new.txt']
+    assert file_system_facade.get_replaced_directories() == []
+    assert sorted(os.listdir(directory.path)) == ['destination', 'source', 'target']
+
+
+@pytest.mark.unit
+@tempdir()
+def test_force_copy_directory_replaces_mount_point_in_place(directory, monkeypatch):
+    source_path = make_directory(directory, 'source')
+    make_file(source_path, 'new.txt')
+    destination_path = make_directory(directory, 'destination')
+    make_file(destination_path, 'old.txt')
+    is_mount = os.path.ismount
+    monkeypatch.setattr(os.path, 'ismount', lambda path: path == destination_path or is_mount(path))
+    file_system_facade = FileSystemFacade()
+
+    file_system_facade.copy_directory(source_path, destination_path, True)
+
+    assert os.listdir(destination_path) == ['new.txt']
+    assert file_system_facade.get_replaced_directories() == []
+    assert sorted(os.listdir(directory.path)) == ['destination', 'source']
+
+
+@pytest.mark.unit
+@tempdir()
+def test_force_copy_directory_creates_missing_parent_directories(directory):
+    source_path = make_directory(directory, 'source')
+    make_file(source_path, 'new.txt')
+    destination_path = os.path.join(directory.path, 'missing', 'destination')
+    file_system_facade = FileSystemFacade()
+
+    file_system_facade.copy_directory(source_path, destination_path, True)
+
+    assert os.listdir(destination_path) == ['new.txt']
+    assert os.listdir(os.path.join(directory.path, 'missing')) == ['destination']
+
+
+@pytest.mark.unit
+@tempdir()
+def test_force_copy_directory_failure_leaves_existing_directory_in_place(directory, monkeypatch):
+    source_path = make_directory(directory, 'source')
+    make_file(source_path, 'new.txt')
+    destination_path = make_directory(directory, 'destination')
+    make_file(destination_path, 'old.txt')
+    file_system_facade = FileSystemFacade()
+
+    def fail_to_copy(self, from_directory, to_directory, index=None):
+        os.makedirs(to_directory)
+        raise OSError('Disk full')
+    monkeypatch.setattr(ParallelDirectoryCopier, 'copy_directory', fail_to_copy)
+
+    with pytest.raises(OSError):
+        file_system_facade.copy_directory(source_path, destination_path, True)
+
+    assert os.listdir(destination_path) == ['old.txt']
+    assert sorted(os.listdir(directory.path)) == ['destination', 'source']
+
+
+@pytest.mark.unit
+@tempdir()
+def test_force_copy_directory_with_verification_failure_leaves_existing_directory_in_place(directory, monkeypatch):
+    directory.write('source/new.txt', b'new')
+    directory.write('destination/old.txt', b'old')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+    file_system_facade = FileSystemFacade()
+    file_system_facade.enable_copy_verification()
+    copy_directory = ParallelDirectoryCopier.copy_directory
+
+    def copy_corrupted(self, from_directory, to_directory, index=None):
+        statistics = copy_directory(self, from_directory, to_directory, index)
+        with open(os.path.join(to_directory, 'new.txt'), 'wb') as file:
+            file.write(b'bad')
+        return statistics
+    monkeypatch.setattr(ParallelDirectoryCopier, 'copy_directory', copy_corrupted)
+
+    with pytest.raises(MigrationError):
+        file_system_facade.copy_directory(source_path, destination_path, True)
+
+    assert os.listdir(destination_path) == ['old.txt']
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_referenced_files_copies_only_referenced_files(directory):
+    directory.write('source/kept/file.txt', b'kept')
+    directory.write('source/orphan/file.txt', b'orphan')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+    missing_path = os.path.join(source_path, 'missing', 'file.txt')
+
+    selection = FileSystemFacade().copy_referenced_files(
+        source_path,
+        destination_path,
+        [os.path.join(source_path, 'kept', 'file.txt'), missing_path])
+
+    assert directory.read('destination/kept/file.txt') == b'kept'
+    assert os.listdir(destination_path) == ['kept']
+    assert [file.source for file in selection.orphaned_files] == [os.path.join(source_path, 'orphan', 'file.txt')]
+    assert selection.missing_paths == [missing_path]
+
+
+@pytest.mark.unit
+@tempdir()
+def test_merge_directory_replaces_copied_files_and_keeps_other_files(directory):
+    directory.write('source/a/file.txt', b'new')
+    directory.write('destination/a/file.txt', b'old')
+    directory.write('destination/other.txt', b'other')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+
+    FileSystemFacade().merge_directory(source_path, destination_path)
+
+    assert directory.read('destination/a/file.txt') == b'new'
+    assert directory.read('destination/other.txt') == b'other'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_without_enough_free_space_raises_error(directory, monkeypatch):
+    directory.write('source/large.bin', b'a' * 100)
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+    usage = shutil.disk_usage(directory.path)._replace(free=50)
+    monkeypatch.setattr(shutil, 'disk_usage', lambda path: usage)
+
+    with pytest.raises(MigrationError):
+        FileSystemFacade().copy_directory(source_path, destination_path, False)
+
+    assert not os.path.exists(destination_path)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_force_copy_directory_with_delta_copy_keeps_unchanged_files(directory):
+    directory.write('source/kept.txt', b'kept')
+    directory.write('destination/kept.txt', b'kept')
+    directory.write('destination/removed.txt', b'removed')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+    os.utime(os.path.join(source_path, 'kept.txt'), (1000000000, 1000000000))
+    os.utime(os.path.join(destination_path, 'kept.txt'), (1000000000, 1000000000))
+    inode = os.stat(os.path.join(destination_path, 'kept.txt')).st_ino
+    file_system_facade = FileSystemFacade()
+    file_system_facade.enable_delta_copy()
+
+    file_system_facade.copy_directory(source_path, destination_path, True)
+
+    assert os.listdir(destination_path) == ['kept.txt']
+    assert os.stat(os.path.join(destination_path, 'kept.txt')).st_ino == inode
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_with_capture_store_captures_manifest_and_restores_files(directory):
+    directory.write('source/a.txt', b'a')
+    source_path = os.path.join(directory.path, 'source')
+    capture_path = os.path.join(directory.path, 'capture')
+    restore_path = os.path.join(directory.path, 'restore')
+    file_system_facade = FileSystemFacade()
+    file_system_facade.set_capture_store(os.path.join(directory.path, 'store'))
+
+    file_system_facade.copy_directory(source_path, capture_path, False)
+    FileSystemFacade().copy_directory(capture_path, restore_path, True)
+
+    assert os.listdir(capture_path) == ['nislmigrate-manifest.json']
+    assert directory.read('restore/a.txt') == b'a'
+
+
 @pytest.mark.unit
 @tempdir()
 def test_copy_directory_source_directory_does_not_exist_raises_error(directory):
@@ -184,16 +398,72 @@ def test_copy_directory_to_encrypted_file_creates_when_file_already_exists_raise
 
 @pytest.mark.unit
 @tempdir()
-def test_copy_directory_to_encrypted_file_creates_when_tar_file_already_exists_raises_error(directory):
+def test_copy_directory_to_encrypted_file_does_not_write_plaintext_archive(directory):
     source_path = make_directory(directory, 'source')
     destination_path = make_directory(directory, 'destination')
     make_file(source_path, 'demofile3.txt')
-    make_file(directory.path, 'source.tar')
     encrypted_file_path = os.path.join(destination_path, 'encrypted_file')
     file_system_facade = FileSystemFacade()
 
-    with pytest.raises(FileExistsError):
-        file_system_facade.copy_directory_to_encrypted_file(source_path, encrypted_file_path, 'password')
+    file_system_facade.copy_directory_to_encrypted_file(source_path, encrypted_file_path, 'password')
+
+    assert sorted(os.listdir(directory.path)) == ['destination', 'source']
+    assert os.listdir(destination_path) == ['encrypted_file']
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_to_encrypted_file_incrementally_restores_changes_and_removals(directory):
+    source_path = make_directory(directory, 'source')
+    make_directory(directory, os.path.join('source', 'minions_pre'))
+    make_directory(directory, os.path.join('source', 'minions'))
+    make_file(source_path, os.path.join('minions_pre', 'minion1'))
+    make_file(source_path, os.path.join('minions', 'minion2'))
+    encrypted_file_path = os.path.join(directory.path, 'encrypted_file')
+    destination_path = os.path.join(directory.path, 'destination')
+    file_system_facade = FileSystemFacade()
+    file_system_facade.copy_directory_to_encrypted_file(source_path, encrypted_file_path, 'password', 1000)
+    os.rename(
+        os.path.join(source_path, 'minions_pre', 'minion1'),
+        os.path.join(source_path, 'minions', 'minion1'))
+    make_file(source_path, 'minion3.pub')
+
+    file_system_facade.copy_directory_to_encrypted_file(
+        source_path,
+        encrypted_file_path,
+        'password',
+        1000,
+        incremental=True)
+    FileSystemFacade().copy_directory_from_encrypted_file(encrypted_file_path, destination_path, 'password')
+
+    assert os.path.isfile(encrypted_file_path + '.1')
+    assert os.listdir(os.path.join(destination_path, 'minions_pre')) == []
+    assert sorted(os.listdir(os.path.join(destination_path, 'minions'))) == ['minion1', 'minion2']
+    assert os.path.isfile(os.path.join(destination_path, 'minion3.pub'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directories_to_encrypted_files_copies_every_directory(directory):
+    first_path = make_directory(directory, 'first')
+    second_path = make_directory(directory, 'second')
+    make_file(first_path, 'demofile1.txt')
+    make_file(second_path, 'demofile2.txt')
+    first_encrypted_path = os.path.join(directory.path, 'first_encrypted')
+    second_encrypted_path = os.path.join(directory.path, 'second_encrypted')
+    file_system_facade = FileSystemFacade()
+
+    file_system_facade.copy_directories_to_encrypted_files(
+        [(first_path, first_encrypted_path), (second_path, second_encrypted_path)],
+        'password',
+        1000)
+    file_system_facade.copy_directory_from_encrypted_file(
+        second_encrypted_path,
+        os.path.join(directory.path, 'restored'),
+        'password')
+
+    assert read_key_derivation(first_encrypted_path) == read_key_derivation(second_encrypted_path)
+    assert os.listdir(os.path.join(directory.path, 'restored')) == ['demofile2.txt']
 
 
 @pytest.mark.unit
@@ -211,6 +481,91 @@ def test_copy_directory_from_encrypted_file_decrypts_file(directory):
     assert os.path.isfile(os.path.join(destination_path, 'demofile3.txt'))
 
 
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_from_encrypted_file_decrypts_file_encrypted_as_single_token(directory):
+    source_path = make_directory(directory, 'source')
+    destination_path = make_directory(directory, 'destination')
+    make_file(source_path, 'demofile3.txt')
+    tar_path = shutil.make_archive(os.path.join(directory.path, 'legacy'), 'tar', source_path)
+    encrypted_file_path = os.path.join(directory.path, 'encrypted_file')
+    with open(tar_path, 'rb') as tar_file, open(encrypted_file_path, 'wb') as encrypted_file:
+        encrypted_file.write(make_legacy_encrypter('password').encrypt(tar_file.read()))
+    file_system_facade = FileSystemFacade()
+
+    file_system_facade.copy_directory_from_encrypted_file(encrypted_file_path, destination_path, 'password')
+
+    assert os.path.isfile(os.path.join(destination_path, 'demofile3.txt'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_from_encrypted_file_refuses_link_outside_destination(directory):
+    destination_path = make_directory(directory, 'destination')
+    tar_path = os.path.join(directory.path, 'source.tar')
+    with tarfile.open(tar_path, 'w') as tar:
+        member = tarfile.TarInfo('link')
+        member.type = tarfile.SYMTYPE
+        member.linkname = '../outside'
+        tar.addfile(member)
+    encrypted_file_path = os.path.join(directory.path, 'encrypted_file')
+    with open(tar_path, 'rb') as tar_file, open(encrypted_file_path, 'wb') as encrypted_file:
+        encrypted_file.write(make_legacy_encrypter('password').encrypt(tar_file.read()))
+
+    with pytest.raises(MigrationError):
+        FileSystemFacade().copy_directory_from_encrypted_file(encrypted_file_path, destination_path, 'password')
+
+    assert not os.path.lexists(os.path.join(destination_path, 'link'))
+    assert not os.path.exists(encrypted_file_path + '.tar')
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_to_encrypted_file_records_key_derivation_iterations(directory):
+    source_path = make_directory(directory, 'source')
+    make_file(source_path, 'demofile3.txt')
+    encrypted_file_path = os.path.join(directory.path, 'encrypted_file')
+    file_system_facade = FileSystemFacade()
+
+    file_system_facade.copy_directory_to_encrypted_file(source_path, encrypted_file_path, 'password', 1000)
+
+    assert read_key_derivation(encrypted_file_path).iterations == 1000
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_to_encrypted_file_uses_one_random_salt_per_run(directory):
+    source_path = make_directory(directory, 'source')
+    make_file(source_path, 'demofile3.txt')
+    first_run_facade = FileSystemFacade()
+    second_run_facade = FileSystemFacade()
+    first_path = os.path.join(directory.path, 'first')
+    second_path = os.path.join(directory.path, 'second')
+    other_run_path = os.path.join(directory.path, 'other_run')
+
+    first_run_facade.copy_directory_to_encrypted_file(source_path, first_path, 'password', 1000)
+    first_run_facade.copy_directory_to_encrypted_file(source_path, second_path, 'password', 1000)
+    second_run_facade.copy_directory_to_encrypted_file(source_path, other_run_path, 'password', 1000)
+
+    assert read_key_derivation(first_path).salt == read_key_derivation(second_path).salt
+    assert read_key_derivation(first_path).salt != read_key_derivation(other_run_path).salt
+    assert read_key_derivation(first_path).salt != b'0' * 16
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_from_encrypted_file_decrypts_file_in_different_run(directory):
+    source_path = make_directory(directory, 'source')
+    destination_path = make_directory(directory, 'destination')
+    make_file(source_path, 'demofile3.txt')
+    encrypted_file_path = os.path.join(directory.path, 'encrypted_file')
+    FileSystemFacade().copy_directory_to_encrypted_file(source_path, encrypted_file_path, 'password', 1000)
+
+    FileSystemFacade().copy_directory_from_encrypted_file(encrypted_file_path, destination_path, 'password')
+
+    assert os.path.isfile(os.path.join(destination_path, 'demofile3.txt'))
+
+
 @pytest.mark.unit
 @tempdir()
 def test_write_file_writes_file(directory):
@@ -268,3 +623,8 @@ def conditionally_make_file(parent: str, name: str, should_exist: bool) -> str:
         return make_file(parent, name)
     else:
         return os.path.join(parent, name)
+
+
+def make_legacy_encrypter(secret: str) -> Fernet:
+    key_derivation_function = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, iterations=320000, salt=b'0'*16)
+    return Fernet(base64.urlsafe_b64encode(key_derivation_function.derive(bytes(secret, 'utf-8'))))
@@ -0,0 +1,169 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+from testfixtures import tempdir
+
+from nislmigrate.facades.git_facade import GitFacade, read_bundle_manifest
+from nislmigrate.facades.process_facade import ProcessFacade
+from nislmigrate.logs.migration_error import MigrationError
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None, reason='git is not installed')
+
+
+def git(repository: str, *arguments: str) -> str:
+    return subprocess.check_output(
+        ['git', '-C', repository, '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(arguments),
+        stderr=subprocess.STDOUT).decode('utf-8').strip()
+
+
+def commit_file(repository: str, name: str, content: str) -> None:
+    with open(os.path.join(repository, name), 'w') as file:
+        file.write(content)
+    git(repository, 'add', name)
+    git(repository, 'commit', '-q', '-m', f'Add {name}')
+
+
+def make_repository(path: str) -> str:
+    os.makedirs(path)
+    git(path, 'init', '-q', '-b', 'main')
+    commit_file(path, 'state.sls', 'first')
+    return path
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_and_restore_repository(directory):
+    repository = make_repository(os.path.join(directory.path, 'source'))
+    git(repository, 'branch', 'other')
+    git(repository, 'tag', '-a', 'v1', '-m', 'Version 1')
+    bundles = os.path.join(directory.path, 'capture')
+    restored = os.path.join(directory.path, 'restored')
+    facade = GitFacade(ProcessFacade())
+
+    manifest = facade.capture_repository_to_bundles(repository, bundles, incremental=False, repack=True)
+    facade.restore_repository_from_bundles(bundles, restored)
+
+    assert manifest.head == 'refs/heads/main'
+    assert git(restored, 'for-each-ref') == git(repository, 'for-each-ref')
+    assert git(restored, 'symbolic-ref', 'HEAD') == 'refs/heads/main'
+    with open(os.path.join(restored, 'state.sls')) as file:
+        assert file.read() == 'first'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_and_restore_bare_repository(directory):
+    repository = make_repository(os.path.join(directory.path, 'source'))
+    bare_repository = os.path.join(directory.path, 'bare')
+    subprocess.check_call(['git', 'clone', '-q', '--bare', repository, bare_repository])
+    bundles = os.path.join(directory.path, 'capture')
+    restored = os.path.join(directory.path, 'restored')
+    facade = GitFacade(ProcessFacade())
+
+    manifest = facade.capture_repository_to_bundles(bare_repository, bundles, incremental=False, repack=False)
+    facade.restore_repository_from_bundles(bundles, restored)
+
+    assert manifest.bare
+    assert git(restored, 'rev-parse', '--is-bare-repository') == 'true'
+    assert not os.path.exists(os.path.join(restored, 'state.sls'))
+    assert git(restored, 'for-each-ref') == git(bare_repository, 'for-each-ref')
+
+
+@pytest.mark.unit
+@tempdir()
+def test_incremental_capture_bundles_only_new_commits(directory):
+    repository = make_repository(os.path.join(directory.path, 'source'))
+    bundles = os.path.join(directory.path, 'capture')
+    restored = os.path.join(directory.path, 'restored')
+    facade = GitFacade(ProcessFacade())
+    facade.capture_repository_to_bundles(repository, bundles, incremental=False, repack=False)
+    first_commit = git(repository, 'rev-parse', 'HEAD')
+    commit_file(repository, 'other.sls', 'second')
+    git(repository, 'branch', 'feature')
+
+    manifest = facade.capture_repository_to_bundles(repository, bundles, incremental=True, repack=False)
+    facade.restore_repository_from_bundles(bundles, restored)
+
+    assert manifest.bundles == ['repository-0001.bundle', 'repository-0002.bundle']
+    with open(os.path.join(bundles, manifest.bundles[1]), 'rb') as file:
+        header = file.read().split(b'\n\n')[0].decode('utf-8')
+    prerequisites = [line[1:].split(' ')[0] for line in header.splitlines() if line.startswith('-')]
+    assert prerequisites == [first_commit]
+    assert git(restored, 'for-each-ref') == git(repository, 'for-each-ref')
+    assert sorted(os.listdir(restored)) == ['.git', 'other.sls', 'state.sls']
+
+
+@pytest.mark.unit
+@tempdir()
+def test_incremental_capture_without_new_commits_adds_no_bundle(directory):
+    repository = make_repository(os.path.join(directory.path, 'source'))
+    bundles = os.path.join(directory.path, 'capture')
+    facade = GitFacade(ProcessFacade())
+    facade.capture_repository_to_bundles(repository, bundles, incremental=False, repack=False)
+    git(repository, 'branch', 'feature')
+
+    manifest = facade.capture_repository_to_bundles(repository, bundles, incremental=True, repack=False)
+
+    assert manifest.bundles == ['repository-0001.bundle']
+    assert 'refs/heads/feature' in read_bundle_manifest(bundles).refs
+
+
+@pytest.mark.unit
+@tempdir()
+def test_full_capture_replaces_previous_bundles(directory):
+    repository = make_repository(os.path.join(directory.path, 'source'))
+    bundles = os.path.join(directory.path, 'capture')
+    facade = GitFacade(ProcessFacade())
+    facade.capture_repository_to_bundles(repository, bundles, incremental=False, repack=False)
+    commit_file(repository, 'other.sls', 'second')
+    facade.capture_repository_to_bundles(repository, bundles, incremental=True, repack=False)
+
+    manifest = facade.capture_repository_to_bundles(repository, bundles, incremental=False, repack=False)
+
+    assert manifest.bundles == ['repository-0001.bundle']
+    assert sorted(os.listdir(bundles)) == ['bundles.json', 'repository-0001.bundle']
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_refuses_working_tree_with_uncommitted_changes(directory):
+    repository = make_repository(os.path.join(directory.path, 'source'))
+    with open(os.path.join(repository, 'state.sls'), 'w') as file:
+        file.write('changed')
+    with open(os.path.join(repository, 'new.sls'), 'w') as file:
+        file.write('new')
+    bundles = os.path.join(directory.path, 'capture')
+
+    with pytest.raises(MigrationError) as error:
+        GitFacade(ProcessFacade()).capture_repository_to_bundles(repository, bundles, incremental=False, repack=False)
+
+    assert 'state.sls' in str(error.value)
+    assert 'new.sls' in str(error.value)
+    assert not os.path.exists(bundles)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_of_working_tree_with_uncommitted_changes_can_be_allowed(directory):
+    repository = make_repository(os.path.join(directory.path, 'source'))
+    with open(os.path.join(repository, 'state.sls'), 'w') as file:
+        file.write('changed')
+    bundles = os.path.join(directory.path, 'capture')
+    restored = os.path.join(directory.path, 'restored')
+    facade = GitFacade(ProcessFacade())
+
+    facade.capture_repository_to_bundles(
+        repository, bundles, incremental=False, repack=False, allow_uncommitted_changes=True)
+    facade.restore_repository_from_bundles(bundles, restored)
+
+    with open(os.path.join(restored, 'state.sls')) as file:
+        assert file.read() == 'first'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_restore_without_bundles_raises_error(directory):
+    with pytest.raises(MigrationError):
+        GitFacade(ProcessFacade()).restore_repository_from_bundles(directory.path, os.path.join(directory.path, 'r'))
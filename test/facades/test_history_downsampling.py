@@ -0,0 +1,50 @@
+import datetime
+
+import pytest
+
+from nislmigrate.facades.history_downsampling import (
+    build_downsampling_pipeline,
+    build_recent_history_query,
+    find_missing_layout_fields,
+    HistoryLayout,
+)
+
+LAYOUT = HistoryLayout('values', ['workspace', 'path'], 'timestamp', 'value')
+OLDER_THAN = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+@pytest.mark.unit
+def test_downsampling_pipeline_groups_older_samples_by_series_and_interval():
+    match, group, project = build_downsampling_pipeline(LAYOUT, OLDER_THAN, datetime.timedelta(minutes=15))
+
+    assert match == {'$match': {'timestamp': {'$lt': OLDER_THAN}}}
+    assert group['$group']['_id'] == {
+        'workspace': '$workspace',
+        'path': '$path',
+        'bucket': {'$subtract': ['$timestamp', {'$mod': [{'$toLong': '$timestamp'}, 15 * 60 * 1000]}]},
+    }
+    assert set(group['$group']) == {'_id', 'min', 'max', 'mean', 'count'}
+    assert project['$project']['timestamp'] == '$_id.bucket'
+    assert project['$project']['value'] == {'$ifNull': ['$mean', '$max']}
+
+
+@pytest.mark.unit
+def test_recent_history_query_keeps_the_samples_the_pipeline_skips():
+    assert build_recent_history_query(LAYOUT, OLDER_THAN) == {'timestamp': {'$gte': OLDER_THAN}}
+
+
+@pytest.mark.unit
+def test_find_missing_layout_fields_lists_series_and_timestamp_fields_missing_from_samples():
+    samples = [
+        {'workspace': 'w', 'path': 'a', 'timestamp': OLDER_THAN, 'value': 1},
+        {'tag': 'b', 'timestamp': OLDER_THAN},
+    ]
+
+    assert find_missing_layout_fields(LAYOUT, samples) == ['workspace', 'path']
+
+
+@pytest.mark.unit
+def test_find_missing_layout_fields_accepts_samples_without_values():
+    samples = [{'workspace': 'w', 'path': 'a', 'timestamp': OLDER_THAN}]
+
+    assert find_missing_layout_fields(LAYOUT, samples) == []
@@ -1,4 +1,5 @@
 import os
+from typing import Any, Dict, List
 from unittest.mock import patch, Mock
 
 import pytest as pytest
@@ -6,8 +7,9 @@ from testfixtures import tempdir, TempDirectory
 
 from nislmigrate.facades import mongo_configuration
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
-from nislmigrate.facades.mongo_facade import MongoFacade
+from nislmigrate.facades.mongo_facade import MongoFacade, read_document_file, write_document_file
 from nislmigrate.facades.process_facade import ProcessFacade
+from nislmigrate.logs.migration_error import MigrationError
 
 
 @pytest.mark.unit
@@ -73,6 +75,48 @@ def test_mongo_facade_capture_migration_directory_already_exists_and_empty(
     process_open.assert_called()
 
 
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('subprocess.Popen')
+def test_mongo_facade_find_documents_without_starting_mongo_reads_running_database(
+        process_open: Mock,
+        client: Mock,
+) -> None:
+    mongo_facade = MongoFacade(ProcessFacade())
+
+    list(mongo_facade.find_documents_in_collection(
+        get_fake_mongo_configuration(),
+        'fileingestion',
+        ['path'],
+        start_mongo=False))
+
+    client.assert_called()
+    process_open.assert_not_called()
+
+
+@pytest.mark.unit
+@tempdir()
+def test_document_file_round_trips_documents(temp_directory: TempDirectory) -> None:
+    path = os.path.join(temp_directory.path, 'history', 'downsampled.bson.gz')
+    documents: List[Dict[str, Any]] = [{'path': 'tag', 'value': 5.5, 'count': 3}, {'path': 'other', 'value': None}]
+
+    assert write_document_file(path, iter(documents)) == 2
+
+    assert list(read_document_file(path)) == documents
+
+
+@pytest.mark.unit
+@tempdir()
+def test_read_document_file_reports_corrupt_file(temp_directory: TempDirectory) -> None:
+    path = os.path.join(temp_directory.path, 'downsampled.bson.gz')
+    write_document_file(path, [{'path': 'tag'}])
+    with open(path, 'rb+') as file:
+        file.truncate(os.path.getsize(path) - 4)
+
+    with pytest.raises(MigrationError):
+        list(read_document_file(path))
+
+
 def make_directory(temp_directory: TempDirectory, name: str) -> str:
     path = os.path.join(temp_directory.path, name)
     os.mkdir(path)
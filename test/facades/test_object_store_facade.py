@@ -0,0 +1,285 @@
+import hashlib
+import io
+import json
+import os
+
+import pytest
+from testfixtures import tempdir
+
+from nislmigrate.facades.object_store_facade import (
+    ObjectStoreTransfer,
+    parse_s3_uri,
+    TRANSFER_JOURNAL_FILE_NAME,
+    TRANSFER_STATE_FILE_NAME,
+)
+from nislmigrate.logs.migration_error import MigrationError
+
+PART_SIZE = 4
+
+
+class FakeClientError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class FakeS3Client:
+    """
+    Stores objects in memory and computes ETags the way S3 does.
+    """
+    def __init__(self, page_size=2):
+        self.objects = {}
+        self.page_size = page_size
+        self.uploads = {}
+        self.get_count = 0
+        self.list_count = 0
+        self.uploaded_part_count = 0
+        self.fail_after_gets = None
+
+    def add_object(self, key, data):
+        self.objects[key] = (data, hashlib.md5(data).hexdigest())
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken='0'):
+        self.list_count += 1
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))
+        start = int(ContinuationToken)
+        page = keys[start:start + self.page_size]
+        response = {
+            'Contents': [{'Key': key, 'Size': len(self.objects[key][0]), 'ETag': f'"{self.objects[key][1]}"'}
+                         for key in page],
+            'IsTruncated': start + self.page_size < len(keys),
+        }
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = str(start + self.page_size)
+        return response
+
+    def get_object(self, Bucket, Key, Range, IfMatch):
+        if self.fail_after_gets is not None and self.get_count >= self.fail_after_gets:
+            raise FakeClientError('InternalError')
+        self.get_count += 1
+        data, etag = self.objects[Key]
+        if IfMatch != f'"{etag}"':
+            raise FakeClientError('PreconditionFailed')
+        first, last = (int(value) for value in Range[len('bytes='):].split('-'))
+        return {'Body': io.BytesIO(data[first:last + 1])}
+
+    def put_object(self, Bucket, Key, Body):
+        self.add_object(Key, Body)
+        return {'ETag': f'"{self.objects[Key][1]}"'}
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = f'upload-{len(self.uploads)}'
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploaded_part_count += 1
+        self.uploads[UploadId][PartNumber] = Body
+        return {'ETag': f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        numbers = [part['PartNumber'] for part in MultipartUpload['Parts']]
+        data = b''.join(parts[number] for number in numbers)
+        digests = b''.join(hashlib.md5(parts[number]).digest() for number in numbers)
+        etag = f'{hashlib.md5(digests).hexdigest()}-{len(numbers)}'
+        self.objects[Key] = (data, etag)
+        return {'ETag': f'"{etag}"'}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+
+
+def download_directory(client, directory, to_directory):
+    transfer = ObjectStoreTransfer(client, directory.path, part_size=PART_SIZE)
+    transfer.download_directory('bucket', 'files/', to_directory)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('uri, expected', [
+    ('s3://bucket', ('bucket', '')),
+    ('s3://bucket/', ('bucket', '')),
+    ('s3://bucket/files', ('bucket', 'files/')),
+    ('S3://bucket/nested/files/', ('bucket', 'nested/files/')),
+])
+def test_parse_s3_uri(uri, expected):
+    assert parse_s3_uri(uri) == expected
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('uri', ['bucket/files', 's3://', 's3:///files', 'https://bucket/files'])
+def test_parse_s3_uri_rejects_other_locations(uri):
+    with pytest.raises(MigrationError):
+        parse_s3_uri(uri)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_download_directory_downloads_objects_in_parts(directory):
+    client = FakeS3Client()
+    client.add_object('files/small.txt', b'abc')
+    client.add_object('files/nested/large.bin', b'0123456789')
+    client.add_object('files/empty.txt', b'')
+    client.add_object('other/ignored.txt', b'ignored')
+    to_directory = os.path.join(directory.path, 'files')
+
+    download_directory(client, directory, to_directory)
+
+    assert directory.read('files/small.txt') == b'abc'
+    assert directory.read('files/nested/large.bin') == b'0123456789'
+    assert directory.read('files/empty.txt') == b''
+    assert not os.path.exists(os.path.join(directory.path, 'files', 'ignored.txt'))
+    assert client.get_count == 1 + 3
+
+
+@pytest.mark.unit
+@tempdir()
+def test_download_directory_resumes_interrupted_download(directory):
+    client = FakeS3Client()
+    client.add_object('files/large.bin', b'0123456789')
+    to_directory = os.path.join(directory.path, 'files')
+    client.fail_after_gets = 2
+
+    with pytest.raises(FakeClientError):
+        ObjectStoreTransfer(client, directory.path, worker_count=1, part_size=PART_SIZE).download_directory(
+            'bucket',
+            'files/',
+            to_directory)
+    client.fail_after_gets = None
+    client.get_count = 0
+    download_directory(client, directory, to_directory)
+
+    assert directory.read('files/large.bin') == b'0123456789'
+    assert client.get_count == 1
+
+
+@pytest.mark.unit
+@tempdir()
+def test_download_directory_journals_finished_parts_instead_of_rewriting_state(directory):
+    client = FakeS3Client()
+    client.add_object('files/large.bin', b'0123456789')
+    to_directory = os.path.join(directory.path, 'files')
+    client.fail_after_gets = 2
+
+    with pytest.raises(FakeClientError):
+        ObjectStoreTransfer(client, directory.path, worker_count=1, part_size=PART_SIZE).download_directory(
+            'bucket',
+            'files/',
+            to_directory)
+
+    with open(os.path.join(directory.path, TRANSFER_STATE_FILE_NAME)) as file:
+        assert json.load(file)['downloads']['files/large.bin']['parts'] == []
+    with open(os.path.join(directory.path, TRANSFER_JOURNAL_FILE_NAME)) as file:
+        assert [json.loads(line)['part'] for line in file] == [0, 1]
+    client.fail_after_gets = None
+    download_directory(client, directory, to_directory)
+    assert not os.path.exists(os.path.join(directory.path, TRANSFER_JOURNAL_FILE_NAME))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_download_directory_skips_objects_already_downloaded(directory):
+    client = FakeS3Client()
+    client.add_object('files/small.txt', b'abc')
+    to_directory = os.path.join(directory.path, 'files')
+    download_directory(client, directory, to_directory)
+    client.get_count = 0
+
+    download_directory(client, directory, to_directory)
+
+    assert client.get_count == 0
+
+
+@pytest.mark.unit
+@tempdir()
+def test_download_directory_reports_error_when_contents_do_not_match_etag(directory):
+    client = FakeS3Client()
+    client.objects['files/small.txt'] = (b'abc', hashlib.md5(b'abd').hexdigest())
+
+    with pytest.raises(MigrationError):
+        ObjectStoreTransfer(client, directory.path, part_size=PART_SIZE).download_directory(
+            'bucket',
+            'files/',
+            os.path.join(directory.path, 'files'))
+
+    assert not os.path.exists(os.path.join(directory.path, 'files', 'small.txt'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_download_directory_rejects_unsafe_keys(directory):
+    client = FakeS3Client()
+    client.add_object('files/../escaped.txt', b'abc')
+
+    with pytest.raises(MigrationError):
+        ObjectStoreTransfer(client, directory.path, part_size=PART_SIZE).download_directory(
+            'bucket',
+            'files/',
+            os.path.join(directory.path, 'files'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_upload_directory_uploads_files_in_parts(directory):
+    directory.write('files/small.txt', b'abc')
+    directory.write('files/nested/large.bin', b'0123456789')
+    client = FakeS3Client()
+
+    ObjectStoreTransfer(client, directory.path, part_size=PART_SIZE).upload_directory(
+        os.path.join(directory.path, 'files'),
+        'bucket',
+        'files/')
+
+    assert client.objects['files/small.txt'][0] == b'abc'
+    assert client.objects['files/nested/large.bin'][0] == b'0123456789'
+    assert client.objects['files/nested/large.bin'][1].endswith('-3')
+    assert client.uploaded_part_count == 3
+
+
+@pytest.mark.unit
+@tempdir()
+def test_upload_directory_resumes_with_parts_already_uploaded(directory):
+    directory.write('files/large.bin', b'0123456789')
+    client = FakeS3Client()
+    upload_id = client.create_multipart_upload(Bucket='bucket', Key='files/large.bin')['UploadId']
+    client.upload_part(Bucket='bucket', Key='files/large.bin', UploadId=upload_id, PartNumber=1, Body=b'0123')
+    file_size = os.path.getsize(os.path.join(directory.path, 'files', 'large.bin'))
+    modified_time = os.stat(os.path.join(directory.path, 'files', 'large.bin')).st_mtime
+    state = {'uploads': {'files/large.bin': {
+        'size': file_size,
+        'modified_time': modified_time,
+        'upload_id': upload_id,
+        'parts': {'0': hashlib.md5(b'0123').hexdigest()},
+    }}}
+    with open(os.path.join(directory.path, TRANSFER_STATE_FILE_NAME), 'w') as file:
+        json.dump(state, file)
+    client.uploaded_part_count = 0
+
+    ObjectStoreTransfer(client, directory.path, part_size=PART_SIZE).upload_directory(
+        os.path.join(directory.path, 'files'),
+        'bucket',
+        'files/')
+
+    assert client.objects['files/large.bin'][0] == b'0123456789'
+    assert client.uploaded_part_count == 2
+
+
+@pytest.mark.unit
+@tempdir()
+def test_upload_directory_skips_files_already_uploaded(directory):
+    directory.write('files/large.bin', b'0123456789')
+    client = FakeS3Client()
+    ObjectStoreTransfer(client, directory.path, part_size=PART_SIZE).upload_directory(
+        os.path.join(directory.path, 'files'),
+        'bucket',
+        'files/')
+    client.uploaded_part_count = 0
+    client.list_count = 0
+
+    ObjectStoreTransfer(client, directory.path, part_size=PART_SIZE).upload_directory(
+        os.path.join(directory.path, 'files'),
+        'bucket',
+        'files/')
+
+    assert client.uploaded_part_count == 0
+    assert client.list_count == 1
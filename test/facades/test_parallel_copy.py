@@ -0,0 +1,271 @@
+import io
+import logging
+import os
+
+import pytest
+from testfixtures import LogCapture, tempdir
+
+from nislmigrate.facades import parallel_copy
+from nislmigrate.facades.parallel_copy import (
+    copy_file_contents,
+    copy_pipelined,
+    copy_single_file,
+    index_directory,
+    LinkMode,
+    ParallelDirectoryCopier,
+    ProgressReporter,
+)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_copies_nested_files(directory):
+    directory.write('source/a.txt', b'a')
+    directory.write('source/b/c.txt', b'cc')
+    directory.write('source/b/d/e.txt', b'eee')
+    os.makedirs(os.path.join(directory.path, 'source', 'empty'))
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+
+    ParallelDirectoryCopier(worker_count=2).copy_directory(source_path, destination_path)
+
+    assert directory.read('destination/a.txt') == b'a'
+    assert directory.read('destination/b/c.txt') == b'cc'
+    assert directory.read('destination/b/d/e.txt') == b'eee'
+    assert os.path.isdir(os.path.join(destination_path, 'empty'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_returns_statistics(directory):
+    directory.write('source/a.txt', b'a' * 10)
+    directory.write('source/b/c.txt', b'c' * 20)
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+
+    statistics = ParallelDirectoryCopier().copy_directory(source_path, destination_path)
+
+    assert statistics.file_count == 2
+    assert statistics.byte_count == 30
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_preserves_modification_times(directory):
+    directory.write('source/b/c.txt', b'c')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+    os.utime(os.path.join(source_path, 'b', 'c.txt'), (1000000000, 1000000000))
+    os.utime(os.path.join(source_path, 'b'), (1000000000, 1000000000))
+
+    ParallelDirectoryCopier().copy_directory(source_path, destination_path)
+
+    assert os.path.getmtime(os.path.join(destination_path, 'b', 'c.txt')) == 1000000000
+    assert os.path.getmtime(os.path.join(destination_path, 'b')) == 1000000000
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_file_contents_copies_file_larger_than_buffer(directory):
+    content = os.urandom(100_000)
+    source_path = directory.write('source', content)
+    destination_path = os.path.join(directory.path, 'destination')
+
+    copy_file_contents(source_path, destination_path, len(content), 4096)
+
+    assert directory.read('destination') == content
+
+
+@pytest.mark.unit
+@tempdir()
+def test_synchronize_directory_copies_only_changed_files(directory):
+    directory.write('source/same.txt', b'same')
+    directory.write('source/changed.txt', b'new content')
+    directory.write('destination/same.txt', b'same')
+    directory.write('destination/changed.txt', b'old')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+    for name in ('same.txt', 'changed.txt'):
+        os.utime(os.path.join(source_path, name), (1000000000, 1000000000))
+    os.utime(os.path.join(destination_path, 'same.txt'), (1000000000, 1000000000))
+
+    statistics = ParallelDirectoryCopier().synchronize_directory(source_path, destination_path)
+
+    assert statistics.file_count == 1
+    assert statistics.unchanged_file_count == 1
+    assert directory.read('destination/changed.txt') == b'new content'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_synchronize_directory_deletes_paths_not_in_source(directory):
+    directory.write('source/kept.txt', b'kept')
+    directory.write('destination/kept.txt', b'kept')
+    directory.write('destination/removed.txt', b'removed')
+    directory.write('destination/removed_directory/file.txt', b'removed')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+
+    statistics = ParallelDirectoryCopier().synchronize_directory(source_path, destination_path)
+
+    assert statistics.deleted_count == 2
+    assert sorted(os.listdir(destination_path)) == ['kept.txt']
+
+
+@pytest.mark.unit
+@tempdir()
+def test_synchronize_directory_replaces_file_with_directory_of_same_name(directory):
+    directory.write('source/name/file.txt', b'file')
+    directory.write('destination/name', b'was a file')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+
+    ParallelDirectoryCopier().synchronize_directory(source_path, destination_path)
+
+    assert directory.read('destination/name/file.txt') == b'file'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_synchronize_directory_comparing_checksums_copies_file_with_same_size_and_time(directory):
+    directory.write('source/file.txt', b'new')
+    directory.write('destination/file.txt', b'old')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+    os.utime(os.path.join(source_path, 'file.txt'), (1000000000, 1000000000))
+    os.utime(os.path.join(destination_path, 'file.txt'), (1000000000, 1000000000))
+
+    ParallelDirectoryCopier().synchronize_directory(source_path, destination_path, compare_checksums=True)
+
+    assert directory.read('destination/file.txt') == b'new'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_with_hardlink_mode_links_files(directory):
+    directory.write('source/b/c.txt', b'c')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+
+    statistics = ParallelDirectoryCopier(link_mode=LinkMode.HARDLINK).copy_directory(source_path, destination_path)
+
+    assert statistics.linked_file_count == 1
+    assert os.path.samefile(os.path.join(source_path, 'b', 'c.txt'), os.path.join(destination_path, 'b', 'c.txt'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_copies_files_that_can_not_be_linked(directory, monkeypatch):
+    directory.write('source/c.txt', b'c')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+
+    def fail_to_link(source, destination):
+        raise OSError('Invalid cross-device link')
+    monkeypatch.setattr(os, 'link', fail_to_link)
+
+    statistics = ParallelDirectoryCopier(link_mode=LinkMode.AUTO).copy_directory(source_path, destination_path)
+
+    assert statistics.linked_file_count == 0
+    assert directory.read('destination/c.txt') == b'c'
+    assert not os.path.samefile(os.path.join(source_path, 'c.txt'), os.path.join(destination_path, 'c.txt'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_synchronize_directory_replaces_changed_linked_file_without_writing_through_link(directory):
+    directory.write('source/file.txt', b'new')
+    directory.write('linked/file.txt', b'old content')
+    source_path = os.path.join(directory.path, 'source')
+    linked_path = os.path.join(directory.path, 'linked')
+    destination_path = os.path.join(directory.path, 'destination')
+    ParallelDirectoryCopier(link_mode=LinkMode.HARDLINK).copy_directory(linked_path, destination_path)
+
+    ParallelDirectoryCopier().synchronize_directory(source_path, destination_path)
+
+    assert directory.read('destination/file.txt') == b'new'
+    assert directory.read('linked/file.txt') == b'old content'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_index_directory_summarizes_tree(directory):
+    directory.write('source/a.txt', b'a')
+    directory.write('source/b/c.txt', b'c' * 30)
+    directory.write('source/b/d/e.txt', b'e' * 20)
+    source_path = os.path.join(directory.path, 'source')
+
+    index = index_directory(source_path, largest_file_count=2)
+
+    assert index.file_count == 3
+    assert index.byte_count == 51
+    assert index.depth == 2
+    assert [file.size for file in index.largest_files] == [30, 20]
+
+
+@pytest.mark.unit
+def test_progress_reporter_logs_percent_and_time_remaining(monkeypatch):
+    monkeypatch.setattr(parallel_copy, 'PROGRESS_INTERVAL_SECONDS', 0)
+    progress = ProgressReporter('Copied', 4, 4 * 1024 * 1024)
+
+    with LogCapture(level=logging.INFO) as logs:
+        progress.add(1, 1024 * 1024)
+
+    message = logs.records[-1].getMessage()
+    assert message.startswith('Copied 1.0 of 4.0 MB (25%)')
+    assert 'remaining' in message
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_pipelined_copies_contents_in_many_buffers(directory):
+    content = os.urandom(100_000)
+    directory.write('source.bin', content)
+
+    with open(os.path.join(directory.path, 'source.bin'), 'rb') as source, \
+            open(os.path.join(directory.path, 'destination.bin'), 'wb') as destination:
+        byte_count = copy_pipelined(source, destination, buffer_size=4096, queue_depth=2)
+
+    assert byte_count == len(content)
+    assert directory.read('destination.bin') == content
+
+
+@pytest.mark.unit
+def test_copy_pipelined_raises_write_error():
+    class FailingWriter(io.BytesIO):
+        def write(self, block):
+            raise OSError('Disk full')
+
+    with pytest.raises(OSError):
+        copy_pipelined(io.BytesIO(b'a' * 100_000), FailingWriter(), buffer_size=10, queue_depth=1)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_single_file_into_directory(directory, monkeypatch):
+    monkeypatch.setattr(parallel_copy, 'PIPELINE_THRESHOLD', 0)
+    monkeypatch.setattr(parallel_copy, '_copy_in_kernel', lambda *arguments: False)
+    directory.write('source/dump.rdb', b'redis data')
+    os.makedirs(os.path.join(directory.path, 'destination'))
+
+    copied_path = copy_single_file(
+        os.path.join(directory.path, 'source', 'dump.rdb'),
+        os.path.join(directory.path, 'destination'),
+        buffer_size=4)
+
+    assert copied_path == os.path.join(directory.path, 'destination', 'dump.rdb')
+    assert directory.read('destination/dump.rdb') == b'redis data'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_file_contents_falls_back_when_kernel_copies_nothing(directory, monkeypatch):
+    monkeypatch.setattr(parallel_copy, '_copy_file_range', lambda *arguments: 0)
+    monkeypatch.setattr(parallel_copy, '_sendfile', lambda *arguments: 0)
+    content = os.urandom(10_000)
+    source_path = directory.write('source', content)
+    destination_path = os.path.join(directory.path, 'destination')
+
+    copy_file_contents(source_path, destination_path, len(content), 4096)
+
+    assert directory.read('destination') == content
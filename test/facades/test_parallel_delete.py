@@ -0,0 +1,116 @@
+import os
+import stat
+import sys
+
+import pytest
+from testfixtures import tempdir
+
+from nislmigrate.facades import parallel_delete
+from nislmigrate.facades.parallel_delete import ParallelTreeRemover
+
+
+@pytest.mark.unit
+@tempdir()
+def test_remove_tree_removes_nested_files_in_several_batches(directory, monkeypatch):
+    monkeypatch.setattr(parallel_delete, 'BATCH_SIZE', 2)
+    for index in range(5):
+        directory.write(f'tree/{index}.txt', b'a')
+        directory.write(f'tree/sub/{index}/file.txt', b'b')
+    os.makedirs(os.path.join(directory.path, 'tree', 'empty', 'deeper'))
+    tree_path = os.path.join(directory.path, 'tree')
+
+    statistics = ParallelTreeRemover(worker_count=2).remove_tree(tree_path)
+
+    assert not os.path.exists(tree_path)
+    assert statistics.file_count == 10
+    assert statistics.directory_count == 9
+
+
+@pytest.mark.unit
+@tempdir()
+def test_remove_tree_removes_read_only_files_and_directories(directory):
+    directory.write('tree/read_only/file.txt', b'a')
+    tree_path = os.path.join(directory.path, 'tree')
+    read_only_directory = os.path.join(tree_path, 'read_only')
+    os.chmod(os.path.join(read_only_directory, 'file.txt'), stat.S_IREAD)
+    os.chmod(read_only_directory, stat.S_IREAD | stat.S_IEXEC)
+
+    statistics = ParallelTreeRemover().remove_tree(tree_path)
+
+    assert not os.path.exists(tree_path)
+    assert statistics.read_only_count == 2
+
+
+@pytest.mark.unit
+@tempdir()
+def test_remove_tree_does_not_follow_links(directory):
+    directory.write('kept/file.txt', b'a')
+    os.makedirs(os.path.join(directory.path, 'tree'))
+    tree_path = os.path.join(directory.path, 'tree')
+    try:
+        os.symlink(os.path.join(directory.path, 'kept'), os.path.join(tree_path, 'link'), target_is_directory=True)
+    except OSError:
+        pytest.skip('Creating symbolic links is not permitted.')
+
+    ParallelTreeRemover().remove_tree(tree_path)
+
+    assert not os.path.exists(tree_path)
+    assert directory.read('kept/file.txt') == b'a'
+
+
+@pytest.mark.unit
+@pytest.mark.skipif(sys.platform != 'win32', reason='Directory junctions only exist on Windows.')
+@tempdir()
+def test_remove_tree_does_not_descend_into_directory_junctions(directory):
+    import _winapi
+    directory.write('kept/file.txt', b'a')
+    os.makedirs(os.path.join(directory.path, 'tree'))
+    tree_path = os.path.join(directory.path, 'tree')
+    _winapi.CreateJunction(os.path.join(directory.path, 'kept'), os.path.join(tree_path, 'junction'))
+
+    statistics = ParallelTreeRemover().remove_tree(tree_path)
+
+    assert not os.path.exists(tree_path)
+    assert directory.read('kept/file.txt') == b'a'
+    assert statistics.file_count == 0
+
+
+@pytest.mark.unit
+def test_remove_tree_removes_reparse_point_directories_without_scanning_them(tmp_path, monkeypatch):
+    tree_path = str(tmp_path / 'tree')
+    mounted_path = os.path.join(tree_path, 'mounted')
+    target_path = str(tmp_path / 'target')
+    os.makedirs(mounted_path)
+    (tmp_path / 'tree' / 'mounted' / 'file.txt').write_bytes(b'a')
+    mounted_inode = os.lstat(mounted_path).st_ino
+    rmdir = os.rmdir
+
+    def remove_directory(path):
+        # Removing a junction or mount point leaves its target in place.
+        if path == mounted_path:
+            os.rename(mounted_path, target_path)
+        else:
+            rmdir(path)
+
+    monkeypatch.setattr(parallel_delete, '_is_reparse_point', lambda path_stat: path_stat.st_ino == mounted_inode)
+    monkeypatch.setattr(parallel_delete.os, 'rmdir', remove_directory)
+
+    statistics = ParallelTreeRemover().remove_tree(tree_path)
+
+    assert not os.path.exists(tree_path)
+    assert (tmp_path / 'target' / 'file.txt').read_bytes() == b'a'
+    assert statistics.file_count == 0
+
+
+@pytest.mark.unit
+@tempdir()
+def test_remove_contents_keeps_directory(directory):
+    directory.write('tree/file.txt', b'a')
+    directory.write('tree/sub/file.txt', b'b')
+    tree_path = os.path.join(directory.path, 'tree')
+
+    statistics = ParallelTreeRemover().remove_contents(tree_path)
+
+    assert os.listdir(tree_path) == []
+    assert statistics.file_count == 2
+    assert statistics.directory_count == 1
@@ -0,0 +1,120 @@
+import os
+import struct
+
+import pytest
+from testfixtures import tempdir
+
+from nislmigrate.facades.rdb_inventory import key_prefix, read_key_dump_inventory, read_rdb_inventory, read_rdb_version
+from nislmigrate.logs.migration_error import MigrationError
+
+
+def rdb_string(value: bytes) -> bytes:
+    return bytes([len(value)]) + value
+
+
+def rdb_file(*entries: bytes) -> bytes:
+    header = b'REDIS0011' + b'\xfa' + rdb_string(b'redis-ver') + rdb_string(b'7.2.4')
+    return header + b'\xfe\x00' + b'\xfb\x05\x01' + b''.join(entries) + b'\xff' + bytes(8)
+
+
+# The key 'tag:' followed by ten 'a's, compressed with LZF as a literal and a back reference.
+LZF_KEY = b'\xc3\x09\x0e' + b'\x04tag:a' + b'\xe0\x00\x00'
+ENTRIES = (
+    b'\x00' + rdb_string(b'tag:Health.CPU') + rdb_string(b'5.5'),
+    b'\xfc' + struct.pack('<q', 1700000000000) + b'\x00' + rdb_string(b'tag:Health.Memory') + b'\xc0\x2a',
+    b'\x10' + rdb_string(b'tag:Health.Disk') + rdb_string(b'listpack bytes'),
+    b'\x04' + rdb_string(b'history:Health.CPU') + b'\x01' + rdb_string(b'type') + rdb_string(b'DOUBLE'),
+    b'\x03' + LZF_KEY + b'\x01' + rdb_string(b'member') + b'\x03' + b'1.5',
+)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_read_rdb_inventory_counts_keys_by_type_and_prefix(directory):
+    path = directory.write('dump.rdb', rdb_file(*ENTRIES))
+
+    inventory = read_rdb_inventory(path)
+
+    assert inventory.version == 11
+    assert inventory.key_count == 5
+    assert inventory.expiring_key_count == 1
+    assert inventory.type_counts == {'string': 2, 'hash': 2, 'zset': 1}
+    assert inventory.prefix_key_counts == {'tag:Health': 3, 'history:Health': 1, 'tag:aaaaaaaaaa': 1}
+    assert inventory.prefix_byte_counts['history:Health'] == len(ENTRIES[3])
+    assert sum(inventory.prefix_byte_counts.values()) == sum(len(entry) for entry in ENTRIES)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_read_rdb_inventory_counts_eviction_details_towards_the_key_they_precede(directory):
+    idle_entry = b'\xf8' + b'\x40\x96' + b'\x00' + rdb_string(b'tag:Health.CPU') + rdb_string(b'5.5')
+    freq_entry = b'\xf9' + b'\x05' + b'\x00' + rdb_string(b'tag:Health.Disk') + rdb_string(b'12')
+    path = directory.write('dump.rdb', rdb_file(idle_entry, freq_entry))
+
+    inventory = read_rdb_inventory(path)
+
+    assert inventory.key_count == 2
+    assert inventory.expiring_key_count == 0
+    assert inventory.prefix_byte_counts == {'tag:Health': len(idle_entry) + len(freq_entry)}
+
+
+@pytest.mark.unit
+@tempdir()
+def test_read_rdb_inventory_skips_function_libraries(directory):
+    library = b'#!lua name=lib\nredis.register_function("f", load)'
+    function_entry = b'\xf5' + rdb_string(library)
+    path = directory.write('dump.rdb', rdb_file(function_entry, ENTRIES[0]))
+
+    inventory = read_rdb_inventory(path)
+
+    assert inventory.key_count == 1
+    assert inventory.prefix_byte_counts == {'tag:Health': len(ENTRIES[0])}
+
+
+@pytest.mark.unit
+@tempdir()
+def test_read_rdb_inventory_rejects_module_data(directory):
+    path = directory.write('dump.rdb', rdb_file(b'\xf7' + b'\x81' + bytes(8), ENTRIES[0]))
+
+    with pytest.raises(MigrationError):
+        read_rdb_inventory(path)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_read_rdb_inventory_reports_truncated_file(directory):
+    path = directory.write('dump.rdb', rdb_file(*ENTRIES)[:-20])
+
+    with pytest.raises(MigrationError):
+        read_rdb_inventory(path)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_read_rdb_version_rejects_other_files(directory):
+    path = directory.write('dump.rdb', b'nislmigrate redis key dump 1\n')
+
+    with pytest.raises(MigrationError):
+        read_rdb_version(path)
+
+
+@pytest.mark.unit
+def test_read_key_dump_inventory_reads_types_and_versions_of_payloads():
+    records = [
+        (b'tag:a', -1, b'\x00' + rdb_string(b'value') + struct.pack('<HQ', 9, 0)),
+        (b'tag:b', 5000, b'\x10' + rdb_string(b'listpack') + struct.pack('<HQ', 11, 0)),
+    ]
+
+    inventory = read_key_dump_inventory(records, os.path.join('data_dir', 'tags.redisdump'))
+
+    assert inventory.version == 11
+    assert inventory.type_counts == {'string': 1, 'hash': 1}
+    assert inventory.expiring_key_count == 1
+    assert inventory.prefix_byte_counts == {'tag:a': 22, 'tag:b': 25}
+
+
+@pytest.mark.unit
+def test_key_prefix_keeps_the_leading_parts_of_a_key():
+    assert key_prefix(b'tag:Health.CPU.0', 1) == 'tag'
+    assert key_prefix(b'tag:Health.CPU.0', 2) == 'tag:Health'
+    assert key_prefix(b'tag', 2) == 'tag'
@@ -0,0 +1,248 @@
+import fnmatch
+import os
+import shutil
+import socket
+import subprocess
+import time
+import types
+from typing import Any, Dict, List
+
+import pytest
+from testfixtures import tempdir
+
+from nislmigrate.facades import redis_facade
+from nislmigrate.facades.process_facade import BackgroundProcess, ProcessFacade
+from nislmigrate.facades.redis_configuration import RedisConfiguration
+from nislmigrate.facades.redis_facade import read_key_dump, read_key_dump_patterns, RedisFacade
+from nislmigrate.logs.migration_error import MigrationError
+
+
+class FakeRedisConnectionError(Exception):
+    pass
+
+
+class FakeRedis:
+    """
+    Stores keys in memory, with DUMP payloads that are the stored values.
+    """
+    servers: Dict[int, Dict[bytes, Any]] = {}
+    is_running = True
+
+    def __init__(self, host, port, password):
+        self.data = FakeRedis.servers.setdefault(port, {})
+        self.saved = False
+
+    def ping(self):
+        if not FakeRedis.is_running:
+            raise FakeRedisConnectionError()
+        return True
+
+    def scan_iter(self, match, count):
+        return iter([key for key in list(self.data) if fnmatch.fnmatchcase(key.decode(), match)])
+
+    def pipeline(self, transaction):
+        return FakePipeline(self)
+
+    def save(self):
+        self.saved = True
+
+    def flushdb(self):
+        self.data.clear()
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def pttl(self, key):
+        self.commands.append(lambda: self.client.data[key][1] if key in self.client.data else -2)
+
+    def dump(self, key):
+        self.commands.append(lambda: self.client.data[key][0] if key in self.client.data else None)
+
+    def restore(self, key, ttl, payload, replace):
+        def restore():
+            self.client.data[key] = (payload, ttl or -1)
+        self.commands.append(restore)
+
+    def execute(self):
+        return [command() for command in self.commands]
+
+
+class FakeRedisServerProcess(BackgroundProcess):
+    def __init__(self, arguments: List[str]):
+        FakeRedis.is_running = True
+        self.stopped = False
+
+    def stop(self):
+        FakeRedis.is_running = False
+        self.stopped = True
+
+
+class FakeRedisServerProcessFacade(ProcessFacade):
+    def __init__(self):
+        self.processes: List[FakeRedisServerProcess] = []
+
+    def run_background_process(self, arguments: List[str]) -> BackgroundProcess:
+        process = FakeRedisServerProcess(arguments)
+        self.processes.append(process)
+        return process
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    FakeRedis.servers = {}
+    FakeRedis.is_running = True
+    monkeypatch.setattr(redis_facade, 'redis', types.SimpleNamespace(
+        Redis=FakeRedis,
+        ConnectionError=FakeRedisConnectionError))
+    return FakeRedis.servers
+
+
+def configuration(port):
+    return RedisConfiguration({'Redis.Host': 'localhost', 'Redis.Port': str(port)})
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_and_restore_keys(directory, fake_redis):
+    fake_redis[1] = {b'tag:a': (b'payload a', -1), b'tag:b': (b'payload b', 5000), b'other': (b'payload', -1)}
+    path = os.path.join(directory.path, 'tags.redisdump')
+    facade = RedisFacade(ProcessFacade())
+
+    assert facade.capture_keys(configuration(1), path, batch_size=2) == 3
+    assert facade.restore_keys(configuration(2), path, batch_size=2) == 3
+
+    assert fake_redis[2] == fake_redis[1]
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_keys_matching_patterns(directory, fake_redis):
+    fake_redis[1] = {b'tag:a': (b'a', -1), b'tag:b': (b'b', -1), b'other': (b'o', -1), b'more': (b'm', -1)}
+    path = os.path.join(directory.path, 'tags.redisdump')
+
+    RedisFacade(ProcessFacade()).capture_keys(configuration(1), path, ['tag:*', 'tag:a', 'm*'])
+
+    assert sorted(key for key, _, _ in read_key_dump(path)) == [b'more', b'tag:a', b'tag:b']
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_keys_of_single_pattern_does_not_remember_scanned_keys(directory, fake_redis, monkeypatch):
+    fake_redis[1] = {b'tag:a': (b'a', -1), b'tag:b': (b'b', -1)}
+    path = os.path.join(directory.path, 'tags.redisdump')
+    scan_iter = FakeRedis.scan_iter
+    monkeypatch.setattr(FakeRedis, 'scan_iter', lambda self, match, count: [*scan_iter(self, match, count), b'tag:a'])
+    facade = RedisFacade(ProcessFacade())
+
+    facade.capture_keys(configuration(1), path)
+    facade.restore_keys(configuration(1), path)
+
+    assert sorted(key for key, _, _ in read_key_dump(path)) == [b'tag:a', b'tag:a', b'tag:b']
+    assert fake_redis[1] == {b'tag:a': (b'a', -1), b'tag:b': (b'b', -1)}
+
+
+@pytest.mark.unit
+@tempdir()
+def test_restore_keys_of_whole_database_removes_keys_added_since_capture(directory, fake_redis):
+    fake_redis[1] = {b'tag:a': (b'a', -1)}
+    path = os.path.join(directory.path, 'tags.redisdump')
+    facade = RedisFacade(ProcessFacade())
+    facade.capture_keys(configuration(1), path)
+    fake_redis[1][b'tag:new'] = (b'new', -1)
+
+    facade.restore_keys(configuration(1), path)
+
+    assert read_key_dump_patterns(path) == ['*']
+    assert fake_redis[1] == {b'tag:a': (b'a', -1)}
+
+
+@pytest.mark.unit
+@tempdir()
+def test_restore_keys_matching_patterns_keeps_other_keys(directory, fake_redis):
+    fake_redis[1] = {b'tag:a': (b'a', -1), b'other': (b'o', -1)}
+    path = os.path.join(directory.path, 'tags.redisdump')
+    facade = RedisFacade(ProcessFacade())
+    facade.capture_keys(configuration(1), path, ['tag:*'])
+    fake_redis[1][b'tag:a'] = (b'changed', -1)
+
+    facade.restore_keys(configuration(1), path)
+
+    assert read_key_dump_patterns(path) == ['tag:*']
+    assert fake_redis[1] == {b'tag:a': (b'a', -1), b'other': (b'o', -1)}
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_and_restore_keys_stop_redis_server_they_started(directory, fake_redis):
+    fake_redis[1] = {b'tag:a': (b'a', -1)}
+    FakeRedis.is_running = False
+    path = os.path.join(directory.path, 'tags.redisdump')
+    process_facade = FakeRedisServerProcessFacade()
+    facade = RedisFacade(process_facade)
+
+    facade.capture_keys(configuration(1), path)
+    facade.restore_keys(configuration(1), path)
+
+    assert len(process_facade.processes) == 2
+    assert all(process.stopped for process in process_facade.processes)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_read_key_dump_reports_truncated_dump(directory, fake_redis):
+    fake_redis[1] = {b'tag:a': (b'payload a', -1)}
+    path = os.path.join(directory.path, 'tags.redisdump')
+    RedisFacade(ProcessFacade()).capture_keys(configuration(1), path)
+    with open(path, 'rb+') as file:
+        file.truncate(os.path.getsize(path) - 1)
+
+    with pytest.raises(MigrationError):
+        list(read_key_dump(path))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_read_key_dump_rejects_other_files(directory):
+    directory.write('dump.rdb', b'REDIS0009')
+
+    with pytest.raises(MigrationError):
+        list(read_key_dump(os.path.join(directory.path, 'dump.rdb')))
+
+
+@pytest.mark.skipif(shutil.which('redis-server') is None, reason='redis-server is not installed')
+@tempdir()
+def test_capture_and_restore_keys_with_redis_server(directory):
+    redis = pytest.importorskip('redis')
+    with socket.socket() as free_socket:
+        free_socket.bind(('localhost', 0))
+        port = free_socket.getsockname()[1]
+    server = subprocess.Popen(
+        ['redis-server', '--port', str(port), '--dir', directory.path, '--save', ''],
+        stdout=subprocess.DEVNULL)
+    try:
+        client = redis.Redis(port=port)
+        for _ in range(50):
+            try:
+                client.ping()
+                break
+            except redis.ConnectionError:
+                time.sleep(0.1)
+        client.set('tag:a', 'value')
+        client.hset('tag:b', mapping={'type': 'DOUBLE', 'value': '5.5'})
+        client.set('expiring', 'value', px=60000)
+        path = os.path.join(directory.path, 'tags.redisdump')
+        facade = RedisFacade(ProcessFacade())
+
+        assert facade.capture_keys(configuration(port), path) == 3
+        client.flushall()
+        assert facade.restore_keys(configuration(port), path) == 3
+
+        assert client.get('tag:a') == b'value'
+        assert client.hgetall('tag:b') == {b'type': b'DOUBLE', b'value': b'5.5'}
+        assert 0 < client.pttl('expiring') <= 60000
+    finally:
+        server.kill()
+        server.wait()
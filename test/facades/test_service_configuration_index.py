@@ -0,0 +1,48 @@
+import os
+
+import pytest
+from testfixtures import tempdir
+
+from nislmigrate.facades.file_system_facade import FileSystemFacade
+from nislmigrate.facades.service_configuration_index import ServiceConfigurationIndex
+
+
+@pytest.mark.unit
+@tempdir()
+def test_does_configuration_exist_lists_directory_once(directory):
+    directory.write('Config/Tags.json', b'{}')
+    config_directory = os.path.join(directory.path, 'Config')
+    index = ServiceConfigurationIndex(FileSystemFacade().read_json_file)
+
+    assert index.does_configuration_exist(os.path.join(config_directory, 'Tags.json'))
+    directory.write('Config/Assets.json', b'{}')
+
+    assert not index.does_configuration_exist(os.path.join(config_directory, 'Assets.json'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_does_configuration_exist_in_missing_directory_returns_false(directory):
+    index = ServiceConfigurationIndex(FileSystemFacade().read_json_file)
+
+    assert not index.does_configuration_exist(os.path.join(directory.path, 'Missing', 'Tags.json'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_read_configuration_parses_file_once(directory):
+    directory.write('Config/Tags.json', b'{"Tags": {"Mongo.Port": "27018"}}')
+    configuration_path = os.path.join(directory.path, 'Config', 'Tags.json')
+    read_paths = []
+
+    def read_json_file(path):
+        read_paths.append(path)
+        return FileSystemFacade().read_json_file(path)
+    index = ServiceConfigurationIndex(read_json_file)
+
+    first = index.read_configuration(configuration_path)
+    second = index.read_configuration(configuration_path)
+
+    assert first == {'Tags': {'Mongo.Port': '27018'}}
+    assert second is first
+    assert read_paths == [configuration_path]
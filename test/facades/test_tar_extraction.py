@@ -0,0 +1,82 @@
+import io
+import os
+import tarfile
+
+import pytest
+from testfixtures import tempdir
+
+from nislmigrate.facades.tar_extraction import extract_member
+from nislmigrate.logs.migration_error import MigrationError
+
+
+@pytest.fixture(params=[True, False], ids=['data_filter', 'fallback'])
+def data_filter(request, monkeypatch):
+    if not request.param:
+        monkeypatch.delattr(tarfile, 'data_filter', raising=False)
+    return request.param
+
+
+def write_archive(path, *members):
+    with tarfile.open(path, 'w') as tar:
+        for member, content in members:
+            tar.addfile(member, io.BytesIO(content) if content is not None else None)
+
+
+def file_member(name, content):
+    member = tarfile.TarInfo(name)
+    member.size = len(content)
+    return member, content
+
+
+def link_member(name, target, link_type=tarfile.SYMTYPE):
+    member = tarfile.TarInfo(name)
+    member.type = link_type
+    member.linkname = target
+    return member, None
+
+
+def extract_all(archive_path, to_directory):
+    with tarfile.open(archive_path) as tar:
+        for member in tar:
+            extract_member(tar, member, to_directory)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_extract_member_extracts_files_within_directory(directory, data_filter):
+    archive_path = os.path.join(directory.path, 'archive.tar')
+    write_archive(archive_path, file_member('a/b.txt', b'b'), link_member('a/c.txt', 'b.txt'))
+
+    extract_all(archive_path, os.path.join(directory.path, 'restore'))
+
+    assert directory.read('restore/a/b.txt') == b'b'
+    assert directory.read('restore/a/c.txt') == b'b'
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('member', [
+    file_member('../evil.txt', b'evil'),
+    link_member('link', '../evil.txt'),
+    link_member('link', '/evil.txt'),
+    link_member('link', '../evil.txt', tarfile.LNKTYPE),
+], ids=['parent', 'symlink_parent', 'symlink_absolute', 'hardlink_parent'])
+def test_extract_member_refuses_members_outside_directory(tmp_path, member, data_filter):
+    archive_path = str(tmp_path / 'archive.tar')
+    write_archive(archive_path, member)
+
+    with pytest.raises(MigrationError):
+        extract_all(archive_path, str(tmp_path / 'restore'))
+
+    assert not (tmp_path / 'evil.txt').exists()
+
+
+@pytest.mark.unit
+@tempdir()
+def test_extract_member_refuses_device_members(directory, data_filter):
+    member = tarfile.TarInfo('device')
+    member.type = tarfile.CHRTYPE
+    archive_path = os.path.join(directory.path, 'archive.tar')
+    write_archive(archive_path, (member, None))
+
+    with pytest.raises(MigrationError):
+        extract_all(archive_path, os.path.join(directory.path, 'restore'))
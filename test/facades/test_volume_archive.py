@@ -0,0 +1,73 @@
+import json
+import os
+
+import pytest
+from testfixtures import tempdir
+
+from nislmigrate.facades.volume_archive import is_volume_archive, read_volume_archive, write_volume_archive
+from nislmigrate.logs.migration_error import MigrationError
+
+pytest.importorskip('zstandard')
+
+
+@pytest.mark.unit
+@tempdir()
+def test_volume_archive_round_trips_directory(directory):
+    directory.write('source/a.txt', b'a' * 100)
+    directory.write('source/b/c.txt', b'c' * 100)
+    os.makedirs(os.path.join(directory.path, 'source', 'empty'))
+    archive_path = os.path.join(directory.path, 'archive')
+
+    write_volume_archive(os.path.join(directory.path, 'source'), archive_path)
+    read_volume_archive(archive_path, os.path.join(directory.path, 'restore'))
+
+    assert is_volume_archive(archive_path)
+    assert directory.read('restore/a.txt') == b'a' * 100
+    assert directory.read('restore/b/c.txt') == b'c' * 100
+    assert os.path.isdir(os.path.join(directory.path, 'restore', 'empty'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_volume_archive_seals_volumes_at_volume_size(directory):
+    for index in range(5):
+        directory.write(f'source/{index}.txt', os.urandom(100))
+    archive_path = os.path.join(directory.path, 'archive')
+
+    write_volume_archive(os.path.join(directory.path, 'source'), archive_path, volume_size=200)
+    read_volume_archive(archive_path, os.path.join(directory.path, 'restore'), worker_count=3)
+
+    assert sorted(name for name in os.listdir(archive_path) if name.endswith('.tar.zst')) == [
+        'volume-00001.tar.zst', 'volume-00002.tar.zst', 'volume-00003.tar.zst']
+    assert sorted(os.listdir(os.path.join(directory.path, 'restore'))) == [f'{index}.txt' for index in range(5)]
+
+
+@pytest.mark.unit
+@tempdir()
+def test_volume_archive_seals_volume_before_file_that_does_not_fit(directory):
+    directory.write('source/0.txt', os.urandom(150))
+    directory.write('source/1.txt', os.urandom(100))
+    directory.write('source/2.txt', os.urandom(100))
+    directory.write('source/3.txt', os.urandom(300))
+    archive_path = os.path.join(directory.path, 'archive')
+
+    write_volume_archive(os.path.join(directory.path, 'source'), archive_path, volume_size=200)
+
+    with open(os.path.join(archive_path, 'volumes.json')) as file:
+        volumes = json.load(file)['volumes']
+    assert all(volume['byte_count'] <= 200 for volume in volumes if volume['file_count'] > 1)
+    assert [volume['file_count'] for volume in volumes if volume['byte_count'] > 200] == [1]
+
+
+@pytest.mark.unit
+@tempdir()
+def test_read_volume_archive_reports_files_missing_from_volume(directory):
+    directory.write('source/a.txt', b'a')
+    archive_path = os.path.join(directory.path, 'archive')
+    write_volume_archive(os.path.join(directory.path, 'source'), archive_path)
+    directory.write('archive/volume-00001.index.json', b'{"paths": [["a.txt", 1], ["b.txt", 1]]}')
+
+    with pytest.raises(MigrationError) as error:
+        read_volume_archive(archive_path, os.path.join(directory.path, 'restore'))
+
+    assert 'b.txt' in str(error.value)
@@ -1,3 +1,4 @@
+import json
 import os
 
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
@@ -15,7 +16,18 @@ from nislmigrate.migrators.file_migrator import (
     _SAVED_OLD_FILE_STORE_ROOT_FILE_NAME,
     _CHANGE_FILE_STORE_ARGUMENT,
     _CHANGE_FILE_STORE_SLASHES_ARGUMENT,
+    _ARCHIVE_ARGUMENT,
+    _ARCHIVE_VOLUME_SIZE_ARGUMENT,
+    _REFERENCED_ONLY_ARGUMENT,
+    _QUERY_ARGUMENT,
+    _QUERY_FILE_NAME,
+    _QUERIED_DOCUMENTS_FILE_NAME,
+    _S3_URI_ARGUMENT,
+    _S3_ENDPOINT_URL_ARGUMENT,
+    _CANNOT_COMBINE_S3_FILES_ERROR,
 )
+from nislmigrate.facades import object_store_facade
+from nislmigrate.facades.file_store_check import FileReference, FileStoreCheckResult, SizeMismatch
 import pytest
 from test.test_utilities import FakeFacadeFactory, FakeFileSystemFacade
 from typing import Any, Dict, Optional, Tuple, List
@@ -89,6 +101,111 @@ def test_file_migrator_does_not_restore_files_when_metadata_only_is_passed():
     assert file_system_facade.last_to_directory is None
 
 
+@pytest.mark.unit
+def test_file_migrator_captures_files_as_volume_archive_when_archive_is_passed():
+    facade_factory, file_system_facade = configure_facade_factory()
+    migrator = FileMigrator()
+
+    migrator.capture('data_dir', facade_factory, {_ARCHIVE_ARGUMENT: True, _ARCHIVE_VOLUME_SIZE_ARGUMENT: '16'})
+
+    assert file_system_facade.last_from_directory == DEFAULT_DATA_DIRECTORY
+    assert file_system_facade.last_to_directory == os.path.join('data_dir', 'files')
+    assert file_system_facade.last_volume_size == 16 * 1024 * 1024
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('volume_size', ['0', '-1', 'large'])
+def test_file_migrator_pre_capture_check_reports_error_for_invalid_volume_size(volume_size: str):
+    facade_factory, _ = configure_facade_factory()
+    migrator = FileMigrator()
+
+    with pytest.raises(MigrationError):
+        migrator.pre_capture_check(
+            'data_dir',
+            facade_factory,
+            {_ARCHIVE_ARGUMENT: True, _ARCHIVE_VOLUME_SIZE_ARGUMENT: volume_size})
+
+
+@pytest.mark.unit
+def test_file_migrator_captures_referenced_files_when_referenced_only_is_passed():
+    facade_factory, file_system_facade = configure_facade_factory()
+    referenced_path = os.path.join(DEFAULT_DATA_DIRECTORY, 'file.txt')
+    facade_factory.mongo_facade.field_values_in_collections['fileingestion'] = [referenced_path]
+    migrator = FileMigrator()
+
+    migrator.capture('data_dir', facade_factory, {_REFERENCED_ONLY_ARGUMENT: True})
+
+    assert file_system_facade.last_from_directory == DEFAULT_DATA_DIRECTORY
+    assert file_system_facade.last_referenced_paths == [referenced_path]
+    report = json.loads(file_system_facade.written_files[os.path.join('data_dir', 'referenced-files.json')])
+    assert report == {'orphaned_files': [], 'missing_files': []}
+
+
+@pytest.mark.unit
+def test_file_migrator_captures_only_metadata_and_files_matching_query():
+    facade_factory, file_system_facade = configure_facade_factory()
+    referenced_path = os.path.join(DEFAULT_DATA_DIRECTORY, 'file.txt')
+    facade_factory.mongo_facade.field_values_in_collections['fileingestion'] = [referenced_path]
+    migrator = FileMigrator()
+
+    migrator.capture('data_dir', facade_factory, {_QUERY_ARGUMENT: '{"workspace": "lab"}'})
+
+    documents_path = os.path.join('data_dir', _QUERIED_DOCUMENTS_FILE_NAME)
+    assert facade_factory.mongo_facade.captured_aggregations[documents_path] == [{'$match': {'workspace': 'lab'}}]
+    assert json.loads(file_system_facade.written_files[os.path.join('data_dir', _QUERY_FILE_NAME)]) == \
+        {'workspace': 'lab'}
+    assert not facade_factory.process_facade.captured
+    assert facade_factory.mongo_facade.last_field_value_query == {'workspace': 'lab'}
+    assert file_system_facade.last_referenced_paths == [referenced_path]
+
+
+@pytest.mark.unit
+def test_file_migrator_restores_query_capture_without_replacing_existing_metadata_and_files():
+    facade_factory, file_system_facade = configure_facade_factory()
+    file_system_facade.missing_files.remove(_QUERY_FILE_NAME)
+    migrator = FileMigrator()
+
+    migrator.restore('data_dir', facade_factory, {})
+
+    assert facade_factory.mongo_facade.upserted_document_files['fileingestion'] == \
+        os.path.join('data_dir', _QUERIED_DOCUMENTS_FILE_NAME)
+    assert not facade_factory.process_facade.restored
+    assert file_system_facade.merged_directories == [(os.path.join('data_dir', 'files'), DEFAULT_DATA_DIRECTORY)]
+
+
+@pytest.mark.unit
+def test_file_migrator_captures_whole_database_without_query():
+    facade_factory, _ = configure_facade_factory()
+    migrator = FileMigrator()
+
+    migrator.capture('data_dir', facade_factory, {})
+
+    assert '--collection' not in facade_factory.process_facade.last_arguments
+    assert '--query' not in facade_factory.process_facade.last_arguments
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('query', ['{"workspace": ', '["lab"]'])
+def test_file_migrator_pre_capture_check_reports_error_for_invalid_query(query: str):
+    facade_factory, _ = configure_facade_factory()
+    migrator = FileMigrator()
+
+    with pytest.raises(MigrationError):
+        migrator.pre_capture_check('data_dir', facade_factory, {_QUERY_ARGUMENT: query})
+
+
+@pytest.mark.unit
+def test_file_migrator_pre_capture_check_reports_error_for_archived_referenced_files():
+    facade_factory, _ = configure_facade_factory()
+    migrator = FileMigrator()
+
+    with pytest.raises(MigrationError):
+        migrator.pre_capture_check(
+            'data_dir',
+            facade_factory,
+            {_ARCHIVE_ARGUMENT: True, _REFERENCED_ONLY_ARGUMENT: True})
+
+
 @pytest.mark.unit
 def test_file_migrator_captures_the_old_file_store_root():
     facade_factory, file_system_facade = configure_facade_factory()
@@ -230,6 +347,72 @@ def test_file_migrator_pre_restore_check_reports_error_when_s3_backend_is_enable
     assert _CANNOT_MIGRATE_S3_FILES_ERROR in str(e.value)
 
 
+@pytest.mark.unit
+def test_file_migrator_captures_s3_files_from_s3_uri():
+    facade_factory, file_system_facade = configure_facade_factory(enable_s3_backend=True)
+    migrator = FileMigrator()
+    arguments = {_S3_URI_ARGUMENT: 's3://bucket/files', _S3_ENDPOINT_URL_ARGUMENT: 'http://localhost:9000'}
+
+    migrator.capture('data_dir', facade_factory, arguments)
+
+    assert facade_factory.object_store_facade.downloads == [{
+        'uri': 's3://bucket/files',
+        'to_directory': os.path.join('data_dir', 'files'),
+        'state_directory': 'data_dir',
+        'endpoint_url': 'http://localhost:9000',
+    }]
+    assert file_system_facade.last_from_directory is None
+
+
+@pytest.mark.unit
+def test_file_migrator_restores_s3_files_to_s3_uri():
+    facade_factory, file_system_facade = configure_facade_factory(enable_s3_backend=True)
+    migrator = FileMigrator()
+
+    migrator.restore('data_dir', facade_factory, {_S3_URI_ARGUMENT: 's3://bucket/files'})
+
+    assert facade_factory.object_store_facade.uploads == [{
+        'from_directory': os.path.join('data_dir', 'files'),
+        'uri': 's3://bucket/files',
+        'state_directory': 'data_dir',
+        'endpoint_url': None,
+    }]
+    assert file_system_facade.last_to_directory is None
+
+
+@pytest.mark.unit
+def test_file_migrator_pre_capture_check_with_s3_uri_does_not_throw_when_s3_backend_is_enabled(monkeypatch):
+    monkeypatch.setattr(object_store_facade, 'boto3', object())
+    facade_factory, _ = configure_facade_factory(enable_s3_backend=True)
+    migrator = FileMigrator()
+
+    migrator.pre_capture_check('data_dir', facade_factory, {_S3_URI_ARGUMENT: 's3://bucket/files'})
+
+
+@pytest.mark.unit
+def test_file_migrator_pre_capture_check_rejects_invalid_s3_uri():
+    facade_factory, _ = configure_facade_factory(enable_s3_backend=True)
+    migrator = FileMigrator()
+
+    with pytest.raises(MigrationError):
+        migrator.pre_capture_check('data_dir', facade_factory, {_S3_URI_ARGUMENT: 'bucket/files'})
+
+
+@pytest.mark.unit
+def test_file_migrator_pre_capture_check_reports_error_when_archiving_s3_files(monkeypatch):
+    monkeypatch.setattr(object_store_facade, 'boto3', object())
+    facade_factory, _ = configure_facade_factory(enable_s3_backend=True)
+    migrator = FileMigrator()
+
+    with pytest.raises(MigrationError) as e:
+        migrator.pre_capture_check(
+            'data_dir',
+            facade_factory,
+            {_S3_URI_ARGUMENT: 's3://bucket/files', _ARCHIVE_ARGUMENT: True})
+
+    assert _CANNOT_COMBINE_S3_FILES_ERROR in str(e.value)
+
+
 @pytest.mark.unit
 def test_file_migrator_pre_modify_check_reports_error_when_old_store_root_is_unset_when_change_root_is_sett():
     facade_factory, _ = configure_facade_factory(enable_s3_backend=True)
@@ -241,6 +424,58 @@ def test_file_migrator_pre_modify_check_reports_error_when_old_store_root_is_uns
     assert _FILE_STORE_ROOT_NOT_SET_FOR_MODIFY_CHANGE_FILE_STORE_ERROR in str(e.value)
 
 
+@pytest.mark.unit
+def test_file_migrator_check_compares_metadata_with_file_store():
+    facade_factory, file_system_facade = configure_facade_factory()
+    facade_factory.mongo_facade.documents_in_collections['fileingestion'] = [
+        {'path': 'store/a.txt', 'size': 3},
+        {'path': 'store/b.txt'},
+        {'size': 4},
+    ]
+    migrator = FileMigrator()
+
+    migrator.check('data_dir', facade_factory, {})
+
+    assert file_system_facade.last_from_directory == DEFAULT_DATA_DIRECTORY
+    assert file_system_facade.last_file_references == [
+        FileReference('store/a.txt', 3),
+        FileReference('store/b.txt', None),
+    ]
+    assert file_system_facade.written_files == {}
+    assert facade_factory.mongo_facade.last_find_started_mongo is False
+
+
+@pytest.mark.unit
+def test_file_migrator_check_reports_inconsistencies():
+    facade_factory, file_system_facade = configure_facade_factory()
+    file_system_facade.file_store_check_result = FileStoreCheckResult(
+        3,
+        ['store/missing.txt'],
+        [SizeMismatch('store/a.txt', 3, 4)],
+        ['store/orphan.txt'],
+        0.0)
+    migrator = FileMigrator()
+
+    with pytest.raises(MigrationError):
+        migrator.check('data_dir', facade_factory, {})
+
+    report = json.loads(file_system_facade.written_files[os.path.join('data_dir', 'file-store-check.json')])
+    assert report == {
+        'missing_files': ['store/missing.txt'],
+        'size_mismatches': [{'path': 'store/a.txt', 'expected_size': 3, 'actual_size': 4}],
+        'unreferenced_files': ['store/orphan.txt'],
+    }
+
+
+@pytest.mark.unit
+def test_file_migrator_check_reports_error_when_s3_backend_is_enabled():
+    facade_factory, _ = configure_facade_factory(enable_s3_backend=True)
+    migrator = FileMigrator()
+
+    with pytest.raises(MigrationError):
+        migrator.check('data_dir', facade_factory, {})
+
+
 def configure_facade_factory(
     data_directory: Optional[str] = None,
     null_data_directory: bool = False,
@@ -268,6 +503,7 @@ def configure_fake_file_system_facade(
 ) -> FakeFileSystemFacade:
     file_system_facade = facade_factory.file_system_facade
     file_system_facade.missing_directories = missing_directories
+    file_system_facade.missing_files.append(_QUERY_FILE_NAME)
     properties: Dict[str, Any] = {
             'Mongo.CustomConnectionString': 'mongodb://localhost',
             'Mongo.Database': 'file'
@@ -0,0 +1,84 @@
+import json
+import os
+
+import pytest
+
+from nislmigrate.facades.parallel_copy import FileToCopy
+from nislmigrate.logs.migration_error import MigrationError
+from nislmigrate.migrators.repository_migrator import (
+    _DEDUPLICATE_ARGUMENT,
+    _REFERENCED_PACKAGES_REPORT_FILE_NAME,
+    BASE_REPOSITORY_PATH_CONFIG_TOKEN,
+    RepositoryMigrator,
+)
+from test.test_utilities import FakeFacadeFactory, FakeFileSystemFacade, FakeMongoFacade
+
+
+@pytest.mark.unit
+def test_repository_migrator_does_not_select_packages_by_default():
+    facade_factory, file_system_facade = configure_facade_factory()
+
+    RepositoryMigrator().capture('data_dir', facade_factory, {})
+
+    assert file_system_facade.last_referenced_paths is None
+    assert file_system_facade.written_files == {}
+
+
+@pytest.mark.unit
+def test_repository_migrator_deduplicated_capture_copies_packages_of_existing_feeds():
+    facade_factory, file_system_facade = configure_facade_factory()
+    mongo_facade: FakeMongoFacade = facade_factory.mongo_facade
+    mongo_facade.field_values_in_collections['feeds'] = ['feed1']
+    mongo_facade.documents_in_collections['packages'] = [
+        {'feedId': 'feed1', 'fileName': os.path.join('feed1', 'a.nipkg')},
+        {'feedId': 'deleted', 'fileName': os.path.join('deleted', 'b.nipkg')},
+    ]
+
+    RepositoryMigrator().capture('data_dir', facade_factory, {_DEDUPLICATE_ARGUMENT: True})
+
+    assert file_system_facade.last_from_directory == 'repository'
+    assert file_system_facade.last_to_directory == os.path.join('data_dir', 'files')
+    assert file_system_facade.last_referenced_paths == [os.path.join('repository', 'feed1', 'a.nipkg')]
+    assert file_system_facade.last_deduplicate
+    assert file_system_facade.last_selected_extensions == ('.nipkg',)
+    report_path = os.path.join('data_dir', _REFERENCED_PACKAGES_REPORT_FILE_NAME)
+    report = json.loads(file_system_facade.written_files[report_path])
+    assert report == {'unreferenced_packages': [], 'missing_packages': []}
+
+
+@pytest.mark.unit
+def test_repository_migrator_deduplicated_capture_reports_error_for_package_without_file_name():
+    facade_factory, _ = configure_facade_factory()
+    mongo_facade: FakeMongoFacade = facade_factory.mongo_facade
+    mongo_facade.field_values_in_collections['feeds'] = ['feed1']
+    mongo_facade.documents_in_collections['packages'] = [{'_id': 'package1', 'feedId': 'feed1'}]
+
+    with pytest.raises(MigrationError):
+        RepositoryMigrator().capture('data_dir', facade_factory, {_DEDUPLICATE_ARGUMENT: True})
+
+
+@pytest.mark.unit
+def test_repository_migrator_deduplicated_capture_reports_error_when_no_referenced_package_is_found():
+    facade_factory, file_system_facade = configure_facade_factory()
+    mongo_facade: FakeMongoFacade = facade_factory.mongo_facade
+    mongo_facade.field_values_in_collections['feeds'] = ['feed1']
+    mongo_facade.documents_in_collections['packages'] = [{'feedId': 'feed1', 'fileName': 'a.nipkg'}]
+    file_system_facade.missing_files.append(os.path.join('repository', 'a.nipkg'))
+    file_system_facade.orphaned_files = [
+        FileToCopy(os.path.join('repository', 'feed1', 'a.nipkg'), os.path.join('files', 'feed1', 'a.nipkg'), 1, 0)]
+
+    with pytest.raises(MigrationError):
+        RepositoryMigrator().capture('data_dir', facade_factory, {_DEDUPLICATE_ARGUMENT: True})
+
+
+def configure_facade_factory():
+    facade_factory = FakeFacadeFactory()
+    file_system_facade: FakeFileSystemFacade = facade_factory.file_system_facade
+    file_system_facade.config = {
+        'PackageRepository': {
+            'Mongo.CustomConnectionString': 'mongodb://localhost',
+            'Mongo.Database': 'repository',
+            BASE_REPOSITORY_PATH_CONFIG_TOKEN: 'repository',
+        }
+    }
+    return facade_factory, file_system_facade
@@ -1,4 +1,8 @@
-from nislmigrate.migrators.system_states_migrator import SystemStatesMigrator, GIT_REPO_CONFIG_CONFIGURATION_KEY
+from nislmigrate.migrators.system_states_migrator import (
+    SystemStatesMigrator,
+    GIT_REPO_CONFIG_CONFIGURATION_KEY,
+    _INCREMENTAL_ARGUMENT,
+)
 import os
 from pathlib import Path
 import pytest
@@ -30,6 +34,57 @@ def test_file_migrator_copies_existing_git_repo(directory):
     migrator.capture('data_dir', facade_factory, {})
 
     assert file_system_facade.last_from_directory == git_path
+    assert file_system_facade.removed_directories == [os.path.join('data_dir', 'bundles')]
+
+
+@pytest.mark.unit
+@tempdir()
+def test_system_states_migrator_captures_git_bundles(directory):
+    git_path = os.path.join(directory.path, 'git')
+    make_directory_with_contents(git_path)
+    facade_factory, file_system_facade = configure_facade_factory(git_path)
+    migrator = SystemStatesMigrator()
+
+    migrator.capture('data_dir', facade_factory, {_INCREMENTAL_ARGUMENT: True})
+
+    assert facade_factory.git_facade.last_capture == {
+        'repository': git_path,
+        'directory': os.path.join('data_dir', 'bundles'),
+        'incremental': True,
+        'repack': False,
+        'allow_uncommitted_changes': False,
+    }
+    assert file_system_facade.last_from_directory is None
+    assert file_system_facade.removed_directories == [os.path.join('data_dir', 'files')]
+
+
+@pytest.mark.unit
+@tempdir()
+def test_system_states_migrator_restores_git_bundles(directory):
+    git_path = os.path.join(directory.path, 'git')
+    facade_factory, file_system_facade = configure_facade_factory(git_path)
+    migrator = SystemStatesMigrator()
+
+    migrator.restore('data_dir', facade_factory, {})
+
+    assert facade_factory.git_facade.last_restore == {
+        'directory': os.path.join('data_dir', 'bundles'),
+        'repository': git_path,
+    }
+    assert file_system_facade.last_to_directory == git_path
+
+
+@pytest.mark.unit
+@tempdir()
+def test_system_states_migrator_restores_copied_files_without_bundles(directory):
+    git_path = os.path.join(directory.path, 'git')
+    facade_factory, file_system_facade = configure_facade_factory(git_path)
+    file_system_facade.missing_files.append('bundles.json')
+    migrator = SystemStatesMigrator()
+
+    migrator.restore('data_dir', facade_factory, {})
+
+    assert facade_factory.git_facade.last_restore is None
 
 
 def configure_facade_factory(git_path: str) -> Tuple[FakeFacadeFactory, FakeFileSystemFacade]:
@@ -93,6 +93,39 @@ def test_systems_management_migrator_capture_pillar_files_do_not_exist_and_are_n
     assert (PILLAR_INSTALLED_PATH, 'data_dir\\pillar', 'password') not in file_system_facade.directories_encrypted
 
 
+@pytest.mark.unit
+def test_systems_management_migrator_capture_uses_configured_key_derivation_iterations():
+    facade_factory, file_system_facade = configure_facade_factory()
+    migrator = SystemsManagementMigrator()
+
+    migrator.capture('data_dir', facade_factory, {'secret': 'password', 'key-derivation-iterations': '500000'})
+
+    assert file_system_facade.key_derivation_iterations == 500000
+
+
+@pytest.mark.unit
+def test_systems_management_migrator_capture_passes_incremental_switch():
+    facade_factory, file_system_facade = configure_facade_factory()
+    migrator = SystemsManagementMigrator()
+
+    migrator.capture('data_dir', facade_factory, {'secret': 'password', 'incremental': True})
+
+    assert file_system_facade.incremental
+    assert len(file_system_facade.directories_encrypted) == 2
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('iterations', ['0', '-1', 'many'])
+def test_systems_management_migrator_pre_capture_check_raises_when_key_derivation_iterations_invalid(iterations):
+    facade_factory, _ = configure_facade_factory()
+    migrator = SystemsManagementMigrator()
+
+    with pytest.raises(MigrationError):
+        migrator.pre_capture_check('data_dir', facade_factory, {
+            'secret': 'password',
+            'key-derivation-iterations': iterations})
+
+
 def configure_facade_factory() -> Tuple[FakeFacadeFactory, FakeFileSystemFacade]:
     facade_factory = FakeFacadeFactory()
     file_system_facade = configure_fake_file_system_facade(facade_factory)
@@ -0,0 +1,235 @@
+import datetime
+import json
+import os
+
+import pytest
+
+from nislmigrate.facades import redis_facade
+from nislmigrate.facades.rdb_inventory import RdbInventory
+from nislmigrate.logs.migration_error import MigrationError
+from nislmigrate.migrators.tag_migrator import (
+    TagMigrator,
+    _DOWNSAMPLED_HISTORY_FILE_NAME as _DOWNSAMPLED_FILE,
+    _DOWNSAMPLING_INTERVAL_ARGUMENT,
+    _FULL_RESOLUTION_DAYS_ARGUMENT,
+    _INVENTORY_FILE_NAME,
+    _REDIS_ARGUMENT,
+    _REDIS_KEY_PATTERN_ARGUMENT,
+)
+from test.test_utilities import FakeFacadeFactory
+
+
+def configure_facade_factory() -> FakeFacadeFactory:
+    facade_factory = FakeFacadeFactory()
+    facade_factory.file_system_facade.config = {
+        'TagHistorian': {
+            'Mongo.CustomConnectionString': 'mongodb://localhost',
+            'Mongo.Database': 'nitaghistorian',
+        }
+    }
+    return facade_factory
+
+
+@pytest.mark.unit
+def test_tag_migrator_captures_dump_file_by_default():
+    facade_factory = configure_facade_factory()
+    migrator = TagMigrator()
+
+    migrator.capture('data_dir', facade_factory, {})
+
+    assert facade_factory.file_system_facade.last_to_directory == 'data_dir'
+    assert facade_factory.redis_facade.last_capture_path is None
+
+
+@pytest.mark.unit
+def test_tag_migrator_captures_keys_from_redis():
+    facade_factory = configure_facade_factory()
+    migrator = TagMigrator()
+
+    migrator.capture('data_dir', facade_factory, {_REDIS_ARGUMENT: True})
+
+    assert facade_factory.redis_facade.last_capture_path == os.path.join('data_dir', 'tags.redisdump')
+    assert facade_factory.redis_facade.last_key_patterns is None
+    assert facade_factory.file_system_facade.last_to_directory is None
+
+
+@pytest.mark.unit
+def test_tag_migrator_key_pattern_captures_matching_keys_from_redis():
+    facade_factory = configure_facade_factory()
+    migrator = TagMigrator()
+
+    migrator.capture('data_dir', facade_factory, {_REDIS_KEY_PATTERN_ARGUMENT: 'tag:*, history:*'})
+
+    assert facade_factory.redis_facade.last_key_patterns == ['tag:*', 'history:*']
+
+
+@pytest.mark.unit
+def test_tag_migrator_restores_keys_when_captured_from_redis():
+    facade_factory = configure_facade_factory()
+    migrator = TagMigrator()
+
+    migrator.restore('data_dir', facade_factory, {})
+
+    assert facade_factory.redis_facade.last_restore_path == os.path.join('data_dir', 'tags.redisdump')
+    assert facade_factory.file_system_facade.last_to_directory is None
+
+
+@pytest.mark.unit
+def test_tag_migrator_restores_dump_file_when_not_captured_from_redis():
+    facade_factory = configure_facade_factory()
+    facade_factory.file_system_facade.missing_files.append('tags.redisdump')
+    migrator = TagMigrator()
+
+    migrator.restore('data_dir', facade_factory, {})
+
+    assert facade_factory.redis_facade.last_restore_path is None
+    assert facade_factory.file_system_facade.last_from_directory == 'data_dir'
+
+
+@pytest.mark.unit
+def test_tag_migrator_pre_capture_check_requires_redis_package(monkeypatch):
+    monkeypatch.setattr(redis_facade, 'redis', None)
+    migrator = TagMigrator()
+
+    with pytest.raises(MigrationError):
+        migrator.pre_capture_check('data_dir', configure_facade_factory(), {_REDIS_ARGUMENT: True})
+
+
+@pytest.mark.unit
+def test_tag_migrator_capture_writes_inventory():
+    facade_factory = configure_facade_factory()
+    facade_factory.redis_facade.inventories['dump.rdb'] = RdbInventory(9, 2, 0, {'hash': 2}, {'tag': 2}, {'tag': 80})
+    facade_factory.file_system_facade.missing_files.append('tags.redisdump')
+    migrator = TagMigrator()
+
+    migrator.capture('data_dir', facade_factory, {})
+
+    written_files = facade_factory.file_system_facade.written_files
+    inventory = json.loads(written_files[os.path.join('data_dir', _INVENTORY_FILE_NAME)])
+    assert inventory['key_count'] == 2
+    assert inventory['prefix_byte_counts'] == {'tag': 80}
+
+
+@pytest.mark.unit
+def test_tag_migrator_capture_skips_inventory_it_can_not_read(caplog):
+    facade_factory = configure_facade_factory()
+    facade_factory.redis_facade.unreadable_inventories.append(os.path.join('data_dir', 'dump.rdb'))
+    facade_factory.file_system_facade.missing_files.append('tags.redisdump')
+    migrator = TagMigrator()
+
+    migrator.capture('data_dir', facade_factory, {})
+
+    assert os.path.join('data_dir', _INVENTORY_FILE_NAME) not in facade_factory.file_system_facade.written_files
+    assert 'Could not summarize the tags' in caplog.text
+
+
+@pytest.mark.unit
+def test_tag_migrator_pre_restore_check_accepts_capture_whose_inventory_can_not_be_read():
+    facade_factory = configure_facade_factory()
+    facade_factory.file_system_facade.missing_files.append('tags.redisdump')
+    facade_factory.redis_facade.unreadable_inventories.append(os.path.join('data_dir', 'dump.rdb'))
+    migrator = TagMigrator()
+
+    migrator.pre_restore_check('data_dir', facade_factory, {})
+
+
+@pytest.mark.unit
+def test_tag_migrator_pre_restore_check_reads_version_of_dump_file_from_its_header():
+    facade_factory = configure_facade_factory()
+    facade_factory.file_system_facade.missing_files.append('tags.redisdump')
+    captured_path = os.path.join('data_dir', 'dump.rdb')
+    facade_factory.redis_facade.unreadable_inventories.append(captured_path)
+    facade_factory.redis_facade.dump_file_versions[captured_path] = 11
+    facade_factory.redis_facade.dump_file_version = 10
+    migrator = TagMigrator()
+
+    with pytest.raises(MigrationError):
+        migrator.pre_restore_check('data_dir', facade_factory, {})
+
+
+@pytest.mark.unit
+def test_tag_migrator_pre_restore_check_rejects_newer_capture():
+    facade_factory = configure_facade_factory()
+    facade_factory.redis_facade.inventories['tags.redisdump'] = RdbInventory(11, 1, 0, {'hash': 1}, {}, {})
+    facade_factory.redis_facade.dump_file_version = 10
+    migrator = TagMigrator()
+
+    with pytest.raises(MigrationError):
+        migrator.pre_restore_check('data_dir', facade_factory, {})
+
+
+@pytest.mark.unit
+def test_tag_migrator_pre_restore_check_accepts_older_capture():
+    facade_factory = configure_facade_factory()
+    facade_factory.file_system_facade.missing_files.append('tags.redisdump')
+    facade_factory.redis_facade.dump_file_versions[os.path.join('data_dir', 'dump.rdb')] = 9
+    facade_factory.redis_facade.dump_file_version = 10
+    migrator = TagMigrator()
+
+    migrator.pre_restore_check('data_dir', facade_factory, {})
+
+
+@pytest.mark.unit
+def test_tag_migrator_downsamples_older_history():
+    facade_factory = configure_facade_factory()
+    migrator = TagMigrator()
+
+    migrator.capture('data_dir', facade_factory, {_FULL_RESOLUTION_DAYS_ARGUMENT: '30'})
+
+    whole_dump, recent_dump = facade_factory.process_facade.all_arguments
+    assert whole_dump[whole_dump.index('--excludeCollection') + 1] == 'values'
+    assert recent_dump[recent_dump.index('--collection') + 1] == 'values'
+    assert '$gte' in json.loads(recent_dump[recent_dump.index('--query') + 1])['timestamp']
+    match, group, _ = facade_factory.mongo_facade.captured_aggregations[os.path.join('data_dir', _DOWNSAMPLED_FILE)]
+    assert match['$match']['timestamp']['$lt'] < datetime.datetime.now(datetime.timezone.utc)
+    assert group['$group']['_id']['bucket']['$subtract'][1]['$mod'][1] == 60 * 60 * 1000
+
+
+@pytest.mark.unit
+def test_tag_migrator_rejects_downsampling_history_without_series_fields():
+    facade_factory = configure_facade_factory()
+    facade_factory.mongo_facade.documents_in_collections['values'] = [{'tag': 'a', 'timestamp': 0}]
+    migrator = TagMigrator()
+
+    with pytest.raises(MigrationError):
+        migrator.capture('data_dir', facade_factory, {_FULL_RESOLUTION_DAYS_ARGUMENT: '30'})
+
+    assert facade_factory.mongo_facade.captured_aggregations == {}
+
+
+@pytest.mark.unit
+def test_tag_migrator_captures_whole_history_by_default():
+    facade_factory = configure_facade_factory()
+    migrator = TagMigrator()
+
+    migrator.capture('data_dir', facade_factory, {})
+
+    assert len(facade_factory.process_facade.all_arguments) == 1
+    assert facade_factory.mongo_facade.captured_aggregations == {}
+
+
+@pytest.mark.unit
+def test_tag_migrator_restores_downsampled_history():
+    facade_factory = configure_facade_factory()
+    migrator = TagMigrator()
+
+    migrator.restore('data_dir', facade_factory, {})
+
+    restores = facade_factory.process_facade.all_arguments
+    assert restores[-1][-2] == '--archive=' + os.path.join('data_dir', 'TagHistorian-recent-history')
+    restored_document_files = facade_factory.mongo_facade.restored_document_files
+    assert restored_document_files == {'values': os.path.join('data_dir', _DOWNSAMPLED_FILE)}
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('arguments', [
+    {_FULL_RESOLUTION_DAYS_ARGUMENT: '0'},
+    {_FULL_RESOLUTION_DAYS_ARGUMENT: 'week'},
+    {_FULL_RESOLUTION_DAYS_ARGUMENT: '30', _DOWNSAMPLING_INTERVAL_ARGUMENT: '-5'},
+    {_DOWNSAMPLING_INTERVAL_ARGUMENT: '5'},
+])
+def test_tag_migrator_pre_capture_check_rejects_invalid_downsampling(arguments):
+    migrator = TagMigrator()
+
+    with pytest.raises(MigrationError):
+        migrator.pre_capture_check('data_dir', configure_facade_factory(), arguments)
@@ -8,6 +8,7 @@ from nislmigrate.argument_handler import CAPTURE_ARGUMENT
 from nislmigrate.argument_handler import RESTORE_ARGUMENT
 from nislmigrate.argument_handler import DEFAULT_MIGRATION_DIRECTORY
 from nislmigrate.extensibility.migrator_plugin import MigratorPlugin, ArgumentManager
+from nislmigrate.facades.parallel_copy import LinkMode
 from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.migration_action import MigrationAction
 from nislmigrate.migrators.asset_migrator import AssetMigrator
@@ -174,6 +175,133 @@ def test_is_force_migration_flag_present_flag_present():
     assert argument_handler.is_force_migration_flag_present()
 
 
+@pytest.mark.unit
+def test_is_delta_copy_flag_present_flag_present():
+    arguments = [RESTORE_ARGUMENT, '--delta']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.is_delta_copy_flag_present()
+    assert not argument_handler.is_delta_checksum_flag_present()
+
+
+@pytest.mark.unit
+def test_is_delta_copy_flag_present_checksum_flag_present():
+    arguments = [RESTORE_ARGUMENT, '--delta-checksum']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.is_delta_copy_flag_present()
+    assert argument_handler.is_delta_checksum_flag_present()
+
+
+@pytest.mark.unit
+def test_is_delta_copy_flag_present_during_capture_returns_false():
+    arguments = [CAPTURE_ARGUMENT]
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert not argument_handler.is_delta_copy_flag_present()
+
+
+@pytest.mark.unit
+def test_get_link_mode_flag_not_present_returns_copy():
+    arguments = [CAPTURE_ARGUMENT]
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_link_mode() == LinkMode.COPY
+
+
+@pytest.mark.unit
+def test_get_link_mode_flag_present():
+    arguments = [CAPTURE_ARGUMENT, '--link-mode', 'hardlink']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_link_mode() == LinkMode.HARDLINK
+
+
+@pytest.mark.unit
+def test_get_buffer_size_flag_not_present_returns_default():
+    arguments = [CAPTURE_ARGUMENT]
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_buffer_size() == 8 * 1024 * 1024
+
+
+@pytest.mark.unit
+def test_get_buffer_size_flag_present_returns_bytes():
+    arguments = [RESTORE_ARGUMENT, '--buffer-size', '32']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_buffer_size() == 32 * 1024 * 1024
+
+
+@pytest.mark.unit
+def test_get_buffer_size_not_positive_raises_error():
+    arguments = [CAPTURE_ARGUMENT, '--buffer-size', '0']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    with pytest.raises(MigrationError):
+        argument_handler.get_buffer_size()
+
+
+@pytest.mark.unit
+def test_get_verification_sample_fraction_flag_not_present_returns_none():
+    arguments = [RESTORE_ARGUMENT]
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_verification_sample_fraction() is None
+
+
+@pytest.mark.unit
+def test_get_verification_sample_fraction_verify_flag_present_returns_one():
+    arguments = [RESTORE_ARGUMENT, '--verify']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_verification_sample_fraction() == 1.0
+
+
+@pytest.mark.unit
+def test_get_verification_sample_fraction_verify_sample_flag_present_returns_fraction():
+    arguments = [CAPTURE_ARGUMENT, '--verify-sample', '0.25']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_verification_sample_fraction() == 0.25
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('fraction', ['0', '1.5'])
+def test_get_verification_sample_fraction_out_of_range_raises_error(fraction: str):
+    arguments = [CAPTURE_ARGUMENT, '--verify-sample', fraction]
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    with pytest.raises(MigrationError):
+        argument_handler.get_verification_sample_fraction()
+
+
+@pytest.mark.unit
+def test_prune_command():
+    arguments = ['prune', '--store', 'store', '--keep', '3']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_migration_action() == MigrationAction.PRUNE
+    assert argument_handler.get_capture_store_directory() == 'store'
+    assert argument_handler.get_number_of_captures_to_keep() == 3
+
+
+@pytest.mark.unit
+def test_check_command():
+    arguments = ['check', '--all']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_migration_action() == MigrationAction.CHECK
+
+
+@pytest.mark.unit
+def test_get_capture_store_directory_flag_not_present_returns_none():
+    arguments = [CAPTURE_ARGUMENT]
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_capture_store_directory() is None
+
+
 @pytest.mark.unit
 def test_is_force_migration_flag_present_during_capture_returns_false():
     arguments = [CAPTURE_ARGUMENT]
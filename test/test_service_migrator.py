@@ -2,10 +2,13 @@ from nislmigrate.facades.facade_factory import FacadeFactory
 from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.migration_action import MigrationAction
 from nislmigrate.extensibility.migrator_plugin import MigratorPlugin, DEFAULT_SERVICE_CONFIGURATION_DIRECTORY
+from nislmigrate.extensibility.mongo_migrator_plugin import MongoMigratorPlugin
 from nislmigrate.migration_facilitator import MigrationFacilitator
 from test.test_utilities import FakeFacadeFactory, FakeArgumentHandler
 from pathlib import Path
+import os
 import pytest
+from testfixtures import tempdir
 from typing import Any, Dict
 
 
@@ -13,6 +16,14 @@ CONFIGURATION_FOR_TEST = config = {
         'test': {
             'key1': 'value1',
             'key2': 'value2'
+        },
+        'mongo1': {
+            'Mongo.CustomConnectionString': 'mongodb://localhost/mongo1',
+            'Mongo.Database': 'mongo1'
+        },
+        'mongo2': {
+            'Mongo.CustomConnectionString': 'mongodb://localhost/mongo2',
+            'Mongo.Database': 'mongo2'
         }
     }
 
@@ -204,6 +215,80 @@ def test_migrate_services_with_restore_action_restarts_web_server():
     assert facade_factory.ni_web_server_manager_facade.restart_count == 1
 
 
+@pytest.mark.unit
+@tempdir()
+def test_migrate_services_captures_mongo_only_services_in_one_batch(directory):
+    facade_factory = configure_fake_facade_factory()
+    service = FakeMigrator()
+    mongo_services = [FakeMongoMigrator('mongo1'), FakeMongoMigrator('mongo2')]
+
+    argument_handler = FakeArgumentHandler(mongo_services + [service], MigrationAction.CAPTURE, directory.path)
+    MigrationFacilitator(facade_factory, argument_handler).migrate()
+
+    dump_commands = facade_factory.process_facade.all_arguments
+    assert sorted(command[-2] for command in dump_commands) == [
+        '--archive=' + os.path.join(directory.path, 'mongo1', 'mongo1'),
+        '--archive=' + os.path.join(directory.path, 'mongo2', 'mongo2'),
+    ]
+    assert service.capture_count == 1
+
+
+@pytest.mark.unit
+@tempdir()
+def test_migrate_services_restores_mongo_only_services_in_one_batch(directory):
+    facade_factory = configure_fake_facade_factory()
+    mongo_services = [FakeMongoMigrator('mongo1'), FakeMongoMigrator('mongo2')]
+    for service in mongo_services:
+        directory.write(os.path.join(service.name, service.name), b'')
+
+    argument_handler = FakeArgumentHandler(mongo_services, MigrationAction.RESTORE, directory.path)
+    MigrationFacilitator(facade_factory, argument_handler).migrate()
+
+    restore_commands = facade_factory.process_facade.all_arguments
+    assert sorted(command[-2] for command in restore_commands) == [
+        '--archive=' + os.path.join(directory.path, 'mongo1', 'mongo1'),
+        '--archive=' + os.path.join(directory.path, 'mongo2', 'mongo2'),
+    ]
+
+
+@pytest.mark.unit
+@tempdir()
+def test_migrate_services_does_not_batch_mongo_service_that_overrides_capture(directory):
+    facade_factory = configure_fake_facade_factory()
+    overriding_service = FakeOverridingMongoMigrator('mongo2')
+    mongo_services = [FakeMongoMigrator('mongo1'), overriding_service]
+
+    argument_handler = FakeArgumentHandler(mongo_services, MigrationAction.CAPTURE, directory.path)
+    MigrationFacilitator(facade_factory, argument_handler).migrate()
+
+    assert overriding_service.capture_count == 1
+    assert len(facade_factory.process_facade.all_arguments) == 1
+
+
+class FakeMongoMigrator(MongoMigratorPlugin):
+    def __init__(self, name: str):
+        self.__name = name
+
+    @property
+    def help(self):
+        return ''
+
+    @property
+    def name(self):
+        return self.__name
+
+    @property
+    def argument(self):
+        return self.__name
+
+
+class FakeOverridingMongoMigrator(FakeMongoMigrator):
+    capture_count = 0
+
+    def capture(self, migration_directory, facade_factory, arguments) -> None:
+        self.capture_count += 1
+
+
 class FakeMigrator(MigratorPlugin):
     pre_restore_migration_directory: str = ''
     pre_capture_migration_directory: str = ''
@@ -1,6 +1,9 @@
 import argparse
 
+from nislmigrate.facades.encrypted_archive import DEFAULT_KEY_DERIVATION_ITERATIONS
+from nislmigrate.facades.file_store_check import FileReference, FileStoreCheckResult
 from nislmigrate.facades.file_system_facade import FileSystemFacade
+from nislmigrate.facades.git_facade import BundleManifest, GitFacade
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
 from nislmigrate.facades.ni_web_server_manager_facade import NiWebServerManagerFacade
 from nislmigrate.argument_handler import ArgumentHandler
@@ -8,12 +11,18 @@ from nislmigrate.extensibility.migrator_plugin import MigratorPlugin
 from nislmigrate.extensibility.migrator_plugin_loader import MigratorPluginLoader
 from nislmigrate.facades.facade_factory import FacadeFactory
 from nislmigrate.facades.mongo_facade import MongoFacade
+from nislmigrate.facades.object_store_facade import ObjectStoreFacade
+from nislmigrate.facades.parallel_copy import FileToCopy, FileTreeIndex, ReferencedFileSelection
 from nislmigrate.facades.process_facade import ProcessError, ProcessFacade, BackgroundProcess
+from nislmigrate.facades.rdb_inventory import RdbInventory
+from nislmigrate.facades.redis_configuration import RedisConfiguration
+from nislmigrate.facades.redis_facade import RedisFacade
 from nislmigrate.facades.system_link_service_manager_facade import SystemLinkServiceManagerFacade
 import os
 from pathlib import Path
-from typing import List, Optional, Dict, Any, Callable
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
+from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.migration_action import MigrationAction
 
 
@@ -25,6 +34,9 @@ class FakeFacadeFactory(FacadeFactory):
         self.file_system_facade: FakeFileSystemFacade = FakeFileSystemFacade()
         self.ni_web_server_manager_facade: FakeNiWebServerManagerFacade = FakeNiWebServerManagerFacade()
         self.system_link_service_manager_facade: FakeServiceManager = FakeServiceManager()
+        self.object_store_facade: FakeObjectStoreFacade = FakeObjectStoreFacade()
+        self.redis_facade: FakeRedisFacade = FakeRedisFacade(self.process_facade)
+        self.git_facade: FakeGitFacade = FakeGitFacade(self.process_facade)
 
     def get_mongo_facade(self) -> MongoFacade:
         return self.mongo_facade
@@ -41,11 +53,21 @@ class FakeFacadeFactory(FacadeFactory):
     def get_process_facade(self) -> ProcessFacade:
         return self.process_facade
 
+    def get_object_store_facade(self) -> ObjectStoreFacade:
+        return self.object_store_facade
+
+    def get_redis_facade(self) -> RedisFacade:
+        return self.redis_facade
+
+    def get_git_facade(self) -> GitFacade:
+        return self.git_facade
+
 
 class FakeArgumentHandler(ArgumentHandler):
-    def __init__(self, services: List[MigratorPlugin], action: MigrationAction):
+    def __init__(self, services: List[MigratorPlugin], action: MigrationAction, migration_directory: str = ''):
         self._services: List[MigratorPlugin] = services
         self._action = action
+        self._migration_directory = migration_directory
         self.parsed_arguments = argparse.Namespace()
 
     def get_list_of_services_to_capture_or_restore(self) -> List[MigratorPlugin]:
@@ -58,7 +80,7 @@ class FakeArgumentHandler(ArgumentHandler):
         return self._action
 
     def get_migration_directory(self) -> str:
-        return ''
+        return self._migration_directory
 
     def is_force_migration_flag_present(self) -> bool:
         return True
@@ -66,6 +88,7 @@ class FakeArgumentHandler(ArgumentHandler):
 
 class FakeFileSystemFacade(FileSystemFacade):
     def __init__(self):
+        super().__init__()
         self.last_read_json_file_path: Optional[str] = None
         self.last_from_directory: Optional[str] = None
         self.last_to_directory: Optional[str] = None
@@ -75,11 +98,68 @@ class FakeFileSystemFacade(FileSystemFacade):
         self.directories_encrypted = []
         self.directories_decrypted = []
         self.written_files = {}
+        self.key_derivation_iterations: Optional[int] = None
+        self.incremental = False
+        self.last_volume_size: Optional[int] = None
+        self.last_referenced_paths: Optional[List[str]] = None
+        self.last_deduplicate: bool = False
+        self.last_selected_extensions: Optional[Tuple[str, ...]] = None
+        self.last_file_references: Optional[List[FileReference]] = None
+        self.file_store_check_result = FileStoreCheckResult(0, [], [], [], 0.0)
+        self.merged_directories: List[Tuple[str, str]] = []
+        self.orphaned_files: List[FileToCopy] = []
+        self.removed_directories: List[str] = []
 
     def copy_directory(self, from_directory: str, to_directory: str, force: bool):
         self.last_from_directory = from_directory
         self.last_to_directory = to_directory
 
+    def remove_directory(self, directory: str):
+        self.removed_directories.append(directory)
+        super().remove_directory(directory)
+
+    def copy_file(self, from_directory: str, to_directory: str, file_name: str):
+        self.last_from_directory = from_directory
+        self.last_to_directory = to_directory
+
+    def merge_directory(self, from_directory: str, to_directory: str):
+        self.last_from_directory = from_directory
+        self.last_to_directory = to_directory
+        self.merged_directories.append((from_directory, to_directory))
+
+    def copy_directory_to_volume_archive(self, from_directory: str, to_directory: str, volume_size: int):
+        self.last_from_directory = from_directory
+        self.last_to_directory = to_directory
+        self.last_volume_size = volume_size
+
+    def copy_referenced_files(
+            self,
+            from_directory: str,
+            to_directory: str,
+            referenced_paths: Iterable[str],
+            deduplicate: bool = False,
+            selected_extensions: Optional[Tuple[str, ...]] = None) -> ReferencedFileSelection:
+        self.last_from_directory = from_directory
+        self.last_to_directory = to_directory
+        paths = list(referenced_paths)
+        self.last_referenced_paths = paths
+        self.last_deduplicate = deduplicate
+        self.last_selected_extensions = selected_extensions
+        missing_paths = [path for path in paths if path in self.missing_files]
+        return ReferencedFileSelection(
+            FileTreeIndex([(from_directory, to_directory)], [], 0, 0, []),
+            self.orphaned_files,
+            missing_paths)
+
+    def replace_directory(self, to_directory: str, create_into: Callable[[str], None]) -> None:
+        self.last_to_directory = to_directory
+        create_into(to_directory)
+
+    def check_file_store(self, data_directory: str, references: Iterable[FileReference]) -> FileStoreCheckResult:
+        self.last_from_directory = data_directory
+        self.last_file_references = list(references)
+        return self.file_store_check_result
+
     def read_json_file(self, path: str) -> dict:
         self.last_read_json_file_path = path
         return self.config
@@ -88,13 +168,38 @@ class FakeFileSystemFacade(FileSystemFacade):
         (_, file_name) = os.path.split(file_path)
         return file_name not in self.missing_files
 
+    def does_service_configuration_exist(self, configuration_file_path: str) -> bool:
+        return self.does_file_exist(configuration_file_path)
+
     def does_directory_exist(self, dir_):
         if not self.missing_directories:
             self.missing_directories = []
         return dir_ not in self.missing_directories
 
-    def copy_directory_to_encrypted_file(self, from_directory: str, encrypted_file_path: str, secret: str):
+    def copy_directory_to_encrypted_file(
+            self,
+            from_directory: str,
+            encrypted_file_path: str,
+            secret: str,
+            key_derivation_iterations: int = DEFAULT_KEY_DERIVATION_ITERATIONS,
+            incremental: bool = False):
         self.directories_encrypted.append((from_directory, encrypted_file_path, secret))
+        self.key_derivation_iterations = key_derivation_iterations
+        self.incremental = incremental
+
+    def copy_directories_to_encrypted_files(
+            self,
+            copies: List[Tuple[str, str]],
+            secret: str,
+            key_derivation_iterations: int = DEFAULT_KEY_DERIVATION_ITERATIONS,
+            incremental: bool = False):
+        for from_directory, encrypted_file_path in copies:
+            self.copy_directory_to_encrypted_file(
+                from_directory,
+                encrypted_file_path,
+                secret,
+                key_derivation_iterations,
+                incremental)
 
     def copy_directory_from_encrypted_file(self, encrypted_file_path: str, to_directory: str, secret: str):
         self.directories_decrypted.append((encrypted_file_path, to_directory, secret))
@@ -120,6 +225,13 @@ class FakeMongoFacade(MongoFacade):
     def __init__(self, process_facade: Optional[ProcessFacade] = None):
         super().__init__(process_facade or FakeProcessFacade())
         self.updated_documents_in_collections: Dict[str, Any] = {}
+        self.field_values_in_collections: Dict[str, List[Any]] = {}
+        self.last_field_value_query: Optional[Dict[str, Any]] = None
+        self.documents_in_collections: Dict[str, List[Dict[str, Any]]] = {}
+        self.captured_aggregations: Dict[str, List[Dict[str, Any]]] = {}
+        self.restored_document_files: Dict[str, str] = {}
+        self.upserted_document_files: Dict[str, str] = {}
+        self.last_find_started_mongo: Optional[bool] = None
 
     def start_mongo(self):
         self.is_mongo_running = True
@@ -149,6 +261,42 @@ class FakeMongoFacade(MongoFacade):
             update_function: Callable[[Any], Any]):
         self.updated_documents_in_collections[collection_name] = configuration
 
+    def find_documents_in_collection(
+            self,
+            configuration: MongoConfiguration,
+            collection_name: str,
+            field_names: List[str],
+            query: Optional[Dict[str, Any]] = None,
+            start_mongo: bool = True) -> Iterator[Dict[str, Any]]:
+        self.last_find_started_mongo = start_mongo
+        return iter(self.documents_in_collections.get(collection_name, []))
+
+    def find_field_values_in_collection(
+            self,
+            configuration: MongoConfiguration,
+            collection_name: str,
+            field_name: str,
+            query: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+        self.last_field_value_query = query
+        return iter(self.field_values_in_collections.get(collection_name, []))
+
+    def capture_aggregation_to_file(
+            self,
+            configuration: MongoConfiguration,
+            collection_name: str,
+            pipeline: List[Dict[str, Any]],
+            path: str) -> int:
+        self.captured_aggregations[path] = pipeline
+        return 0
+
+    def restore_documents_from_file(self, configuration: MongoConfiguration, collection_name: str, path: str) -> int:
+        self.restored_document_files[collection_name] = path
+        return 0
+
+    def upsert_documents_from_file(self, configuration: MongoConfiguration, collection_name: str, path: str) -> int:
+        self.upserted_document_files[collection_name] = path
+        return 0
+
     def did_update_documents_in_collection(
             self,
             configuration: MongoConfiguration,
@@ -166,17 +314,109 @@ class FakeNiWebServerManagerFacade(NiWebServerManagerFacade):
         self.restart_count = self.restart_count + 1
 
 
+class FakeObjectStoreFacade(ObjectStoreFacade):
+    def __init__(self):
+        self.downloads: List[Dict[str, Any]] = []
+        self.uploads: List[Dict[str, Any]] = []
+
+    def download_directory(
+            self,
+            uri: str,
+            to_directory: str,
+            state_directory: str,
+            endpoint_url: Optional[str] = None) -> None:
+        self.downloads.append(
+            {'uri': uri, 'to_directory': to_directory, 'state_directory': state_directory,
+             'endpoint_url': endpoint_url})
+
+    def upload_directory(
+            self,
+            from_directory: str,
+            uri: str,
+            state_directory: str,
+            endpoint_url: Optional[str] = None) -> None:
+        self.uploads.append(
+            {'from_directory': from_directory, 'uri': uri, 'state_directory': state_directory,
+             'endpoint_url': endpoint_url})
+
+
+class FakeRedisFacade(RedisFacade):
+    def __init__(self, process_facade: ProcessFacade):
+        super().__init__(process_facade)
+        self.last_capture_path: Optional[str] = None
+        self.last_key_patterns: Optional[List[str]] = None
+        self.last_restore_path: Optional[str] = None
+        self.inventories: Dict[str, RdbInventory] = {}
+        self.unreadable_inventories: List[str] = []
+        self.dump_file_version = 9
+        self.dump_file_versions: Dict[str, int] = {}
+
+    def capture_keys(
+            self,
+            configuration: RedisConfiguration,
+            path: str,
+            key_patterns: Optional[List[str]] = None,
+            batch_size: int = 0) -> int:
+        self.last_capture_path = path
+        self.last_key_patterns = key_patterns
+        return 0
+
+    def restore_keys(self, configuration: RedisConfiguration, path: str, batch_size: int = 0) -> int:
+        self.last_restore_path = path
+        return 0
+
+    def inventory_key_dump(self, path: str) -> RdbInventory:
+        return self.__inventory(path)
+
+    def inventory_dump_file(self, path: str) -> RdbInventory:
+        return self.__inventory(path)
+
+    def read_dump_file_version(self, path: str) -> int:
+        return self.dump_file_versions.get(path, self.dump_file_version)
+
+    def __inventory(self, path: str) -> RdbInventory:
+        if path in self.unreadable_inventories:
+            raise MigrationError(f'{path} holds module or function data, which can not be inventoried.')
+        (_, file_name) = os.path.split(path)
+        return self.inventories.get(file_name, RdbInventory(self.dump_file_version, 0, 0, {}, {}, {}))
+
+
+class FakeGitFacade(GitFacade):
+    def __init__(self, process_facade: ProcessFacade):
+        super().__init__(process_facade)
+        self.last_capture: Optional[Dict[str, Any]] = None
+        self.last_restore: Optional[Dict[str, str]] = None
+
+    def capture_repository_to_bundles(
+            self,
+            repository: str,
+            directory: str,
+            incremental: bool,
+            repack: bool,
+            allow_uncommitted_changes: bool = False) -> BundleManifest:
+        self.last_capture = {'repository': repository, 'directory': directory, 'incremental': incremental,
+                             'repack': repack, 'allow_uncommitted_changes': allow_uncommitted_changes}
+        return BundleManifest([], {}, None)
+
+    def restore_repository_from_bundles(self, directory: str, repository: str) -> None:
+        self.last_restore = {'directory': directory, 'repository': repository}
+
+
 class FakeProcessFacade(ProcessFacade):
     def __init__(self):
         self.reset()
 
     def reset(self):
         self.last_capture_path: Optional[Path] = None
+        self.last_arguments: List[str] = []
+        self.all_arguments: List[List[str]] = []
         self.captured: bool = False
         self.last_restore_path: Optional[Path] = None
         self.restored: bool = False
 
     def run_process(self, args: List[str]):
+        self.last_arguments = args
+        self.all_arguments.append(args)
         archive_arg = [a for a in args if a.startswith('--archive=')][0]
         if not archive_arg:
             raise ProcessError('missing --archive= argument')